@@ -0,0 +1,118 @@
+"""Pencatat aktivitas user (last_activity dan profil di tabel users).
+
+Menggantikan tulis-per-update ke tabel users:
+
+    activity_tracker.record(user_id, username="budi", last_activity=activity_timestamp())
+
+- Perubahan dikumpulkan di memori per user (panggilan berulang dalam satu
+  interval hanya mengganti nilai), lalu ditulis setiap ACTIVITY_FLUSH_SECONDS
+  dalam satu transaksi writer.
+- Penulisan berupa `INSERT ... ON CONFLICT (user_id) DO UPDATE` yang hanya
+  mengubah kolom yang dicatat (bukan INSERT OR REPLACE yang menghapus dan
+  menulis ulang baris beserta semua index-nya dan mereset created_at); satu
+  executemany per kombinasi kolom.
+- Trigger migrasi 0011 menjaga counter user aktif per hari di deal_counters
+  (scope 'active_day'), yang dibaca dashboard admin.
+"""
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Tuple
+
+from db_sqlite import db
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "30"))
+
+# Kolom users yang boleh dicatat
+ACTIVITY_COLUMNS = frozenset({"username", "first_name", "last_name", "reachable", "profile_updated_at", "last_activity"})
+
+
+def activity_timestamp(at: float = None) -> str:
+    """Format last_activity (UTC, sama dengan datetime('now') SQLite)"""
+    moment = datetime.fromtimestamp(time.time() if at is None else at, timezone.utc)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _upsert_sql(columns: Tuple[str, ...]) -> str:
+    return (
+        f"INSERT INTO users (user_id, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))}) "
+        f"ON CONFLICT (user_id) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in columns)}"
+    )
+
+
+def _write(conn: sqlite3.Connection, changes: Iterable[Tuple[int, Dict[str, Any]]]):
+    groups: Dict[Tuple[str, ...], list] = {}
+    for user_id, columns in changes:
+        names = tuple(sorted(columns))
+        groups.setdefault(names, []).append((user_id, *(columns[name] for name in names)))
+    for names, rows in groups.items():
+        conn.executemany(_upsert_sql(names), rows)
+
+
+class ActivityTracker:
+    """Perubahan kolom users per user di memori, ditulis berkala dalam satu transaksi"""
+
+    def __init__(self, database=db, interval: float = ACTIVITY_FLUSH_SECONDS):
+        self.db = database
+        self.interval = interval
+        self.recorded = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._flushing = None
+        self._running = False
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, user_id: int, **columns):
+        """Catat nilai kolom users untuk user ini; ditulis pada flush berikutnya"""
+        unknown = set(columns) - ACTIVITY_COLUMNS
+        if unknown:
+            raise ValueError(f"Kolom users tidak dikenal: {', '.join(sorted(unknown))}")
+        self._pending.setdefault(user_id, {}).update(columns)
+        self.recorded += 1
+
+    async def flush(self) -> int:
+        """Tulis semua perubahan tertunda; mengembalikan jumlah user yang ditulis"""
+        # Flush bersamaan (loop berkala dan shutdown) menunggu yang sedang berjalan
+        while self._flushing is not None:
+            await self._flushing
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        self._flushing = asyncio.get_running_loop().create_future()
+        try:
+            await self.db.transaction(_write, list(pending.items()))
+        except Exception:
+            # Kembalikan supaya ditulis di flush berikutnya (perubahan baru tetap menang)
+            for user_id, columns in pending.items():
+                self._pending[user_id] = {**columns, **self._pending.get(user_id, {})}
+            raise
+        finally:
+            self._flushing.set_result(None)
+            self._flushing = None
+        self.flushes += 1
+        self.rows_written += len(pending)
+        return len(pending)
+
+    def stop(self):
+        self._running = False
+
+    async def run(self):
+        """Loop flush berkala; jalankan sebagai background task"""
+        self._running = True
+        while self._running:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing user activity: {e}")
+
+
+activity_tracker = ActivityTracker()
@@ -0,0 +1,209 @@
+"""Analitik siklus deal: berapa lama deal berada di setiap status, dari tabel logs.
+
+    summary = await deal_analytics.summary()
+    summary["states"]["WAITING_VERIFICATION"]["p95"]   # detik
+
+- Setiap log transisi (event deal_state, nama aksi handler seperti
+  FUND_VERIFY, atau log lama seperti JOIN_COMPLETE) menandai deal masuk ke
+  status baru; lama di status sebelumnya = selisih created_at kedua log.
+  Admin yang mengakhiri status (mis. verifikasi pembayaran) ikut dicatat.
+- Log dibaca sebagai stream terurut (deal_id, created_at) dari index migrasi
+  0015. Yang disimpan hanya sketch kuantil per status dan per admin
+  (QuantileSketch, ukurannya tetap) serta status terakhir deal yang belum
+  selesai, jadi memori tidak bergantung pada jumlah log.
+- Pembacaan penuh hanya sekali; refresh berikutnya (paling cepat setiap
+  ANALYTICS_TTL detik) hanya membaca log dengan id di atas watermark.
+"""
+import os
+import math
+import time
+import heapq
+import asyncio
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from db_sqlite import db
+from deal_state import TRANSITIONS
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_TTL = float(os.getenv("ANALYTICS_TTL", "60"))
+# Galat relatif nilai kuantil (0.01 = 1%)
+ANALYTICS_ACCURACY = float(os.getenv("ANALYTICS_ACCURACY", "0.01"))
+ANALYTICS_MAX_BUCKETS = int(os.getenv("ANALYTICS_MAX_BUCKETS", "2048"))
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Status yang dimasuki deal per action log
+ACTION_TARGETS = {
+    **{event: transition.target for event, transition in TRANSITIONS.items()},
+    "CREATE": "PENDING_JOIN",
+    "JOIN_COMPLETE": "PENDING_FUNDING",
+    "FUND_VERIFY": "FUNDED",
+    "FINAL_RELEASE": "COMPLETED",
+    "CONFIRM_PAYOUT": "COMPLETED",
+}
+FINAL_STATES = frozenset({"COMPLETED", "CANCELLED", "REFUNDED"})
+# Urutan tampil, mengikuti TRANSITIONS
+STATES = tuple(dict.fromkeys(("PENDING_JOIN", *(t.target for t in TRANSITIONS.values()))))
+
+_COLUMNS = "id, deal_id, actor_id, role, action, created_at"
+FULL_SQL = f"SELECT {_COLUMNS} FROM logs ORDER BY deal_id, created_at, id"
+# Hanya log baru: rentang rowid, sort hanya atas log baru
+TAIL_SQL = f"SELECT {_COLUMNS} FROM logs NOT INDEXED WHERE id > ? ORDER BY deal_id, created_at, id"
+
+
+class QuantileSketch:
+    """Sketch kuantil bergalat relatif `accuracy` (bucket logaritmik seperti DDSketch)"""
+
+    # Nilai di bawah ini (detik) dianggap nol
+    MIN_VALUE = 1e-3
+
+    def __init__(self, accuracy: float = ANALYTICS_ACCURACY, max_buckets: int = ANALYTICS_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if value < self.MIN_VALUE:
+            self.zeros += 1
+            return
+        # Bucket k berisi nilai (gamma^(k-1), gamma^k]
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        if len(self.buckets) > self.max_buckets:
+            # Gabungkan dua bucket terkecil: galat hanya bergeser ke ekor bawah
+            lowest, second = heapq.nsmallest(2, self.buckets)
+            self.buckets[second] += self.buckets.pop(lowest)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = int(q * (self.count - 1))
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return min(2 * self._gamma ** key / (self._gamma + 1), self.max)
+        return self.max
+
+    def stats(self) -> Dict[str, float]:
+        result = {"count": self.count, "mean": self.total / self.count if self.count else 0.0}
+        for q in QUANTILES:
+            result[f"p{round(q * 100)}"] = self.quantile(q)
+        return result
+
+
+def _parse_time(value) -> Optional[datetime]:
+    # created_at berisi datetime.now() (dengan mikrodetik) atau CURRENT_TIMESTAMP
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class DealAnalytics:
+    """Sketch lama-status per status dan per admin, diperbarui bertahap dari logs"""
+
+    def __init__(self, database=db, ttl: float = ANALYTICS_TTL, accuracy: float = ANALYTICS_ACCURACY):
+        self.db = database
+        self.ttl = ttl
+        self.accuracy = accuracy
+        self.refreshes = 0
+        self._lock = asyncio.Lock()
+        self._refreshed_at = 0.0
+        self._reset()
+
+    def _reset(self):
+        self.states: Dict[str, QuantileSketch] = {}
+        self.admins: Dict[int, Dict[str, QuantileSketch]] = {}
+        self.rows = 0
+        self._last_id = 0
+        # deal_id -> (status, waktu masuk) untuk deal yang belum berstatus akhir
+        self._open: Dict[str, Tuple[str, datetime]] = {}
+
+    def _sketch(self, sketches: Dict[str, QuantileSketch], state: str) -> QuantileSketch:
+        sketch = sketches.get(state)
+        if sketch is None:
+            sketch = sketches[state] = QuantileSketch(self.accuracy)
+        return sketch
+
+    def _keep_open(self, deal_id: Optional[str], state: Optional[str], entered: Optional[datetime]):
+        if deal_id is not None and state is not None and state not in FINAL_STATES:
+            self._open[deal_id] = (state, entered)
+
+    def _consume(self, conn: sqlite3.Connection) -> int:
+        """Proses log di atas watermark (di thread database); mengembalikan jumlah baris"""
+        if self._last_id:
+            rows = conn.execute(TAIL_SQL, (self._last_id,))
+        else:
+            rows = conn.execute(FULL_SQL)
+        count, last_id = 0, self._last_id
+        deal, state, entered = None, None, None
+        for log_id, deal_id, actor_id, role, action, created_at in rows:
+            count += 1
+            last_id = max(last_id, log_id)
+            if deal_id != deal:
+                self._keep_open(deal, state, entered)
+                deal = deal_id
+                state, entered = self._open.pop(deal_id, (None, None))
+            target = ACTION_TARGETS.get(action)
+            at = _parse_time(created_at)
+            if target is None or target == state or at is None:
+                continue
+            if state is not None:
+                seconds = (at - entered).total_seconds()
+                # Campuran waktu lokal dan UTC di log lama bisa negatif
+                if seconds >= 0:
+                    self._sketch(self.states, state).add(seconds)
+                    if role == "ADMIN":
+                        self._sketch(self.admins.setdefault(actor_id, {}), state).add(seconds)
+            state, entered = target, at
+        self._keep_open(deal, state, entered)
+        self.rows += count
+        self._last_id = last_id
+        return count
+
+    async def refresh(self, force: bool = False) -> int:
+        """Proses log baru jika sudah lewat ttl (atau `force`); mengembalikan jumlah baris"""
+        async with self._lock:
+            if not force and self.refreshes and time.monotonic() - self._refreshed_at < self.ttl:
+                return 0
+            try:
+                count = await self.db.run(self._consume)
+            except Exception:
+                # Stream terputus di tengah: sketch sudah setengah diperbarui, baca ulang penuh
+                self._reset()
+                raise
+            self._refreshed_at = time.monotonic()
+            self.refreshes += 1
+            return count
+
+    async def summary(self) -> Dict[str, Any]:
+        """{'states': {status: stats}, 'admins': {admin_id: {status: stats}}, 'rows', 'open'}; stats dalam detik"""
+        await self.refresh()
+        async with self._lock:
+            return {
+                "states": {state: sketch.stats() for state, sketch in self.states.items()},
+                "admins": {admin_id: {state: sketch.stats() for state, sketch in sketches.items()}
+                           for admin_id, sketches in self.admins.items()},
+                "rows": self.rows,
+                "open": len(self._open),
+            }
+
+
+deal_analytics = DealAnalytics()
@@ -0,0 +1,2277 @@
+"""Micro-benchmark untuk lapisan database Rekber Bot.
+
+Semua benchmark berjalan di database sementara (tidak menyentuh rekber.db).
+File ini hanya untuk pengukuran waktu; pemeriksaan kebenaran ada di tests/
+(`python -m pytest -q`), yang memanggil fungsi bench_* dengan ukuran kecil.
+
+Pemakaian:
+    python benchmark.py pool [jumlah_baris] [jumlah_query]
+    python benchmark.py loop_lag [lama_lock_ms]
+    python benchmark.py group_commit [jumlah_tulis] [jumlah_klien]
+    python benchmark.py audit [jumlah_log]
+    python benchmark.py rate_limit [jumlah_cek] [jumlah_user]
+    python benchmark.py state_race [jumlah_klik] [jumlah_thread]
+    python benchmark.py sweep [jumlah_deal] [latensi_kirim_ms]
+    python benchmark.py scheduler [jumlah_job] [jumlah_job_dekat]
+    python benchmark.py deadline [jumlah_deal_dekat] [jumlah_deal_jauh]
+    python benchmark.py dispatch [jumlah_pesan] [jumlah_grup]
+    python benchmark.py outbox [jumlah_deal] [persen_gagal]
+    python benchmark.py profile [jumlah_user] [jumlah_lookup]
+    python benchmark.py webhook [jumlah_update] [jumlah_koneksi]
+    python benchmark.py updates [jumlah_deal] [latensi_ms]
+    python benchmark.py router [jumlah_lookup]
+    python benchmark.py persistence [jumlah_user_aktif]
+    python benchmark.py deals [jumlah_deal]
+    python benchmark.py activity [jumlah_update] [jumlah_user]
+    python benchmark.py reputation [jumlah_deal] [jumlah_user]
+    python benchmark.py leaderboard [jumlah_deal] [jumlah_user]
+    python benchmark.py rollup [jumlah_deal]
+    python benchmark.py analytics [jumlah_log] [jumlah_admin]
+"""
+import os
+import sys
+import json
+import time
+import random
+import resource
+import asyncio
+import sqlite3
+import tempfile
+import shutil
+import threading
+import functools
+import math
+import logging
+import re
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from telegram import Bot, Chat, Update, User
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ConversationHandler, MessageHandler, filters
+from telegram.error import Forbidden, NetworkError
+from telegram.request import HTTPXRequest
+
+import db_sqlite
+import deal_state
+import migrations
+from db_sqlite import ConnectionPool, AsyncDatabase, WriteQueue, AuditLogger
+from deal_cache import DealCache
+from deal_state import apply_transition, SELLER
+from dispatcher import Dispatcher, INTERACTIVE, REMINDER, BROADCAST, LANES, is_group
+from handlers.notifications import NotificationManager
+from outbox import Notification, OutboxRelay, counts as outbox_counts
+from persistence import SQLitePersistence
+from profile_cache import ProfileCache
+from activity import ActivityTracker, activity_timestamp
+from leaderboard import Leaderboard
+from rate_limiter import RateLimiter, RatePolicy
+from scheduler import Scheduler, add_job
+from webhook import WebhookServer, ALLOWED_UPDATES, serve as serve_webhook
+from update_locks import OrderedApplication
+
+STATUSES = ("PENDING_JOIN", "PENDING_FUNDING", "WAITING_VERIFICATION", "FUNDED",
+            "AWAITING_CONFIRM", "COMPLETED", "CANCELLED")
+
+
+def build_synthetic_deals(path: str, rows: int):
+    """Isi tabel deals sintetis berisi `rows` baris"""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("""
+    CREATE TABLE deals (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        buyer_id INTEGER,
+        seller_id INTEGER,
+        status TEXT DEFAULT 'CREATED',
+        admin_fee INTEGER DEFAULT 0,
+        admin_fee_payer TEXT DEFAULT 'BUYER',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    chunk = 50_000
+    for start in range(0, rows, chunk):
+        conn.executemany(
+            "INSERT INTO deals (id, title, amount, buyer_id, seller_id, status, admin_fee) VALUES (?,?,?,?,?,?,?)",
+            ((f"RB-{i:08d}", f"Deal sintetis {i}", random.randint(1_000, 10_000_000),
+              random.randint(1, 50_000), random.randint(1, 50_000), random.choice(STATUSES), 5000)
+             for i in range(start, min(start + chunk, rows)))
+        )
+        conn.commit()
+    conn.close()
+
+
+def _report(label: str, elapsed: float, queries: int):
+    print(f"{label:<28} {elapsed:8.3f} s  {queries / elapsed:10.0f} query/s  {elapsed / queries * 1e6:8.1f} us/query")
+
+
+def bench_pool(rows: int = 1_000_000, queries: int = 20_000):
+    """Bandingkan connect-per-query dengan koneksi dari pool"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(f"Menyiapkan {rows:,} baris deals sintetis...")
+        build_synthetic_deals(path, rows)
+        ids = [f"RB-{random.randrange(rows):08d}" for _ in range(queries)]
+        sql = "SELECT id, title, amount, buyer_id, seller_id, status FROM deals WHERE id = ?"
+
+        start = time.perf_counter()
+        for deal_id in ids:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute(sql, (deal_id,)).fetchone()
+            conn.close()
+        _report("connect-per-query", time.perf_counter() - start, queries)
+
+        pool = ConnectionPool(path, size=4)
+        start = time.perf_counter()
+        for deal_id in ids:
+            conn = pool.acquire()
+            conn.execute(sql, (deal_id,)).fetchone()
+            conn.close()
+        _report("pooled", time.perf_counter() - start, queries)
+        pool.close_all()
+
+
+def _hold_write_lock(path: str, hold: float, locked: threading.Event):
+    """Pegang write lock (BEGIN IMMEDIATE) selama `hold` detik dari thread lain"""
+    conn = sqlite3.connect(path)
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("UPDATE deals SET admin_fee = admin_fee WHERE id = 'RB-00000000'")
+    locked.set()
+    time.sleep(hold)
+    conn.commit()
+    conn.close()
+
+
+async def _measure_lag(write, path: str, hold: float) -> float:
+    """Jalankan `write` saat lock dipegang, kembalikan lag event loop terbesar (detik)"""
+    locked = threading.Event()
+    blocker = threading.Thread(target=_hold_write_lock, args=(path, hold, locked))
+    blocker.start()
+    locked.wait()
+
+    max_lag = 0.0
+    done = False
+
+    async def ticker(interval=0.005):
+        nonlocal max_lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            max_lag = max(max_lag, time.perf_counter() - start - interval)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.02)
+    await write()
+    done = True
+    await tick
+    blocker.join()
+    return max_lag
+
+
+def bench_loop_lag(hold_ms: int = 1000):
+    """Buktikan event loop tetap responsif saat write menunggu lock yang dipegang lama"""
+    hold = hold_ms / 1000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        build_synthetic_deals(path, 1_000)
+        sql = "UPDATE deals SET status = 'FUNDED' WHERE id = ?"
+
+        async def run():
+            adb = AsyncDatabase(path, workers=2)
+            pool = ConnectionPool(path, size=1)
+
+            async def sync_write():
+                conn = pool.acquire()
+                conn.execute(sql, ("RB-00000001",))
+                conn.commit()
+                conn.close()
+
+            async def async_write():
+                await adb.execute(sql, ("RB-00000002",))
+
+            sync_lag = await _measure_lag(sync_write, path, hold)
+            async_lag = await _measure_lag(async_write, path, hold)
+            adb.shutdown()
+            pool.close_all()
+            return sync_lag, async_lag
+
+        sync_lag, async_lag = asyncio.run(run())
+        print(f"write lock dipegang {hold_ms} ms")
+        print(f"{'sqlite3 langsung di loop':<28} lag maks {sync_lag * 1000:8.1f} ms")
+        print(f"{'AsyncDatabase':<28} lag maks {async_lag * 1000:8.1f} ms")
+        return {"sync_lag": sync_lag, "async_lag": async_lag}
+
+
+def _create_deal_with_log(conn, deal_id: str):
+    """Operasi tulis tipikal: buat deal + catat log"""
+    conn.execute(
+        "INSERT INTO deals (id, title, amount, buyer_id, status) VALUES (?,?,?,?,?)",
+        (deal_id, "Deal benchmark", 100_000, 1, "PENDING_JOIN")
+    )
+    conn.execute(
+        "INSERT INTO logs (deal_id, actor_id, role, action, detail) VALUES (?,?,?,?,?)",
+        (deal_id, 1, "BUYER", "CREATE", "benchmark")
+    )
+
+
+def bench_group_commit(writes: int = 5_000, clients: int = 256):
+    """Bandingkan commit per operasi dengan single writer + group commit saat lonjakan tulis.
+
+    Pembanding utama adalah commit per op dengan synchronous=NORMAL (pengaturan
+    pool dari user-001), yang lebih cepat tetapi tidak durable saat commit;
+    group commit memakai FULL dan tetap harus lebih cepat darinya.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        build_synthetic_deals(path, 10_000)
+        _create_logs_table(path)
+
+        def per_op_commit(synchronous: str):
+            pool = ConnectionPool(path, size=clients)
+
+            def write(i):
+                conn = pool.acquire()
+                conn.execute(f"PRAGMA synchronous={synchronous}")
+                _create_deal_with_log(conn, f"PO-{synchronous}-{i}")
+                conn.commit()
+                conn.close()
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                list(executor.map(write, range(writes)))
+            elapsed = time.perf_counter() - start
+            pool.close_all()
+            return elapsed
+
+        def group_commit():
+            writer = WriteQueue(path)
+
+            async def run():
+                sem = asyncio.Semaphore(clients)
+
+                async def write(i):
+                    async with sem:
+                        await writer.submit_async(_create_deal_with_log, f"GC-{i}")
+
+                await asyncio.gather(*(write(i) for i in range(writes)))
+
+            start = time.perf_counter()
+            asyncio.run(run())
+            elapsed = time.perf_counter() - start
+            print(f"  ({writer.ops} operasi dalam {writer.batches} batch, rata-rata {writer.ops / writer.batches:.1f}/batch)")
+            writer.close()
+            return elapsed
+
+        print(f"{writes:,} tulis (deal + log), {clients} klien bersamaan")
+        full = per_op_commit("FULL")
+        _report("commit per op (FULL)", full, writes)
+        normal = per_op_commit("NORMAL")
+        _report("commit per op (NORMAL)", normal, writes)
+        grouped = group_commit()
+        _report("group commit (FULL)", grouped, writes)
+        print(f"group commit {full / grouped:.1f}x commit per op FULL (durabilitas sama), "
+              f"{normal / grouped:.1f}x commit per op NORMAL (tanpa fsync per commit)")
+        return {"full": full, "normal": normal, "grouped": grouped}
+
+
+def _create_logs_table(path: str):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE logs (id INTEGER PRIMARY KEY AUTOINCREMENT, deal_id TEXT, actor_id INTEGER, "
+                 "role TEXT, action TEXT, detail TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    conn.commit()
+    conn.close()
+
+
+def bench_audit(records: int = 10_000):
+    """Bandingkan satu commit per log dengan buffer audit (write-behind)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _create_logs_table(path)
+        sql = "INSERT INTO logs (deal_id, actor_id, role, action, detail) VALUES (?,?,?,?,?)"
+        writer = WriteQueue(path)
+        original_writer, db_sqlite.writer = db_sqlite.writer, writer
+        try:
+            start = time.perf_counter()
+            for i in range(records):
+                writer.run(lambda conn: conn.execute(sql, (f"RB-{i}", 1, "BUYER", "JOIN", "benchmark")))
+            _report("commit per log", time.perf_counter() - start, records)
+
+            audit = AuditLogger(flush_size=200, flush_interval=1.0)
+            start = time.perf_counter()
+            for i in range(records):
+                audit.log(f"RB-{i}", 1, "BUYER", "JOIN", "benchmark")
+            _report("buffer (sisi pemanggil)", time.perf_counter() - start, records)
+            audit.flush()
+            _report("buffer (sampai flush)", time.perf_counter() - start, records)
+        finally:
+            db_sqlite.writer = original_writer
+            writer.close()
+
+        conn = sqlite3.connect(path)
+        total = conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+        conn.close()
+        print(f"{total:,} baris tersimpan (harus {2 * records:,})")
+
+
+def _legacy_check_rate_limit(conn, user_id: int, action: str, max_count: int = 5) -> bool:
+    """Implementasi lama check_rate_limit: DELETE + SELECT + INSERT/UPDATE per cek"""
+    conn.execute("DELETE FROM rate_limits WHERE reset_time < datetime('now')")
+    row = conn.execute("SELECT count FROM rate_limits WHERE user_id = ? AND action = ?", (user_id, action)).fetchone()
+    if not row:
+        conn.execute("INSERT INTO rate_limits (user_id, action, count, reset_time) "
+                     "VALUES (?, ?, 1, datetime('now', '+1 hour'))", (user_id, action))
+        conn.commit()
+        return True
+    if row[0] >= max_count:
+        return False
+    conn.execute("UPDATE rate_limits SET count = count + 1 WHERE user_id = ? AND action = ?", (user_id, action))
+    conn.commit()
+    return True
+
+
+def bench_rate_limit(checks: int = 200_000, users: int = 50_000):
+    """Biaya per cek: tabel rate_limits lama vs token bucket di memori"""
+    keys = [(random.randrange(users), random.choice(("join", "create", "release"))) for _ in range(checks)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE rate_limits (user_id INTEGER NOT NULL, action TEXT NOT NULL, count INTEGER DEFAULT 1, "
+                     "reset_time TIMESTAMP DEFAULT (datetime('now', '+1 hour')), PRIMARY KEY (user_id, action))")
+        legacy_checks = min(checks, 5_000)
+        start = time.perf_counter()
+        for user_id, action in keys[:legacy_checks]:
+            _legacy_check_rate_limit(conn, user_id, action)
+        _report("tabel rate_limits", time.perf_counter() - start, legacy_checks)
+        conn.close()
+
+    limiter = RateLimiter({"default": RatePolicy(5, 3600)}, max_entries=users)
+    start = time.perf_counter()
+    for user_id, action in keys:
+        limiter.check(user_id, action)
+    _report("token bucket", time.perf_counter() - start, checks)
+    print(f"{len(limiter):,} bucket di memori (maks {limiter.max_entries:,})")
+
+
+def _legacy_transition(conn, deal_id: str, source: str, target: str) -> bool:
+    """Pola lama handler: SELECT status, cek di Python, lalu UPDATE terpisah"""
+    row = conn.execute("SELECT status FROM deals WHERE id = ?", (deal_id,)).fetchone()
+    if row[0] != source:
+        return False
+    conn.execute("UPDATE deals SET status = ? WHERE id = ?", (target, deal_id))
+    conn.commit()
+    return True
+
+
+def bench_state_race(clicks: int = 500, threads: int = 16):
+    """Ratusan transisi paralel pada satu deal: tepat satu yang boleh berhasil"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "race.db")
+        migrations.migrate(path)
+        conn = sqlite3.connect(path)
+        conn.execute("INSERT INTO deals (id, title, amount, buyer_id, seller_id, status) "
+                     "VALUES ('RACE', 'race', 1000, 1, 2, 'WAITING_VERIFICATION')")
+        conn.commit()
+        conn.close()
+
+        def contend(fn):
+            barrier = threading.Barrier(threads)
+
+            def worker(n):
+                local = sqlite3.connect(path, timeout=30, isolation_level=None)
+                local.row_factory = sqlite3.Row
+                barrier.wait()
+                wins = sum(fn(local) for _ in range(n))
+                local.close()
+                return wins
+
+            per_thread = [clicks // threads + (i < clicks % threads) for i in range(threads)]
+            with ThreadPoolExecutor(threads) as pool:
+                return sum(pool.map(worker, per_thread))
+
+        # 1. Pola lama, tiap thread punya koneksi sendiri
+        legacy_wins = contend(lambda c: _legacy_transition(c, "RACE", "WAITING_VERIFICATION", "FUNDED"))
+        print(f"{'SELECT lalu UPDATE':<28} {legacy_wins:5d} dari {clicks} klik berhasil")
+
+        # 2. Compare-and-set lewat writer tunggal (jalur handler)
+        conn = sqlite3.connect(path)
+        conn.execute("UPDATE deals SET status = 'WAITING_VERIFICATION' WHERE id = 'RACE'")
+        conn.commit()
+        conn.close()
+
+        async def via_writer():
+            adb = AsyncDatabase(path, workers=2)
+            try:
+                results = await asyncio.gather(*(
+                    adb.transaction(lambda c, i=i: apply_transition(c, "RACE", "VERIFY_PAYMENT", i, "ADMIN"))
+                    for i in range(clicks)
+                ))
+            finally:
+                adb.shutdown()
+            return sum(row is not None for row in results)
+
+        writer_wins = asyncio.run(via_writer())
+        print(f"{'deal_state via writer':<28} {writer_wins:5d} dari {clicks} klik berhasil")
+
+        # 3. Compare-and-set dari banyak koneksi sekaligus (tanpa writer tunggal)
+        def cas(c):
+            c.execute("BEGIN IMMEDIATE")
+            row = apply_transition(c, "RACE", "MARK_SHIPPED", 2, "SELLER", guard=SELLER, guard_params=(2,))
+            c.execute("COMMIT")
+            return row is not None
+
+        cas_wins = contend(cas)
+        print(f"{'deal_state multi-koneksi':<28} {cas_wins:5d} dari {clicks} klik berhasil")
+
+        conn = sqlite3.connect(path)
+        logs = dict(conn.execute("SELECT action, COUNT(*) FROM logs WHERE deal_id = 'RACE' GROUP BY action").fetchall())
+        conn.close()
+        print(f"log: {logs}")
+        return {"legacy_wins": legacy_wins, "writer_wins": writer_wins, "cas_wins": cas_wins, "logs": logs}
+
+
+class _FakeBot:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+
+
+class _TimedDatabase(AsyncDatabase):
+    """AsyncDatabase yang mencatat lama setiap transaksi di thread writer"""
+
+    def __init__(self, path: str):
+        super().__init__(path, workers=2)
+        self.holds = []
+
+    async def transaction(self, fn, *args):
+        def timed(conn, *fn_args):
+            start = time.perf_counter()
+            try:
+                return fn(conn, *fn_args)
+            finally:
+                self.holds.append(time.perf_counter() - start)
+        return await super().transaction(timed, *args)
+
+
+def _probe_writes(path: str, stop: threading.Event, waits: list):
+    """Penulis lain (mis. handler) yang terus menulis selama sweep berjalan"""
+    conn = sqlite3.connect(path, timeout=600, isolation_level=None)
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT INTO logs (deal_id, actor_id, role, action) VALUES ('PROBE', 0, 'SYSTEM', 'PROBE')")
+        conn.execute("COMMIT")
+        waits.append(time.perf_counter() - start)
+        time.sleep(0.005)
+    conn.close()
+
+
+def _legacy_sweep(path: str, cutoff) -> float:
+    """Pola lama: SELECT semua deal kadaluarsa lalu UPDATE satu per satu dalam satu transaksi"""
+    conn = sqlite3.connect(path, timeout=600)
+    start = time.perf_counter()
+    expired = conn.execute(
+        "SELECT id, buyer_id, seller_id, title FROM deals WHERE status IN ('PENDING_JOIN', 'PENDING_FUNDING') "
+        "AND created_at < ?", (cutoff,)
+    ).fetchall()
+    for deal_id, _, _, _ in expired:
+        conn.execute("UPDATE deals SET status = 'CANCELLED', updated_at = ? WHERE id = ?",
+                     (datetime.now(), deal_id))
+        # (di kode lama dua send_message di-await di sini, lock tetap dipegang)
+    conn.commit()
+    hold = time.perf_counter() - start
+    conn.close()
+    return hold
+
+
+def _with_probe(path: str, fn):
+    stop, waits = threading.Event(), []
+    probe = threading.Thread(target=_probe_writes, args=(path, stop, waits))
+    probe.start()
+    try:
+        result = fn()
+    finally:
+        stop.set()
+        probe.join()
+    return result, max(waits) if waits else 0.0
+
+
+def bench_sweep(deals: int = 100_000, send_ms: int = 1):
+    """Auto-cancel `deals` deal kadaluarsa: lama lock tulis dan waktu tunggu penulis lain"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sweep.db")
+        migrations.migrate(path)
+        old = datetime.now() - timedelta(days=2)
+        fresh = 1000
+
+        def reset():
+            conn = sqlite3.connect(path)
+            conn.execute("DELETE FROM deals")
+            conn.execute("DELETE FROM logs")
+            # Separuh belum ada penjual (PENDING_JOIN), separuh menunggu transfer (PENDING_FUNDING)
+            conn.executemany(
+                "INSERT INTO deals (id, title, amount, buyer_id, seller_id, status, created_at, expires_at) "
+                "VALUES (?, 'sweep', 1000, ?, ?, ?, ?, ?)",
+                ((f"D{i:07d}", i + 1, *((i + 2, "PENDING_FUNDING") if i % 2 else (None, "PENDING_JOIN")),
+                  *((old, old + timedelta(hours=24))
+                    if i < deals else (datetime.now(), datetime.now() + timedelta(hours=24))))
+                 for i in range(deals + fresh))
+            )
+            conn.commit()
+            conn.close()
+
+        reset()
+        cutoff = datetime.now() - timedelta(hours=24)
+        legacy_hold, legacy_wait = _with_probe(path, lambda: _legacy_sweep(path, cutoff))
+        print(f"{'SELECT + UPDATE per deal':<26} lock {legacy_hold * 1000:9.1f} ms (satu transaksi), "
+              f"penulis lain menunggu maks {legacy_wait * 1000:8.1f} ms (tanpa latensi Telegram)")
+
+        reset()
+        bot = _FakeBot(send_ms / 1000)
+
+        async def run_sweep():
+            adb = _TimedDatabase(path)
+            manager = NotificationManager(bot, sender=bot)
+            manager.db = adb
+            try:
+                start = time.perf_counter()
+                swept = await manager.auto_cancel_unpaid_deals()
+                return swept, time.perf_counter() - start, adb.holds
+            finally:
+                adb.shutdown()
+
+        (swept, elapsed, holds), wait = _with_probe(path, lambda: asyncio.run(run_sweep()))
+        holds.sort()
+        print(f"{'UPDATE ... RETURNING/batch':<26} lock maks {holds[-1] * 1000:6.1f} ms, "
+              f"median {holds[len(holds) // 2] * 1000:5.1f} ms ({len(holds)} batch), "
+              f"penulis lain menunggu maks {wait * 1000:8.1f} ms")
+        print(f"{'':<26} {swept} deal, {bot.sent} notifikasi ({send_ms} ms/pesan) dalam {elapsed:.1f} s")
+
+        conn = sqlite3.connect(path)
+        cancelled = conn.execute("SELECT COUNT(*) FROM deals WHERE status = 'CANCELLED'").fetchone()[0]
+        logged = conn.execute("SELECT COUNT(*) FROM logs WHERE action = 'AUTO_CANCEL'").fetchone()[0]
+        untouched = conn.execute(
+            "SELECT COUNT(*) FROM deals WHERE status IN ('PENDING_JOIN', 'PENDING_FUNDING')"
+        ).fetchone()[0]
+        conn.close()
+        return {"swept": swept, "cancelled": cancelled, "logged": logged, "untouched": untouched, "fresh": fresh,
+                "sent": bot.sent, "max_hold": holds[-1], "legacy_hold": legacy_hold}
+
+
+def bench_scheduler(jobs: int = 1_000_000, near: int = 500):
+    """Scheduler dengan `jobs` job terjadwal: memori terbatas, akurasi firing, catch-up"""
+    overdue, stale, max_loaded, horizon = 5000, 500, 1000, 2.0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sched.db")
+        migrations.migrate(path)
+        now = time.time()
+        conn = sqlite3.connect(path)
+        conn.execute("INSERT INTO deals (id, title, amount, buyer_id, status) VALUES ('SCHED', 's', 1, 1, 'PENDING_FUNDING')")
+        start = time.perf_counter()
+        conn.executemany(
+            "INSERT INTO scheduled_jobs (kind, key, due_at, created_at) VALUES ('far', ?, ?, ?)",
+            ((f"far:{i}", now + 3600 + random.random() * 30 * 86400, now) for i in range(jobs))
+        )
+        # Terlewat saat bot mati: sebagian masih layak dijalankan, sebagian sudah basi
+        conn.executemany(
+            "INSERT INTO scheduled_jobs (kind, key, due_at, created_at) VALUES ('overdue', ?, ?, ?)",
+            ((f"overdue:{i}", now - random.random() * 3600, now) for i in range(overdue))
+        )
+        conn.executemany(
+            "INSERT INTO scheduled_jobs (kind, key, due_at, created_at) VALUES ('overdue', ?, ?, ?)",
+            ((f"stale:{i}", now - 2 * 86400, now) for i in range(stale))
+        )
+        # Separuh job dekat ditulis transaksi lain sebelum start (dimuat lewat refill)
+        now = time.time()
+        for i in range(near // 2):
+            add_job(conn, "near", now + horizon + 1 + random.random() * 5, key=f"near:db:{i}")
+        dedup = [add_job(conn, "near", now + 1, key="dup") for _ in range(2)]
+        add_job(conn, "cancelled", now + 1, key="cancel", deal_id="SCHED", deal_status="PENDING_FUNDING")
+        conn.execute("UPDATE deals SET status = 'CANCELLED' WHERE id = 'SCHED'")
+        conn.commit()
+        print(f"{jobs + overdue + stale + near // 2:,} job disimpan dalam {time.perf_counter() - start:.1f} s")
+        conn.close()
+
+        lateness, counts = [], {}
+
+        async def run():
+            adb = AsyncDatabase(path, workers=2)
+            sched = Scheduler(adb, horizon=horizon, max_loaded=max_loaded, max_lateness=6 * 3600)
+
+            async def handler(job):
+                counts[job['kind']] = counts.get(job['kind'], 0) + 1
+                if job['kind'] == "near":
+                    lateness.append(time.time() - job['due_at'])
+
+            for kind in ("far", "overdue", "near", "cancelled"):
+                sched.register(kind, handler)
+            started = time.perf_counter()
+            loop_task = asyncio.create_task(sched.run())
+            peak, caught_up = 0, None
+            # Separuh lagi dijadwalkan saat berjalan (langsung masuk heap)
+            for i in range(near - near // 2):
+                await sched.schedule("near", time.time() + 0.5 + random.random() * 5, key=f"near:live:{i}")
+            deadline = time.time() + 30
+            # Job "dup" juga berjenis near: near + 1 job dekat
+            while time.time() < deadline and (counts.get("near", 0) < near + 1 or counts.get("overdue", 0) < overdue):
+                peak = max(peak, len(sched))
+                if caught_up is None and counts.get("overdue", 0) == overdue:
+                    caught_up = time.perf_counter() - started
+                await asyncio.sleep(0.01)
+            sched.stop()
+            await loop_task
+            adb.shutdown()
+            return sched, peak, caught_up
+
+        sched, peak, caught_up = asyncio.run(run())
+        lateness.sort()
+        p50, p99 = lateness[len(lateness) // 2], lateness[int(len(lateness) * 0.99)]
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"catch-up: {counts.get('overdue', 0)}/{overdue} dijalankan, {sched.skipped} basi dilewati "
+              f"(dalam {caught_up or 0:.2f} s)")
+        print(f"akurasi {len(lateness)} job dekat: p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, "
+              f"maks {lateness[-1] * 1000:.1f} ms")
+        print(f"heap maks {peak} job (batas {max_loaded}), RSS maks {rss_mb:.0f} MB, "
+              f"dedup {dedup}, job deal yang berubah status dijalankan: {counts.get('cancelled', 0)}")
+        return {"counts": counts, "overdue": overdue, "skipped": sched.skipped, "stale": stale, "lateness": lateness,
+                "peak": peak, "max_loaded": max_loaded, "dedup": dedup}
+
+
+class _RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        self.sent.append((chat_id, time.time()))
+
+
+def bench_deadline(near: int = 1000, far: int = 100_000):
+    """Sweeper expires_at: ketepatan waktu, bangun lebih awal saat deadline berubah, tanpa scan idle"""
+    moved = 50
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "deadline.db")
+        migrations.migrate(path)
+        conn = sqlite3.connect(path)
+        conn.executemany(
+            "INSERT INTO deals (id, title, amount, buyer_id, status, expires_at) VALUES (?, 'f', 1, ?, 'PENDING_JOIN', ?)",
+            ((f"F{i}", near + i, datetime.now() + timedelta(days=1)) for i in range(far))
+        )
+        conn.executemany(
+            "INSERT INTO deals (id, title, amount, buyer_id, seller_id, status) VALUES (?, 'm', 1, ?, ?, 'FUNDED')",
+            ((f"M{i}", -1 - i, -1 - moved - i) for i in range(moved))
+        )
+        start = datetime.now()
+        # buyer_id unik per deal supaya notifikasi bisa dicocokkan dengan deadline-nya
+        deadlines = {i: start + timedelta(seconds=1 + random.random() * 3) for i in range(near)}
+        conn.executemany(
+            "INSERT INTO deals (id, title, amount, buyer_id, status, expires_at) VALUES (?, 'n', 1, ?, 'PENDING_JOIN', ?)",
+            ((f"N{i}", i, expires_at) for i, expires_at in deadlines.items())
+        )
+        conn.commit()
+        conn.close()
+
+        # Deadline AWAITING_CONFIRM dipersingkat: MARK_SHIPPED memindahkan deadline saat sweeper tidur
+        awaiting_confirm = deal_state.DEADLINES["AWAITING_CONFIRM"]
+        deal_state.DEADLINES["AWAITING_CONFIRM"] = (timedelta(seconds=1.5), awaiting_confirm[1])
+        bot = _RecordingBot()
+
+        async def run():
+            adb = AsyncDatabase(path, workers=2)
+            manager = NotificationManager(bot, sender=bot)
+            manager.db = adb
+            task = asyncio.create_task(manager.start_background_tasks())
+            while len(bot.sent) < near and datetime.now() < start + timedelta(seconds=15):
+                await asyncio.sleep(0.05)
+            # Tunggu sampai sweeper tidur menuju deadline deal jauh (besok), baru hitung siklus idle
+            while (manager.sleeping_until is None or manager.sleeping_until < datetime.now() + timedelta(hours=1)) \
+                    and datetime.now() < start + timedelta(seconds=20):
+                await asyncio.sleep(0.01)
+            sweeps_near = manager.sweeps
+            await asyncio.sleep(0.5)
+            idle_sweeps = manager.sweeps - sweeps_near
+            moved_deadlines = {}
+            for i in range(moved):
+                row = await adb.transaction(lambda c, i=i: deal_state.apply_transition(
+                    c, f"M{i}", "MARK_SHIPPED", 0, "SYSTEM", returning="buyer_id, expires_at"))
+                moved_deadlines[row['buyer_id']] = datetime.fromisoformat(str(row['expires_at'])).timestamp()
+            limit = time.time() + 10
+            while len(bot.sent) < near + 2 * moved and time.time() < limit:
+                await asyncio.sleep(0.05)
+            task.cancel()
+            adb.shutdown()
+            return sweeps_near, idle_sweeps, moved_deadlines
+
+        try:
+            sweeps_near, idle_sweeps, moved_deadlines = asyncio.run(run())
+        finally:
+            deal_state.DEADLINES["AWAITING_CONFIRM"] = awaiting_confirm
+        near_late = sorted(sent - deadlines[chat].timestamp() for chat, sent in bot.sent if chat in deadlines)
+        moved_late = sorted(sent - moved_deadlines[chat] for chat, sent in bot.sent if chat in moved_deadlines)
+
+        def summary(values):
+            if not values:
+                return "-"
+            return (f"p50 {values[len(values) // 2] * 1000:.0f} ms, p99 {values[int(len(values) * 0.99)] * 1000:.0f} ms, "
+                    f"maks {values[-1] * 1000:.0f} ms")
+
+        print(f"{len(near_late)}/{near} deal kadaluarsa dibatalkan, keterlambatan {summary(near_late)} "
+              f"({sweeps_near} siklus sweep, {far:,} deal lain tidak tersentuh)")
+        print(f"{len(moved_late)}/{moved} deadline yang dipindah transisi, keterlambatan {summary(moved_late)}")
+        print(f"siklus sweep saat idle 0.5 s: {idle_sweeps}")
+
+        conn = sqlite3.connect(path)
+        untouched = conn.execute("SELECT COUNT(*) FROM deals WHERE id LIKE 'F%' AND status = 'PENDING_JOIN'").fetchone()[0]
+        conn.close()
+        return {"near_late": near_late, "moved_late": moved_late, "moved": moved, "untouched": untouched,
+                "idle_sweeps": idle_sweeps}
+
+
+class _FakeBotApi:
+    """Bot API palsu (HTTP/1.1 keep-alive) yang menegakkan limit Telegram secara ketat.
+
+    Limit: 30 pesan per jendela 1 detik, 1 pesan/detik per chat pribadi,
+    20 pesan per 60 detik per grup. Pelanggaran dibalas 429 dengan
+    parameters.retry_after, persis seperti Telegram.
+    """
+
+    def __init__(self, latency=(0.02, 0.04)):
+        self.latency = latency
+        self.window = deque()
+        self.last_private = {}
+        self.group_window = defaultdict(deque)
+        self.sent = []
+        self.rejected = 0
+        self.webhooks = []
+
+    def _retry_after(self, chat_id, now: float):
+        while self.window and now - self.window[0] >= 1:
+            self.window.popleft()
+        if len(self.window) >= 30:
+            return 1
+        if is_group(chat_id):
+            window = self.group_window[chat_id]
+            while window and now - window[0] >= 60:
+                window.popleft()
+            if len(window) >= 20:
+                return int(60 - (now - window[0])) + 1
+            window.append(now)
+        else:
+            last = self.last_private.get(chat_id)
+            if last is not None and now - last < 1:
+                return 1
+            self.last_private[chat_id] = now
+        self.window.append(now)
+        return None
+
+    def _call(self, method: str, params: dict, now: float):
+        if method == "getMe":
+            return 200, {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        if method in ("setWebhook", "deleteWebhook"):
+            self.webhooks.append((method, params))
+            return 200, True
+        chat_id = int(params["chat_id"])
+        retry_after = self._retry_after(chat_id, now)
+        if retry_after is not None:
+            self.rejected += 1
+            return 429, {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}",
+                         "parameters": {"retry_after": retry_after}}
+        self.sent.append((chat_id, params.get("text"), now))
+        return 200, {"message_id": len(self.sent), "date": int(time.time()), "text": params.get("text"),
+                     "chat": {"id": chat_id, "type": "group" if chat_id < 0 else "private"}}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                now = time.monotonic()
+                if "json" in headers.get("content-type", ""):
+                    params = json.loads(body or b"{}")
+                else:
+                    params = dict(parse_qsl(body.decode()))
+                status, result = self._call(request_line.split()[1].decode().rsplit("/", 1)[-1], params, now)
+                if status == 200:
+                    result = {"ok": True, "result": result}
+                await asyncio.sleep(random.uniform(*self.latency))
+                payload = json.dumps(result).encode()
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Too Many Requests'}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode()
+                             + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def bench_dispatch(messages: int = 600, groups: int = 3):
+    """Beban puncak lewat Dispatcher ke Bot API palsu: nol 429, prioritas, coalescing, antrean terbatas"""
+    bursts, burst_size, per_group = 20, 5, 6
+    api = _FakeBotApi()
+    results = {lane: [] for lane in LANES}
+
+    async def run():
+        server = await asyncio.start_server(api.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        bot = Bot("123:FAKE", base_url=f"http://127.0.0.1:{port}/bot",
+                  request=HTTPXRequest(connection_pool_size=64))
+        await bot.initialize()
+        dispatcher = Dispatcher(max_queue=messages // 3)
+        dispatcher.start(bot)
+
+        async def send(chat_id, text, priority):
+            start = time.monotonic()
+            await dispatcher.send_message(chat_id, text, priority=priority)
+            results[LANES[priority]].append(time.monotonic() - start)
+
+        # Reminder dan broadcast massal masuk sekaligus (lebih banyak dari batas antrean)
+        bulk = [send(100_000 + i, f"reminder {i}", REMINDER) for i in range(messages // 3)]
+        bulk += [send(200_000 + i, f"broadcast {i}", BROADCAST) for i in range(messages // 3)]
+        bulk += [send(-1000 - g, f"grup {g} #{n}", BROADCAST) for g in range(groups) for n in range(per_group)]
+        bulk_task = asyncio.gather(*bulk)
+        # Balasan interaktif datang terus selama antrean massal diproses
+        interactive = []
+        for i in range(messages // 3):
+            if i < bursts:
+                interactive += [asyncio.create_task(send(i, f"burst {i} #{n}", INTERACTIVE)) for n in range(burst_size)]
+            else:
+                interactive.append(asyncio.create_task(send(i, f"balas {i}", INTERACTIVE)))
+            # ~20/detik: sisa kapasitas global untuk antrean massal
+            await asyncio.sleep(0.05)
+        await asyncio.gather(bulk_task, *interactive)
+        stats = dispatcher.stats()
+        await dispatcher.close()
+        await bot.shutdown()
+        server.close()
+        return stats
+
+    start = time.monotonic()
+    stats = asyncio.run(run())
+    elapsed = time.monotonic() - start
+    times = sorted(sent_at for _, _, sent_at in api.sent)
+    peak = max(sum(1 for t in times[i:] if t - times[i] < 1) for i in range(len(times))) if times else 0
+
+    print(f"{sum(len(v) for v in results.values())} pesan dalam {elapsed:.1f} s -> {len(api.sent)} request sendMessage, "
+          f"{len(api.sent) / elapsed:.1f}/s, puncak {peak} per detik")
+    print(f"429 dari Bot API palsu: {api.rejected}, RetryAfter di dispatcher: {stats['retry_after']}, "
+          f"error: {stats['errors']}")
+    print(f"digabung (coalesce): {stats['coalesced']}, pengirim menunggu antrean penuh: {stats['queue_full']}")
+    for lane, values in results.items():
+        values.sort()
+        if values:
+            print(f"  {lane:<12} {len(values):>5} pesan, latensi p50 {values[len(values) // 2] * 1000:.0f} ms, "
+                  f"p99 {values[int(len(values) * 0.99)] * 1000:.0f} ms, maks {values[-1] * 1000:.0f} ms")
+
+    # Urutan pesan beruntun ke satu chat harus tetap terjaga
+    ordered = all(
+        [text for chat_id, text, _ in api.sent if chat_id == i] ==
+        sorted([text for chat_id, text, _ in api.sent if chat_id == i], key=lambda t: t.split("#")[1])
+        for i in range(bursts)
+    ) and all(
+        "\n\n".join(text for chat_id, text, _ in api.sent if chat_id == i).split("\n\n")
+        == [f"burst {i} #{n}" for n in range(burst_size)]
+        for i in range(bursts)
+    )
+    return {"rejected": api.rejected, "stats": stats, "ordered": ordered, "latency": results}
+
+
+class _FlakySender:
+    """Pengganti dispatcher: gagal acak (NetworkError) dan menolak chat yang memblokir bot (Forbidden)"""
+
+    def __init__(self, fail_rate: float, blocked: set):
+        self.fail_rate = fail_rate
+        self.blocked = blocked
+        self.sent = []
+
+    async def send_message(self, chat_id, text, priority=None, **kwargs):
+        await asyncio.sleep(0.002)
+        if chat_id in self.blocked:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        if random.random() < self.fail_rate:
+            raise NetworkError("Timed out")
+        self.sent.append((chat_id, text))
+
+
+def bench_outbox(deals: int = 2000, fail_pct: int = 30):
+    """Outbox: notifikasi tidak hilang walau relay mati di tengah jalan dan Telegram gagal acak"""
+    blocked = 20
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "outbox.db")
+        migrations.migrate(path)
+        conn = sqlite3.connect(path)
+        conn.executemany(
+            "INSERT INTO deals (id, title, amount, buyer_id, seller_id, status) VALUES (?, 'o', 1, ?, ?, 'AWAITING_CONFIRM')",
+            ((f"O{i}", i + 1, deals + i + 1) for i in range(deals))
+        )
+        conn.commit()
+        conn.close()
+
+        # Penjual dari `blocked` deal pertama memblokir bot
+        sender = _FlakySender(fail_pct / 100, {deals + i + 1 for i in range(blocked)})
+        expected = {(i + 1, f"buyer {i}") for i in range(deals)} | {(deals + i + 1, f"seller {i}") for i in range(blocked, deals)}
+
+        def relay(database):
+            profiles = ProfileCache(database=database, tracker=ActivityTracker(database))
+            # Dengan gagal acak 30%, batas percobaan bawaan (8) sesekali membuat pesan sehat jadi dead letter
+            return OutboxRelay(database=database, sender=sender, profiles=profiles, max_attempts=30,
+                               retry_base=0.05, retry_max=0.5, lease=1.0, poll=0.2)
+
+        async def run():
+            adb = AsyncDatabase(path, workers=2)
+            start = time.perf_counter()
+            await asyncio.gather(*(adb.transaction(lambda c, i=i: apply_transition(
+                c, f"O{i}", "RELEASE", i + 1, "BUYER", returning="buyer_id, seller_id",
+                notify=lambda row: [Notification(row['buyer_id'], f"buyer {i}"),
+                                    Notification(row['seller_id'], f"seller {i}")]
+            )) for i in range(deals)))
+            commit_time = time.perf_counter() - start
+
+            # Relay pertama "crash" di tengah pengiriman, meninggalkan baris yang sudah di-lease
+            first = relay(adb)
+            task = asyncio.create_task(first.run())
+            while first.delivered < deals:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            leased = (await adb.fetchone("SELECT COUNT(*) FROM outbox WHERE dead_at IS NULL AND next_attempt_at > ?",
+                                         (time.time(),)))[0]
+
+            second = relay(adb)
+            start = time.perf_counter()
+            task = asyncio.create_task(second.run())
+            while time.perf_counter() - start < 60:
+                if (await adb.run(outbox_counts))['pending'] == 0:
+                    break
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - start
+            task.cancel()
+            totals = await adb.run(outbox_counts)
+            adb.shutdown()
+            return commit_time, first.delivered, leased, second.stats(), elapsed, totals
+
+        commit_time, first_delivered, leased, stats, elapsed, totals = asyncio.run(run())
+        delivered = set(sender.sent)
+        lost = expected - delivered
+        duplicates = len(sender.sent) - len(delivered)
+
+        print(f"{deals} transisi + {2 * deals} notifikasi di transaksi yang sama dalam {commit_time:.2f} s")
+        print(f"relay pertama mati setelah {first_delivered} terkirim ({leased} baris masih ter-lease/menunggu retry); "
+              f"relay kedua: {stats['delivered']} terkirim "
+              f"dalam {elapsed:.2f} s ({stats['delivered'] / elapsed:.0f}/s), {stats['retried']} retry, "
+              f"{stats['dead']} dead letter")
+        print(f"latensi commit -> terkirim p50 {stats['latency_p50'] * 1000:.0f} ms, p99 {stats['latency_p99'] * 1000:.0f} ms")
+        print(f"hilang: {len(lost)}, terkirim ganda: {duplicates}, tertunda: {totals['pending']}, dead letter: {totals['dead']}")
+        return {"lost": lost, "duplicates": duplicates, "pending": totals['pending'], "dead": totals['dead'],
+                "blocked": blocked}
+
+
+class _ProfileBot:
+    """Bot palsu: get_chat lambat dan menghitung panggilan; chat di `blocked` memblokir bot"""
+
+    def __init__(self, blocked: set, latency: float = 0.02):
+        self.blocked = blocked
+        self.latency = latency
+        self.calls = 0
+
+    async def get_chat(self, chat_id):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if chat_id in self.blocked:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        return Chat(chat_id, Chat.PRIVATE, username=f"user{chat_id}", first_name=f"User {chat_id}")
+
+
+def bench_profile(users: int = 5000, lookups: int = 100_000):
+    """Cache profil: hit rate, single-flight get_chat, refresh TTL, dan persistensi di tabel users"""
+    blocked = set(range(2, users + 1, 50))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "profile.db")
+        migrations.migrate(path)
+        bot = _ProfileBot(blocked)
+
+        async def run():
+            adb = AsyncDatabase(path, workers=2)
+            tracker = ActivityTracker(adb)
+            cache = ProfileCache(database=adb, ttl=3600, tracker=tracker)
+            # Separuh user pernah mengirim update ke bot (diisi pasif)
+            for user_id in range(1, users + 1, 2):
+                cache.observe(User(user_id, f"User {user_id}", False, username=f"user{user_id}"), private_chat=True)
+
+            # Lookup terdistribusi miring: sebagian kecil user paling sering dicari
+            start = time.perf_counter()
+            for _ in range(lookups):
+                user_id = min(users, int(random.paretovariate(1.2)))
+                await cache.display_name(user_id, bot)
+            elapsed = time.perf_counter() - start
+            hot_calls = bot.calls
+
+            # 200 lookup bersamaan untuk satu user baru -> satu get_chat
+            bot.calls = 0
+            names = await asyncio.gather(*(cache.display_name(users + 1, bot) for _ in range(200)))
+            single_flight = bot.calls
+
+            # Profil kadaluarsa di-refresh sekali, lalu kembali dari cache
+            cache.ttl = 0.05
+            await asyncio.sleep(0.1)
+            bot.calls = 0
+            await asyncio.gather(*(cache.get(users + 1, bot) for _ in range(50)))
+            await cache.get(users + 1, bot)
+            cache.ttl = 3600
+            refreshed = bot.calls
+            reachable = [await cache.is_reachable(user_id, bot) for user_id in sorted(blocked)[:10]]
+
+            # Cache baru (mis. setelah restart) membaca profil dari tabel users tanpa get_chat
+            await tracker.flush()
+            bot.calls = 0
+            fresh = ProfileCache(database=adb, ttl=3600, tracker=tracker)
+            for user_id in range(1, users + 1, 2):
+                await fresh.get(user_id, bot)
+            restart_calls = bot.calls
+            stored = (await adb.fetchone("SELECT COUNT(*) FROM users WHERE profile_updated_at IS NOT NULL"))[0]
+            adb.shutdown()
+            return (elapsed, hot_calls, cache.hits, cache.lookups, single_flight, set(names), refreshed,
+                    reachable, restart_calls, stored)
+
+        (elapsed, hot_calls, hits, total, single_flight, names, refreshed,
+         reachable, restart_calls, stored) = asyncio.run(run())
+        print(f"{lookups} lookup nama dalam {elapsed:.2f} s ({elapsed / lookups * 1e6:.1f} us/lookup), "
+              f"{hot_calls} get_chat, hit rate {hits / total:.1%}")
+        print(f"200 lookup bersamaan user baru: {single_flight} get_chat, hasil {sorted(names)}")
+        print(f"refresh setelah TTL (51 lookup): {refreshed} get_chat; 10 user yang memblokir bot terjangkau: {sum(reachable)}")
+        print(f"setelah restart: {restart_calls} get_chat untuk {len(range(1, users + 1, 2))} profil; {stored} profil di tabel users")
+        return {"single_flight": single_flight, "names": names, "refreshed": refreshed, "reachable": reachable,
+                "restart_calls": restart_calls, "stored": stored}
+
+
+def _recorded_update(update_id: int) -> dict:
+    """Update rekaman (format Bot API): /start, teks, foto bukti transfer, atau tombol inline"""
+    user = {"id": 1000 + update_id % 500, "is_bot": False, "first_name": "Budi", "username": f"budi{update_id % 500}"}
+    message = {"message_id": update_id, "date": int(time.time()), "from": user,
+               "chat": {"id": user["id"], "type": "private", "first_name": "Budi"}}
+    kind = update_id % 4
+    if kind == 0:
+        message.update(text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])
+    elif kind == 1:
+        message.update(text="Jual akun game level 80")
+    elif kind == 2:
+        message.update(photo=[{"file_id": f"AgAC{update_id}", "file_unique_id": f"u{update_id}",
+                               "width": 1280, "height": 720}])
+    else:
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": "1", "message": message,
+            "data": f"rekber_status|RB-{update_id:08d}"}}
+    return {"update_id": update_id, "message": message}
+
+
+def bench_webhook(updates: int = 4000, connections: int = 20):
+    """Mode webhook: POST update rekaman ke server lokal, ukur latensi sampai handler berjalan"""
+    import httpx
+
+    api = _FakeBotApi()
+    handled = {}
+
+    async def record(update, context):
+        handled[update.update_id] = time.perf_counter()
+
+    async def run():
+        api_server = await asyncio.start_server(api.handle, "127.0.0.1", 0)
+        api_port = api_server.sockets[0].getsockname()[1]
+        app = Application.builder().token("123:FAKE").base_url(f"http://127.0.0.1:{api_port}/bot").build()
+        app.add_handler(CommandHandler("start", record))
+        app.add_handler(MessageHandler(filters.PHOTO, record))
+        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, record))
+        app.add_handler(CallbackQueryHandler(record, pattern="^rekber_status\\|"))
+
+        server = WebhookServer(app, secret="rahasia", listen="127.0.0.1", port=0)
+        stop = asyncio.Event()
+        task = asyncio.create_task(serve_webhook(app, "https://rekber.example.com", server=server, stop=stop))
+        while not app.running:
+            await asyncio.sleep(0.01)
+        base = f"http://127.0.0.1:{server.port}"
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "rahasia"}
+
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=connections)) as client:
+            checks = {
+                "secret salah": (await client.post(base + server.path, json=_recorded_update(0),
+                                                   headers={"X-Telegram-Bot-Api-Secret-Token": "x"})).status_code,
+                "tanpa secret": (await client.post(base + server.path, json=_recorded_update(0))).status_code,
+                "JSON rusak": (await client.post(base + server.path, content=b"{", headers=headers)).status_code,
+                "path lain": (await client.post(base + "/lain", json=_recorded_update(0), headers=headers)).status_code,
+            }
+
+            sent_at = {}
+            slots = asyncio.Semaphore(connections)
+
+            async def post(update_id):
+                async with slots:
+                    sent_at[update_id] = time.perf_counter()
+                    response = await client.post(base + server.path, json=_recorded_update(update_id), headers=headers)
+                    return response.status_code
+
+            start = time.perf_counter()
+            statuses = await asyncio.gather(*(post(i) for i in range(1, updates + 1)))
+            while len(handled) < updates and time.perf_counter() - start < 30:
+                await asyncio.sleep(0.005)
+            elapsed = time.perf_counter() - start
+            health = (await client.get(base + "/health")).json()
+
+        stop.set()
+        await task
+        api_server.close()
+        return checks, statuses, sent_at, elapsed, health
+
+    checks, statuses, sent_at, elapsed, health = asyncio.run(run())
+    latency = sorted(handled[i] - sent_at[i] for i in handled if i in sent_at)
+    registered = [params for method, params in api.webhooks if method == "setWebhook"]
+
+    print(f"{len(handled)}/{updates} update sampai ke handler dalam {elapsed:.2f} s ({len(handled) / elapsed:.0f}/s, "
+          f"{connections} koneksi)")
+    if latency:
+        print(f"latensi POST -> handler: p50 {latency[len(latency) // 2] * 1000:.1f} ms, "
+              f"p99 {latency[int(len(latency) * 0.99)] * 1000:.1f} ms, maks {latency[-1] * 1000:.1f} ms")
+    print("penolakan: " + ", ".join(f"{name} {status}" for name, status in checks.items()))
+    print(f"health: {health}")
+    print(f"setWebhook: {registered}")
+    return {"handled": handled, "statuses": statuses, "checks": checks, "health": health, "registered": registered}
+
+
+# Urutan klik per deal: penjual kirim barang, pembeli konfirmasi, penjual isi data pencairan
+_DEAL_FLOW = (("rekber_mark_shipped", "MARK_SHIPPED", "SELLER"), ("rekber_release", "RELEASE", "BUYER"),
+              ("payout_start", "SUBMIT_PAYOUT", "SELLER"))
+
+
+def bench_updates(deals: int = 200, latency_ms: int = 10):
+    """Update paralel dengan lock per deal/user: throughput per tingkat konkurensi, transisi tetap benar"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "updates.db")
+        migrations.migrate(path)
+        api = _FakeBotApi(latency=(0, 0))
+
+        def reset(conn):
+            conn.execute("DELETE FROM deals")
+            conn.executemany(
+                "INSERT INTO deals (id, title, amount, buyer_id, seller_id, status) VALUES (?, 'u', 1, ?, ?, 'FUNDED')",
+                ((f"RB-{i:06d}", 1000 + i, 5000 + i) for i in range(deals))
+            )
+
+        def callback_update(update_id: int, deal: int, step: int) -> Update:
+            prefix, _, role = _DEAL_FLOW[step]
+            user_id = (1000 if role == "BUYER" else 5000) + deal
+            user = {"id": user_id, "is_bot": False, "first_name": "U"}
+            return Update.de_json({"update_id": update_id, "callback_query": {
+                "id": str(update_id), "from": user, "chat_instance": "1",
+                "data": f"{prefix}|RB-{deal:06d}"}}, None)
+
+        async def run_level(adb, port, concurrency: int, ordered: bool):
+            await adb.transaction(reset)
+            failed = []
+
+            async def handle(update, context):
+                prefix, deal_id = update.callback_query.data.split("|")
+                event, role = next((e, r) for p, e, r in _DEAL_FLOW if p == prefix)
+                # Handler nyata menunggu Telegram (answer/edit) sebelum dan sesudah menulis
+                await asyncio.sleep(random.uniform(0.5, 1.5) * latency_ms / 1000)
+                row = await adb.transaction(lambda c: apply_transition(
+                    c, deal_id, event, update.effective_user.id, role, returning="id"))
+                if row is None:
+                    failed.append((deal_id, event))
+                await asyncio.sleep(random.uniform(0.5, 1.5) * latency_ms / 1000)
+
+            builder = Application.builder().token("123:FAKE").base_url(f"http://127.0.0.1:{port}/bot")
+            if ordered:
+                builder = builder.concurrent_updates(1024).application_class(OrderedApplication, {"concurrency": concurrency})
+            else:
+                builder = builder.concurrent_updates(concurrency)
+            app = builder.build()
+            app.add_handler(CallbackQueryHandler(handle))
+            await app.initialize()
+            await app.start()
+            # Ketiga klik satu deal masuk beruntun (penjual/pembeli merespons cepat)
+            update_id = 0
+            start = time.perf_counter()
+            for deal in range(deals):
+                for step in range(len(_DEAL_FLOW)):
+                    update_id += 1
+                    await app.update_queue.put(callback_update(update_id, deal, step))
+            await app.update_queue.join()
+            elapsed = time.perf_counter() - start
+            peak = app.update_locks.peak if ordered else 0
+            locks_left = len(app.update_locks) if ordered else 0
+            await app.stop()
+            await app.shutdown()
+            done = (await adb.fetchone("SELECT COUNT(*) FROM deals WHERE status = 'AWAITING_PAYOUT'"))[0]
+            return update_id / elapsed, len(failed), done, peak, locks_left
+
+        async def run():
+            server = await asyncio.start_server(api.handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            adb = AsyncDatabase(path, workers=2)
+            results = []
+            for concurrency in (1, 4, 16, 64):
+                results.append(("berurutan per deal", concurrency, *await run_level(adb, port, concurrency, True)))
+            results.append(("tanpa lock", 64, *await run_level(adb, port, 64, False)))
+            adb.shutdown()
+            server.close()
+            return results
+
+        results = asyncio.run(run())
+        total = deals * len(_DEAL_FLOW)
+        print(f"{deals} deal x {len(_DEAL_FLOW)} klik ({total} update), latensi Telegram ~{2 * latency_ms} ms per update")
+        for mode, concurrency, rate, failed, done, peak, locks_left in results:
+            print(f"  {mode:<20} konkurensi {concurrency:>3}: {rate:7.0f} update/s, transisi gagal {failed:4d}, "
+                  f"deal selesai {done}/{deals}, lock maks {peak}, lock tersisa {locks_left}")
+        return results
+
+
+# Rantai CallbackQueryHandler main.py sebelum router (urutan sama): (pattern, nama handler)
+_LEGACY_CALLBACKS = [
+    ("^admin_release_execute\\|", "admin_release_execute"),
+    ("^rekber_create_role$", "rekber_create_role"),
+    ("^rekber_join\\|", "rekber_join"),
+    ("^rekber_join_confirm\\|", "rekber_join_confirm"),
+    ("^rekber_status\\|", "rekber_status"),
+    ("^rekber_mark_shipped\\|", "rekber_mark_shipped"),
+    ("^rekber_release\\|", "rekber_release"),
+    ("^rekber_dispute\\|", "rekber_dispute"),
+    ("^seller_fee_confirm", "rekber_fee_paid"),
+    ("^fee_verify", "rekber_fee_verify"),
+    ("^rekber_fund_confirm\\|", "rekber_fund_confirm"),
+    ("^start_payment\\|", "start_payment_handler"),
+    ("^rekber_funding_cancel\\|", "rekber_funding_cancel"),
+    ("^rekber_cancel_request", "rekber_cancel_request"),
+    ("^rekber_cancel_approve", "rekber_cancel_approve"),
+    ("^rekber_cancel_reject", "rekber_cancel_reject"),
+    ("^rekber_admin_verify\\|", "rekber_admin_verify"),
+    ("^rekber_admin_reject\\|", "rekber_admin_reject"),
+    ("^rekber_admin_release\\|", "rekber_admin_release"),
+    ("^rekber_admin_refund\\|", "rekber_admin_refund"),
+    ("^admin_release_final\\|", "admin_release_final"),
+    ("^admin_release_execute\\|", "admin_release_execute"),
+    ("^admin_confirm_payout\\|", "admin_confirm_payout"),
+    ("^verify_payment\\|", "verify_payment_with_proof"),
+    ("^reject_payment\\|", "reject_payment_with_proof"),
+    ("^rate", "handle_rating"),
+    ("^skip_comment", "skip_comment"),
+    ("^rekber_panduan$", "rekber_panduan"),
+    ("^rekber_panduan_page_1$", "panduan_page_1"),
+    ("^rekber_panduan_page_2$", "panduan_page_2"),
+    ("^rekber_panduan_page_3$", "panduan_page_3"),
+    ("^rekber_panduan_page_4$", "panduan_page_4"),
+    ("^rekber_main_menu$", "rekber_main_menu"),
+    ("^rekber_user_history$", "rekber_user_history"),
+    ("^rekber_history_menu$", "rekber_user_history"),
+    ("^admin_pending_actions", "admin_pending_actions"),
+    ("^admin_user_stats", "admin_user_stats"),
+    ("^admin_analytics$", "admin_analytics"),
+    ("^admin_outbox_retry$", "admin_outbox_retry"),
+    ("^admin_outbox$", "admin_outbox"),
+    ("^help_create_role", "help_create_role"),
+    ("^help_what_is_rekber", "help_what_is_rekber"),
+    ("^join_cancel", "join_cancel"),
+    ("^change_fee_payer", "change_fee_payer_handler"),
+]
+
+
+def _route_name(callback) -> str:
+    if isinstance(callback, functools.partial):
+        return f"panduan_page_{callback.keywords['page']}"
+    return callback.__name__
+
+
+def _callback_samples() -> list:
+    """callback_data contoh: dari setiap pattern lama dan dari semua tombol yang dibuat handler"""
+    samples = set()
+    for pattern, _ in _LEGACY_CALLBACKS:
+        action = pattern.strip("^$").replace("\\|", "")
+        if not pattern.endswith("\\|"):
+            samples.add(action)
+        if not pattern.endswith("$"):
+            samples.add(f"{action}|RB-000001|5")
+    for name in os.listdir("handlers"):
+        if name.endswith(".py"):
+            with open(os.path.join("handlers", name)) as f:
+                for data in re.findall(r"callback_data=f?[\"']([^\"']*)[\"']", f.read()):
+                    samples.add(re.sub(r"\{[^}]*\}", "RB-000001", data))
+    return sorted(samples)
+
+
+def bench_router(lookups: int = 200_000):
+    """Router callback_data vs rantai regex lama: tabel rute yang sama dan biaya dispatch per tombol"""
+    # handlers.* membaca config (butuh BOT_TOKEN); benchmark ini tidak menghubungi Telegram
+    os.environ.setdefault("BOT_TOKEN", "123:FAKE")
+    from handlers.router import callback_router
+
+    samples = _callback_samples()
+    legacy = [(re.compile(pattern), name) for pattern, name in _LEGACY_CALLBACKS]
+
+    mismatches = []
+    for data in samples:
+        old = next((name for regex, name in legacy if regex.match(data)), None)
+        resolved = callback_router.resolve(data)
+        new = _route_name(resolved[0]) if resolved else None
+        if old != new:
+            mismatches.append((data, old, new))
+    routed = sum(1 for data in samples if callback_router.resolve(data))
+    print(f"{len(samples)} callback_data contoh ({routed} lewat router, sisanya milik ConversationHandler "
+          f"atau tanpa handler), {len(_LEGACY_CALLBACKS)} pattern lama -> {len(callback_router.routes)} rute")
+    for data, old, new in mismatches:
+        print(f"  BEDA {data!r}: lama {old}, router {new}")
+
+    async def noop(update, context):
+        pass
+
+    chain = [CallbackQueryHandler(noop, pattern=pattern) for pattern, _ in _LEGACY_CALLBACKS]
+    updates = [Update.de_json({"update_id": i, "callback_query": {
+        "id": str(i), "from": {"id": 1, "is_bot": False, "first_name": "U"}, "chat_instance": "1", "data": data}}, None)
+        for i, data in enumerate(samples)]
+    picks = [random.choice(updates) for _ in range(lookups)]
+
+    def scan_chain(update):
+        # Sama dengan Application.process_update: handler pertama yang cocok menang
+        for handler in chain:
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                return check
+        return None
+
+    results = {}
+    for label, check in (("rantai regex", scan_chain), ("router", callback_router.check_update)):
+        start = time.perf_counter()
+        for update in picks:
+            check(update)
+        elapsed = time.perf_counter() - start
+        results[label] = elapsed
+        print(f"{label:<14} {elapsed / lookups * 1e6:7.2f} us/tombol")
+    print(f"router {results['rantai regex'] / results['router']:.1f}x lebih cepat")
+    return {"mismatches": mismatches, "routed": routed, "samples": len(samples)}
+
+
+def _form_data(user_id: int) -> dict:
+    """user_data khas di tengah alur buat transaksi"""
+    return {"role": "SELLER", "title": f"Akun game level {user_id % 100}", "amount": 150_000 + user_id,
+            "admin_fee": 5000, "total": 155_000 + user_id, "admin_fee_payer": "BUYER"}
+
+
+def _text_update(update_id: int, user_id: int, text: str, bot=None) -> Update:
+    return Update.de_json({"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": text,
+        "from": {"id": user_id, "is_bot": False, "first_name": "U"},
+        "chat": {"id": user_id, "type": "private"},
+        **({"entities": [{"type": "bot_command", "offset": 0, "length": len(text)}]} if text.startswith("/") else {})}},
+        bot)
+
+
+def bench_persistence(users: int = 100_000):
+    """Persistence SQLite: biaya flush untuk banyak user aktif, coalescing, lazy load, dan pemulihan setelah restart"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "persistence.db")
+        migrations.migrate(path)
+        api = _FakeBotApi(latency=(0, 0))
+
+        async def run():
+            adb = AsyncDatabase(path, workers=4)
+            persistence = SQLitePersistence(database=adb)
+            results = {}
+
+            # Semua user aktif berubah dalam satu interval (kasus terburuk satu flush)
+            live = {}
+            for user_id in range(1, users + 1):
+                live[user_id] = {}
+            start = time.perf_counter()
+            for user_id in range(1, users + 1):
+                await persistence.refresh_user_data(user_id, live[user_id])
+            results["lazy_load"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for user_id in range(1, users + 1):
+                live[user_id].update(_form_data(user_id))
+                await persistence.update_user_data(user_id, live[user_id])
+                await persistence.update_conversation("rekber_create", (user_id, user_id), 2)
+            await persistence._flush_task
+            results["full_flush"] = time.perf_counter() - start
+
+            # 10% user berubah 5x dalam satu interval -> masing-masing cukup ditulis sekali
+            changed = users // 10
+            written = persistence.rows_written
+            start = time.perf_counter()
+            for _ in range(5):
+                for user_id in range(1, changed + 1):
+                    live[user_id]["amount"] += 1
+                    await persistence.update_user_data(user_id, live[user_id])
+            await persistence._flush_task
+            results["partial_flush"] = time.perf_counter() - start
+            results["partial_rows"] = persistence.rows_written - written
+
+            # Restart: percakapan dimuat saat start, user_data per user saat dibutuhkan
+            restarted = SQLitePersistence(database=adb)
+            start = time.perf_counter()
+            conversations = await restarted.get_conversations("rekber_create")
+            results["load_conversations"] = time.perf_counter() - start
+            start = time.perf_counter()
+            sample = random.sample(range(1, users + 1), min(1000, users))
+            restored = 0
+            for user_id in sample:
+                data = {}
+                await restarted.refresh_user_data(user_id, data)
+                expected = _form_data(user_id)
+                if user_id <= changed:
+                    expected["amount"] += 5
+                restored += data == expected
+            results["lazy_load_sample"] = (time.perf_counter() - start) / len(sample)
+            results["conversations"] = len(conversations)
+            results["restored"] = restored
+            results["sampled"] = len(sample)
+
+            # User yang menganggur dilepas dari memori
+            persistence.idle_timeout = 0
+            await persistence._flush()
+            results["evicted"] = persistence.evicted
+            results["cleared"] = sum(1 for data in live.values() if not data)
+            results["db_bytes"] = os.path.getsize(path) + os.path.getsize(path + "-wal")
+            adb.shutdown()
+            results["e2e"] = await _persistence_restart(path, api)
+            return results
+
+        results = asyncio.run(run())
+        print(f"{users} user aktif: refresh_user_data pertama (lazy, baris belum ada) {results['lazy_load']:.2f} s")
+        print(f"flush {2 * users} baris (user_data + state percakapan): "
+              f"{results['full_flush']:.2f} s ({2 * users / results['full_flush']:.0f} baris/s)")
+        print(f"{users // 10} user berubah 5x dalam satu interval: {results['partial_rows']} baris ditulis, "
+              f"{results['partial_flush'] * 1000:.0f} ms")
+        print(f"setelah restart: {results['conversations']} percakapan dimuat dalam {results['load_conversations']:.2f} s, "
+              f"user_data dimuat per user {results['lazy_load_sample'] * 1e6:.0f} us, "
+              f"{results['restored']}/{results['sampled']} sama persis")
+        print(f"evict user menganggur: {results['evicted']} (dict dikosongkan: {results['cleared']}); "
+              f"ukuran database {results['db_bytes'] / users:.0f} byte/user")
+        print(f"alur buat transaksi lewat Application dipulihkan setelah restart: {results['e2e']}")
+        return results
+
+
+async def _persistence_restart(path: str, api) -> bool:
+    """Mulai alur ConversationHandler, matikan Application, lanjutkan di Application baru"""
+    server = await asyncio.start_server(api.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    finished = []
+
+    async def ask_title(update, context):
+        context.user_data["role"] = "SELLER"
+        return 1
+
+    async def receive_title(update, context):
+        finished.append((context.user_data.get("role"), update.message.text))
+        context.user_data.clear()
+        return ConversationHandler.END
+
+    def build(adb):
+        app = (Application.builder().token("123:FAKE").base_url(f"http://127.0.0.1:{port}/bot")
+               .persistence(SQLitePersistence(database=adb)).build())
+        app.add_handler(ConversationHandler(
+            entry_points=[CommandHandler("jual", ask_title)],
+            states={1: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_title)]},
+            fallbacks=[], name="form", persistent=True,
+        ))
+        return app
+
+    adb = AsyncDatabase(path, workers=1)
+    app = build(adb)
+    await app.initialize()
+    await app.process_update(_text_update(1, 42, "/jual", app.bot))
+    await app.shutdown()
+
+    app = build(adb)
+    await app.initialize()
+    await app.process_update(_text_update(2, 42, "Akun game level 80", app.bot))
+    await app.shutdown()
+    adb.shutdown()
+    server.close()
+    return finished == [("SELLER", "Akun game level 80")]
+
+
+class _CountingDatabase(AsyncDatabase):
+    """AsyncDatabase yang menghitung statement SQL (baca dan tulis, termasuk yang dijalankan listener commit)"""
+
+    def __init__(self, path: str):
+        super().__init__(path, workers=2)
+        self.queries = 0
+        self._last = threading.local()
+        connect = self.writer._connect
+
+        def traced_connect():
+            conn = connect()
+            conn.set_trace_callback(self._count)
+            return conn
+        self.writer._connect = traced_connect
+
+    def _count(self, sql: str):
+        # Statement tulis yang memicu trigger dilaporkan ulang untuk setiap trigger: hitung sekali
+        last, self._last.sql = getattr(self._last, "sql", None), sql
+        verb = sql.lstrip().split(None, 1)[0].upper()
+        if verb == "SELECT" or (verb in ("INSERT", "UPDATE", "DELETE") and sql != last):
+            self.queries += 1
+
+    async def run(self, fn, *args):
+        def traced(conn, *fn_args):
+            conn.set_trace_callback(self._count)
+            try:
+                return fn(conn, *fn_args)
+            finally:
+                conn.set_trace_callback(None)
+        return await super().run(traced, *args)
+
+
+def _handler_update(user_id: int, data: str = None, text: str = None):
+    """Update minimal untuk memanggil handler langsung (tanpa Telegram)"""
+    async def noop(*args, **kwargs):
+        pass
+
+    user = User(user_id, "U", False, username=f"user{user_id}")
+    query = SimpleNamespace(data=data, from_user=user, answer=noop, edit_message_text=noop) if data else None
+    message = SimpleNamespace(text=text, reply_text=noop) if text else None
+    return SimpleNamespace(callback_query=query, message=message, effective_user=user)
+
+
+# (langkah, alur) alur join dan alur pembayaran pembeli
+_JOIN_FLOW = [("start", "join"), ("rekber_join_confirm", "join"), ("start_payment", "funding"),
+              ("rekber_status", "funding"), ("rekber_fund_confirm", "funding"), ("rekber_status", "funding")]
+# Query per update alur yang sama dengan handler sebelum deal_cache (diukur dengan harness ini):
+# rekber_join 2 SELECT, _join_deal SELECT-UPDATE-SELECT, start_payment + rekber_funding_menu 2 SELECT
+_LEGACY_QUERIES = {"join": 3.5, "funding": 1.5}
+
+
+def bench_deals(deals: int = 500):
+    """Cache deal: query per update di alur join dan pembayaran, dengan dan tanpa cache, dan tidak ada data basi"""
+    # handlers.* membaca config (butuh BOT_TOKEN); benchmark ini tidak menghubungi Telegram
+    os.environ.setdefault("BOT_TOKEN", "123:FAKE")
+    import handlers.rekber as rekber
+    logging.getLogger().setLevel(logging.WARNING)
+
+    handlers = {"start": rekber.rekber_join, "rekber_join_confirm": rekber.rekber_join_confirm,
+                "start_payment": rekber.start_payment_handler, "rekber_status": rekber.rekber_status,
+                "rekber_fund_confirm": rekber.rekber_fund_confirm}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "deals.db")
+        migrations.migrate(path)
+
+        async def run_flow(adb, cache) -> dict:
+            rekber.db = deal_state.db = adb
+            rekber.deal_cache = deal_state.deal_cache = cache
+            rekber.dispatcher = _FakeBot(0)
+            rekber.log_action = lambda *args, **kwargs: None
+            await adb.transaction(lambda conn: conn.execute("DELETE FROM deals"))
+            # Deal dibuat penjual lewat handler (seperti produksi), query-nya tidak dihitung
+            for i in range(deals):
+                rekber.generate_deal_id = lambda i=i: f"RB-{i:06d}"
+                await rekber.rekber_new_seller(_handler_update(5000 + i, text="Akun game"),
+                                               SimpleNamespace(user_data={"admin_fee_payer": "BUYER"}, bot=None),
+                                               "Akun game", 150000, 5000)
+            queries = defaultdict(int)
+            steps = defaultdict(int)
+            start = time.perf_counter()
+            for i in range(deals):
+                deal_id, buyer_id = f"RB-{i:06d}", 1000 + i
+                for step, flow in _JOIN_FLOW:
+                    if step == "start":
+                        update = _handler_update(buyer_id, text=f"/start rekber_{deal_id}")
+                        context = SimpleNamespace(args=[f"rekber_{deal_id}"], user_data={}, bot=None)
+                    else:
+                        data = f"{step}|{deal_id}|BUYER" if step == "rekber_join_confirm" else f"{step}|{deal_id}"
+                        update = _handler_update(buyer_id, data=data)
+                        context = SimpleNamespace(args=None, user_data={}, bot=None)
+                    before = adb.queries
+                    await handlers[step](update, context)
+                    queries[flow] += adb.queries - before
+                    steps[flow] += 1
+            elapsed = time.perf_counter() - start
+
+            rows = await adb.fetchall("SELECT * FROM deals")
+            return {"per_update": {flow: queries[flow] / steps[flow] for flow in steps}, "elapsed": elapsed,
+                    "stale": sum(1 for row in rows if (cache._deals.get(row['id']) or dict(row)) != dict(row)),
+                    "done": sum(1 for row in rows if row['status'] == "WAITING_PAYMENT_PROOF"), "stats": cache.stats()}
+
+        async def race(adb) -> int:
+            # Baca bersamaan dengan transisi: cache harus mengikuti setiap commit
+            cache = DealCache(database=adb)
+            deal_state.deal_cache = cache
+            await adb.transaction(lambda conn: conn.execute(
+                "UPDATE deals SET status = 'FUNDED', buyer_id = 1, seller_id = 2"))
+            ids = [f"RB-{i:06d}" for i in range(min(deals, 100))]
+
+            async def reader():
+                for _ in range(50):
+                    await cache.get(random.choice(ids))
+
+            async def writer():
+                for deal_id in ids:
+                    await deal_state.transition(deal_id, "MARK_SHIPPED", 2, "SELLER", returning="id")
+
+            await asyncio.gather(writer(), *(reader() for _ in range(8)))
+            stale = 0
+            for deal_id in ids:
+                fresh = await adb.fetchone("SELECT * FROM deals WHERE id = ?", (deal_id,))
+                stale += (await cache.get(deal_id)) != dict(fresh)
+            return stale
+
+        async def run():
+            adb = _CountingDatabase(path)
+            results = {"tanpa cache": await run_flow(adb, DealCache(database=adb, max_entries=0)),
+                       "dengan cache": await run_flow(adb, DealCache(database=adb))}
+            results["race_stale"] = await race(adb)
+            adb.shutdown()
+            return results
+
+        # Handler memakai instance global; dipulihkan agar pemanggil berikutnya (tests/) tidak memakai adb yang sudah mati
+        originals = [(module, name, getattr(module, name)) for module, names in (
+            (rekber, ("db", "deal_cache", "dispatcher", "log_action", "generate_deal_id")),
+            (deal_state, ("db", "deal_cache")),
+        ) for name in names]
+        try:
+            results = asyncio.run(run())
+        finally:
+            for module, name, value in originals:
+                setattr(module, name, value)
+        for label in ("tanpa cache", "dengan cache"):
+            result = results[label]
+            per_update = result["per_update"]
+            print(f"{label:<13} join {per_update['join']:.2f} query/update, pembayaran {per_update['funding']:.2f} "
+                  f"query/update ({result['elapsed'] / deals / len(_JOIN_FLOW) * 1000:.2f} ms/update), "
+                  f"{result['done']}/{deals} deal sampai WAITING_PAYMENT_PROOF")
+        stats = results["dengan cache"]["stats"]
+        print(f"cache: hit {stats['hits']}, miss {stats['misses']}, eviction {stats['evictions']}, "
+              f"invalidasi {stats['invalidations']}, dibaca ulang setelah commit {stats['refreshes']} (hit rate {stats['hit_rate']:.1%}), "
+              f"snapshot basi setelah alur {results['dengan cache']['stale']}, saat baca bersamaan transisi "
+              f"{results['race_stale']}")
+        before, after = results["tanpa cache"]["per_update"], results["dengan cache"]["per_update"]
+        print(f"sebelum deal_cache: join {_LEGACY_QUERIES['join']:.2f} query/update, "
+              f"pembayaran {_LEGACY_QUERIES['funding']:.2f} query/update")
+        return results
+
+
+def bench_activity(updates: int = 200_000, users: int = 200_000):
+    """Activity tracker vs INSERT OR REPLACE per update, dan user aktif 30 hari dari counter vs scan"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "activity.db")
+        migrations.migrate(path)
+        conn = sqlite3.connect(path)
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO users (user_id, username, first_name, created_at, last_activity) VALUES (?, ?, ?, ?, ?)",
+            ((i, f"user{i}", f"User {i}", "2024-01-01 00:00:00", activity_timestamp(now - random.uniform(0, 90 * 86400)))
+             for i in range(1, users + 1))
+        )
+        conn.commit()
+        conn.close()
+        # Update miring: sebagian kecil user paling sering menekan tombol
+        senders = [min(users, int(random.paretovariate(1.1))) for _ in range(updates)]
+        scan_sql = "SELECT COUNT(*) FROM users WHERE DATE(last_activity) > DATE('now', '-30 days')"
+        counter_sql = ("SELECT IFNULL(SUM(count), 0) FROM deal_counters "
+                       "WHERE scope = 'active_day' AND key > DATE('now', '-30 days')")
+
+        def active(sql: str):
+            conn = sqlite3.connect(path)
+            start = time.perf_counter()
+            for _ in range(20):
+                value = conn.execute(sql).fetchone()[0]
+            elapsed = (time.perf_counter() - start) / 20
+            conn.close()
+            return value, elapsed
+
+        before = active(scan_sql)[0]
+
+        # Cara lama: satu INSERT OR REPLACE + commit per update (sampel, karena lambat), di
+        # salinan database: penghapusan oleh REPLACE tidak menjalankan trigger DELETE
+        legacy_path = os.path.join(tmp, "legacy.db")
+        shutil.copy(path, legacy_path)
+        legacy_updates = senders[:min(updates, 5000)]
+        writer = WriteQueue(legacy_path)
+        start = time.perf_counter()
+        for user_id in legacy_updates:
+            writer.run(lambda conn, user_id=user_id: conn.execute(
+                "INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, last_activity) "
+                "VALUES (?, ?, ?, ?, datetime('now'))", (user_id, f"user{user_id}", f"User {user_id}", "")))
+        legacy = time.perf_counter() - start
+        writer.close()
+        conn = sqlite3.connect(legacy_path)
+        reset = conn.execute("SELECT COUNT(*) FROM users WHERE created_at > '2024-01-01 00:00:00'").fetchone()[0]
+        conn.close()
+
+        async def run():
+            adb = AsyncDatabase(path, workers=2)
+            tracker = ActivityTracker(adb)
+            # 10 interval flush selama update masuk
+            start = time.perf_counter()
+            for i, user_id in enumerate(senders, 1):
+                tracker.record(user_id, username=f"user{user_id}", first_name=f"User {user_id}",
+                               last_activity=activity_timestamp())
+                if i % max(1, updates // 10) == 0:
+                    await tracker.flush()
+            await tracker.flush()
+            elapsed = time.perf_counter() - start
+            adb.shutdown()
+            return elapsed, tracker.rows_written, tracker.flushes
+
+        elapsed, rows_written, flushes = asyncio.run(run())
+        conn = sqlite3.connect(path)
+        created_reset = conn.execute(
+            "SELECT COUNT(*) FROM users WHERE created_at > '2024-01-01 00:00:00'").fetchone()[0]
+        expected = {tuple(row) for row in conn.execute(
+            f"SELECT * FROM ({db_sqlite.DEAL_COUNTERS_SQL}) WHERE scope = 'active_day' AND count")}
+        actual = {tuple(row) for row in conn.execute(
+            "SELECT scope, key, count, amount FROM deal_counters WHERE scope = 'active_day' AND count")}
+        conn.close()
+        (scan, scan_time), (counter, counter_time) = active(scan_sql), active(counter_sql)
+
+        print(f"INSERT OR REPLACE per update: {len(legacy_updates)} update dalam {legacy:.2f} s "
+              f"({len(legacy_updates) / legacy:.0f} update/s), {len(legacy_updates)} baris ditulis ulang, "
+              f"created_at direset untuk {reset} user")
+        print(f"activity tracker: {updates} update dalam {elapsed:.2f} s ({updates / elapsed:.0f} update/s), "
+              f"{rows_written} baris ditulis dalam {flushes} flush, created_at direset untuk {created_reset} user")
+        print(f"user aktif 30 hari ({users} user): sebelum {before}, sesudah scan {scan} ({scan_time * 1000:.2f} ms), "
+              f"counter {counter} ({counter_time * 1000:.3f} ms); counter per hari sama dengan hitung ulang: "
+              f"{expected == actual}")
+        return {"created_reset": created_reset, "scan": scan, "counter": counter, "expected": expected,
+                "actual": actual, "rows_written": rows_written}
+
+
+_LEGACY_USER_STATS = (
+    """
+    SELECT COUNT(*) as total_deals,
+        COUNT(CASE WHEN status = 'COMPLETED' THEN 1 END) as completed_deals,
+        COUNT(CASE WHEN status = 'CANCELLED' OR status = 'REFUNDED' THEN 1 END) as cancelled_deals
+    FROM deals WHERE buyer_id = ? OR seller_id = ?
+    """,
+    """
+    SELECT AVG(rating) as avg_rating, COUNT(*) as total_ratings
+    FROM ratings r JOIN deals d ON r.deal_id = d.id
+    WHERE (d.buyer_id = ? OR d.seller_id = ?) AND r.user_id != ?
+    """,
+)
+
+
+def bench_reputation(deals: int = 200_000, users: int = 20_000):
+    """Reputasi user: agregat di users (trigger) vs agregasi deals/ratings per baca, dan rekonsiliasi"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "reputation.db")
+        migrations.migrate(path)
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        # Sebagian pihak belum punya baris users: trigger harus membuatkannya
+        conn.executemany("INSERT INTO users (user_id, username) VALUES (?, ?)",
+                         ((i, f"user{i}") for i in range(1, users - 100)))
+        parties = [random.sample(range(1, users + 1), 2) for _ in range(deals)]
+        conn.executemany(
+            "INSERT INTO deals (id, title, amount, buyer_id, seller_id, status) VALUES (?, 'r', 1000, ?, ?, 'FUNDED')",
+            ((f"RB-{i}", buyer, seller) for i, (buyer, seller) in enumerate(parties))
+        )
+        conn.commit()
+        conn.close()
+        legacy_path = os.path.join(tmp, "legacy.db")
+        shutil.copy(path, legacy_path)
+        conn = sqlite3.connect(legacy_path)
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'user_reputation_%'").fetchall():
+            conn.execute(f"DROP TRIGGER {name}")
+        conn.commit()
+        conn.close()
+
+        # Deal mencapai status akhir satu per satu, lalu dinilai (seperti handle_rating)
+        finals = [(random.choice(("COMPLETED", "COMPLETED", "COMPLETED", "CANCELLED", "REFUNDED")), f"RB-{i}")
+                  for i in range(deals) if random.random() < 0.8]
+        ratings = [(deal_id, parties[int(deal_id[3:])][side], random.randint(1, 5))
+                   for status, deal_id in finals if status == "COMPLETED"
+                   for side in (0, 1) if random.random() < 0.6]
+
+        def finish(target: str) -> float:
+            conn = sqlite3.connect(target)
+            start = time.perf_counter()
+            for i in range(0, len(finals), 100):
+                conn.executemany("UPDATE deals SET status = ? WHERE id = ?", finals[i:i + 100])
+                conn.commit()
+            for i in range(0, len(ratings), 100):
+                conn.executemany("INSERT INTO ratings (deal_id, user_id, rating) VALUES (?, ?, ?)", ratings[i:i + 100])
+                conn.commit()
+            elapsed = time.perf_counter() - start
+            conn.close()
+            return elapsed
+
+        without_triggers, with_triggers = finish(legacy_path), finish(path)
+        writes = len(finals) + len(ratings)
+
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        # Ubah dan hapus sebagian rating: trigger UPDATE/DELETE ikut menjaga agregat
+        sample = conn.execute("SELECT id FROM ratings ORDER BY random() LIMIT 2000").fetchall()
+        conn.executemany("UPDATE ratings SET rating = 6 - rating WHERE id = ?", [tuple(row) for row in sample[:1000]])
+        conn.executemany("DELETE FROM ratings WHERE id = ?", [tuple(row) for row in sample[1000:]])
+        conn.commit()
+        drift = db_sqlite._reconcile_reputation(conn, fix=False)
+
+        lookups = random.sample(range(1, users + 1), min(2000, users))
+        start = time.perf_counter()
+        for user_id in lookups:
+            conn.execute(_LEGACY_USER_STATS[0], (user_id, user_id)).fetchone()
+            conn.execute(_LEGACY_USER_STATS[1], (user_id, user_id, user_id)).fetchone()
+        legacy_read = (time.perf_counter() - start) / len(lookups)
+        start = time.perf_counter()
+        for user_id in lookups:
+            conn.execute("SELECT total_deals, successful_deals, cancelled_deals, rating_count, average_rating "
+                         "FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        read = (time.perf_counter() - start) / len(lookups)
+        # Nilai agregat sama dengan query lama
+        mismatched = 0
+        for user_id in lookups[:200]:
+            old = conn.execute(_LEGACY_USER_STATS[0], (user_id, user_id)).fetchone()
+            old_rating = conn.execute(_LEGACY_USER_STATS[1], (user_id, user_id, user_id)).fetchone()
+            new = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            finished = conn.execute(
+                "SELECT COUNT(*) FROM deals WHERE (buyer_id = ? OR seller_id = ?) AND status IN "
+                "('COMPLETED', 'CANCELLED', 'REFUNDED')", (user_id, user_id)).fetchone()[0]
+            if (new is None or (new['total_deals'], new['successful_deals'], new['cancelled_deals'], new['rating_count'])
+                    != (finished, old['completed_deals'], old['cancelled_deals'], old_rating['total_ratings'])
+                    or abs((new['average_rating'] or 0) - (old_rating['avg_rating'] or 0)) > 1e-9):
+                mismatched += 1
+
+        # Rekonsiliasi memperbaiki agregat yang rusak
+        conn.execute("UPDATE users SET total_deals = total_deals + 1 WHERE user_id % 97 = 0")
+        conn.execute("DELETE FROM users WHERE user_id % 101 = 0")
+        conn.commit()
+        broken = len(db_sqlite._reconcile_reputation(conn, fix=True))
+        conn.commit()
+        after_fix = len(db_sqlite._reconcile_reputation(conn, fix=False))
+        conn.close()
+
+        print(f"{len(finals)} deal selesai + {len(ratings)} rating ({deals} deal, {users} user): "
+              f"tanpa trigger {without_triggers:.2f} s, dengan trigger reputasi {with_triggers:.2f} s "
+              f"(+{(with_triggers - without_triggers) / writes * 1e6:.1f} us/tulis)")
+        print(f"baca reputasi: query lama {legacy_read * 1e6:.0f} us/user, lookup primary key {read * 1e6:.1f} us/user "
+              f"({legacy_read / read:.0f}x); beda dengan query lama: {mismatched}/200")
+        print(f"selisih setelah update/hapus rating: {len(drift)}; rekonsiliasi memperbaiki {broken} user rusak, "
+              f"sisa selisih {after_fix}")
+        return {"drift": drift, "mismatched": mismatched, "broken": broken, "after_fix": after_fix}
+
+
+_LEGACY_TOP_USERS = """
+SELECT CASE WHEN buyer_id IS NOT NULL THEN buyer_id ELSE seller_id END as user_id,
+    COUNT(*) as deal_count, SUM(amount) as total_volume
+FROM deals WHERE status = 'COMPLETED'
+GROUP BY user_id ORDER BY deal_count DESC LIMIT 10
+"""
+
+
+def bench_leaderboard(deals: int = 500_000, users: int = 50_000):
+    """Leaderboard admin: GROUP BY lama vs top-K dari index, untuk riwayat kecil dan besar, plus invalidasi"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "leaderboard.db")
+        migrations.migrate(path)
+        conn = sqlite3.connect(path)
+        conn.executemany("INSERT INTO users (user_id, username) VALUES (?, ?)",
+                         ((i, f"user{i}") for i in range(1, users + 1)))
+        conn.commit()
+        conn.close()
+
+        def add_history(start: int, count: int):
+            # Deal selesai langsung di-insert (trigger insert menjaga angka leaderboard)
+            conn = sqlite3.connect(path)
+            rows = [(f"RB-{i}", random.randint(10, 5000) * 1000, *random.sample(range(1, users + 1), 2))
+                    for i in range(start, start + count)]
+            conn.executemany("INSERT INTO deals (id, title, amount, buyer_id, seller_id, status) "
+                             "VALUES (?, 'l', ?, ?, ?, 'COMPLETED')", rows)
+            conn.executemany("INSERT INTO ratings (deal_id, user_id, rating) VALUES (?, ?, ?)",
+                             ((deal_id, buyer, random.randint(3, 5)) for deal_id, _, buyer, _ in rows
+                              if random.random() < 0.5))
+            conn.commit()
+            conn.close()
+
+        async def measure(board) -> dict:
+            conn = sqlite3.connect(path)
+            start = time.perf_counter()
+            for _ in range(3):
+                conn.execute(_LEGACY_TOP_USERS).fetchall()
+            legacy = (time.perf_counter() - start) / 3
+            conn.close()
+            start = time.perf_counter()
+            for _ in range(50):
+                board.invalidate()
+                await board.top("deals")
+            rebuild = (time.perf_counter() - start) / 50
+            rebuilds = board.rebuilds
+            start = time.perf_counter()
+            for _ in range(10_000):
+                await board.top("deals"), await board.top("volume"), await board.top("rating")
+            cached = (time.perf_counter() - start) / 10_000
+            return {"legacy": legacy, "rebuild": rebuild, "cached": cached, "cached_rebuilds": board.rebuilds - rebuilds}
+
+        async def run():
+            adb = AsyncDatabase(path, workers=2)
+            board = Leaderboard(adb, size=10, ttl=3600)
+            results = {}
+            small = deals // 10
+            add_history(0, small)
+            results[small] = await measure(board)
+            add_history(small, deals - small)
+            results[deals] = await measure(board)
+
+            # Kebenaran: dibandingkan dengan agregasi penuh yang menghitung kedua pihak
+            conn = sqlite3.connect(path)
+            expected = {
+                "deals": [row[0] for row in conn.execute(
+                    "SELECT COUNT(*) AS n FROM (SELECT buyer_id AS party FROM deals WHERE status = 'COMPLETED' "
+                    "UNION ALL SELECT seller_id FROM deals WHERE status = 'COMPLETED') GROUP BY party "
+                    "ORDER BY n DESC LIMIT 10")],
+                "volume": [row[0] for row in conn.execute(
+                    "SELECT SUM(amount) AS v FROM (SELECT buyer_id AS party, amount FROM deals WHERE status = 'COMPLETED' "
+                    "UNION ALL SELECT seller_id, amount FROM deals WHERE status = 'COMPLETED') GROUP BY party "
+                    "ORDER BY v DESC LIMIT 10")],
+                "rating": [round(row[0], 9) for row in conn.execute(
+                    "SELECT AVG(r.rating) AS a, COUNT(*) AS c FROM ratings r JOIN deals d ON d.id = r.deal_id "
+                    "GROUP BY d.seller_id HAVING c >= ? ORDER BY a DESC, c DESC LIMIT 10", (board.min_ratings,))],
+            }
+            legacy_total = sum(row[1] for row in conn.execute(_LEGACY_TOP_USERS))
+            conn.close()
+            board.invalidate()
+            actual = {
+                "deals": [entry.deals for entry in await board.top("deals")],
+                "volume": [entry.volume for entry in await board.top("volume")],
+                "rating": [round(entry.average_rating, 9) for entry in await board.top("rating")],
+            }
+
+            # Invalidasi: deal yang selesai lewat deal_state langsung terlihat di daftar yang sudah di-cache
+            top = actual["deals"][0]
+            newcomer = users + 1
+            await adb.transaction(lambda conn: conn.executemany(
+                "INSERT INTO deals (id, title, amount, buyer_id, seller_id, status) VALUES (?, 'n', 1000, ?, ?, 'RELEASED')",
+                ((f"NEW-{i}", newcomer, random.randint(1, users)) for i in range(top + 1))))
+            await board.top("deals")
+            saved = deal_state.leaderboard, deal_state.deal_cache
+            deal_state.leaderboard, deal_state.deal_cache = board, DealCache(database=adb)
+            try:
+                for i in range(top + 1):
+                    await adb.transaction(lambda conn, i=i: apply_transition(conn, f"NEW-{i}", "COMPLETE", 0, "ADMIN"))
+            finally:
+                deal_state.leaderboard, deal_state.deal_cache = saved
+            leader = (await board.top("deals"))[0]
+            adb.shutdown()
+            return results, expected, actual, legacy_total, leader, newcomer
+
+        results, expected, actual, legacy_total, leader, newcomer = asyncio.run(run())
+        for size, result in results.items():
+            print(f"{size} deal selesai: GROUP BY lama {result['legacy'] * 1000:.1f} ms, "
+                  f"bangun ulang top-K {result['rebuild'] * 1000:.2f} ms, "
+                  f"dari cache {result['cached'] * 1e6:.1f} us untuk 3 daftar ({result['cached_rebuilds']} bangun ulang)")
+        print(f"query lama menghitung {legacy_total} deal untuk top 10 (penjual tidak dihitung); "
+              f"leaderboard sama dengan agregasi penuh: "
+              + ", ".join(f"{kind} {expected[kind] == actual[kind]}" for kind in expected))
+        print(f"deal selesai lewat deal_state langsung terlihat: user teratas {leader.user_id} "
+              f"({leader.deals} transaksi), seharusnya {newcomer}")
+        return {"expected": expected, "actual": actual, "leader": leader.user_id, "newcomer": newcomer,
+                "sizes": results}
+
+
+def _legacy_rekber_stats(conn: sqlite3.Connection, start: str = None, end: str = None) -> tuple:
+    """Empat scan tabel deals seperti /rekber_stats sebelum rollup"""
+    filter_sql, params = ("WHERE created_at >= ? AND created_at < ?", [start, end]) if start else ("", [])
+    joiner = filter_sql + (" AND" if filter_sql else "WHERE")
+    total = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM deals {filter_sql}", params).fetchone()
+    aktif = conn.execute(f"SELECT COUNT(*) FROM deals {joiner} status IN "
+                         "('PENDING_JOIN','PENDING_FUNDING','FUNDED','AWAITING_CONFIRM','DISPUTED')", params).fetchone()
+    selesai = conn.execute(f"SELECT COUNT(*) FROM deals {joiner} status IN ('RELEASED','REFUNDED','CANCELLED')",
+                           params).fetchone()
+    dispute = conn.execute(f"SELECT COUNT(*) FROM deals {joiner} status = 'DISPUTED'", params).fetchone()
+    return total, aktif, selesai, dispute
+
+
+def bench_rollup(deals: int = 5_000_000):
+    """/rekber_stats: empat scan deals vs jumlah baris rollup, kebenaran per rentang, dan rollup dijaga transisi"""
+    # handlers.* membaca config (butuh BOT_TOKEN); benchmark ini tidak menghubungi Telegram
+    os.environ.setdefault("BOT_TOKEN", "123:FAKE")
+    from handlers.rekber import parse_stats_range
+
+    statuses = ("PENDING_JOIN", "PENDING_FUNDING", "FUNDED", "AWAITING_CONFIRM", "DISPUTED",
+                "RELEASED", "REFUNDED", "CANCELLED", "COMPLETED")
+    now = time.time()
+    span = 3 * 365 * 86400
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rollup.db")
+        migrations.migrate(path)
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=OFF")
+        # Isi massal tanpa trigger, lalu rollup dibangun ulang seperti job backfill
+        triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'deals'").fetchall()
+        for name, _ in triggers:
+            conn.execute(f"DROP TRIGGER {name}")
+        start = time.perf_counter()
+        chunk = 50_000
+        for first in range(0, deals, chunk):
+            conn.executemany(
+                "INSERT INTO deals (id, title, amount, buyer_id, seller_id, status, admin_fee, created_at) "
+                "VALUES (?, 'r', ?, ?, ?, ?, ?, ?)",
+                ((f"RB-{i:08d}", amount, random.randint(1, 100_000), random.randint(1, 100_000),
+                  random.choice(statuses), amount // 100,
+                  time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - random.random() * span)))
+                 for i in range(first, min(first + chunk, deals))
+                 for amount in (random.randint(10, 10_000) * 1000,))
+            )
+            conn.commit()
+        insert_time = time.perf_counter() - start
+        for _, sql in triggers:
+            conn.execute(sql)
+        conn.commit()
+        start = time.perf_counter()
+        db_sqlite._rebuild_deal_rollup(conn, True)
+        conn.commit()
+        rebuild_time = time.perf_counter() - start
+        rollup_rows = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in db_sqlite.DEAL_ROLLUP_SQL)
+
+        middle = datetime.utcfromtimestamp(now - span / 2)
+        ranges = {
+            "semua": (None, None),
+            "bulan": parse_stats_range(middle.strftime("%Y-%m"))[:2],
+            "hari": parse_stats_range(middle.strftime("%Y-%m-%d"))[:2],
+            "100 hari": parse_stats_range(f"{middle:%Y-%m-%d}..{middle + timedelta(days=99):%Y-%m-%d}")[:2],
+            "2 tahun": parse_stats_range(f"{middle - timedelta(days=365):%Y-%m-%d}..{middle + timedelta(days=364):%Y-%m-%d}")[:2],
+            "7d": parse_stats_range("7d")[:2],
+        }
+        results = {}
+        for label, (first, end) in ranges.items():
+            bounds = (first.isoformat(), end.isoformat()) if first else ()
+            started = time.perf_counter()
+            legacy = _legacy_rekber_stats(conn, *bounds)
+            legacy_time = time.perf_counter() - started
+            started = time.perf_counter()
+            for _ in range(100):
+                totals = db_sqlite.deal_rollup_totals(conn, first, end)
+            rollup_time = (time.perf_counter() - started) / 100
+            where = "WHERE created_at >= ? AND created_at < ?" if first else ""
+            expected = {row[0]: {'count': row[1], 'volume': row[2], 'fees': row[3]} for row in conn.execute(
+                f"SELECT status, COUNT(*), SUM(amount), SUM(admin_fee) FROM deals {where} GROUP BY status", bounds)}
+            same_legacy = (legacy[0][0] == sum(row['count'] for row in totals.values())
+                           and legacy[0][1] == sum(row['volume'] for row in totals.values())
+                           and legacy[3][0] == totals.get("DISPUTED", {}).get('count', 0))
+            results[label] = (legacy_time, rollup_time, totals == expected and same_legacy, legacy[0][0])
+        conn.close()
+
+        async def transitions() -> tuple:
+            # Deal baru melewati alur bot lewat deal_state; trigger harus memindahkan baris rollup
+            adb = AsyncDatabase(path, workers=2)
+            saved = deal_state.leaderboard, deal_state.deal_cache
+            deal_state.leaderboard = Leaderboard(adb)
+            deal_state.deal_cache = DealCache(database=adb)
+            flows = (
+                ("JOIN", "FUND_CONFIRM", "SUBMIT_PROOF", "VERIFY_PAYMENT", "MARK_SHIPPED", "RELEASE", "COMPLETE"),
+                ("JOIN", "FUND_CONFIRM", "SUBMIT_PROOF", "VERIFY_PAYMENT", "OPEN_DISPUTE", "ADMIN_REFUND"),
+                ("JOIN", "CANCEL"),
+                ("JOIN", "FUND_CONFIRM"),
+            )
+            applied = 0
+            try:
+                await adb.transaction(lambda conn: conn.executemany(
+                    "INSERT INTO deals (id, title, amount, buyer_id, seller_id, status, admin_fee) "
+                    "VALUES (?, 't', ?, 1, 2, 'PENDING_JOIN', 5000)",
+                    ((f"NEW-{i}", random.randint(10, 10_000) * 1000) for i in range(400))))
+                for i in range(400):
+                    for event in flows[i % len(flows)]:
+                        row = await adb.transaction(lambda conn, i=i, event=event:
+                                                    apply_transition(conn, f"NEW-{i}", event, 0, "ADMIN"))
+                        applied += row is not None
+                # Koreksi manual juga ikut: ubah nominal, pindah tanggal, hapus
+                await adb.transaction(lambda conn: (
+                    conn.execute("UPDATE deals SET amount = amount + 1000 WHERE id IN ('NEW-0', 'NEW-1')"),
+                    conn.execute("UPDATE deals SET created_at = '2020-01-01 00:00:00' WHERE id = 'NEW-2'"),
+                    conn.execute("DELETE FROM deals WHERE id IN ('NEW-3', 'RB-00000000')"),
+                ))
+                drift = await adb.run(db_sqlite._rebuild_deal_rollup, False)
+            finally:
+                deal_state.leaderboard, deal_state.deal_cache = saved
+                adb.shutdown()
+            return applied, sum(len(flows[i % len(flows)]) for i in range(400)), drift
+
+        applied, expected_applied, drift = asyncio.run(transitions())
+
+    print(f"{deals} deal diisi dalam {insert_time:.1f} s; bangun ulang rollup {rebuild_time:.1f} s ({rollup_rows} baris)")
+    for label, (legacy_time, rollup_time, same, total) in results.items():
+        print(f"{label:<10} {total:>9} deal: 4 scan lama {legacy_time * 1000:9.1f} ms, "
+              f"rollup {rollup_time * 1000:7.3f} ms ({legacy_time / rollup_time:8.0f}x), sama: {same}")
+    print(f"{applied} transisi + koreksi manual: {len(drift)} baris rollup selisih")
+    return {"drift": drift, "ranges": results, "applied": applied, "expected_applied": expected_applied}
+
+
+# Alur sintetis: (action, role, status yang dimasuki, median lama di status sebelumnya dalam detik)
+_ANALYTICS_FLOWS = (
+    (("CREATE", "BUYER", "PENDING_JOIN", 0), ("JOIN", "SELLER", "PENDING_FUNDING", 600),
+     ("JOIN_COMPLETE", "SELLER", None, 0), ("FUND_CONFIRM", "BUYER", "WAITING_PAYMENT_PROOF", 1800),
+     ("SUBMIT_PROOF", "BUYER", "WAITING_VERIFICATION", 300), ("FUND_VERIFY", "ADMIN", "FUNDED", 900),
+     ("MARK_SHIPPED", "SELLER", "AWAITING_CONFIRM", 7200), ("RELEASE", "BUYER", "RELEASED", 86400),
+     ("SUBMIT_PAYOUT", "SELLER", "AWAITING_PAYOUT", 600), ("FINAL_RELEASE", "ADMIN", "COMPLETED", 3600),
+     ("RATE", "USER", None, 0)),
+    (("CREATE", "SELLER", "PENDING_JOIN", 0), ("JOIN", "BUYER", "PENDING_FUNDING", 600),
+     ("FUND_CONFIRM", "BUYER", "WAITING_PAYMENT_PROOF", 1800), ("SUBMIT_PROOF", "BUYER", "WAITING_VERIFICATION", 300),
+     ("VERIFY_PAYMENT", "ADMIN", "FUNDED", 900), ("OPEN_DISPUTE", "BUYER", "DISPUTED", 3600),
+     ("ADMIN_REFUND", "ADMIN", "REFUNDED", 43200)),
+    (("CREATE", "BUYER", "PENDING_JOIN", 0), ("CANCEL_REQUEST", "BUYER", None, 0),
+     ("CANCEL", "BUYER", "CANCELLED", 1200)),
+)
+
+
+def bench_analytics(logs: int = 3_000_000, admins: int = 5):
+    """Analitik siklus deal: stream logs penuh dalam memori tetap, akurasi kuantil, dan refresh bertahap"""
+    import tracemalloc
+    from analytics import DealAnalytics
+
+    exact = defaultdict(list)
+
+    def add_logs(conn, start: int, deals: int, unfinished: int = 0, resume: dict = None) -> dict:
+        # Deal `start`..; `unfinished` deal terakhir berhenti di tengah alur dan dilanjutkan lewat `resume`
+        resume = resume or {}
+        stopped = {}
+        batch = []
+        sql = "INSERT INTO logs (deal_id, actor_id, role, action, created_at) VALUES (?, ?, ?, ?, ?)"
+        for number in [*resume, *range(start, start + deals)]:
+            flow_index, step, at, state, entered = resume.get(number, (number % 3, 0, 1.7e9 + number * 60.0, None, None))
+            flow = _ANALYTICS_FLOWS[flow_index]
+            stop = random.randint(1, len(flow) - 1) if number >= start + deals - unfinished else len(flow)
+            while step < stop:
+                action, role, target, median = flow[step]
+                actor = random.randint(1, admins) if role == "ADMIN" else 1000 + number
+                if target is not None and state is not None:
+                    at = round(max(at, entered + random.lognormvariate(math.log(median), 1.0)), 6)
+                    exact[state].append(at - entered)
+                    if role == "ADMIN":
+                        exact[(actor, state)].append(at - entered)
+                else:
+                    at += 1
+                if target is not None:
+                    state, entered = target, at
+                batch.append((f"RB-{number:08d}", actor, role, action, datetime.utcfromtimestamp(at).isoformat(" ")))
+                step += 1
+            if step < len(flow):
+                stopped[number] = (flow_index, step, at, state, entered)
+            if len(batch) >= 50_000:
+                conn.executemany(sql, batch)
+                batch.clear()
+        conn.executemany(sql, batch)
+        conn.commit()
+        return stopped
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "analytics.db")
+        migrations.migrate(path)
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA synchronous=OFF")
+        deals = logs // 7
+        start = time.perf_counter()
+        stopped = add_logs(conn, 0, deals, unfinished=2000)
+        insert_time = time.perf_counter() - start
+        total_logs = conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+        async def run():
+            adb = AsyncDatabase(path, workers=2)
+            analytics = DealAnalytics(adb, ttl=0)
+            started = time.perf_counter()
+            await analytics.refresh()
+            full_time = time.perf_counter() - started
+
+            # Memori Python selama stream penuh (di instance terpisah)
+            tracemalloc.start()
+            traced = DealAnalytics(adb, ttl=0)
+            await traced.refresh()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            # Log baru: deal yang belum selesai dilanjutkan, ditambah deal baru
+            add_logs(conn, deals, 5000, resume=stopped)
+            started = time.perf_counter()
+            tail = await analytics.refresh()
+            tail_time = time.perf_counter() - started
+            rebuilt = DealAnalytics(adb, ttl=0)
+            await rebuilt.refresh()
+            summary = await analytics.summary()
+            adb.shutdown()
+            return analytics, rebuilt, summary, full_time, peak, tail, tail_time
+
+        analytics, rebuilt, summary, full_time, peak, tail, tail_time = asyncio.run(run())
+        conn.close()
+
+    def quantile(values, q):
+        return values[int(q * (len(values) - 1))]
+
+    worst = 0.0
+    checked = 0
+    for key, values in exact.items():
+        values.sort()
+        sketch = analytics.admins[key[0]][key[1]] if isinstance(key, tuple) else analytics.states[key]
+        for q in (0.5, 0.95, 0.99):
+            expected = quantile(values, q)
+            worst = max(worst, abs(sketch.quantile(q) - expected) / expected)
+            checked += 1
+    same = (
+        {state: (sketch.count, sketch.zeros, sketch.buckets) for state, sketch in analytics.states.items()}
+        == {state: (sketch.count, sketch.zeros, sketch.buckets) for state, sketch in rebuilt.states.items()}
+        and {admin: {state: sketch.buckets for state, sketch in sketches.items()} for admin, sketches in analytics.admins.items()}
+        == {admin: {state: sketch.buckets for state, sketch in sketches.items()} for admin, sketches in rebuilt.admins.items()}
+    )
+    counted = sum(sketch.count for sketch in analytics.states.values())
+    expected_count = sum(len(values) for key, values in exact.items() if not isinstance(key, tuple))
+
+    print(f"{total_logs} log ({deals} deal) diisi dalam {insert_time:.1f} s")
+    print(f"stream penuh: {full_time:.1f} s ({total_logs / full_time:.0f} log/s), "
+          f"puncak memori Python {peak / 1e6:.1f} MB")
+    print(f"refresh bertahap: {tail} log baru dalam {tail_time * 1000:.0f} ms; sama dengan baca ulang penuh: {same}")
+    print(f"{counted} lama-status (seharusnya {expected_count}), galat relatif kuantil terbesar "
+          f"{worst:.2%} dari {checked} kuantil (batas {analytics.accuracy:.0%})")
+    for state in ("WAITING_VERIFICATION", "AWAITING_CONFIRM", "DISPUTED"):
+        stats = summary["states"][state]
+        print(f"  {state:<22} p50 {stats['p50']:9.0f} s  p95 {stats['p95']:9.0f} s  p99 {stats['p99']:9.0f} s")
+    return {"same": same, "counted": counted, "expected_count": expected_count, "worst": worst,
+            "accuracy": analytics.accuracy, "peak": peak}
+
+
+BENCHMARKS = {
+    "pool": bench_pool,
+    "loop_lag": bench_loop_lag,
+    "group_commit": bench_group_commit,
+    "audit": bench_audit,
+    "rate_limit": bench_rate_limit,
+    "state_race": bench_state_race,
+    "sweep": bench_sweep,
+    "scheduler": bench_scheduler,
+    "deadline": bench_deadline,
+    "dispatch": bench_dispatch,
+    "outbox": bench_outbox,
+    "profile": bench_profile,
+    "webhook": bench_webhook,
+    "updates": bench_updates,
+    "router": bench_router,
+    "persistence": bench_persistence,
+    "deals": bench_deals,
+    "activity": bench_activity,
+    "reputation": bench_reputation,
+    "leaderboard": bench_leaderboard,
+    "rollup": bench_rollup,
+    "analytics": bench_analytics,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__)
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*(int(arg) for arg in sys.argv[2:]))
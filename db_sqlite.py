@@ -1,25 +1,130 @@
+import os
+import time
+import queue
+import atexit
 import sqlite3
 import random
 import logging
-from datetime import datetime
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 from typing import Optional, Dict, Any, List
-from functools import wraps
+from functools import wraps, partial
+
+import migrations
 
 logger = logging.getLogger(__name__)
 
+DB_PATH = os.getenv("DB_PATH", "rekber.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "256"))
+# 0 = tanpa menunggu tambahan; batch berisi operasi yang menumpuk selama commit sebelumnya
+WRITE_BATCH_MS = float(os.getenv("WRITE_BATCH_MS", "0"))
+AUDIT_FLUSH_SIZE = int(os.getenv("AUDIT_FLUSH_SIZE", "100"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+
+# Pragma yang dipasang sekali per koneksi saat koneksi dibuat
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA mmap_size=268435456",   # 256 MB
+    "PRAGMA cache_size=-16000",     # ~16 MB page cache per koneksi
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    """Koneksi SQLite yang kembali ke pool saat close() dipanggil"""
+
+    _pool = None
+    _idle = False
+
+    def close(self):
+        if self._pool is None:
+            super().close()
+        else:
+            self._pool.release(self)
+
+    def discard(self):
+        """Tutup koneksi fisik (tidak dikembalikan ke pool)"""
+        self._pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """Pool koneksi SQLite berumur panjang dengan pragma yang sudah di-tuning.
+
+    Koneksi idle disimpan maksimal `size` buah; jika pool kosong koneksi baru
+    dibuat on-demand, dan kelebihannya ditutup saat dikembalikan.
+    """
+
+    def __init__(self, path: str = DB_PATH, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _connect(self) -> PooledConnection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=PooledConnection)
+        conn.row_factory = sqlite3.Row  # Make results dict-like
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conn._pool = self
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+        conn._idle = False
+        return conn
+
+    def release(self, conn: PooledConnection):
+        with self._lock:
+            if conn._idle:
+                return  # sudah dikembalikan sebelumnya (double close)
+            try:
+                # Samakan dengan close() biasa: transaksi yang belum di-commit dibuang
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.row_factory = sqlite3.Row
+            except sqlite3.Error as e:
+                logger.warning(f"Discarding broken pooled connection: {e}")
+                conn.discard()
+                return
+            if self._idle.qsize() >= self.size:
+                conn.discard()
+                return
+            conn._idle = True
+            self._idle.put(conn)
+
+    def close_all(self):
+        """Tutup semua koneksi idle (dipanggil saat shutdown)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.discard()
+
+
+_pool = ConnectionPool()
+atexit.register(_pool.close_all)
+
 # Database connection untuk SQLite
 def get_connection():
-    """Mendapatkan koneksi SQLite dengan row factory"""
+    """Mendapatkan koneksi SQLite dari pool dengan row factory"""
     try:
-        conn = sqlite3.connect('rekber.db', check_same_thread=False)
-        conn.row_factory = sqlite3.Row  # Make results dict-like
-        return conn
+        return _pool.acquire()
     except Exception as e:
         logger.error(f"SQLite connection error: {e}")
         return None
 
 def return_connection(conn):
-    """Menutup koneksi SQLite"""
+    """Mengembalikan koneksi SQLite ke pool"""
     if conn:
         try:
             conn.close()
@@ -45,333 +150,391 @@ def with_db_connection(func):
             return None
     return wrapper
 
-def init_db():
-    """Inisialisasi schema database SQLite"""
-    try:
-        conn = get_connection()
-        if not conn:
-            logger.warning("Database connection failed. Bot will start without database.")
-            return
-        
-        cur = conn.cursor()
-        
-        # Tabel deals (transaksi rekber)
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS deals (
-            id TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            amount INTEGER NOT NULL,
-            buyer_id INTEGER,
-            seller_id INTEGER,
-            status TEXT DEFAULT 'CREATED',
-            fund_status TEXT DEFAULT 'UNPAID',
-            admin_fee INTEGER DEFAULT 0,
-            admin_fee_payer TEXT DEFAULT 'BUYER',
-            payment_proof TEXT,
-            payment_proof_file_id TEXT,
-            joined_by INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP
-        )
-        """)
-        
-        # Index untuk performa query
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_deals_buyer_id ON deals(buyer_id)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_deals_seller_id ON deals(seller_id)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_deals_status ON deals(status)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_deals_created_at ON deals(created_at)")
 
-        # Tabel logs (riwayat aktivitas)
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            deal_id TEXT NOT NULL,
-            actor_id INTEGER NOT NULL,
-            role TEXT NOT NULL,
-            action TEXT NOT NULL,
-            detail TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (deal_id) REFERENCES deals(id) ON DELETE CASCADE
-        )
-        """)
-        
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_deal_id ON logs(deal_id)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_created_at ON logs(created_at)")
+def _settle_async(items):
+    for future, value, ok in items:
+        if not future.done():
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
 
-        # Tabel disputes (sengketa)
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS disputes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            deal_id TEXT NOT NULL,
-            raised_by INTEGER NOT NULL,
-            reason TEXT,
-            evidence TEXT,
-            status TEXT DEFAULT 'OPEN',
-            resolved_by INTEGER,
-            resolution TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            resolved_at TIMESTAMP,
-            FOREIGN KEY (deal_id) REFERENCES deals(id) ON DELETE CASCADE
-        )
-        """)
 
-        # Tabel shipments (pengiriman)
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS shipments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            deal_id TEXT NOT NULL,
-            seller_id INTEGER NOT NULL,
-            tracking_no TEXT,
-            courier TEXT,
-            proof TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (deal_id) REFERENCES deals(id) ON DELETE CASCADE
-        )
-        """)
+class WriteQueue:
+    """Single writer untuk semua operasi tulis SQLite (group commit).
 
-        # Tabel ratings (penilaian)
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS ratings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            deal_id TEXT NOT NULL,
-            user_id INTEGER NOT NULL,
-            rating INTEGER CHECK (rating >= 1 AND rating <= 5),
-            comment TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (deal_id) REFERENCES deals(id) ON DELETE CASCADE,
-            UNIQUE(deal_id, user_id)
-        )
-        """)
+    Operasi tulis diantrikan dan dieksekusi berurutan oleh satu thread writer.
+    Operasi dikumpulkan menjadi batch (maks `batch_size` operasi atau
+    `batch_ms` milidetik) lalu di-commit sekali dengan satu fsync. Setiap
+    operasi dibungkus SAVEPOINT, jadi operasi yang gagal tidak membatalkan
+    operasi lain di batch yang sama. Future pemanggil baru selesai setelah
+    commit batch-nya tersimpan ke disk.
 
-        # Tabel payouts (pencairan dana)
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS payouts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            deal_id TEXT UNIQUE NOT NULL,
-            seller_id INTEGER NOT NULL,
-            method TEXT NOT NULL CHECK (method IN ('BANK', 'EWALLET')),
-            bank_name TEXT,
-            account_number TEXT,
-            account_name TEXT,
-            ewallet_provider TEXT,
-            ewallet_number TEXT,
-            note TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (deal_id) REFERENCES deals(id) ON DELETE CASCADE
-        )
-        """)
-        
-        # Tabel users untuk statistik dan riwayat pengguna
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            total_deals INTEGER DEFAULT 0,
-            successful_deals INTEGER DEFAULT 0,
-            average_rating REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
-        
-        # Tabel untuk rate limiting dan security
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS rate_limits (
-            user_id INTEGER NOT NULL,
-            action TEXT NOT NULL,
-            count INTEGER DEFAULT 1,
-            reset_time TIMESTAMP DEFAULT (datetime('now', '+1 hour')),
-            PRIMARY KEY (user_id, action)
-        )
-        """)
+    Koneksi writer memakai synchronous=FULL: dalam mode WAL, NORMAL tidak
+    fsync saat commit (baru saat checkpoint), sehingga commit terakhir bisa
+    hilang saat listrik/OS mati dan future tidak bisa menjanjikan durable.
+    Dengan group commit biaya FULL hanya satu fsync WAL per batch. Pemanggil
+    async (`submit_async`) diselesaikan sekaligus per batch dengan satu
+    call_soon_threadsafe per event loop, bukan satu wakeup per operasi.
+    """
 
-        conn.commit()
-        logger.info("Database SQLite berhasil diinisialisasi")
-        
-    except Exception as e:
-        if 'conn' in locals():
-            conn.rollback()
-        logger.error(f"Error saat inisialisasi database: {e}")
-        raise
-    finally:
-        if 'conn' in locals() and conn:
-            if 'cur' in locals():
-                cur.close()
+    def __init__(self, path: str = DB_PATH, batch_size: int = WRITE_BATCH_SIZE,
+                 batch_ms: float = WRITE_BATCH_MS):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_ms = batch_ms
+        self.batches = 0
+        self.ops = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._commit_listeners = []
+        self._rollback_listeners = []
+
+    def on_commit(self, callback):
+        """callback(conn) dipanggil di thread writer setiap selesai commit, sebelum future pemanggil selesai"""
+        self._commit_listeners.append(callback)
+
+    def on_rollback(self, callback):
+        """callback() dipanggil di thread writer setiap ada operasi (atau seluruh batch) yang dibatalkan"""
+        self._rollback_listeners.append(callback)
+
+    def _notify(self, listeners, *args):
+        for callback in listeners:
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.error(f"Error in writer listener: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: BEGIN/SAVEPOINT/COMMIT dikendalikan manual
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        # Satu fsync per batch, sehingga future yang selesai memang sudah durable
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, fn, *args) -> Future:
+        """Antrikan fn(conn, *args). fn tidak boleh memanggil commit()/rollback()"""
+        future = Future()
+        self._start()
+        self._queue.put((fn, args, future))
+        return future
+
+    def submit_async(self, fn, *args) -> asyncio.Future:
+        """Seperti submit(), tetapi mengembalikan asyncio.Future milik event loop pemanggil"""
+        future = asyncio.get_running_loop().create_future()
+        self._start()
+        self._queue.put((fn, args, future))
+        return future
+
+    def run(self, fn, *args):
+        """Versi blocking dari submit() untuk kode sinkron"""
+        return self.submit(fn, *args).result()
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.batch_ms / 1000
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # berhenti setelah batch ini selesai
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch = self._collect()
+                if batch is None:
+                    break
+                self._commit_batch(conn, batch)
+        finally:
             conn.close()
 
-@with_db_connection
-def log_action(conn, deal_id: str, actor_id: int, role: str, action: str, detail: str = None):
-    """Mencatat aktivitas ke tabel logs"""
-    cur = conn.cursor()
+    def _commit_batch(self, conn: sqlite3.Connection, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, future in batch:
+                if isinstance(future, asyncio.Future):
+                    if future.cancelled():
+                        continue
+                elif not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT op")
+                try:
+                    value = fn(conn, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    self._notify(self._rollback_listeners)
+                    results.append((future, e, False))
+                else:
+                    conn.execute("RELEASE op")
+                    results.append((future, value, True))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self._notify(self._rollback_listeners)
+            logger.error(f"Group commit gagal ({len(batch)} operasi): {e}")
+            self._settle([(future, e, False) for _, _, future in batch])
+            return
+
+        self.batches += 1
+        self.ops += len(results)
+        self._notify(self._commit_listeners, conn)
+        self._settle(results)
+
+    def _settle(self, results):
+        # Future asyncio dikumpulkan per event loop: satu wakeup loop per batch
+        by_loop = {}
+        for future, value, ok in results:
+            if isinstance(future, asyncio.Future):
+                by_loop.setdefault(future.get_loop(), []).append((future, value, ok))
+            elif not future.done():
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+        for loop, items in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_settle_async, items)
+            except RuntimeError:
+                pass  # event loop pemanggil sudah ditutup
+
+    def close(self):
+        """Selesaikan semua operasi yang tertunda lalu hentikan thread writer"""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+class AsyncDatabase:
+    """Lapisan akses database non-blocking untuk handler async.
+
+    Query baca dijalankan di executor khusus; setiap thread worker memegang
+    satu koneksi sendiri. Semua operasi tulis lewat `WriteQueue` (single
+    writer, group commit). Event loop PTB tidak pernah menunggu lock atau
+    I/O SQLite.
+    """
+
+    def __init__(self, path: str = DB_PATH, workers: int = 4):
+        self.path = path
+        self.writer = WriteQueue(path)
+        self._pool = ConnectionPool(path, size=workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._local = threading.local()
+        self._conns = []
+
+    def _conn(self) -> PooledConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._pool.acquire()
+            self._conns.append(conn)
+        return conn
+
+    def _run_sync(self, fn, *args):
+        conn = self._conn()
+        try:
+            return fn(conn, *args)
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+    async def run(self, fn, *args):
+        """Jalankan fn(conn, *args) di thread database"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run_sync, fn, *args)
+
+    async def call(self, fn, *args, **kwargs):
+        """Jalankan fungsi data-layer sinkron (mis. get_payout_info) di executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def fetchone(self, sql: str, params=()) -> Optional[sqlite3.Row]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params=()) -> List[sqlite3.Row]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def write(self, fn, *args):
+        """Antrikan fn(conn, *args) ke single writer; selesai setelah batch di-commit"""
+        return await self.writer.submit_async(fn, *args)
+
+    async def execute(self, sql: str, params=()) -> int:
+        """Eksekusi satu statement tulis, mengembalikan rowcount"""
+        return await self.write(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def insert(self, sql: str, params=()) -> int:
+        """Eksekusi INSERT, mengembalikan lastrowid"""
+        return await self.write(lambda conn: conn.execute(sql, params).lastrowid)
+
+    async def execute_returning(self, sql: str, params=()) -> List[sqlite3.Row]:
+        """Eksekusi statement tulis dengan klausa RETURNING"""
+        return await self.write(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def executemany(self, sql: str, seq_of_params) -> int:
+        return await self.write(lambda conn: conn.executemany(sql, seq_of_params).rowcount)
+
+    async def transaction(self, fn, *args):
+        """Jalankan fn(conn, *args) secara atomik di single writer (tanpa commit di fn)"""
+        return await self.write(fn, *args)
+
+    def shutdown(self):
+        """Hentikan executor dan writer, lalu tutup koneksi milik thread worker"""
+        self._executor.shutdown(wait=True)
+        self.writer.close()
+        while self._conns:
+            self._conns.pop().discard()
+
+
+db = AsyncDatabase()
+writer = db.writer
+atexit.register(db.shutdown)
+
+def init_db():
+    """Terapkan migrasi schema yang tertunda (lihat paket migrations).
+
+    Jika schema sudah terbaru, hanya tabel schema_version yang dibaca;
+    tidak ada DDL yang dijalankan.
+    """
     try:
-        cur.execute(
-            "INSERT INTO logs (deal_id, actor_id, role, action, detail, created_at) VALUES (?,?,?,?,?,?)",
-            (deal_id, actor_id, role, action, detail or "", datetime.now())
-        )
-        conn.commit()
+        applied = migrations.migrate(DB_PATH)
     except Exception as e:
-        conn.rollback()
-        logger.error(f"Error saat mencatat log: {e}")
+        logger.error(f"Error saat inisialisasi database: {e}")
         raise
-    finally:
-        cur.close()
+    if applied:
+        logger.info(f"Migrasi database diterapkan: {', '.join(applied)}")
+    else:
+        logger.info("Schema database sudah terbaru")
 
 def log_action_bulk(logs_data: List[Dict]):
     """Bulk insert untuk multiple logs sekaligus"""
     if not logs_data:
         return
-        
-    conn = get_connection()
-    if not conn:
-        return
-        
-    cur = conn.cursor()
+
+    values = [(log['deal_id'], log['actor_id'], log['role'], 
+              log['action'], log.get('detail'), log.get('created_at') or datetime.now()) 
+             for log in logs_data]
     try:
-        values = [(log['deal_id'], log['actor_id'], log['role'], 
-                  log['action'], log.get('detail'), datetime.now()) 
-                 for log in logs_data]
-        
-        cur.executemany(
+        writer.run(lambda conn: conn.executemany(
             "INSERT INTO logs (deal_id, actor_id, role, action, detail, created_at) VALUES (?,?,?,?,?,?)",
             values
-        )
-        conn.commit()
+        ))
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error saat bulk insert logs: {e}")
         raise
-    finally:
-        cur.close()
-        return_connection(conn)
 
-def log_action(deal_id: str, actor_id: int, role: str, action: str, detail: str = None):
-    """Wrapper function untuk log_action tanpa perlu pass connection"""
-    conn = get_connection()
-    if not conn:
-        return
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO logs (deal_id, actor_id, role, action, detail, created_at) VALUES (?,?,?,?,?,?)",
-            (deal_id, actor_id, role, action, detail or "", datetime.now())
-        )
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Error saat mencatat log: {e}")
-    finally:
-        cur.close()
-        return_connection(conn)
+class AuditLogger:
+    """Write-behind buffer untuk tabel logs.
 
-def save_payout_info(deal_id: str, seller_id: int, method: str, **kwargs):
-    """Simpan informasi payout ke database"""
-    conn = get_connection()
-    if not conn:
-        return
-    
-    cur = conn.cursor()
-    try:
-        # Create payout table if not exists
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS payouts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                deal_id TEXT,
-                seller_id INTEGER,
-                method TEXT,
-                bank_name TEXT,
-                account_number TEXT,
-                account_name TEXT,
-                ewallet_provider TEXT,
-                ewallet_number TEXT,
-                note TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Delete existing payout info for this deal
-        cur.execute("DELETE FROM payouts WHERE deal_id = ?", (deal_id,))
-        
-        # Insert new payout info
-        cur.execute("""
-            INSERT INTO payouts (deal_id, seller_id, method, bank_name, account_number, account_name, ewallet_provider, ewallet_number, note)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            deal_id, seller_id, method,
-            kwargs.get('bank_name'),
-            kwargs.get('account_number'),
-            kwargs.get('account_name'),
-            kwargs.get('ewallet_provider'),
-            kwargs.get('ewallet_number'),
-            kwargs.get('note')
-        ))
-        
-        conn.commit()
-        logger.info(f"Payout info saved for deal {deal_id}")
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Error saving payout info: {e}")
-    finally:
-        cur.close()
-        return_connection(conn)
+    Record ditampung di memori dan ditulis lewat `log_action_bulk` saat buffer
+    mencapai `flush_size` atau setiap `flush_interval` detik. Buffer juga
+    di-flush saat proses berhenti.
+    """
 
-def get_payout_info(deal_id: str) -> Optional[Dict]:
-    """Ambil informasi payout dari database"""
-    conn = get_connection()
-    if not conn:
-        return None
-    
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT * FROM payouts WHERE deal_id = ?", (deal_id,))
-        row = cur.fetchone()
-        if row:
-            return dict(row)
-        return None
-    except Exception as e:
-        logger.error(f"Error getting payout info: {e}")
-        return None
-    finally:
-        cur.close()
-        return_connection(conn)
+    def __init__(self, flush_size: int = AUDIT_FLUSH_SIZE, flush_interval: float = AUDIT_FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
 
-def check_rate_limit(user_id: int) -> bool:
-    """Simple rate limiting check"""
-    # For now, always return True (no rate limiting)
-    return True
+    def log(self, deal_id: str, actor_id: int, role: str, action: str, detail: str = None, sync: bool = False):
+        record = {
+            'deal_id': deal_id, 'actor_id': actor_id, 'role': role,
+            'action': action, 'detail': detail or "", 'created_at': datetime.now(),
+        }
+        with self._lock:
+            self._buffer.append(record)
+            full = len(self._buffer) >= self.flush_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+                self._thread.start()
+        if sync:
+            self.flush()
+        elif full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Tulis semua record yang tertunda (blocking sampai commit selesai)"""
+        # _flush_lock menjaga urutan: flush berikutnya menunggu flush sebelumnya selesai
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            try:
+                log_action_bulk(batch)
+            except Exception as e:
+                logger.error(f"Gagal flush {len(batch)} audit log, dicoba lagi nanti: {e}")
+                with self._lock:
+                    self._buffer[:0] = batch
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
 
-def update_user_activity(user_id: int, activity: str):
-    """Update user activity"""
-    # Simple logging for now
-    logger.info(f"User {user_id} activity: {activity}")
+
+audit_log = AuditLogger()
+atexit.register(audit_log.flush)
+
+def log_action(deal_id: str, actor_id: int, role: str, action: str, detail: str = None, sync: bool = False):
+    """Catat aktivitas ke tabel logs lewat buffer audit.
+
+    `sync=True` untuk aksi yang memindahkan uang: pemanggil menunggu sampai
+    log (dan semua log sebelumnya) sudah di-commit.
+    """
+    audit_log.log(deal_id, actor_id, role, action, detail, sync=sync)
 
 def save_payout_info(deal_id: str, seller_id: int, method: str,
                     bank_name=None, account_number=None, account_name=None,
                     ewallet_provider=None, ewallet_number=None, note=None):
     """Menyimpan informasi pencairan dana"""
-    conn = get_connection()
-    if not conn:
-        return
-        
-    cur = conn.cursor()
     try:
-        # SQLite doesn't have ON CONFLICT DO UPDATE, so we use INSERT OR REPLACE
-        cur.execute("""
-        INSERT OR REPLACE INTO payouts (deal_id, seller_id, method, bank_name, account_number, 
+        # Upsert per deal_id: id dan created_at baris lama tetap (INSERT OR REPLACE menghapus baris)
+        writer.run(lambda conn: conn.execute("""
+        INSERT INTO payouts (deal_id, seller_id, method, bank_name, account_number, 
                        account_name, ewallet_provider, ewallet_number, note)
         VALUES (?,?,?,?,?,?,?,?,?)
+        ON CONFLICT (deal_id) DO UPDATE SET
+            seller_id = excluded.seller_id, method = excluded.method, bank_name = excluded.bank_name,
+            account_number = excluded.account_number, account_name = excluded.account_name,
+            ewallet_provider = excluded.ewallet_provider, ewallet_number = excluded.ewallet_number,
+            note = excluded.note
         """, (deal_id, seller_id, method, bank_name, account_number, 
-              account_name, ewallet_provider, ewallet_number, note))
-        conn.commit()
+              account_name, ewallet_provider, ewallet_number, note)))
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error saat menyimpan info payout: {e}")
         raise
-    finally:
-        cur.close()
-        conn.close()
 
 def get_payout_info(deal_id: str) -> Optional[Dict[str, Any]]:
     """Mendapatkan informasi pencairan dana"""
@@ -397,171 +560,137 @@ def generate_deal_id() -> str:
     rand = random.randint(100, 999)
     return f"RB-{now}{rand}"
 
+def user_deals_query(columns: str, condition: str = None, limit: Optional[int] = 10) -> str:
+    """SQL daftar deal milik user (pembeli atau penjual), terbaru dulu.
+
+    `WHERE buyer_id = ? OR seller_id = ?` memaksa OR-merge lalu sort. Di sini
+    dua cabang UNION ALL masing-masing membaca index (buyer_id, created_at) /
+    (seller_id, created_at) yang sudah terurut, jadi SQLite cukup me-merge
+    keduanya. Cabang penjual melewati deal di mana user juga pembeli agar
+    tidak muncul dua kali. Parameter: (user_id, user_id, user_id).
+    """
+    extra = f" AND ({condition})" if condition else ""
+    branch = columns if "created_at" in columns.split(", ") else f"{columns}, created_at"
+    sql = (
+        f"SELECT {branch} FROM deals WHERE buyer_id = ?{extra} "
+        f"UNION ALL "
+        f"SELECT {branch} FROM deals WHERE seller_id = ? AND buyer_id IS NOT ?{extra} "
+        f"ORDER BY created_at DESC"
+    )
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    # Subquery compound dijalankan sebagai co-routine, urutannya dipertahankan
+    return f"SELECT {columns} FROM ({sql})"
+
 def get_user_stats(user_id: int) -> Dict[str, Any]:
-    """Mendapatkan statistik pengguna"""
+    """Mendapatkan statistik (reputasi) pengguna.
+
+    Dibaca dari agregat di baris users (dijaga trigger, lihat migrasi 0012):
+    satu lookup primary key. total_deals hanya menghitung deal yang sudah
+    selesai (COMPLETED, CANCELLED, REFUNDED).
+    """
+    empty = {
+        'total_deals': 0,
+        'completed_deals': 0,
+        'cancelled_deals': 0,
+        'success_rate': 0.0,
+        'average_rating': 0.0,
+        'total_ratings': 0
+    }
     conn = get_connection()
     if not conn:
-        return {
-            'total_deals': 0,
-            'completed_deals': 0, 
-            'cancelled_deals': 0,
-            'success_rate': 0.0,
-            'average_rating': 0.0,
-            'total_ratings': 0
-        }
-        
+        return empty
+
     cur = conn.cursor()
     try:
-        # Statistik deal
         cur.execute("""
-        SELECT 
-            COUNT(*) as total_deals,
-            COUNT(CASE WHEN status = 'COMPLETED' THEN 1 END) as completed_deals,
-            COUNT(CASE WHEN status = 'CANCELLED' OR status = 'REFUNDED' THEN 1 END) as cancelled_deals
-        FROM deals 
-        WHERE buyer_id = ? OR seller_id = ?
-        """, (user_id, user_id))
-        
+        SELECT total_deals, successful_deals, cancelled_deals, rating_count, average_rating
+        FROM users WHERE user_id = ?
+        """, (user_id,))
         stats = cur.fetchone()
-        
-        # Rating rata-rata
-        cur.execute("""
-        SELECT AVG(rating) as avg_rating, COUNT(*) as total_ratings
-        FROM ratings r
-        JOIN deals d ON r.deal_id = d.id
-        WHERE (d.buyer_id = ? OR d.seller_id = ?) AND r.user_id != ?
-        """, (user_id, user_id, user_id))
-        
-        rating_stats = cur.fetchone()
-        
+        if stats is None:
+            return empty
+
         return {
-            'total_deals': stats['total_deals'] or 0,
-            'completed_deals': stats['completed_deals'] or 0,
-            'cancelled_deals': stats['cancelled_deals'] or 0,
-            'success_rate': round((stats['completed_deals'] or 0) / max(stats['total_deals'] or 1, 1) * 100, 1),
-            'average_rating': float(rating_stats['avg_rating']) if rating_stats['avg_rating'] else 0.0,
-            'total_ratings': rating_stats['total_ratings'] or 0
+            'total_deals': stats['total_deals'],
+            'completed_deals': stats['successful_deals'],
+            'cancelled_deals': stats['cancelled_deals'],
+            'success_rate': round(stats['successful_deals'] / max(stats['total_deals'], 1) * 100, 1),
+            'average_rating': stats['average_rating'] or 0.0,
+            'total_ratings': stats['rating_count']
         }
-        
+
     except Exception as e:
         logger.error(f"Error saat mengambil statistik user: {e}")
-        return {
-            'total_deals': 0,
-            'completed_deals': 0, 
-            'cancelled_deals': 0,
-            'success_rate': 0.0,
-            'average_rating': 0.0,
-            'total_ratings': 0
-        }
+        return empty
     finally:
         cur.close()
         conn.close()
 
 def check_rate_limit(user_id: int, action: str, max_count: int = 5) -> bool:
-    """Mengecek rate limiting untuk mencegah spam"""
-    conn = get_connection()
-    if not conn:
-        return True  # Allow on error to prevent blocking legitimate users
-        
-    cur = conn.cursor()
-    try:
-        # Hapus record yang sudah expired
-        cur.execute("DELETE FROM rate_limits WHERE reset_time < datetime('now')")
-        
-        # Cek current count
-        cur.execute("SELECT count FROM rate_limits WHERE user_id = ? AND action = ?", (user_id, action))
-        row = cur.fetchone()
-        
-        if not row:
-            # Insert new record
-            cur.execute("""
-            INSERT INTO rate_limits (user_id, action, count, reset_time) 
-            VALUES (?, ?, 1, datetime('now', '+1 hour'))
-            """, (user_id, action))
-            conn.commit()
-            return True
-        
-        if row['count'] >= max_count:
-            return False
-        
-        # Increment count
-        cur.execute("""
-        UPDATE rate_limits SET count = count + 1 
-        WHERE user_id = ? AND action = ?
-        """, (user_id, action))
-        conn.commit()
-        return True
-        
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Error saat cek rate limit: {e}")
-        return True  # Allow on error to prevent blocking legitimate users
-    finally:
-        cur.close()
-        conn.close()
+    """Mengecek rate limiting untuk mencegah spam (maks `max_count` per jam)"""
+    from rate_limiter import limiter, RatePolicy
+    return limiter.check(user_id, action, policy=RatePolicy(max_count, 3600))
 
 def update_user_activity(user_id: int, username: str = None, first_name: str = None, last_name: str = None):
-    """Update aktivitas terakhir pengguna"""
-    conn = get_connection()
-    if not conn:
-        return
-        
-    cur = conn.cursor()
-    try:
-        # SQLite doesn't have ON CONFLICT DO UPDATE, so we use INSERT OR REPLACE
-        cur.execute("""
-        INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, last_activity)
-        VALUES (?, ?, ?, ?, datetime('now'))
-        """, (user_id, username or "", first_name or "", last_name or ""))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Error saat update aktivitas user: {e}")
-    finally:
-        cur.close()
-        conn.close()
+    """Catat aktivitas terakhir pengguna (ditulis berkala oleh activity_tracker)"""
+    from activity import activity_tracker, activity_timestamp
+    profile = {name: value for name, value in
+               (("username", username), ("first_name", first_name), ("last_name", last_name)) if value is not None}
+    activity_tracker.record(user_id, last_activity=activity_timestamp(), **profile)
+
+# Counter yang seharusnya ada di deal_counters, dihitung ulang dari nol
+DEAL_COUNTERS_SQL = """
+SELECT 'status' AS scope, IFNULL(status, '') AS key, COUNT(*) AS count, IFNULL(SUM(amount), 0) AS amount
+FROM deals GROUP BY 2
+UNION ALL
+SELECT 'day', IFNULL(DATE(created_at), ''), COUNT(*), 0 FROM deals GROUP BY 2
+UNION ALL
+SELECT 'dispute', IFNULL(status, ''), COUNT(*), 0 FROM disputes GROUP BY 2
+UNION ALL
+SELECT 'active_day', IFNULL(DATE(last_activity), ''), COUNT(*), 0 FROM users GROUP BY 2
+UNION ALL
+SELECT 'user_day', IFNULL(DATE(created_at), ''), COUNT(*), 0 FROM users GROUP BY 2
+"""
 
 def get_admin_dashboard_stats() -> Dict[str, Any]:
-    """Mendapatkan statistik untuk dashboard admin"""
+    """Mendapatkan statistik untuk dashboard admin.
+
+    Dibaca dari deal_counters (dijaga trigger, lihat migrasi 0005 dan 0011),
+    jadi biayanya tidak bergantung pada jumlah deal maupun user.
+    """
     conn = get_connection()
     if not conn:
         return {}
         
     cur = conn.cursor()
     try:
-        # Total deals
-        cur.execute("SELECT COUNT(*) as total FROM deals")
-        total_deals = cur.fetchone()['total']
-        
-        # Deals by status  
         cur.execute("""
-        SELECT status, COUNT(*) as count 
-        FROM deals 
-        GROUP BY status
-        ORDER BY count DESC
+        SELECT scope, key, count, amount FROM deal_counters
+        WHERE scope IN ('status', 'dispute') OR (scope = 'day' AND key = DATE('now'))
         """)
-        status_counts = {row['status']: row['count'] for row in cur.fetchall()}
-        
-        # Total volume transaksi
-        cur.execute("SELECT COALESCE(SUM(amount), 0) as total_volume FROM deals WHERE status = 'COMPLETED'")
-        total_volume = cur.fetchone()['total_volume']
-        
-        # Deals hari ini
-        cur.execute("SELECT COUNT(*) as today FROM deals WHERE DATE(created_at) = DATE('now')")
-        deals_today = cur.fetchone()['today']
+        counters = cur.fetchall()
+
+        status_rows = sorted(
+            (row for row in counters if row['scope'] == 'status' and row['count']),
+            key=lambda row: row['count'], reverse=True
+        )
+        status_counts = {row['key']: row['count'] for row in status_rows}
+        total_deals = sum(status_counts.values())
+        total_volume = next((row['amount'] for row in status_rows if row['key'] == 'COMPLETED'), 0)
+        deals_today = next((row['count'] for row in counters if row['scope'] == 'day'), 0)
+        pending_verifications = status_counts.get('WAITING_VERIFICATION', 0)
+        open_disputes = next(
+            (row['count'] for row in counters if row['scope'] == 'dispute' and row['key'] == 'OPEN'), 0
+        )
         
-        # Active users (activity dalam 30 hari)
-        cur.execute("SELECT COUNT(*) as active FROM users WHERE last_activity > datetime('now', '-30 days')")
+        # Active users (aktivitas terakhir dalam 30 hari), counter per hari dari migrasi 0011
+        cur.execute("""
+        SELECT IFNULL(SUM(count), 0) AS active FROM deal_counters
+        WHERE scope = 'active_day' AND key > DATE('now', '-30 days')
+        """)
         active_users = cur.fetchone()['active']
         
-        # Pending verifications
-        cur.execute("SELECT COUNT(*) as pending FROM deals WHERE status = 'WAITING_VERIFICATION'")
-        pending_verifications = cur.fetchone()['pending']
-        
-        # Open disputes
-        cur.execute("SELECT COUNT(*) as open FROM disputes WHERE status = 'OPEN'")
-        open_disputes = cur.fetchone()['open']
-        
         return {
             'total_deals': total_deals,
             'status_counts': status_counts,
@@ -577,4 +706,181 @@ def get_admin_dashboard_stats() -> Dict[str, Any]:
         return {}
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+def reconcile_deal_counters(fix: bool = True) -> List[Dict[str, Any]]:
+    """Hitung ulang deal_counters dari nol dan kembalikan daftar selisih.
+
+    Berjalan di writer thread sehingga tidak ada tulisan lain di antara
+    penghitungan dan perbaikan. `fix=False` hanya melaporkan.
+    """
+    def _reconcile(conn):
+        expected = {(row['scope'], row['key']): (row['count'], row['amount'])
+                    for row in conn.execute(DEAL_COUNTERS_SQL)}
+        actual = {(row['scope'], row['key']): (row['count'], row['amount'])
+                  for row in conn.execute("SELECT scope, key, count, amount FROM deal_counters")}
+        drift = []
+        for scope, key in sorted(set(expected) | set(actual)):
+            exp_count, exp_amount = expected.get((scope, key), (0, 0))
+            act_count, act_amount = actual.get((scope, key), (0, 0))
+            if (exp_count, exp_amount) != (act_count, act_amount):
+                drift.append({
+                    'scope': scope, 'key': key,
+                    'expected_count': exp_count, 'actual_count': act_count,
+                    'expected_amount': exp_amount, 'actual_amount': act_amount,
+                })
+        if fix and drift:
+            conn.execute("DELETE FROM deal_counters")
+            conn.execute(f"INSERT INTO deal_counters (scope, key, count, amount) {DEAL_COUNTERS_SQL}")
+        return drift
+
+    return writer.run(_reconcile)
+
+# Agregat reputasi dan leaderboard yang seharusnya ada di users, dihitung dari
+# riwayat deals/ratings (dijaga trigger migrasi 0012 dan 0013)
+USER_REPUTATION_SQL = """
+SELECT user_id, SUM(deals) AS total_deals, SUM(completed) AS successful_deals,
+       SUM(cancelled) AS cancelled_deals, SUM(rating) AS rating_sum, SUM(rated) AS rating_count,
+       SUM(completed AND buyer) AS buyer_deals, SUM((completed AND buyer) * amount) AS buyer_volume,
+       SUM(completed AND NOT buyer) AS seller_deals, SUM((completed AND NOT buyer) * amount) AS seller_volume
+FROM (
+    SELECT party AS user_id, 1 AS deals, status = 'COMPLETED' AS completed,
+           status IN ('CANCELLED', 'REFUNDED') AS cancelled, 0 AS rating, 0 AS rated, buyer, amount
+    FROM (SELECT buyer_id AS party, 1 AS buyer, status, amount FROM deals
+          UNION ALL SELECT seller_id, 0, status, amount FROM deals)
+    WHERE party IS NOT NULL AND status IN ('COMPLETED', 'CANCELLED', 'REFUNDED')
+    UNION ALL
+    SELECT party, 0, 0, 0, r.rating, 1, 0, 0
+    FROM ratings r JOIN (
+        SELECT id, buyer_id AS party FROM deals UNION ALL SELECT id, seller_id FROM deals
+    ) d ON d.id = r.deal_id
+    WHERE party IS NOT NULL AND party != r.user_id AND r.rating IS NOT NULL
+)
+GROUP BY user_id
+"""
+
+REPUTATION_COLUMNS = ('total_deals', 'successful_deals', 'cancelled_deals', 'rating_sum', 'rating_count',
+                      'buyer_deals', 'buyer_volume', 'seller_deals', 'seller_volume')
+
+
+def _average_rating(rating_sum: int, rating_count: int) -> Optional[float]:
+    return rating_sum * 1.0 / rating_count if rating_count else None
+
+
+def _reconcile_reputation(conn: sqlite3.Connection, fix: bool) -> List[Dict[str, Any]]:
+    expected = {row['user_id']: tuple(row[column] for column in REPUTATION_COLUMNS)
+                for row in conn.execute(USER_REPUTATION_SQL)}
+    zero = (0,) * len(REPUTATION_COLUMNS)
+    drift = []
+    for row in conn.execute(f"SELECT user_id, {', '.join(REPUTATION_COLUMNS)}, average_rating FROM users"):
+        actual = tuple(row[column] for column in REPUTATION_COLUMNS)
+        wanted = expected.pop(row['user_id'], zero)
+        if actual != wanted or row['average_rating'] != _average_rating(*wanted[3:5]):
+            drift.append({'user_id': row['user_id'], 'expected': wanted, 'actual': actual})
+    # Pihak deal yang belum punya baris users
+    drift.extend({'user_id': user_id, 'expected': wanted, 'actual': None}
+                 for user_id, wanted in sorted(expected.items()))
+    if fix and drift:
+        conn.executemany(
+            f"INSERT INTO users (user_id, {', '.join(REPUTATION_COLUMNS)}, average_rating, last_activity) "
+            f"VALUES ({', '.join('?' * (len(REPUTATION_COLUMNS) + 2))}, NULL) ON CONFLICT (user_id) DO UPDATE SET "
+            + ", ".join(f"{column} = excluded.{column}" for column in (*REPUTATION_COLUMNS, 'average_rating')),
+            [(item['user_id'], *item['expected'], _average_rating(*item['expected'][3:5])) for item in drift]
+        )
+    return drift
+
+
+def reconcile_user_reputation(fix: bool = True) -> List[Dict[str, Any]]:
+    """Hitung ulang agregat reputasi di users dan kembalikan daftar selisih.
+
+    Seperti reconcile_deal_counters: berjalan di writer thread, `fix=False`
+    hanya melaporkan. Setiap selisih berisi user_id, `expected` dan `actual`
+    (nilai REPUTATION_COLUMNS, None jika user belum punya baris).
+    """
+    return writer.run(_reconcile_reputation, fix)
+
+# Isi deal_daily_rollup / deal_monthly_rollup yang seharusnya (dijaga trigger migrasi 0014)
+DEAL_ROLLUP_SQL = {
+    "deal_daily_rollup": """
+    SELECT IFNULL(DATE(created_at), '') AS key, IFNULL(status, '') AS status,
+           COUNT(*) AS count, SUM(amount) AS volume, SUM(IFNULL(admin_fee, 0)) AS fees
+    FROM deals GROUP BY 1, 2
+    """,
+    "deal_monthly_rollup": """
+    SELECT IFNULL(STRFTIME('%Y-%m', created_at), '') AS key, IFNULL(status, '') AS status,
+           COUNT(*) AS count, SUM(amount) AS volume, SUM(IFNULL(admin_fee, 0)) AS fees
+    FROM deals GROUP BY 1, 2
+    """,
+}
+ROLLUP_KEYS = {"deal_daily_rollup": "day", "deal_monthly_rollup": "month"}
+
+
+def _rebuild_deal_rollup(conn: sqlite3.Connection, fix: bool) -> List[Dict[str, Any]]:
+    drift = []
+    for table, sql in DEAL_ROLLUP_SQL.items():
+        key = ROLLUP_KEYS[table]
+        expected = {(row['key'], row['status']): (row['count'], row['volume'], row['fees'])
+                    for row in conn.execute(sql)}
+        # Baris yang sudah kosong (semua deal-nya pindah status) sama dengan tidak ada
+        actual = {(row[key], row['status']): (row['count'], row['volume'], row['fees'])
+                  for row in conn.execute(f"SELECT {key}, status, count, volume, fees FROM {table}")
+                  if row['count'] or row['volume'] or row['fees']}
+        for period, status in sorted(set(expected) | set(actual)):
+            wanted = expected.get((period, status), (0, 0, 0))
+            found = actual.get((period, status), (0, 0, 0))
+            if wanted != found:
+                drift.append({'table': table, 'key': period, 'status': status, 'expected': wanted, 'actual': found})
+        if fix and drift:
+            conn.execute(f"DELETE FROM {table}")
+            conn.execute(f"INSERT INTO {table} ({key}, status, count, volume, fees) {sql}")
+    return drift
+
+
+def rebuild_deal_rollup(fix: bool = True) -> List[Dict[str, Any]]:
+    """Hitung ulang rollup harian/bulanan dari tabel deals dan kembalikan daftar selisih.
+
+    Seperti reconcile_deal_counters: berjalan di writer thread, `fix=False`
+    hanya melaporkan. Setiap selisih berisi table, key (hari/bulan), status,
+    `expected` dan `actual` (count, volume, fees).
+    """
+    return writer.run(_rebuild_deal_rollup, fix)
+
+
+def deal_rollup_totals(conn: sqlite3.Connection, start: Optional[date] = None,
+                       end: Optional[date] = None) -> Dict[str, Dict[str, int]]:
+    """Jumlah count/volume/fees per status untuk deal yang dibuat pada [start, end).
+
+    Tanpa batas: semua baris bulanan. Selain itu bulan yang tercakup penuh
+    dibaca dari deal_monthly_rollup dan sisa hari di kedua ujung dari
+    deal_daily_rollup, jadi paling banyak ~60 hari + beberapa bulan per status
+    berapa pun panjang rentangnya.
+    """
+    if start is None and end is None:
+        parts = [("SELECT status, count, volume, fees FROM deal_monthly_rollup", ())]
+    else:
+        start = start or date.min
+        end = end or date.max
+        first_month = start if start.day == 1 else (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        last_month = end.replace(day=1)
+        if first_month < last_month:
+            parts = [
+                ("SELECT status, count, volume, fees FROM deal_monthly_rollup WHERE month >= ? AND month < ?",
+                 (first_month.isoformat()[:7], last_month.isoformat()[:7])),
+                ("SELECT status, count, volume, fees FROM deal_daily_rollup WHERE day >= ? AND day < ?",
+                 (start.isoformat(), first_month.isoformat())),
+                ("SELECT status, count, volume, fees FROM deal_daily_rollup WHERE day >= ? AND day < ?",
+                 (last_month.isoformat(), end.isoformat())),
+            ]
+        else:
+            parts = [("SELECT status, count, volume, fees FROM deal_daily_rollup WHERE day >= ? AND day < ?",
+                      (start.isoformat(), end.isoformat()))]
+
+    totals: Dict[str, Dict[str, int]] = {}
+    for sql, params in parts:
+        for status, count, volume, fees in conn.execute(sql, params):
+            if count:
+                total = totals.setdefault(status, {'count': 0, 'volume': 0, 'fees': 0})
+                total['count'] += count
+                total['volume'] += volume
+                total['fees'] += fees
+    return totals
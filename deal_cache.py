@@ -0,0 +1,175 @@
+"""Cache baris deal (read-through) untuk handler Rekber Bot.
+
+Satu alur (join, pembayaran, status) membaca deal yang sama berkali-kali;
+handler membacanya lewat cache ini:
+
+    deal = await deal_cache.get(deal_id)
+    if deal is None: ...  # deal tidak ada
+    deal['status'], deal['buyer_id'], ...
+
+- Yang dikembalikan snapshot seluruh kolom deal (read-only, akses seperti
+  sqlite3.Row), jadi satu entri melayani semua handler apa pun kolom yang
+  dibutuhkan. Maksimal DEAL_CACHE_SIZE deal (LRU).
+- Semua penulisan deals lewat lapisan data (deal_state.apply_transition,
+  apply_transition_batch, _join_deal) memanggil `invalidate` di transaksi
+  writer. Setelah commit, deal yang tadinya ada di cache diperbarui: dari
+  baris RETURNING * penulisan itu jika ada, selain itu dibaca ulang oleh
+  thread writer (satu SELECT per batch commit), jadi klik berikutnya pada
+  deal yang sama tetap hit. Hasil baca yang tumpang tindih dengan penulisan
+  tidak disimpan, sehingga cache tidak pernah menyimpan versi lama setelah
+  commit.
+- Deal baru dari handler pembuatan deal (`created`) langsung masuk cache
+  setelah commit, sehingga alur join mulai dengan hit.
+- Deal yang tidak ada tidak di-cache.
+"""
+import os
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Union
+
+from db_sqlite import db
+
+logger = logging.getLogger(__name__)
+
+DEAL_CACHE_SIZE = int(os.getenv("DEAL_CACHE_SIZE", "5000"))
+
+Deal = Mapping[str, Any]
+
+
+def _load(conn: sqlite3.Connection, deal_id: str) -> Optional[Deal]:
+    row = conn.execute("SELECT * FROM deals WHERE id = ?", (deal_id,)).fetchone()
+    return MappingProxyType(dict(row)) if row is not None else None
+
+
+class DealCache:
+    """LRU snapshot deal di atas tabel deals dengan invalidasi dari writer"""
+
+    def __init__(self, database=db, max_entries: int = DEAL_CACHE_SIZE):
+        self.db = database
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.refreshes = 0
+        self._deals: "OrderedDict[str, Deal]" = OrderedDict()
+        # invalidate() dipanggil dari thread writer, get() dari event loop
+        self._lock = threading.Lock()
+        # deal_id -> jumlah load yang sedang berjalan / invalidasi selama load itu
+        self._loading: Dict[str, int] = {}
+        self._dirty: Dict[str, int] = {}
+        # Ditulis di transaksi yang belum commit -> snapshot baru, True (baca ulang
+        # setelah commit) atau False (tidak ada di cache, cukup dibuang)
+        self._uncommitted: Dict[str, Union[Deal, bool]] = {}
+        database.writer.on_commit(self._committed)
+        database.writer.on_rollback(self._rolled_back)
+
+    def __len__(self):
+        return len(self._deals)
+
+    async def get(self, deal_id: str) -> Optional[Deal]:
+        """Snapshot deal, dibaca dari database jika belum ada di cache"""
+        with self._lock:
+            deal = self._deals.get(deal_id)
+            if deal is not None:
+                self._deals.move_to_end(deal_id)
+                self.hits += 1
+                return deal
+            self.misses += 1
+            self._loading[deal_id] = self._loading.get(deal_id, 0) + 1
+            dirty = self._dirty.get(deal_id, 0)
+        try:
+            deal = await self.db.run(_load, deal_id)
+        finally:
+            with self._lock:
+                # Ditulis selama load berjalan: hasilnya mungkin versi lama, jangan disimpan
+                if deal is not None and self._dirty.get(deal_id, 0) == dirty:
+                    self._store(deal_id, deal)
+                self._loading[deal_id] -= 1
+                if not self._loading[deal_id]:
+                    del self._loading[deal_id]
+                    self._dirty.pop(deal_id, None)
+        return deal
+
+    def _store(self, deal_id: str, deal: Deal):
+        self._deals[deal_id] = deal
+        self._deals.move_to_end(deal_id)
+        while len(self._deals) > self.max_entries:
+            self._deals.popitem(last=False)
+            self.evictions += 1
+
+    def _discard(self, deal_id: str):
+        self._deals.pop(deal_id, None)
+        if deal_id in self._loading:
+            self._dirty[deal_id] = self._dirty.get(deal_id, 0) + 1
+
+    def invalidate(self, deal_id: str, row: sqlite3.Row = None):
+        """Buang deal dari cache; panggil di transaksi yang menulis deal tersebut.
+
+        `row` adalah seluruh kolom deal setelah ditulis (RETURNING *), dipakai
+        sebagai snapshot baru setelah commit tanpa membaca ulang.
+        """
+        with self._lock:
+            self.invalidations += 1
+            if self._uncommitted.get(deal_id, False) is not False or deal_id in self._deals or deal_id in self._loading:
+                self._uncommitted[deal_id] = MappingProxyType(dict(row)) if row is not None else True
+            else:
+                self._uncommitted[deal_id] = False
+            self._discard(deal_id)
+
+    def created(self, deal_id: str, row: sqlite3.Row):
+        """Deal baru (INSERT ... RETURNING *) di transaksi ini: langsung di-cache setelah commit.
+
+        Pembuat deal membagikan link join, jadi baca pertama oleh pihak kedua
+        tidak perlu ke database.
+        """
+        with self._lock:
+            self._uncommitted[deal_id] = MappingProxyType(dict(row))
+            self._discard(deal_id)
+
+    def _rolled_back(self):
+        # Operasi di batch dibatalkan: snapshot yang sudah dicatat belum tentu ikut commit
+        with self._lock:
+            for deal_id, pending in self._uncommitted.items():
+                if pending is not False:
+                    self._uncommitted[deal_id] = True
+
+    def _committed(self, conn: sqlite3.Connection):
+        # Dipanggil di thread writer setelah commit. Yang dibaca sebelum commit
+        # masih melihat versi lama: buang sekali lagi, lalu perbarui deal yang
+        # memang sedang dipakai. Tidak ada penulis lain selama ini berjalan.
+        with self._lock:
+            uncommitted, self._uncommitted = self._uncommitted, {}
+            for deal_id in uncommitted:
+                self._discard(deal_id)
+        if not self.max_entries:
+            return
+        snapshots = {deal_id: pending for deal_id, pending in uncommitted.items() if not isinstance(pending, bool)}
+        refresh = [deal_id for deal_id, pending in uncommitted.items() if pending is True]
+        if refresh:
+            for row in conn.execute(
+                f"SELECT * FROM deals WHERE id IN ({', '.join('?' * len(refresh))})", refresh
+            ).fetchall():
+                snapshots[row['id']] = MappingProxyType(dict(row))
+            self.refreshes += len(refresh)
+        with self._lock:
+            for deal_id, deal in snapshots.items():
+                self._store(deal_id, deal)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._deals),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "refreshes": self.refreshes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+deal_cache = DealCache()
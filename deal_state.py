@@ -0,0 +1,252 @@
+"""State machine status transaksi Rekber.
+
+Semua perubahan status deal lewat modul ini. Setiap transisi dijalankan
+sebagai satu UPDATE bersyarat (compare-and-set):
+
+    UPDATE deals SET status = <tujuan> WHERE id = ? AND status IN (<asal>) RETURNING ...
+
+ditambah baris log di transaksi yang sama. Jika dua orang menekan tombol
+bersamaan, hanya satu UPDATE yang cocok; yang lain mendapat None.
+
+Alur utama:
+    PENDING_JOIN -> PENDING_FUNDING -> WAITING_PAYMENT_PROOF -> WAITING_VERIFICATION
+    -> FUNDED -> AWAITING_CONFIRM -> RELEASED -> AWAITING_PAYOUT -> COMPLETED
+
+Setiap deal yang berubah dibuang dari deal_cache di transaksi yang sama;
+transisi ke COMPLETED juga menandai leaderboard basi.
+
+Notifikasi untuk pihak terkait ditulis ke outbox di transaksi yang sama
+(parameter `notify`), lalu dikirim relay di outbox.py setelah commit.
+
+Setiap transisi juga mengisi `expires_at` sesuai `DEADLINES` status tujuan
+(NULL jika status tersebut tidak punya batas waktu), sehingga sweeper cukup
+membaca deadline terdekat dari index.
+
+Pekerjaan lain yang terikat status (mis. reminder pembayaran) didaftarkan
+lewat `on_enter`/`on_leave` dan ikut berjalan di transaksi transisi.
+"""
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, FrozenSet, List, NamedTuple, Optional, Sequence
+
+from db_sqlite import db
+from deal_cache import deal_cache
+from leaderboard import leaderboard
+from outbox import Notification, enqueue, outbox
+
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "500"))
+
+
+class Transition(NamedTuple):
+    sources: FrozenSet[str]
+    target: str
+
+
+def _t(sources, target) -> Transition:
+    return Transition(frozenset(sources), target)
+
+
+TRANSITIONS: Dict[str, Transition] = {
+    # Pihak kedua bergabung, pembeli & penjual lengkap
+    "JOIN": _t({"PENDING_JOIN"}, "PENDING_FUNDING"),
+    # Pembeli mulai transfer, bot menunggu foto bukti
+    "FUND_CONFIRM": _t({"PENDING_FUNDING"}, "WAITING_PAYMENT_PROOF"),
+    "SUBMIT_PROOF": _t({"WAITING_PAYMENT_PROOF"}, "WAITING_VERIFICATION"),
+    "VERIFY_PAYMENT": _t({"WAITING_VERIFICATION"}, "FUNDED"),
+    "REJECT_PAYMENT": _t({"WAITING_VERIFICATION"}, "PENDING_FUNDING"),
+    "MARK_SHIPPED": _t({"FUNDED"}, "AWAITING_CONFIRM"),
+    # Pembeli konfirmasi barang diterima
+    "RELEASE": _t({"AWAITING_CONFIRM", "SHIPPED"}, "RELEASED"),
+    "OPEN_DISPUTE": _t({"FUNDED", "SHIPPED", "AWAITING_CONFIRM"}, "DISPUTED"),
+    "ADMIN_RELEASE": _t({"DISPUTED"}, "RELEASED"),
+    "ADMIN_REFUND": _t({"DISPUTED"}, "REFUNDED"),
+    # Penjual mengisi data pencairan
+    "SUBMIT_PAYOUT": _t({"FUNDED", "AWAITING_CONFIRM", "RELEASED"}, "AWAITING_PAYOUT"),
+    # Admin mencairkan dana ke penjual
+    "COMPLETE": _t({"RELEASED", "AWAITING_PAYOUT"}, "COMPLETED"),
+    "CANCEL": _t({"PENDING_JOIN", "PENDING_FUNDING"}, "CANCELLED"),
+    # Pembatalan yang disetujui kedua pihak (lihat rekber_cancel_request)
+    "CANCEL_APPROVED": _t({"PENDING_FUNDING", "FUNDED", "AWAITING_CONFIRM"}, "CANCELLED"),
+    # Sweeper otomatis di handlers/notifications.py (CREATED/SHIPPED: deal versi lama)
+    "AUTO_CANCEL": _t({"PENDING_JOIN", "PENDING_FUNDING", "CREATED"}, "CANCELLED"),
+    # Dana dilepas seperti RELEASE; pencairan ke penjual tetap lewat admin
+    "AUTO_COMPLETE": _t({"AWAITING_CONFIRM", "SHIPPED"}, "RELEASED"),
+}
+
+# Status dengan batas waktu: (lama, event yang dijalankan sweeper saat lewat)
+DEADLINES: Dict[str, tuple] = {
+    # Pihak kedua tidak bergabung / pembeli tidak transfer
+    "PENDING_JOIN": (timedelta(hours=24), "AUTO_CANCEL"),
+    "PENDING_FUNDING": (timedelta(hours=24), "AUTO_CANCEL"),
+    # Pembeli tidak konfirmasi penerimaan barang
+    "AWAITING_CONFIRM": (timedelta(hours=72), "AUTO_COMPLETE"),
+}
+
+# Dipanggil dengan deadline baru setiap kali transisi mengisi expires_at
+# (dari thread writer, sebelum commit)
+_deadline_listeners: List[Callable[[datetime], None]] = []
+
+
+def on_deadline(callback: Callable[[datetime], None]):
+    _deadline_listeners.append(callback)
+
+
+def off_deadline(callback: Callable[[datetime], None]):
+    if callback in _deadline_listeners:
+        _deadline_listeners.remove(callback)
+
+
+# Hook per status, dijalankan di transaksi transisi (mis. menjadwalkan dan
+# membatalkan reminder di handlers/notifications.py)
+_enter_hooks: Dict[str, List[Callable[[sqlite3.Connection, str, datetime], None]]] = {}
+_leave_hooks: Dict[str, List[Callable[[sqlite3.Connection, str], None]]] = {}
+
+
+def on_enter(status: str, callback: Callable[[sqlite3.Connection, str, datetime], None]):
+    """callback(conn, deal_id, now) setiap kali deal masuk ke `status`"""
+    _enter_hooks.setdefault(status, []).append(callback)
+
+
+def on_leave(status: str, callback: Callable[[sqlite3.Connection, str], None]):
+    """callback(conn, deal_id) setiap kali deal (mungkin) keluar dari `status`.
+
+    Transisi dengan beberapa status asal memanggil hook semua status asalnya,
+    jadi callback harus aman dipanggil untuk deal yang tidak berstatus itu.
+    """
+    _leave_hooks.setdefault(status, []).append(callback)
+
+
+def _run_hooks(conn: sqlite3.Connection, transition: Transition, deal_ids: Sequence[str], now: datetime):
+    for status in transition.sources - {transition.target}:
+        for callback in _leave_hooks.get(status, ()):
+            for deal_id in deal_ids:
+                callback(conn, deal_id)
+    for callback in _enter_hooks.get(transition.target, ()):
+        for deal_id in deal_ids:
+            callback(conn, deal_id, now)
+
+
+def deadline_for(status: str, now: datetime) -> Optional[datetime]:
+    deadline = DEADLINES.get(status)
+    return now + deadline[0] if deadline else None
+
+
+def _announce(expires_at: Optional[datetime]):
+    if expires_at is None:
+        return
+    for callback in _deadline_listeners:
+        callback(expires_at)
+
+
+def initial_deadline(status: str, now: datetime) -> Optional[datetime]:
+    """expires_at untuk deal baru berstatus `status` (INSERT deal di handler); deadline-nya ikut diumumkan"""
+    expires_at = deadline_for(status, now)
+    _announce(expires_at)
+    return expires_at
+
+
+# Guard umum untuk parameter `guard`; parameternya user_id
+BUYER = "buyer_id = ?"
+SELLER = "seller_id = ?"
+PARTY = "? IN (buyer_id, seller_id)"
+
+
+def can_transition(status: str, event: str) -> bool:
+    return status in TRANSITIONS[event].sources
+
+
+def apply_transition(conn: sqlite3.Connection, deal_id: str, event: str, actor_id: int, role: str,
+                     detail: str = None, action: str = None, guard: str = None,
+                     guard_params: Sequence[Any] = (), fields: Dict[str, Any] = None,
+                     returning: str = "*",
+                     notify: Callable[[sqlite3.Row], List[Notification]] = None) -> Optional[sqlite3.Row]:
+    """Jalankan transisi di transaksi yang sedang berjalan pada `conn`.
+
+    Mengembalikan baris deal (kolom `returning`) setelah berubah, atau None
+    jika deal tidak ada, statusnya bukan status asal transisi, atau `guard`
+    tidak terpenuhi. Log (`action`, default nama event) hanya ditulis jika
+    transisi berhasil, begitu juga notifikasi hasil `notify(row)` ke outbox.
+    Tidak commit: dipanggil lewat db.transaction.
+    """
+    transition = TRANSITIONS[event]
+    now = datetime.now()
+    expires_at = deadline_for(transition.target, now)
+    assignments = ["status = ?", "updated_at = ?", "expires_at = ?"]
+    params = [transition.target, now, expires_at]
+    for column, value in (fields or {}).items():
+        assignments.append(f"{column} = ?")
+        params.append(value)
+
+    sources = sorted(transition.sources)
+    sql = (
+        f"UPDATE deals SET {', '.join(assignments)} "
+        f"WHERE id = ? AND status IN ({', '.join('?' * len(sources))})"
+    )
+    params += [deal_id, *sources]
+    if guard:
+        sql += f" AND ({guard})"
+        params += list(guard_params)
+    row = conn.execute(f"{sql} RETURNING {returning}", params).fetchone()
+    if row is None:
+        return None
+    deal_cache.invalidate(deal_id, row if returning == "*" else None)
+    if transition.target == "COMPLETED":
+        leaderboard.invalidate()
+
+    conn.execute(
+        "INSERT INTO logs (deal_id, actor_id, role, action, detail, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (deal_id, actor_id, role, action or event, detail, now)
+    )
+    _run_hooks(conn, transition, (deal_id,), now)
+    if notify is not None:
+        for notification in notify(row):
+            enqueue(conn, notification.chat_id, notification.text, deal_id=deal_id, **notification.options)
+    _announce(expires_at)
+    return row
+
+
+def apply_transition_batch(conn: sqlite3.Connection, event: str, condition: str, params: Sequence[Any],
+                           actor_id: int, role: str, detail: str = None, limit: int = SWEEP_BATCH_SIZE,
+                           returning: str = "*") -> List[sqlite3.Row]:
+    """Transisi massal untuk sweeper: satu UPDATE ... RETURNING untuk maksimal `limit` deal.
+
+    `condition` adalah filter tambahan atas tabel deals (parameternya
+    `params`). Log ditulis sekaligus dengan executemany. `returning` harus
+    memuat kolom id. Panggil berulang sampai hasilnya kurang dari `limit`;
+    setiap panggilan adalah transaksi sendiri sehingga lock tulis hanya
+    dipegang selama satu batch.
+    """
+    transition = TRANSITIONS[event]
+    now = datetime.now()
+    expires_at = deadline_for(transition.target, now)
+    sources = sorted(transition.sources)
+    rows = conn.execute(
+        f"UPDATE deals SET status = ?, updated_at = ?, expires_at = ? WHERE id IN ("
+        f"SELECT id FROM deals WHERE status IN ({', '.join('?' * len(sources))}) AND ({condition}) LIMIT ?"
+        f") RETURNING {returning}",
+        [transition.target, now, expires_at, *sources, *params, limit]
+    ).fetchall()
+    conn.executemany(
+        "INSERT INTO logs (deal_id, actor_id, role, action, detail, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [(row['id'], actor_id, role, event, detail, now) for row in rows]
+    )
+    for row in rows:
+        deal_cache.invalidate(row['id'], row if returning == "*" else None)
+    _run_hooks(conn, transition, [row['id'] for row in rows], now)
+    if rows and transition.target == "COMPLETED":
+        leaderboard.invalidate()
+    if rows:
+        _announce(expires_at)
+    return rows
+
+
+async def transition(deal_id: str, event: str, actor_id: int, role: str, detail: str = None,
+                     **kwargs) -> Optional[sqlite3.Row]:
+    """Versi async apply_transition untuk handler (lewat writer thread)"""
+    row = await db.transaction(
+        lambda conn: apply_transition(conn, deal_id, event, actor_id, role, detail, **kwargs)
+    )
+    if row is not None and kwargs.get("notify") is not None:
+        outbox.wake()
+    return row
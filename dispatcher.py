@@ -0,0 +1,352 @@
+"""Dispatcher pesan keluar Rekber Bot yang menghormati limit Telegram.
+
+Semua send_message/send_photo lewat satu antrean:
+
+    await dispatcher.send_message(chat_id, "teks", parse_mode="Markdown")
+    await dispatcher.send_message(chat_id, "reminder", priority=REMINDER)
+
+- Token bucket global (DISPATCH_GLOBAL_RATE pesan/detik, limit Telegram ~30)
+  dan per chat (1 pesan/DISPATCH_CHAT_INTERVAL detik untuk chat pribadi,
+  1 pesan/DISPATCH_GROUP_INTERVAL detik untuk grup/channel, limit 20/menit).
+- Tiga lajur prioritas: INTERACTIVE (balasan ke user) > REMINDER > BROADCAST.
+  Chat yang siap kirim dilayani dari lajur tertinggi lebih dulu.
+- Urutan pesan dalam satu chat tetap FIFO per prioritas, dan hanya satu
+  pesan per chat yang sedang dikirim.
+- Pesan teks beruntun ke chat yang sama (parse_mode sama, tanpa
+  reply_markup) digabung menjadi satu pesan selama muat 4096 karakter.
+- RetryAfter: semua pengiriman ditahan selama retry_after lalu pesan
+  dikirim ulang; pemanggil hanya melihat hasil akhirnya.
+- Antrean dibatasi DISPATCH_MAX_QUEUE pesan; pengirim REMINDER/BROADCAST
+  menunggu jika penuh, balasan INTERACTIVE tetap masuk.
+"""
+import os
+import time
+import heapq
+import asyncio
+import logging
+from collections import deque
+from datetime import timedelta
+from typing import Any, Deque, Dict, List, Optional, Union
+
+from telegram.error import RetryAfter
+
+from rate_limiter import RatePolicy, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, REMINDER, BROADCAST = 0, 1, 2
+LANES = ("interactive", "reminder", "broadcast")
+
+DISPATCH_GLOBAL_RATE = float(os.getenv("DISPATCH_GLOBAL_RATE", "29"))
+DISPATCH_CHAT_INTERVAL = float(os.getenv("DISPATCH_CHAT_INTERVAL", "1.05"))
+DISPATCH_GROUP_INTERVAL = float(os.getenv("DISPATCH_GROUP_INTERVAL", "3.1"))
+DISPATCH_MAX_QUEUE = int(os.getenv("DISPATCH_MAX_QUEUE", "10000"))
+# Request HTTP ke Bot API yang berjalan bersamaan
+DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", "32"))
+MAX_MESSAGE_LENGTH = 4096
+# Sampel latensi antre per lajur untuk stats()
+LATENCY_SAMPLES = 1000
+
+ChatId = Union[int, str]
+
+
+def is_group(chat_id: ChatId) -> bool:
+    """Grup/channel: id negatif atau @username channel"""
+    return isinstance(chat_id, str) or chat_id < 0
+
+
+def _seconds(retry_after: Union[int, float, timedelta]) -> float:
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class _Message:
+    __slots__ = ("method", "kwargs", "priority", "futures", "enqueued")
+
+    def __init__(self, method: str, kwargs: Dict[str, Any], priority: int, future: asyncio.Future):
+        self.method = method
+        self.kwargs = kwargs
+        self.priority = priority
+        self.futures = [future]
+        self.enqueued = time.monotonic()
+
+    @property
+    def coalescible(self) -> bool:
+        return self.method == "send_message" and "reply_markup" not in self.kwargs
+
+
+class _Chat:
+    __slots__ = ("chat_id", "policy", "queues", "bucket", "in_flight", "waiting", "lane", "paused_until")
+
+    def __init__(self, chat_id: ChatId, policy: RatePolicy, now: float):
+        self.chat_id = chat_id
+        self.policy = policy
+        self.queues: List[Deque[_Message]] = [deque() for _ in LANES]
+        self.bucket = TokenBucket(policy, now)
+        self.in_flight = False
+        self.waiting = False
+        # Lajur ready tempat chat ini terdaftar (None jika tidak ada)
+        self.lane: Optional[int] = None
+        self.paused_until = 0.0
+
+    def head(self) -> Optional[int]:
+        for priority, queue in enumerate(self.queues):
+            if queue:
+                return priority
+        return None
+
+
+class Dispatcher:
+    """Antrean pesan keluar dengan token bucket global + per chat dan lajur prioritas"""
+
+    def __init__(self, global_rate: float = DISPATCH_GLOBAL_RATE, chat_interval: float = DISPATCH_CHAT_INTERVAL,
+                 group_interval: float = DISPATCH_GROUP_INTERVAL, max_queue: int = DISPATCH_MAX_QUEUE,
+                 concurrency: int = DISPATCH_CONCURRENCY):
+        self.bot = None
+        self.max_queue = max_queue
+        self.concurrency = concurrency
+        self.chat_policy = RatePolicy(1, chat_interval)
+        self.group_policy = RatePolicy(1, group_interval)
+        self._global = TokenBucket(RatePolicy(1, 1 / global_rate), time.monotonic())
+        self._chats: Dict[ChatId, _Chat] = {}
+        self._ready: List[Deque[_Chat]] = [deque() for _ in LANES]
+        # (siap_pada, urutan, chat) untuk chat yang menunggu bucket atau RetryAfter
+        self._waiting = []
+        self._seq = 0
+        self._queued = 0
+        self._depth = [0] * len(LANES)
+        self._latency: List[Deque[float]] = [deque(maxlen=LATENCY_SAMPLES) for _ in LANES]
+        self._evict_at = 0.0
+        # RetryAfter dari Telegram: semua pengiriman ditahan sampai waktu ini
+        self._paused_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.errors = 0
+        self.queue_full = 0
+
+    def start(self, bot):
+        """Mulai worker dispatcher di event loop yang sedang berjalan"""
+        self.bot = bot
+        self._wake = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self, timeout: float = 10.0):
+        """Tunggu antrean kosong (maks `timeout` detik) lalu hentikan worker"""
+        deadline = time.monotonic() + timeout
+        while self._queued and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def send_message(self, chat_id: ChatId, text: str, priority: int = INTERACTIVE, **kwargs):
+        return await self._submit("send_message", chat_id, priority, dict(kwargs, text=text))
+
+    async def send_photo(self, chat_id: ChatId, photo, priority: int = INTERACTIVE, **kwargs):
+        return await self._submit("send_photo", chat_id, priority, dict(kwargs, photo=photo))
+
+    def stats(self) -> Dict[str, Any]:
+        """Metrik antrean: kedalaman per lajur, jumlah terkirim/digabung/RetryAfter/error, latensi antre"""
+        latency = {}
+        for lane, samples in zip(LANES, self._latency):
+            ordered = sorted(samples)
+            if ordered:
+                latency[lane] = {
+                    "p50_ms": ordered[len(ordered) // 2] * 1000,
+                    "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+                }
+        return {
+            "queued": self._queued,
+            "lanes": dict(zip(LANES, self._depth)),
+            "chats": len(self._chats),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retry_after": self.retried,
+            "errors": self.errors,
+            "queue_full": self.queue_full,
+            "latency": latency,
+        }
+
+    # --- Antrean ---
+
+    async def _submit(self, method: str, chat_id: ChatId, priority: int, kwargs: Dict[str, Any]):
+        if self._task is None:
+            raise RuntimeError("Dispatcher belum dijalankan (dispatcher.start(bot))")
+        # Balasan interaktif tidak ikut menunggu; backpressure hanya untuk pengirim massal
+        if priority != INTERACTIVE and self._queued >= self.max_queue:
+            self.queue_full += 1
+            async with self._space:
+                await self._space.wait_for(lambda: self._queued < self.max_queue)
+
+        now = time.monotonic()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            policy = self.group_policy if is_group(chat_id) else self.chat_policy
+            chat = self._chats[chat_id] = _Chat(chat_id, policy, now)
+        future = asyncio.get_running_loop().create_future()
+        chat.queues[priority].append(_Message(method, dict(kwargs, chat_id=chat_id), priority, future))
+        self._queued += 1
+        self._depth[priority] += 1
+
+        if chat.lane is not None and priority < chat.lane:
+            # Chat sudah siap di lajur lebih rendah: naikkan ke lajur pesan baru
+            self._mark_ready(chat, priority)
+        elif not (chat.in_flight or chat.waiting or chat.lane is not None):
+            self._schedule(chat, now)
+        self._wake.set()
+        return await future
+
+    def _mark_ready(self, chat: _Chat, lane: int):
+        # Entri lama di lajur lain diabaikan saat diambil (chat.lane tidak cocok)
+        chat.lane = lane
+        self._ready[lane].append(chat)
+
+    def _schedule(self, chat: _Chat, now: float):
+        """Masukkan chat ke lajur ready, atau ke heap tunggu jika bucket/pause belum lewat"""
+        head = chat.head()
+        if head is None:
+            return
+        ready_at = max(chat.paused_until, now + chat.bucket.retry_after(now))
+        if ready_at <= now:
+            self._mark_ready(chat, head)
+        else:
+            chat.waiting = True
+            self._seq += 1
+            heapq.heappush(self._waiting, (ready_at, self._seq, chat))
+
+    def _promote(self, now: float):
+        while self._waiting and self._waiting[0][0] <= now:
+            _, _, chat = heapq.heappop(self._waiting)
+            chat.waiting = False
+            self._schedule(chat, now)
+
+    def _next_ready(self) -> Optional[_Chat]:
+        for lane, ready in enumerate(self._ready):
+            while ready:
+                chat = ready.popleft()
+                if chat.lane == lane:
+                    chat.lane = None
+                    return chat
+        return None
+
+    def _take(self, chat: _Chat) -> _Message:
+        """Ambil pesan terdepan chat, digabung dengan pesan teks sejenis di belakangnya"""
+        queue = chat.queues[chat.head()]
+        message = queue.popleft()
+        if not message.coalescible:
+            return message
+        parse_mode = message.kwargs.get("parse_mode")
+        texts = [message.kwargs["text"]]
+        length = len(texts[0])
+        while queue and queue[0].coalescible and queue[0].kwargs.get("parse_mode") == parse_mode:
+            text = queue[0].kwargs["text"]
+            if length + 2 + len(text) > MAX_MESSAGE_LENGTH:
+                break
+            merged = queue.popleft()
+            message.futures.extend(merged.futures)
+            texts.append(text)
+            length += 2 + len(text)
+            self.coalesced += 1
+        if len(texts) > 1:
+            message.kwargs["text"] = "\n\n".join(texts)
+        return message
+
+    def _evict(self, now: float):
+        # Chat idle dengan bucket penuh setara chat baru
+        for chat_id in [chat_id for chat_id, chat in self._chats.items()
+                        if chat.head() is None and not chat.in_flight and chat.bucket.is_full(now)]:
+            del self._chats[chat_id]
+        self._evict_at = now + 60
+
+    # --- Worker ---
+
+    async def _run(self):
+        while True:
+            try:
+                now = time.monotonic()
+                if now >= self._evict_at:
+                    self._evict(now)
+                self._promote(now)
+                chat = self._next_ready()
+                if chat is None:
+                    timeout = self._waiting[0][0] - now if self._waiting else None
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                wait = max(self._global.retry_after(now), self._paused_until - now)
+                if wait > 0:
+                    # Kembalikan ke depan lajurnya; bisa disalip chat berprioritas lebih tinggi
+                    chat.lane = chat.head()
+                    self._ready[chat.lane].appendleft(chat)
+                    await asyncio.sleep(wait)
+                    continue
+                if not chat.bucket.consume(now):
+                    self._schedule(chat, now)
+                    continue
+                self._global.consume(now)
+
+                message = self._take(chat)
+                chat.in_flight = True
+                await self._slots.acquire()
+                asyncio.create_task(self._send(chat, message))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in dispatcher loop: {e}")
+                await asyncio.sleep(1)
+
+    async def _send(self, chat: _Chat, message: _Message):
+        done = True
+        try:
+            result = await getattr(self.bot, message.method)(**message.kwargs)
+        except RetryAfter as e:
+            # Kirim ulang pesan yang sama (termasuk yang sudah digabung) setelah jeda
+            delay = _seconds(e.retry_after)
+            self.retried += 1
+            logger.warning(f"RetryAfter {delay:.0f}s untuk chat {chat.chat_id}")
+            chat.paused_until = time.monotonic() + delay
+            self._paused_until = max(self._paused_until, chat.paused_until)
+            chat.queues[message.priority].appendleft(message)
+            done = False
+        except Exception as e:
+            self.errors += 1
+            for future in message.futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self.sent += 1
+            for future in message.futures:
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            chat.in_flight = False
+            self._slots.release()
+
+        # Jarak antar pesan dihitung dari respons terakhir, bukan dari saat kirim,
+        # agar variasi latensi HTTP tidak membuat dua pesan tiba terlalu rapat
+        now = time.monotonic()
+        chat.bucket = TokenBucket(chat.policy, now, tokens=0)
+        if done:
+            count = len(message.futures)
+            self._queued -= count
+            self._depth[message.priority] -= count
+            self._latency[message.priority].append(now - message.enqueued)
+            async with self._space:
+                self._space.notify_all()
+        self._schedule(chat, now)
+        self._wake.set()
+
+
+dispatcher = Dispatcher()
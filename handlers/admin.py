@@ -1,6 +1,11 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from db_sqlite import get_connection, log_action, get_payout_info, get_admin_dashboard_stats
+from db_sqlite import db, get_payout_info, get_admin_dashboard_stats
+from deal_state import transition
+from dispatcher import dispatcher
+from outbox import Notification
+from profile_cache import profile_cache
+from deal_cache import deal_cache
 from utils import format_rupiah
 import config
 import logging
@@ -8,61 +13,76 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def _payment_verified_notifications(deal_id: str, row):
+    """Notifikasi pembayaran terverifikasi ke pembeli & penjual (ditulis ke outbox)"""
+    keyboard_seller = [[InlineKeyboardButton("📦 Tandai Sudah Dikirim", callback_data=f"rekber_mark_shipped|{deal_id}")]]
+    return [
+        Notification(
+            row['buyer_id'],
+            f"✅ Pembayaran untuk transaksi <b>{row['title']}</b> sudah diverifikasi. Menunggu pengiriman barang/jasa dari penjual.",
+            {"parse_mode": "HTML"}
+        ),
+        Notification(
+            row['seller_id'],
+            f"✅ Pembayaran untuk transaksi <b>{row['title']}</b> sudah diverifikasi. Silakan kirim barang/jasa ke pembeli dan klik tombol di bawah setelah selesai.",
+            {"parse_mode": "HTML", "reply_markup": InlineKeyboardMarkup(keyboard_seller)}
+        ),
+    ]
+
+
+def _rating_keyboard(deal_id: str):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("⭐ Berikan Ulasan (1)", callback_data=f"rate|{deal_id}|1"),
+         InlineKeyboardButton("⭐⭐ Berikan Ulasan (2)", callback_data=f"rate|{deal_id}|2")],
+        [InlineKeyboardButton("⭐⭐⭐ Berikan Ulasan (3)", callback_data=f"rate|{deal_id}|3"),
+         InlineKeyboardButton("⭐⭐⭐⭐ Berikan Ulasan (4)", callback_data=f"rate|{deal_id}|4")],
+        [InlineKeyboardButton("⭐⭐⭐⭐⭐ Berikan Ulasan (5)", callback_data=f"rate|{deal_id}|5")],
+        [InlineKeyboardButton("📝 Kirim Testimoni", callback_data=f"send_testimoni_menu|{deal_id}")]
+    ])
+
+
+def _final_release_notifications(deal_id: str, row):
+    """Notifikasi dana final dirilis + ajakan rating (ditulis ke outbox)"""
+    return [
+        Notification(
+            row['buyer_id'],
+            f"🎉 *Selamat! Rekber* `{deal_id}` *telah selesai*\n\n"
+            f"✅ Dana telah berhasil dirilis ke penjual\n"
+            f"🙏 Terima kasih telah menggunakan REKBER-BOT by Nexo\n\n"
+            f"💬 Bagaimana pengalaman transaksi Anda dengan penjual?",
+            {"parse_mode": "Markdown", "reply_markup": _rating_keyboard(deal_id)}
+        ),
+        Notification(
+            row['seller_id'],
+            f"🎉 *Selamat! Rekber* `{deal_id}` *telah selesai*\n\n"
+            f"💰 Dana sebesar {format_rupiah(row['amount'])} telah dirilis ke Anda\n"
+            f"🙏 Terima kasih telah menggunakan REKBER-BOT by Nexo\n\n"
+            f"💬 Bagaimana pengalaman transaksi Anda dengan pembeli?",
+            {"parse_mode": "Markdown", "reply_markup": _rating_keyboard(deal_id)}
+        ),
+    ]
+
+
 async def rekber_admin_verify(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Admin handler untuk verifikasi pembayaran"""
     query = update.callback_query
     await query.answer()
     deal_id = query.data.split("|")[1]
 
-    conn = get_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT buyer_id, seller_id, title, amount, admin_fee, admin_fee_payer FROM deals WHERE id = ?", (deal_id,))
-        row = cur.fetchone()
-
-        if not row:
-            await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-            return
-
-        buyer_id = row['buyer_id']
-        seller_id = row['seller_id']
-        title = row['title']
-        amount = int(row['amount'])  # Convert to integer
-        admin_fee = int(row['admin_fee'])
-        admin_fee_payer = row['admin_fee_payer']
-
-        # Update status ke FUNDED (dana sudah terverifikasi)
-        cur.execute("UPDATE deals SET status = ? WHERE id = ?", ("FUNDED", deal_id))
-        conn.commit()
+        # Update status ke FUNDED (dana sudah terverifikasi); log dan notifikasi di transaksi yang sama
+        row = await transition(
+            deal_id, "VERIFY_PAYMENT", query.from_user.id, "ADMIN", "Admin verifikasi pembayaran",
+            returning="buyer_id, seller_id, title", notify=lambda row: _payment_verified_notifications(deal_id, row)
+        )
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error in rekber_admin_verify: {e}")
         await query.edit_message_text("❌ Terjadi kesalahan saat verifikasi.")
         return
-    finally:
-        cur.close()
-        from db_sqlite import return_connection
-        return_connection(conn)
-
-    # Log the verification
-    from db_sqlite import log_action
-    log_action(deal_id, query.from_user.id, "ADMIN", "VERIFY_PAYMENT", f"Admin verifikasi pembayaran untuk {title}")
-
-    # Notifikasi ke pembeli
-    await context.bot.send_message(
-        chat_id=buyer_id,
-        text=f"✅ Pembayaran untuk transaksi <b>{title}</b> sudah diverifikasi. Menunggu pengiriman barang/jasa dari penjual.",
-        parse_mode="HTML"
-    )
 
-    # Notifikasi ke penjual dengan tombol mark shipped
-    keyboard_seller = [[InlineKeyboardButton("📦 Tandai Sudah Dikirim", callback_data=f"rekber_mark_shipped|{deal_id}")]]
-    await context.bot.send_message(
-        chat_id=seller_id,
-        text=f"✅ Pembayaran untuk transaksi <b>{title}</b> sudah diverifikasi. Silakan kirim barang/jasa ke pembeli dan klik tombol di bawah setelah selesai.",
-        parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(keyboard_seller)
-    )
+    if not row:
+        await query.edit_message_text("❌ Transaksi tidak ditemukan atau sudah diproses.")
+        return
 
     await query.edit_message_text(f"✅ Pembayaran untuk transaksi {deal_id} berhasil diverifikasi.")
 
@@ -73,27 +93,19 @@ async def admin_release_final(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     deal_id = query.data.split("|")[1]
 
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT buyer_id, seller_id, title, amount FROM deals WHERE id=?", (deal_id,))
-        row = cur.fetchone()
-    finally:
-        cur.close()
-        from db_sqlite import return_connection
-        return_connection(conn)
+    row = await deal_cache.get(deal_id)
 
     if not row:
         await query.edit_message_text("❌ Transaksi tidak ditemukan.")
         return
 
-    buyer_id, seller_id, title, amount = row
-    payout = get_payout_info(deal_id)
+    seller_id, title, amount = row['seller_id'], row['title'], row['amount']
+    payout = await db.call(get_payout_info, deal_id)
 
     if not payout:
         # otomatis minta seller mengisi
         kb_seller = [[InlineKeyboardButton("💳 Isi Rekening Pencairan", callback_data=f"payout_start|{deal_id}")]]
-        await context.bot.send_message(
+        await dispatcher.send_message(
             seller_id,
             f"⚠️ Admin akan merilis dana untuk `{deal_id}`, namun data pencairan belum ada.\n"
             f"Silakan isi terlebih dahulu:",
@@ -159,29 +171,20 @@ async def admin_release_execute(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     deal_id = query.data.split("|")[1]
 
-    conn = get_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT buyer_id, seller_id, title, amount FROM deals WHERE id=?", (deal_id,))
-        row = cur.fetchone()
-        if not row:
-            await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-            return
-
-        buyer_id, seller_id, title, amount = row
-
-        cur.execute("UPDATE deals SET status='COMPLETED' WHERE id=?", (deal_id,))
-        conn.commit()
+        row = await transition(
+            deal_id, "COMPLETE", query.from_user.id, "ADMIN", "Admin melepaskan dana final ke seller",
+            action="FINAL_RELEASE", returning="buyer_id, seller_id, title, amount",
+            notify=lambda row: _final_release_notifications(deal_id, row)
+        )
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error in admin_release_execute: {e}")
         await query.edit_message_text("❌ Terjadi kesalahan saat mengeksekusi pencairan.")
         return
-    finally:
-        cur.close()
-        from db_sqlite import return_connection
-        return_connection(conn)
 
+    if not row:
+        await query.edit_message_text("❌ Transaksi tidak ditemukan atau sudah diproses.")
+        return
 
     await query.edit_message_text(
         f"✅ *Dana Rekber* `{deal_id}` *berhasil dirilis ke seller*\n\n"
@@ -189,45 +192,6 @@ async def admin_release_execute(update: Update, context: ContextTypes.DEFAULT_TY
         parse_mode="Markdown"
     )
 
-    # (Notifikasi rating ke buyer & seller – pakai blok yang sama seperti sebelumnya)
-    buyer_keyboard = [
-        [InlineKeyboardButton("⭐ Berikan Ulasan (1)", callback_data=f"rate|{deal_id}|1"),
-         InlineKeyboardButton("⭐⭐ Berikan Ulasan (2)", callback_data=f"rate|{deal_id}|2")],
-        [InlineKeyboardButton("⭐⭐⭐ Berikan Ulasan (3)", callback_data=f"rate|{deal_id}|3"),
-         InlineKeyboardButton("⭐⭐⭐⭐ Berikan Ulasan (4)", callback_data=f"rate|{deal_id}|4")],
-        [InlineKeyboardButton("⭐⭐⭐⭐⭐ Berikan Ulasan (5)", callback_data=f"rate|{deal_id}|5")],
-        [InlineKeyboardButton("📝 Kirim Testimoni", callback_data=f"send_testimoni_menu|{deal_id}")]
-    ]
-    await context.bot.send_message(
-        buyer_id,
-        f"🎉 *Selamat! Rekber* `{deal_id}` *telah selesai*\n\n"
-        f"✅ Dana telah berhasil dirilis ke penjual\n"
-        f"🙏 Terima kasih telah menggunakan REKBER-BOT by Nexo\n\n"
-        f"💬 Bagaimana pengalaman transaksi Anda dengan penjual?",
-        parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup(buyer_keyboard)
-    )
-
-    seller_keyboard = [
-        [InlineKeyboardButton("⭐ Berikan Ulasan (1)", callback_data=f"rate|{deal_id}|1"),
-         InlineKeyboardButton("⭐⭐ Berikan Ulasan (2)", callback_data=f"rate|{deal_id}|2")],
-        [InlineKeyboardButton("⭐⭐⭐ Berikan Ulasan (3)", callback_data=f"rate|{deal_id}|3"),
-         InlineKeyboardButton("⭐⭐⭐⭐ Berikan Ulasan (4)", callback_data=f"rate|{deal_id}|4")],
-        [InlineKeyboardButton("⭐⭐⭐⭐⭐ Berikan Ulasan (5)", callback_data=f"rate|{deal_id}|5")],
-        [InlineKeyboardButton("📝 Kirim Testimoni", callback_data=f"send_testimoni_menu|{deal_id}")]
-    ]
-    await context.bot.send_message(
-        seller_id,
-        f"🎉 *Selamat! Rekber* `{deal_id}` *telah selesai*\n\n"
-        f"💰 Dana sebesar {format_rupiah(amount)} telah dirilis ke Anda\n"
-        f"🙏 Terima kasih telah menggunakan REKBER-BOT by Nexo\n\n"
-        f"💬 Bagaimana pengalaman transaksi Anda dengan pembeli?",
-        parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup(seller_keyboard)
-    )
-
-    log_action(deal_id, query.from_user.id, "ADMIN", "FINAL_RELEASE", "Admin melepaskan dana final ke seller")
-
 
 # ADMIN: Konfirmasi payout dan selesaikan transaksi
 async def admin_confirm_payout(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -235,34 +199,25 @@ async def admin_confirm_payout(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     deal_id = query.data.split("|")[1]
 
-    conn = get_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT buyer_id, seller_id, title, amount FROM deals WHERE id=?", (deal_id,))
-        row = cur.fetchone()
-
-        if not row:
-            await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-            return
-
-        # Properly extract values from the row
-        buyer_id = row['buyer_id']
-        seller_id = row['seller_id']
-        title = row['title']
-        amount = int(row['amount'])
-
         # Update status ke COMPLETED
-        cur.execute("UPDATE deals SET status='COMPLETED' WHERE id=?", (deal_id,))
-        conn.commit()
+        row = await transition(
+            deal_id, "COMPLETE", query.from_user.id, "ADMIN", "Admin konfirmasi payout dan selesaikan transaksi",
+            action="CONFIRM_PAYOUT", returning="buyer_id, seller_id, title, amount"
+        )
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error in admin_confirm_payout: {e}")
         await query.edit_message_text("❌ Terjadi kesalahan saat konfirmasi payout.")
         return
-    finally:
-        cur.close()
-        from db_sqlite import return_connection
-        return_connection(conn)
+
+    if not row:
+        await query.edit_message_text("❌ Transaksi tidak ditemukan atau sudah diproses.")
+        return
+
+    buyer_id = row['buyer_id']
+    seller_id = row['seller_id']
+    title = row['title']
+    amount = int(row['amount'])
 
 
     await query.edit_message_text(
@@ -271,20 +226,9 @@ async def admin_confirm_payout(update: Update, context: ContextTypes.DEFAULT_TYP
         parse_mode="Markdown"
     )
 
-    # Ambil username buyer & seller dengan error handling
-    try:
-        buyer_chat = await context.bot.get_chat(buyer_id)
-        buyer_username = "@" + buyer_chat.username if buyer_chat.username else buyer_chat.first_name
-    except Exception as e:
-        logger.warning(f"Cannot get buyer chat info for buyer_id {buyer_id}: {e}")
-        buyer_username = f"User {buyer_id}"
-
-    try:
-        seller_chat = await context.bot.get_chat(seller_id)
-        seller_username = "@" + seller_chat.username if seller_chat.username else seller_chat.first_name
-    except Exception as e:
-        logger.warning(f"Cannot get seller chat info for seller_id {seller_id}: {e}")
-        seller_username = f"User {seller_id}"
+    # Nama buyer & seller dari cache profil (get_chat hanya jika profil sudah kadaluarsa)
+    buyer_username = await profile_cache.display_name(buyer_id, context.bot)
+    seller_username = await profile_cache.display_name(seller_id, context.bot)
 
     # Notifikasi ke buyer dengan tombol rating
     buyer_keyboard = [
@@ -297,7 +241,7 @@ async def admin_confirm_payout(update: Update, context: ContextTypes.DEFAULT_TYP
     ]
 
     try:
-        await context.bot.send_message(
+        await dispatcher.send_message(
             chat_id=buyer_id,
             text=f"🎉 <b>Selamat! Rekber {deal_id} telah selesai!</b>\n\n"
                  f"✅ Transaksi telah berhasil diselesaikan\n"
@@ -323,7 +267,7 @@ async def admin_confirm_payout(update: Update, context: ContextTypes.DEFAULT_TYP
     ]
 
     try:
-        await context.bot.send_message(
+        await dispatcher.send_message(
             chat_id=seller_id,
             text=f"🎉 <b>Selamat! Rekber {deal_id} telah selesai!</b>\n\n"
                  f"💰 Dana sebesar {format_rupiah(amount)} telah dikonfirmasi untuk dicairkan\n"
@@ -337,8 +281,6 @@ async def admin_confirm_payout(update: Update, context: ContextTypes.DEFAULT_TYP
     except Exception as e:
         logger.warning(f"Cannot send completion message to seller {seller_id}: {e}")
 
-    log_action(deal_id, query.from_user.id, "ADMIN", "CONFIRM_PAYOUT", "Admin konfirmasi payout dan selesaikan transaksi")
-
 
 # TOLAK DANA
 async def rekber_admin_reject(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -347,37 +289,29 @@ async def rekber_admin_reject(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     deal_id = query.data.split("|")[1]
 
-    conn = get_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT buyer_id, seller_id, title FROM deals WHERE id = ?", (deal_id,))
-        row = cur.fetchone()
-
-        if not row:
-            await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-            return
-
-        buyer_id = row['buyer_id']
-        seller_id = row['seller_id']
-        title = row['title']
-
         # Update status ke PENDING_FUNDING (buyer harus transfer ulang)
-        cur.execute("UPDATE deals SET status = ? WHERE id = ?", ("PENDING_FUNDING", deal_id))
-        conn.commit()
+        row = await transition(
+            deal_id, "REJECT_PAYMENT", query.from_user.id, "ADMIN", "Admin tolak pembayaran",
+            returning="buyer_id, seller_id, title"
+        )
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error in rekber_admin_reject: {e}")
         await query.edit_message_text("❌ Terjadi kesalahan saat menolak pembayaran.")
         return
-    finally:
-        cur.close()
-        from db_sqlite import return_connection
-        return_connection(conn)
+
+    if not row:
+        await query.edit_message_text("❌ Transaksi tidak ditemukan atau sudah diproses.")
+        return
+
+    buyer_id = row['buyer_id']
+    seller_id = row['seller_id']
+    title = row['title']
 
     await query.edit_message_text(f"❌ Pembayaran untuk transaksi {deal_id} ditolak.")
 
     # Notif ke pembeli dengan instruksi
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=buyer_id,
         text=f"❌ <b>Pembayaran Ditolak</b>\n\n"
              f"Pembayaran untuk transaksi <b>{title}</b> ditolak oleh admin.\n\n"
@@ -390,7 +324,7 @@ async def rekber_admin_reject(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
 
     # Notif ke penjual
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=seller_id,
         text=f"⚠️ Pembayaran untuk transaksi <b>{title}</b> ditolak oleh admin. Menunggu pembeli melakukan pembayaran ulang.",
         parse_mode="HTML"
@@ -403,38 +337,26 @@ async def rekber_admin_release(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     deal_id = query.data.split("|")[1]
 
-    conn = get_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT buyer_id, seller_id FROM deals WHERE id=?", (deal_id,))
-        row = cur.fetchone()
-
-        if not row:
-            await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-            return
-
-        buyer_id, seller_id = row
-
-        # update status → RELEASED
-        cur.execute("UPDATE deals SET status='RELEASED' WHERE id=?", (deal_id,))
-        conn.commit()
+        # update status → RELEASED (hanya dari DISPUTED)
+        row = await transition(
+            deal_id, "ADMIN_RELEASE", query.from_user.id, "ADMIN", "Admin memutuskan dana dirilis ke penjual",
+            returning="buyer_id, seller_id", notify=lambda row: [
+                Notification(row['seller_id'], f"🎉 Dana escrow Rekber {deal_id} dirilis ke kamu oleh admin."),
+                Notification(row['buyer_id'], f"⚠️ Admin memutuskan dana Rekber {deal_id} dirilis ke penjual."),
+            ]
+        )
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error in rekber_admin_release: {e}")
         await query.edit_message_text("❌ Terjadi kesalahan saat merilis dana.")
         return
-    finally:
-        cur.close()
-        from db_sqlite import return_connection
-        return_connection(conn)
 
+    if not row:
+        await query.edit_message_text("❌ Transaksi tidak ditemukan atau sengketa sudah diputuskan.")
+        return
 
     await query.edit_message_text(f"✅ Admin memutuskan dana Rekber {deal_id} dirilis ke penjual.")
 
-    # notif ke kedua pihak
-    await context.bot.send_message(seller_id, f"🎉 Dana escrow Rekber {deal_id} dirilis ke kamu oleh admin.")
-    await context.bot.send_message(buyer_id, f"⚠️ Admin memutuskan dana Rekber {deal_id} dirilis ke penjual.")
-
 
 # ADMIN: RESOLVE DISPUTE (Refund ke Buyer)
 async def rekber_admin_refund(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -442,38 +364,26 @@ async def rekber_admin_refund(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     deal_id = query.data.split("|")[1]
 
-    conn = get_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT buyer_id, seller_id FROM deals WHERE id=?", (deal_id,))
-        row = cur.fetchone()
-
-        if not row:
-            await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-            return
-
-        buyer_id, seller_id = row
-
-        # update status → REFUNDED
-        cur.execute("UPDATE deals SET status='REFUNDED' WHERE id=?", (deal_id,))
-        conn.commit()
+        # update status → REFUNDED (hanya dari DISPUTED)
+        row = await transition(
+            deal_id, "ADMIN_REFUND", query.from_user.id, "ADMIN", "Admin memutuskan dana dikembalikan ke pembeli",
+            returning="buyer_id, seller_id", notify=lambda row: [
+                Notification(row['buyer_id'], f"💸 Dana escrow Rekber {deal_id} dikembalikan ke kamu oleh admin."),
+                Notification(row['seller_id'], f"⚠️ Admin memutuskan dana Rekber {deal_id} dikembalikan ke pembeli."),
+            ]
+        )
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error in rekber_admin_refund: {e}")
         await query.edit_message_text("❌ Terjadi kesalahan saat mengembalikan dana.")
         return
-    finally:
-        cur.close()
-        from db_sqlite import return_connection
-        return_connection(conn)
 
+    if not row:
+        await query.edit_message_text("❌ Transaksi tidak ditemukan atau sengketa sudah diputuskan.")
+        return
 
     await query.edit_message_text(f"💸 Admin memutuskan dana Rekber {deal_id} dikembalikan ke pembeli.")
 
-    # notif ke kedua pihak
-    await context.bot.send_message(buyer_id, f"💸 Dana escrow Rekber {deal_id} dikembalikan ke kamu oleh admin.")
-    await context.bot.send_message(seller_id, f"⚠️ Admin memutuskan dana Rekber {deal_id} dikembalikan ke pembeli.")
-
 # ========== NEW PAYMENT VERIFICATION HANDLERS ==========
 async def verify_payment_with_proof(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Admin handler untuk verifikasi pembayaran dengan bukti foto"""
@@ -481,69 +391,34 @@ async def verify_payment_with_proof(update: Update, context: ContextTypes.DEFAUL
     await query.answer()
     deal_id = query.data.split("|")[1]
 
-    conn = get_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT buyer_id, seller_id, title, amount, admin_fee, admin_fee_payer FROM deals WHERE id = ?", (deal_id,))
-        row = cur.fetchone()
-
-        if not row:
-            # Use edit_message_caption for photo messages
-            try:
-                await query.edit_message_caption("❌ Transaksi tidak ditemukan.")
-            except:
-                await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-            return
-
-        buyer_id = row['buyer_id']
-        seller_id = row['seller_id']
-        title = row['title']
-        amount = int(row['amount'])
-        admin_fee = int(row['admin_fee'])
-        admin_fee_payer = row['admin_fee_payer']
-
-        # Update status ke FUNDED (dana sudah terverifikasi)
-        cur.execute("UPDATE deals SET status = ? WHERE id = ?", ("FUNDED", deal_id))
-        conn.commit()
+        # Update status ke FUNDED (dana sudah terverifikasi), log di transaksi yang sama
+        row = await transition(
+            deal_id, "VERIFY_PAYMENT", query.from_user.id, "ADMIN", "Admin verifikasi bukti pembayaran",
+            returning="buyer_id, seller_id, title", notify=lambda row: _payment_verified_notifications(deal_id, row)
+        )
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error in verify_payment_with_proof: {e}")
         try:
             await query.edit_message_caption("❌ Terjadi kesalahan saat verifikasi.")
         except:
             await query.edit_message_text("❌ Terjadi kesalahan saat verifikasi.")
         return
-    finally:
-        cur.close()
-        from db_sqlite import return_connection
-        return_connection(conn)
 
-    # Log the verification
-    from db_sqlite import log_action
-    log_action(deal_id, query.from_user.id, "ADMIN", "VERIFY_PAYMENT", f"Admin verifikasi pembayaran untuk {title}")
-
-    # Notifikasi ke pembeli
-    await context.bot.send_message(
-        chat_id=buyer_id,
-        text=f"✅ Pembayaran untuk transaksi <b>{title}</b> sudah diverifikasi. Menunggu pengiriman barang/jasa dari penjual.",
-        parse_mode="HTML"
-    )
-
-    # Notifikasi ke penjual dengan tombol mark shipped
-    keyboard_seller = [[InlineKeyboardButton("📦 Tandai Sudah Dikirim", callback_data=f"rekber_mark_shipped|{deal_id}")]]
-    await context.bot.send_message(
-        chat_id=seller_id,
-        text=f"✅ Pembayaran untuk transaksi <b>{title}</b> sudah diverifikasi. Silakan kirim barang/jasa ke pembeli dan klik tombol di bawah setelah selesai.",
-        parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(keyboard_seller)
-    )
+    if not row:
+        # Use edit_message_caption for photo messages
+        try:
+            await query.edit_message_caption("❌ Transaksi tidak ditemukan atau sudah diproses.")
+        except:
+            await query.edit_message_text("❌ Transaksi tidak ditemukan atau sudah diproses.")
+        return
 
     # Edit photo caption instead of text for photo messages
     try:
         await query.edit_message_caption(f"✅ Pembayaran untuk transaksi {deal_id} berhasil diverifikasi.")
     except:
         # Fallback to sending new message if edit fails
-        await context.bot.send_message(
+        await dispatcher.send_message(
             chat_id=query.from_user.id,
             text=f"✅ Pembayaran untuk transaksi {deal_id} berhasil diverifikasi."
         )
@@ -554,45 +429,33 @@ async def reject_payment_with_proof(update: Update, context: ContextTypes.DEFAUL
     await query.answer()
     deal_id = query.data.split("|")[1]
 
-    conn = get_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT buyer_id, seller_id, title FROM deals WHERE id = ?", (deal_id,))
-        row = cur.fetchone()
-
-        if not row:
-            try:
-                await query.edit_message_caption("❌ Transaksi tidak ditemukan.")
-            except:
-                await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-            return
-
-        buyer_id = row['buyer_id']
-        seller_id = row['seller_id']
-        title = row['title']
-
         # Update status kembali ke PENDING_FUNDING
-        cur.execute("UPDATE deals SET status = ?, payment_proof_file_id = NULL WHERE id = ?", ("PENDING_FUNDING", deal_id))
-        conn.commit()
+        row = await transition(
+            deal_id, "REJECT_PAYMENT", query.from_user.id, "ADMIN", "Admin tolak bukti pembayaran",
+            fields={"payment_proof_file_id": None}, returning="buyer_id, seller_id, title"
+        )
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error in reject_payment_with_proof: {e}")
         try:
             await query.edit_message_caption("❌ Terjadi kesalahan saat menolak pembayaran.")
         except:
             await query.edit_message_text("❌ Terjadi kesalahan saat menolak pembayaran.")
         return
-    finally:
-        cur.close()
-        from db_sqlite import return_connection
-        return_connection(conn)
 
-    # Log the rejection
-    from db_sqlite import log_action
-    log_action(deal_id, query.from_user.id, "ADMIN", "REJECT_PAYMENT", f"Admin tolak bukti pembayaran untuk {title}")
+    if not row:
+        try:
+            await query.edit_message_caption("❌ Transaksi tidak ditemukan atau sudah diproses.")
+        except:
+            await query.edit_message_text("❌ Transaksi tidak ditemukan atau sudah diproses.")
+        return
+
+    buyer_id = row['buyer_id']
+    seller_id = row['seller_id']
+    title = row['title']
 
     # Notifikasi ke pembeli untuk upload ulang
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=buyer_id,
         text=(
             f"❌ <b>BUKTI PEMBAYARAN DITOLAK</b>\n\n"
@@ -607,7 +470,7 @@ async def reject_payment_with_proof(update: Update, context: ContextTypes.DEFAUL
     )
 
     # Notifikasi ke penjual
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=seller_id,
         text=f"⚠️ Bukti pembayaran untuk transaksi <b>{title}</b> ditolak admin. Pembeli perlu upload ulang bukti yang benar.",
         parse_mode="HTML"
@@ -618,7 +481,7 @@ async def reject_payment_with_proof(update: Update, context: ContextTypes.DEFAUL
         await query.edit_message_caption(f"❌ Bukti pembayaran untuk transaksi {deal_id} ditolak. Pembeli diminta upload ulang.")
     except:
         # Fallback to sending new message if edit fails
-        await context.bot.send_message(
+        await dispatcher.send_message(
             chat_id=query.from_user.id,
             text=f"❌ Bukti pembayaran untuk transaksi {deal_id} ditolak. Pembeli diminta upload ulang."
         )
\ No newline at end of file
@@ -1,9 +1,14 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from db_sqlite import get_admin_dashboard_stats, get_connection
+from db_sqlite import db, get_admin_dashboard_stats
 from utils import format_rupiah
 from security import check_admin_permission
+from outbox import outbox, counts as outbox_counts, dead_letters, requeue
+from deal_cache import deal_cache
+from leaderboard import leaderboard
+from analytics import deal_analytics, STATES
 import config
+import html
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,7 +23,7 @@ async def admin_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        stats = get_admin_dashboard_stats()
+        stats = await db.call(get_admin_dashboard_stats)
         
         # Format pesan statistik
         dashboard_text = f"""
@@ -52,6 +57,13 @@ async def admin_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 'REFUNDED': '↩️'
             }.get(status, '📋')
             dashboard_text += f"• {status_emoji} {status}: {count}\n"
+
+        cache = deal_cache.stats()
+        dashboard_text += (
+            f"\n🗂️ **CACHE DEAL**\n"
+            f"• {cache['size']} deal | hit {cache['hit_rate']:.0%} ({cache['hits']}/{cache['hits'] + cache['misses']})\n"
+            f"• Eviction: {cache['evictions']} | Invalidasi: {cache['invalidations']}\n"
+        )
         
         keyboard = [
             [
@@ -62,6 +74,7 @@ async def admin_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 InlineKeyboardButton("⚠️ Pending Actions", callback_data="admin_pending_actions"),
                 InlineKeyboardButton("📊 Analytics", callback_data="admin_analytics")
             ],
+            [InlineKeyboardButton("📮 Outbox Notifikasi", callback_data="admin_outbox")],
             [InlineKeyboardButton("🏠 Back to Main", callback_data="rekber_main_menu")]
         ]
         
@@ -86,21 +99,17 @@ async def admin_pending_actions(update: Update, context: ContextTypes.DEFAULT_TY
         return
     
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
         # Ambil transaksi yang menunggu verifikasi
-        cur.execute("""
+        pending_deals = await db.fetchall("""
         SELECT id, title, amount, buyer_id, created_at 
         FROM deals 
         WHERE status = 'WAITING_VERIFICATION'
         ORDER BY created_at ASC
         LIMIT 10
         """)
-        pending_deals = cur.fetchall()
         
         # Ambil dispute terbuka
-        cur.execute("""
+        open_disputes = await db.fetchall("""
         SELECT d.deal_id, d.reason, d.created_at, deals.title
         FROM disputes d
         JOIN deals ON d.deal_id = deals.id
@@ -108,10 +117,6 @@ async def admin_pending_actions(update: Update, context: ContextTypes.DEFAULT_TY
         ORDER BY d.created_at ASC
         LIMIT 5
         """)
-        open_disputes = cur.fetchall()
-        
-        cur.close()
-        conn.close()
         
         pending_text = "⚠️ **AKSI YANG PERLU PERHATIAN**\n\n"
         
@@ -149,6 +154,14 @@ async def admin_pending_actions(update: Update, context: ContextTypes.DEFAULT_TY
         logger.error(f"Error in admin pending actions: {e}")
         await query.edit_message_text("❌ Terjadi error saat memuat data.")
 
+def _leaderboard_name(entry) -> str:
+    if entry.username:
+        return f"@{html.escape(entry.username)} (<code>{entry.user_id}</code>)"
+    if entry.first_name:
+        return f"{html.escape(entry.first_name)} (<code>{entry.user_id}</code>)"
+    return f"User <code>{entry.user_id}</code>"
+
+
 async def admin_user_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Statistik pengguna untuk admin"""
     query = update.callback_query
@@ -160,63 +173,180 @@ async def admin_user_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        # Top users berdasarkan jumlah transaksi
-        cur.execute("""
-        SELECT 
-            CASE 
-                WHEN buyer_id IS NOT NULL THEN buyer_id 
-                ELSE seller_id 
-            END as user_id,
-            COUNT(*) as deal_count,
-            SUM(amount) as total_volume
-        FROM deals 
-        WHERE status = 'COMPLETED'
-        GROUP BY user_id
-        ORDER BY deal_count DESC
-        LIMIT 10
+        # User baru dari counter per hari (migrasi 0013), daftar teratas dari leaderboard
+        new_users = await db.fetchone("""
+        SELECT IFNULL(SUM(count), 0) FROM deal_counters
+        WHERE scope = 'user_day' AND key > DATE('now', '-7 days')
         """)
-        top_users = cur.fetchall()
-        
-        # Statistik user baru (registrasi dalam 7 hari terakhir)
-        cur.execute("""
-        SELECT COUNT(*) as new_users
-        FROM users 
-        WHERE created_at > CURRENT_TIMESTAMP - INTERVAL '7 days'
-        """)
-        new_users = cur.fetchone()
-        
-        cur.close()
-        conn.close()
-        
-        stats_text = f"""
-👥 **STATISTIK PENGGUNA**
-━━━━━━━━━━━━━━━━━━━━
+        by_deals = await leaderboard.top("deals")
+        by_volume = await leaderboard.top("volume")
+        by_rating = await leaderboard.top("rating")
 
-📊 **RINGKASAN:**
-• User Baru (7 hari): {new_users['new_users'] if new_users else 0}
+        stats_text = (
+            "👥 <b>STATISTIK PENGGUNA</b>\n"
+            "━━━━━━━━━━━━━━━━━━━━\n\n"
+            "📊 <b>RINGKASAN:</b>\n"
+            f"• User Baru (7 hari): {new_users[0] if new_users else 0}\n\n"
+            "🏆 <b>TOP USERS (berdasarkan transaksi):</b>\n"
+        )
+        for idx, entry in enumerate(by_deals, 1):
+            stats_text += f"{idx}. {_leaderboard_name(entry)}\n"
+            stats_text += (f"   📊 {entry.deals} transaksi (🛒 {entry.buyer_deals} beli | 🏪 {entry.seller_deals} jual)"
+                           f" | 💰 {format_rupiah(entry.volume)}\n\n")
+
+        stats_text += "💰 <b>TOP USERS (berdasarkan volume):</b>\n"
+        for idx, entry in enumerate(by_volume, 1):
+            stats_text += (f"{idx}. {_leaderboard_name(entry)}: {format_rupiah(entry.volume)}"
+                           f" (🛒 {format_rupiah(entry.buyer_volume)} | 🏪 {format_rupiah(entry.seller_volume)})\n")
+
+        stats_text += "\n⭐ <b>TOP USERS (berdasarkan rating):</b>\n"
+        for idx, entry in enumerate(by_rating, 1):
+            stats_text += f"{idx}. {_leaderboard_name(entry)}: {entry.average_rating:.2f}/5 ({entry.rating_count} rating)\n"
 
-🏆 **TOP USERS (berdasarkan transaksi):**
-"""
-        
-        for idx, user in enumerate(top_users, 1):
-            user_id_val, deal_count, total_volume = user
-            stats_text += f"{idx}. User `{user_id_val}`\n"
-            stats_text += f"   📊 {deal_count} transaksi | 💰 {format_rupiah(total_volume or 0)}\n\n"
-        
         keyboard = [[
             InlineKeyboardButton("🔄 Refresh", callback_data="admin_user_stats"),
             InlineKeyboardButton("🏠 Dashboard", callback_data="admin_dashboard_main")
         ]]
-        
+
         await query.edit_message_text(
             stats_text,
-            parse_mode="Markdown",
+            parse_mode="HTML",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
-        
+
     except Exception as e:
         logger.error(f"Error in admin user stats: {e}")
-        await query.edit_message_text("❌ Terjadi error saat memuat statistik user.")
\ No newline at end of file
+        await query.edit_message_text("❌ Terjadi error saat memuat statistik user.")
+
+
+
+def _duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f} dtk"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} mnt"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f} jam"
+    return f"{seconds / 86400:.1f} hari"
+
+
+def _latency_line(state: str, stats: dict) -> str:
+    return (f"<b>{state}</b> ({stats['count']}): {_duration(stats['p50'])} / "
+            f"{_duration(stats['p95'])} / {_duration(stats['p99'])}\n")
+
+
+async def admin_analytics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Lama deal di setiap status (p50/p95/p99) dari logs, per status dan per admin"""
+    query = update.callback_query
+    await query.answer()
+
+    if not check_admin_permission(query.from_user.id, "view_analytics"):
+        await query.edit_message_text("❌ Akses ditolak.")
+        return
+
+    try:
+        summary = await deal_analytics.summary()
+
+        text = (
+            "📊 <b>ANALITIK SIKLUS DEAL</b>\n"
+            "━━━━━━━━━━━━━━━━━━━━\n\n"
+            "⏱️ <b>LAMA DI SETIAP STATUS</b> (jumlah): p50 / p95 / p99\n"
+        )
+        for state in STATES:
+            if state in summary["states"]:
+                text += "• " + _latency_line(state, summary["states"][state])
+        if not summary["states"]:
+            text += "Belum ada transisi tercatat.\n"
+
+        # Admin dengan transisi terbanyak; status yang mereka akhiri (mis. verifikasi pembayaran)
+        admins = sorted(summary["admins"].items(),
+                        key=lambda item: -sum(stats["count"] for stats in item[1].values()))[:10]
+        if admins:
+            text += "\n👮 <b>PER ADMIN</b> (status yang diakhiri admin):\n"
+            for admin_id, states in admins:
+                text += f"• Admin <code>{admin_id}</code>\n"
+                for state in STATES:
+                    if state in states:
+                        text += "   " + _latency_line(state, states[state])
+
+        text += f"\n<i>{summary['rows']} log diproses, {summary['open']} deal belum selesai</i>"
+
+        keyboard = [[
+            InlineKeyboardButton("🔄 Refresh", callback_data="admin_analytics"),
+            InlineKeyboardButton("🏠 Dashboard", callback_data="admin_dashboard_main")
+        ]]
+
+        await query.edit_message_text(
+            text,
+            parse_mode="HTML",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+
+    except Exception as e:
+        logger.error(f"Error in admin analytics: {e}")
+        await query.edit_message_text("❌ Terjadi error saat memuat analitik.")
+
+
+async def _outbox_view():
+    """Teks dan tombol halaman outbox admin"""
+    totals = await db.run(outbox_counts)
+    dead = await db.run(dead_letters, 10)
+    metrics = outbox.stats()
+
+    text = (
+        "📮 <b>OUTBOX NOTIFIKASI</b>\n"
+        "━━━━━━━━━━━━━━━━━━━━\n\n"
+        f"• Tertunda: {totals['pending']} (tertua {totals['oldest_pending']:.0f} detik)\n"
+        f"• Dead letter: {totals['dead']}\n\n"
+        f"📈 <b>Sejak bot start</b>\n"
+        f"• Terkirim: {metrics['delivered']} ({metrics['per_minute']}/menit terakhir)\n"
+        f"• Dijadwalkan ulang: {metrics['retried']} | Gagal permanen: {metrics['dead']}\n"
+        f"• Latensi commit → terkirim: p50 {metrics['latency_p50']:.1f} s, p99 {metrics['latency_p99']:.1f} s\n"
+    )
+    if dead:
+        text += "\n⚠️ <b>DEAD LETTER TERBARU:</b>\n"
+        for row in dead:
+            text += (f"• #{row['id']} deal <code>{html.escape(str(row['deal_id']))}</code> → {row['chat_id']} "
+                     f"({row['attempts']}x): {html.escape(row['last_error'] or '-')[:120]}\n")
+
+    keyboard = [[InlineKeyboardButton("🔄 Refresh", callback_data="admin_outbox")]]
+    if dead:
+        keyboard.insert(0, [InlineKeyboardButton("🔁 Kirim Ulang Semua", callback_data="admin_outbox_retry")])
+    keyboard.append([InlineKeyboardButton("🏠 Dashboard", callback_data="admin_dashboard_main")])
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+async def admin_outbox(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Status outbox notifikasi dan daftar dead letter untuk admin (/admin_outbox)"""
+    query = update.callback_query
+    if query:
+        await query.answer()
+    reply = query.edit_message_text if query else update.message.reply_text
+    if not check_admin_permission(update.effective_user.id, "view_outbox"):
+        await reply("❌ Akses ditolak.")
+        return
+
+    try:
+        text, keyboard = await _outbox_view()
+        await reply(text, parse_mode="HTML", reply_markup=keyboard)
+    except Exception as e:
+        logger.error(f"Error in admin outbox: {e}")
+        await reply("❌ Terjadi error saat memuat outbox.")
+
+
+async def admin_outbox_retry(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Kembalikan semua dead letter ke antrean outbox"""
+    query = update.callback_query
+    if not check_admin_permission(query.from_user.id, "retry_outbox"):
+        await query.answer("❌ Akses ditolak.", show_alert=True)
+        return
+
+    try:
+        count = await db.transaction(requeue)
+        outbox.wake()
+        await query.answer(f"🔁 {count} notifikasi dijadwalkan ulang.", show_alert=True)
+        text, keyboard = await _outbox_view()
+        await query.edit_message_text(text, parse_mode="HTML", reply_markup=keyboard)
+    except Exception as e:
+        logger.error(f"Error in admin outbox retry: {e}")
+        await query.edit_message_text("❌ Terjadi error saat menjadwalkan ulang outbox.")
@@ -1,38 +1,92 @@
+import os
 import asyncio
 import logging
 from datetime import datetime, timedelta
 from telegram.ext import ContextTypes
-from db_sqlite import get_connection
+from db_sqlite import db
+from dispatcher import dispatcher, REMINDER
+from deal_state import apply_transition_batch, on_deadline, off_deadline, on_enter, on_leave, DEADLINES, SWEEP_BATCH_SIZE
+from scheduler import Scheduler, add_job, cancel_jobs
 from utils import format_rupiah
-import config
 
 logger = logging.getLogger(__name__)
 
+# Batas pesan Telegram yang dikirim bersamaan saat sweep
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "20"))
+NEXT_DEADLINE_SQL = "SELECT MIN(expires_at) FROM ({})".format(" UNION ALL ".join(
+    ["SELECT MIN(expires_at) AS expires_at FROM deals WHERE status = ? AND expires_at IS NOT NULL"] * len(DEADLINES)
+))
+# Batas tidur sweeper deadline (jaring pengaman untuk expires_at yang ditulis proses lain)
+DEADLINE_MAX_SLEEP = float(os.getenv("DEADLINE_MAX_SLEEP", "3600"))
+
+# Reminder per status deal: (jenis job, detik setelah deal masuk ke status itu).
+# Job terikat ke status tersebut dan dibatalkan begitu deal keluar darinya.
+STATUS_REMINDERS = {
+    # Pembeli belum transfer setelah kedua pihak bergabung
+    "PENDING_FUNDING": (
+        ("payment_reminder", 2 * 3600),
+        ("payment_reminder", 12 * 3600),
+        # 2 jam sebelum auto-cancel
+        ("expiry_warning", int(DEADLINES["PENDING_FUNDING"][0].total_seconds()) - 2 * 3600),
+    ),
+    # Barang sudah dikirim, pembeli belum konfirmasi
+    "AWAITING_CONFIRM": (
+        ("completion_reminder", 48 * 3600),
+    ),
+}
+
+
+def _reminder_key(kind: str, deal_id: str, delay: int) -> str:
+    return f"{kind}:{deal_id}:{delay}"
+
+
+def schedule_status_reminders(conn, deal_id: str, status: str, now: datetime = None):
+    """Jadwalkan reminder `status` untuk deal di transaksi `conn` (key unik per deal dan jeda)"""
+    start = (now or datetime.now()).timestamp()
+    for kind, delay in STATUS_REMINDERS[status]:
+        add_job(conn, kind, start + delay, key=_reminder_key(kind, deal_id, delay), deal_id=deal_id,
+                deal_status=status, payload={"hours": delay // 3600})
+
+
+def cancel_status_reminders(conn, deal_id: str, status: str):
+    """Batalkan reminder `status` untuk deal lewat key-nya (job yang sudah jalan/batal diabaikan)"""
+    for kind, delay in STATUS_REMINDERS[status]:
+        cancel_jobs(conn, key=_reminder_key(kind, deal_id, delay))
+
+
+def register_reminders():
+    """Jadwalkan/batalkan reminder di setiap transisi yang masuk/keluar dari status di STATUS_REMINDERS"""
+    for status in STATUS_REMINDERS:
+        on_enter(status, lambda conn, deal_id, now, status=status: schedule_status_reminders(conn, deal_id, status, now))
+        on_leave(status, lambda conn, deal_id, status=status: cancel_status_reminders(conn, deal_id, status))
+
 class NotificationManager:
-    def __init__(self, bot):
+    def __init__(self, bot, sender=None):
         self.bot = bot
+        # Semua pesan keluar lewat dispatcher (lajur REMINDER)
+        self.sender = sender or dispatcher
+        self.db = db
         self.reminder_tasks = {}
+        self.next_deadline = None
+        self.sweeps = 0
+        # Waktu bangun sweeper berikutnya selama ia tidur (None saat sedang sweep)
+        self.sleeping_until = None
+        self._announced = None
+        self._deadline_moved = None
     
-    async def send_payment_reminder(self, deal_id: str, buyer_id: int):
+    async def send_payment_reminder(self, deal_id: str, hours_passed: int):
         """Kirim reminder pembayaran ke buyer"""
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("""
-            SELECT title, amount, admin_fee, admin_fee_payer, created_at 
+            deal = await self.db.fetchone("""
+            SELECT title, amount, admin_fee, admin_fee_payer, buyer_id
             FROM deals 
-            WHERE id = ? AND status = 'CREATED'
+            WHERE id = ? AND status = 'PENDING_FUNDING'
             """, (deal_id,))
             
-            deal = cur.fetchone()
-            cur.close()
-            from db_sqlite import return_connection
-            return_connection(conn)
-            
             if not deal:
                 return
             
-            title, amount, admin_fee, admin_fee_payer, created_at = deal
+            title, amount, admin_fee, admin_fee_payer, buyer_id = deal
             
             # Hitung total yang harus dibayar
             if admin_fee_payer == 'BUYER':
@@ -40,10 +94,6 @@ class NotificationManager:
             else:
                 total_to_pay = amount
             
-            # Hitung berapa lama deal sudah dibuat
-            time_created = datetime.now() - created_at
-            hours_passed = int(time_created.total_seconds() // 3600)
-            
             reminder_text = f"""
 ⏰ **REMINDER PEMBAYARAN**
 
@@ -51,7 +101,7 @@ class NotificationManager:
 🏷️ **Judul:** {title}
 💰 **Total Pembayaran:** {format_rupiah(total_to_pay)}
 
-⚠️ Deal ini sudah dibuat {hours_passed} jam yang lalu dan masih menunggu pembayaran.
+⚠️ Deal ini sudah menunggu pembayaran selama {hours_passed} jam.
 
 📱 **Informasi Pembayaran:**
 • DANA: 082119299186 (Muhammad Abdu Wafaqih)
@@ -64,35 +114,29 @@ class NotificationManager:
 ⏳ Deal akan otomatis dibatalkan jika tidak ada pembayaran dalam 24 jam.
 """
             
-            await self.bot.send_message(
+            await self.sender.send_message(
                 chat_id=buyer_id,
                 text=reminder_text,
-                parse_mode="Markdown"
+                parse_mode="Markdown",
+                priority=REMINDER
             )
             
         except Exception as e:
             logger.error(f"Error sending payment reminder: {e}")
     
-    async def send_completion_reminder(self, deal_id: str, buyer_id: int):
+    async def send_completion_reminder(self, deal_id: str):
         """Kirim reminder konfirmasi penerimaan barang ke buyer"""
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("""
-            SELECT title, seller_id 
+            deal = await self.db.fetchone("""
+            SELECT title, seller_id, buyer_id
             FROM deals 
-            WHERE id = ? AND status = 'SHIPPED'
+            WHERE id = ? AND status = 'AWAITING_CONFIRM'
             """, (deal_id,))
             
-            deal = cur.fetchone()
-            cur.close()
-            from db_sqlite import return_connection
-            return_connection(conn)
-            
             if not deal:
                 return
             
-            title, seller_id = deal
+            title, seller_id, buyer_id = deal
             
             reminder_text = f"""
 📦 **REMINDER KONFIRMASI BARANG**
@@ -112,18 +156,26 @@ class NotificationManager:
 Gunakan /rekber_active untuk melihat dan mengonfirmasi transaksi ini.
 """
             
-            await self.bot.send_message(
+            await self.sender.send_message(
                 chat_id=buyer_id,
                 text=reminder_text,
-                parse_mode="Markdown"
+                parse_mode="Markdown",
+                priority=REMINDER
             )
             
         except Exception as e:
             logger.error(f"Error sending completion reminder: {e}")
     
-    async def send_expiry_warning(self, deal_id: str, buyer_id: int):
+    async def send_expiry_warning(self, deal_id: str):
         """Kirim peringatan sebelum deal expired"""
         try:
+            deal = await self.db.fetchone(
+                "SELECT buyer_id FROM deals WHERE id = ? AND status = 'PENDING_FUNDING'", (deal_id,)
+            )
+            if not deal:
+                return
+            buyer_id = deal[0]
+
             reminder_text = f"""
 🚨 **PERINGATAN DEAL AKAN BERAKHIR**
 
@@ -139,124 +191,100 @@ Gunakan /rekber_active untuk melihat dan mengonfirmasi transaksi ini.
 ❌ Jika terlewat, Anda perlu membuat deal baru.
 """
             
-            await self.bot.send_message(
+            await self.sender.send_message(
                 chat_id=buyer_id,
                 text=reminder_text,
-                parse_mode="Markdown"
+                parse_mode="Markdown",
+                priority=REMINDER
             )
             
         except Exception as e:
             logger.error(f"Error sending expiry warning: {e}")
     
-    async def schedule_reminders(self, deal_id: str, buyer_id: int):
-        """Schedule berbagai reminder untuk sebuah deal"""
-        # Reminder pembayaran setelah 2 jam
-        await asyncio.sleep(2 * 3600)  # 2 jam
-        await self.send_payment_reminder(deal_id, buyer_id)
-        
-        # Reminder lagi setelah 12 jam
-        await asyncio.sleep(10 * 3600)  # 10 jam lagi (total 12 jam)
-        await self.send_payment_reminder(deal_id, buyer_id)
-        
-        # Warning sebelum expired (22 jam)
-        await asyncio.sleep(10 * 3600)  # 10 jam lagi (total 22 jam)
-        await self.send_expiry_warning(deal_id, buyer_id)
-    
-    async def auto_cancel_unpaid_deals(self):
+    def register_jobs(self, scheduler: Scheduler):
+        """Daftarkan handler reminder ke scheduler persisten dan jadwalkan reminder di setiap transisi"""
+        scheduler.register("payment_reminder", lambda job: self.send_payment_reminder(job['deal_id'], job['payload']['hours']))
+        scheduler.register("expiry_warning", lambda job: self.send_expiry_warning(job['deal_id']))
+        scheduler.register("completion_reminder", lambda job: self.send_completion_reminder(job['deal_id']))
+        register_reminders()
+
+    async def _notify_all(self, messages):
+        """Antrekan banyak pesan sekaligus (maks NOTIFY_CONCURRENCY menunggu hasil bersamaan)"""
+        semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+
+        async def send(chat_id, text):
+            async with semaphore:
+                try:
+                    await self.sender.send_message(chat_id=chat_id, text=text, parse_mode="Markdown",
+                                                   priority=REMINDER)
+                except Exception as notify_error:
+                    logger.error(f"Failed to notify {chat_id}: {notify_error}")
+
+        await asyncio.gather(*(send(chat_id, text) for chat_id, text in messages))
+
+    async def _sweep(self, event: str, condition: str, params, returning: str, detail: str):
+        """Jalankan transisi massal per batch; setiap batch di-commit sebelum batch berikutnya"""
+        while True:
+            rows = await self.db.transaction(
+                apply_transition_batch, event, condition, params, 0, "SYSTEM", detail, SWEEP_BATCH_SIZE, returning
+            )
+            if rows:
+                yield rows
+            if len(rows) < SWEEP_BATCH_SIZE:
+                break
+
+    async def auto_cancel_unpaid_deals(self) -> int:
         """Background task untuk auto-cancel deal yang tidak dibayar"""
+        cancelled = 0
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            
-            try:
-                # Cari deal yang sudah lebih dari 24 jam tanpa pembayaran
-                cur.execute("""
-                SELECT id, buyer_id, seller_id, title
-                FROM deals 
-                WHERE status = 'CREATED' 
-                AND created_at < ?
-                """, (datetime.now() - timedelta(hours=24),))
-                
-                expired_deals = cur.fetchall()
-                
-                for deal in expired_deals:
+            # PENDING_JOIN/PENDING_FUNDING yang lewat deadline (24 jam tanpa pihak kedua/pembayaran)
+            batches = self._sweep(
+                "AUTO_CANCEL", "expires_at <= ?", (datetime.now(),),
+                "id, buyer_id, seller_id, title", "Tidak ada pembayaran dalam 24 jam"
+            )
+            async for deals in batches:
+                messages = []
+                for deal in deals:
                     deal_id, buyer_id, seller_id, title = deal
-                    
-                    # Update status jadi CANCELLED
-                    cur.execute("""
-                    UPDATE deals 
-                    SET status = 'CANCELLED', updated_at = ? 
-                    WHERE id = ?
-                    """, (datetime.now(), deal_id))
-                    
-                    # Notify buyer dan seller
-                    try:
-                        await self.bot.send_message(
-                            chat_id=buyer_id,
-                            text=f"❌ Deal `{deal_id}` ({title}) dibatalkan otomatis karena tidak ada pembayaran dalam 24 jam.",
-                            parse_mode="Markdown"
-                        )
-                    except Exception as notify_error:
-                        logger.error(f"Failed to notify buyer {buyer_id}: {notify_error}")
-                    
-                    if seller_id:
-                        try:
-                            await self.bot.send_message(
-                                chat_id=seller_id,
-                                text=f"❌ Deal `{deal_id}` ({title}) dibatalkan otomatis karena buyer tidak melakukan pembayaran.",
-                                parse_mode="Markdown"
-                            )
-                        except Exception as notify_error:
-                            logger.error(f"Failed to notify seller {seller_id}: {notify_error}")
-                    
-                    logger.info(f"Auto-cancelled deal {deal_id} due to no payment")
-                
-                conn.commit()
-            except Exception as db_error:
-                conn.rollback()
-                raise db_error
-            finally:
-                cur.close()
-                from db_sqlite import return_connection
-                return_connection(conn)
-            
+                    if buyer_id is None or seller_id is None:
+                        # Masih PENDING_JOIN: hanya pembuat deal yang terdaftar
+                        messages.append((
+                            seller_id if buyer_id is None else buyer_id,
+                            f"❌ Deal `{deal_id}` ({title}) dibatalkan otomatis karena tidak ada pihak lain yang bergabung dalam 24 jam."
+                        ))
+                        continue
+                    messages.append((
+                        buyer_id,
+                        f"❌ Deal `{deal_id}` ({title}) dibatalkan otomatis karena tidak ada pembayaran dalam 24 jam."
+                    ))
+                    messages.append((
+                        seller_id,
+                        f"❌ Deal `{deal_id}` ({title}) dibatalkan otomatis karena buyer tidak melakukan pembayaran."
+                    ))
+                # Status sudah di-commit; kirim notifikasi tanpa memegang lock database
+                await self._notify_all(messages)
+                cancelled += len(deals)
+            if cancelled:
+                logger.info(f"Auto-cancelled {cancelled} deals due to no payment")
         except Exception as e:
             logger.error(f"Error in auto_cancel_unpaid_deals: {e}")
-    
-    async def auto_complete_shipped_deals(self):
-        """Background task untuk auto-complete deal yang sudah shipped >72 jam"""
+        return cancelled
+
+    async def auto_complete_shipped_deals(self) -> int:
+        """Background task untuk melepas dana deal AWAITING_CONFIRM yang tidak dikonfirmasi >72 jam"""
+        completed = 0
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            
-            try:
-                # Cari deal yang sudah shipped >72 jam
-                cur.execute("""
-                SELECT d.id, d.buyer_id, d.seller_id, d.title, d.amount
-                FROM deals d
-                JOIN shipments s ON d.id = s.deal_id
-                WHERE d.status = 'SHIPPED' 
-                AND s.created_at < ?
-                """, (datetime.now() - timedelta(hours=72),))
-                
-                auto_complete_deals = cur.fetchall()
-                
-                for deal in auto_complete_deals:
+            # Deal yang sudah dikirim lebih dari 72 jam tanpa konfirmasi (status menjadi RELEASED)
+            batches = self._sweep(
+                "AUTO_COMPLETE", "expires_at <= ?", (datetime.now(),),
+                "id, buyer_id, seller_id, title, amount", "Tidak ada konfirmasi dalam 72 jam"
+            )
+            async for deals in batches:
+                messages = []
+                for deal in deals:
                     deal_id, buyer_id, seller_id, title, amount = deal
-                    
-                    # Update status jadi COMPLETED
-                    cur.execute("""
-                    UPDATE deals 
-                    SET status = 'COMPLETED', updated_at = ? 
-                    WHERE id = ?
-                    """, (datetime.now(), deal_id))
-                    
-                    # Notify buyer dan seller with error handling
-                    try:
-                        await self.bot.send_message(
-                            chat_id=buyer_id,
-                            text=f"""
-✅ **TRANSAKSI OTOMATIS DISELESAIKAN**
+                    messages.append((buyer_id, f"""
+✅ **DANA OTOMATIS DILEPAS**
 
 📋 **Deal ID:** `{deal_id}`
 🏷️ **Judul:** {title}
@@ -265,61 +293,76 @@ Gunakan /rekber_active untuk melihat dan mengonfirmasi transaksi ini.
 Dana sudah dilepas ke penjual karena tidak ada konfirmasi dalam 72 jam.
 
 🌟 Jangan lupa berikan rating untuk transaksi ini!
-""",
-                            parse_mode="Markdown"
-                        )
-                    except Exception as notify_error:
-                        logger.error(f"Failed to notify buyer {buyer_id}: {notify_error}")
-                    
-                    try:
-                        await self.bot.send_message(
-                            chat_id=seller_id,
-                            text=f"""
+"""))
+                    messages.append((seller_id, f"""
 🎉 **DANA SUDAH DILEPAS!**
 
 📋 **Deal ID:** `{deal_id}`
 🏷️ **Judul:** {title}
 💰 **Nominal:** {format_rupiah(amount)}
 
-Transaksi selesai otomatis. Dana sudah bisa dicairkan.
+Dana dilepas otomatis karena pembeli tidak konfirmasi dalam 72 jam.
+
+🏦 Silakan isi data pencairan (rekening/e-wallet) lewat /rekber_active untuk menerima dana.
 
 🌟 Jangan lupa berikan rating untuk transaksi ini!
-""",
-                            parse_mode="Markdown"
-                        )
-                    except Exception as notify_error:
-                        logger.error(f"Failed to notify seller {seller_id}: {notify_error}")
-                    
-                    logger.info(f"Auto-completed deal {deal_id} after 72 hours")
-                
-                conn.commit()
-            except Exception as db_error:
-                conn.rollback()
-                raise db_error
-            finally:
-                cur.close()
-                from db_sqlite import return_connection
-                return_connection(conn)
-            
+"""))
+                await self._notify_all(messages)
+                completed += len(deals)
+            if completed:
+                logger.info(f"Auto-released {completed} deals after 72 hours")
         except Exception as e:
             logger.error(f"Error in auto_complete_shipped_deals: {e}")
-    
+        return completed
+
+    def _deadline_announced(self, expires_at: datetime):
+        # Dipanggil di event loop; bangunkan sweeper hanya jika deadline baru lebih awal
+        if self._announced is None or expires_at < self._announced:
+            self._announced = expires_at
+        if self.next_deadline is None or expires_at < self.next_deadline:
+            self._deadline_moved.set()
+
     async def start_background_tasks(self):
-        """Start background tasks untuk auto-processing"""
-        while True:
-            try:
-                # Jalankan auto-cancel setiap 1 jam
-                await self.auto_cancel_unpaid_deals()
-                
-                # Jalankan auto-complete setiap 1 jam  
-                await self.auto_complete_shipped_deals()
-                
-                # Tunggu 1 jam sebelum cycle berikutnya
-                await asyncio.sleep(3600)
-                
-            except Exception as e:
-                logger.error(f"Error in background tasks: {e}")
-                await asyncio.sleep(300)  # Tunggu 5 menit jika ada error
+        """Sweeper deadline: tidur tepat sampai expires_at terdekat, lalu jalankan auto-cancel/auto-complete"""
+        loop = asyncio.get_running_loop()
+        self._deadline_moved = asyncio.Event()
+        listener = lambda expires_at: loop.call_soon_threadsafe(self._deadline_announced, expires_at)
+        on_deadline(listener)
+        try:
+            while True:
+                try:
+                    swept_at = datetime.now()
+                    await self.auto_cancel_unpaid_deals()
+                    await self.auto_complete_shipped_deals()
+                    self.sweeps += 1
+
+                    # Satu seek index (status, expires_at) per status yang punya deadline
+                    row = await self.db.fetchone(NEXT_DEADLINE_SQL, list(DEADLINES))
+                    # Deadline yang diumumkan transisi yang belum terlihat (belum commit) tetap diperhitungkan
+                    candidates = [d for d in (row[0] and datetime.fromisoformat(str(row[0])), self._announced) if d]
+                    self.next_deadline = min(candidates) if candidates else None
+                    self._announced = None
+
+                    delay = DEADLINE_MAX_SLEEP
+                    if self.next_deadline is not None:
+                        # Deadline yang sudah lewat sebelum sweep tapi belum tersapu (mis. sweep gagal): coba lagi sedetik lagi
+                        remaining = 1.0 if self.next_deadline <= swept_at else (self.next_deadline - datetime.now()).total_seconds()
+                        delay = min(max(remaining, 0), DEADLINE_MAX_SLEEP)
+                    self._deadline_moved.clear()
+                    self.sleeping_until = datetime.now() + timedelta(seconds=delay)
+                    try:
+                        await asyncio.wait_for(self._deadline_moved.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    finally:
+                        self.sleeping_until = None
+
+                except Exception as e:
+                    logger.error(f"Error in background tasks: {e}")
+                    await asyncio.sleep(300)  # Tunggu 5 menit jika ada error
+        finally:
+            # Loop ini selesai (mis. task dibatalkan): transisi berikutnya tidak lagi membangunkannya
+            off_deadline(listener)
 
 # Global instance
 notification_manager = None
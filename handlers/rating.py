@@ -1,6 +1,9 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from db_sqlite import get_connection, log_action
+from db_sqlite import db, log_action
+from dispatcher import dispatcher, BROADCAST
+from profile_cache import display_name
+from leaderboard import leaderboard
 import html
 import logging
 
@@ -28,27 +31,19 @@ async def handle_rating(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     logger.info(f"Processing rating: deal_id={deal_id}, rating={rating}, user_id={user_id}")
 
-    # Save rating to database
-    conn = get_connection()
-    cur = conn.cursor()
-
     # Check if user already rated this deal
-    cur.execute("SELECT id FROM ratings WHERE deal_id=? AND user_id=?", (deal_id, user_id))
-    existing = cur.fetchone()
+    existing = await db.fetchone("SELECT id FROM ratings WHERE deal_id=? AND user_id=?", (deal_id, user_id))
 
     if existing:
         await query.edit_message_text("❌ Anda sudah memberikan rating untuk transaksi ini.")
-        conn.close()
         return
 
-    # Insert rating
-    cur.execute(
+    # Save rating to database (reputasi pihak lain diperbarui trigger migrasi 0012)
+    rating_id = await db.insert(
         "INSERT INTO ratings (deal_id, user_id, rating, created_at) VALUES (?,?,?,'now')",
         (deal_id, user_id, rating)
     )
-    rating_id = cur.lastrowid
-    conn.commit()
-    conn.close()
+    leaderboard.invalidate()
 
     # Store rating_id in user_data for later use
     if context.user_data is None:
@@ -119,22 +114,12 @@ async def receive_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Session expired. Silakan coba lagi.")
         return ConversationHandler.END
 
-    # Update rating with comment
-    conn = get_connection()
-    cur = conn.cursor()
-    
-    # Update comment first
-    cur.execute("UPDATE ratings SET comment=? WHERE id=?", (comment, rating_id))
-    
-    # Get rating details for testimoni
-    cur.execute("""
-        SELECT deal_id, rating, user_id 
-        FROM ratings 
-        WHERE id=?
-    """, (rating_id,))
-    rating_data = cur.fetchone()
-    conn.commit()
-    conn.close()
+    # Update rating with comment, sekaligus ambil detail rating untuk testimoni
+    rows = await db.execute_returning("""
+        UPDATE ratings SET comment=? WHERE id=?
+        RETURNING deal_id, rating, user_id
+    """, (comment, rating_id))
+    rating_data = rows[0] if rows else None
 
     # Cek apakah rating_data ada
     if not rating_data:
@@ -160,7 +145,7 @@ async def receive_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Post to testimoni channel
     user = update.effective_user
-    username = "@" + user.username if user.username else user.first_name
+    username = display_name(user)
 
     from config import TESTIMONI_CHANNEL
 
@@ -179,8 +164,9 @@ async def receive_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     try:
-        await context.bot.send_message(
+        await dispatcher.send_message(
             chat_id=TESTIMONI_CHANNEL,
+            priority=BROADCAST,
             text=testimoni_text,
             parse_mode="MarkdownV2"
         )
@@ -208,22 +194,18 @@ async def skip_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("❌ Session expired. Silakan coba lagi.")
         return ConversationHandler.END
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
+    rating_data = await db.fetchone("""
         SELECT deal_id, rating, user_id 
         FROM ratings 
         WHERE id=?
     """, (rating_id,))
-    rating_data = cur.fetchone()
-    conn.close()
 
     # Post to testimoni channel without comment
     if rating_data:
         deal_id, rating_value, user_id = rating_data
             
         user = query.from_user
-        username = "@" + user.username if user.username else user.first_name
+        username = display_name(user)
         stars = "⭐" * rating_value
 
         from config import TESTIMONI_CHANNEL
@@ -239,8 +221,9 @@ async def skip_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
         try:
-            await context.bot.send_message(
+            await dispatcher.send_message(
                 chat_id=TESTIMONI_CHANNEL,
+                priority=BROADCAST,
                 text=testimoni_text,
                 parse_mode="MarkdownV2"
             )
@@ -305,7 +288,7 @@ async def receive_testimoni(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Receive and forward testimoni to channel"""
     deal_id = context.user_data.get('testimoni_deal_id')
     user = update.effective_user
-    username = "@" + user.username if user.username else user.first_name
+    username = display_name(user)
 
     from config import TESTIMONI_CHANNEL
     from telegram.helpers import escape_markdown
@@ -341,8 +324,9 @@ async def receive_testimoni(update: Update, context: ContextTypes.DEFAULT_TYPE):
             safe_caption = escape_markdown(caption, version=2)
             full_caption = testimoni_header + safe_caption + footer
 
-            await context.bot.send_photo(
+            await dispatcher.send_photo(
                 chat_id=TESTIMONI_CHANNEL,
+                priority=BROADCAST,
                 photo=photo.file_id,
                 caption=full_caption,
                 parse_mode="MarkdownV2"
@@ -351,8 +335,9 @@ async def receive_testimoni(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Testimoni teks saja
             safe_text = escape_markdown(update.message.text, version=2)
             testimoni_text = testimoni_header + safe_text + footer
-            await context.bot.send_message(
+            await dispatcher.send_message(
                 chat_id=TESTIMONI_CHANNEL,
+                priority=BROADCAST,
                 text=testimoni_text,
                 parse_mode="MarkdownV2"
             )
@@ -2,9 +2,15 @@ import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, CommandHandler, CallbackQueryHandler, filters
 from utils import generate_deal_id, format_rupiah, calculate_admin_fee
-from db_sqlite import get_connection, return_connection, log_action, save_payout_info, get_payout_info, check_rate_limit, update_user_activity
+from db_sqlite import db, user_deals_query, log_action, save_payout_info, get_payout_info, check_rate_limit, update_user_activity, deal_rollup_totals
 from config import BOT_USERNAME, ADMIN_ID
-from datetime import datetime
+from deal_state import transition, apply_transition, initial_deadline, BUYER, SELLER, PARTY
+from dispatcher import dispatcher
+from outbox import Notification
+from profile_cache import profile_cache, display_name
+from deal_cache import deal_cache
+from security import check_admin_permission
+from datetime import datetime, timedelta, timezone
 import random
 from telegram.helpers import escape_markdown
 import html
@@ -17,30 +23,19 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 async def is_chat_accessible(context, chat_id):
-    """Check if bot can access the chat"""
-    try:
-        await context.bot.get_chat(chat_id)
-        return True
-    except Exception as e:
-        logger.error(f"Cannot access chat {chat_id}: {e}")
-        return False
+    """Check if bot can access the chat (lewat cache profil, get_chat hanya jika kadaluarsa)"""
+    return await profile_cache.is_reachable(chat_id, context.bot)
 
-def debug_transaction_state(deal_id: str, action: str, user_id: int):
+async def debug_transaction_state(deal_id: str, action: str, user_id: int):
     """Helper function to debug transaction states"""
-    from db_sqlite import get_connection
-    conn = get_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT id, title, status, buyer_id, seller_id FROM deals WHERE id = ?", (deal_id,))
-        row = cur.fetchone()
+        row = await deal_cache.get(deal_id)
         if row:
             logger.info(f"🔍 Transaction Debug - Action: {action}, Deal: {deal_id}, Status: {row['status']}, Buyer: {row['buyer_id']}, Seller: {row['seller_id']}, Current User: {user_id}")
         else:
             logger.warning(f"⚠️ Transaction Debug - Action: {action}, Deal: {deal_id} NOT FOUND, User: {user_id}")
     except Exception as e:
         logger.error(f"❌ Error in debug_transaction_state: {e}")
-    finally:
-        conn.close()
 
 
 
@@ -289,46 +284,38 @@ async def rekber_pick_fee_payer(update: Update, context: ContextTypes.DEFAULT_TY
 #======= NEW REKBER SELLER =======
 async def rekber_new_seller(update, context, title, amount, admin_fee):
     user_id = update.effective_user.id
-    username = "@" + update.effective_user.username if update.effective_user.username else update.effective_user.first_name
+    username = display_name(update.effective_user)
 
     deal_id = generate_deal_id()
     total = amount + admin_fee
 
+    def _create_deal(conn):
+        # Insert deal dan log dalam satu transaction
+        now = datetime.now()
+        row = conn.execute(
+            "INSERT INTO deals (id, title, amount, admin_fee, admin_fee_payer, seller_id, buyer_id, status, expires_at) VALUES (?,?,?,?,?,?,?,?,?) RETURNING *",
+            (
+                deal_id,
+                title,
+                amount,
+                admin_fee,
+                context.user_data.get("admin_fee_payer"),
+                user_id,
+                None,
+                "PENDING_JOIN",
+                initial_deadline("PENDING_JOIN", now)
+            )
+        ).fetchone()
+        # Pembeli yang membuka link join langsung dilayani dari cache
+        deal_cache.created(deal_id, row)
+        conn.execute(
+            "INSERT INTO logs (deal_id, actor_id, role, action, detail, created_at) VALUES (?,?,?,?,?,?)",
+            (deal_id, user_id, "SELLER", "CREATE", f"Penjual {username} buat transaksi {title} Rp {amount:,}", now)
+        )
+
     # Optimized database operation dengan transaction
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        try:
-            # Insert deal dan log dalam satu transaction
-            cur.execute(
-                "INSERT INTO deals (id, title, amount, admin_fee, admin_fee_payer, seller_id, buyer_id, status) VALUES (?,?,?,?,?,?,?,?)",
-                (
-                    deal_id,
-                    title,
-                    amount,
-                    admin_fee,
-                    context.user_data.get("admin_fee_payer"),
-                    user_id,
-                    None,
-                    "PENDING_JOIN"
-                )
-            )
-            
-            # Insert log dalam transaction yang sama
-            cur.execute(
-                "INSERT INTO logs (deal_id, actor_id, role, action, detail, created_at) VALUES (?,?,?,?,?,?)",
-                (deal_id, user_id, "SELLER", "CREATE", f"Penjual {username} buat transaksi {title} Rp {amount:,}", datetime.now())
-            )
-            
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Error creating seller transaction: {e}")
-            raise
-        finally:
-            cur.close()
-            from db_sqlite import return_connection
-            return_connection(conn)
+        await db.transaction(_create_deal)
     except Exception as e:
         logger.error(f"Database error in rekber_new_seller: {e}")
         error_message = (
@@ -407,7 +394,7 @@ async def rekber_new_seller(update, context, title, amount, admin_fee):
                 f"Transaksi aman dengan jaminan rekber bot! ✅"
             )
 
-            await context.bot.send_message(
+            await dispatcher.send_message(
                 chat_id=user_id,
                 text=invite_template
             )
@@ -415,7 +402,7 @@ async def rekber_new_seller(update, context, title, amount, admin_fee):
             logger.error(f"Error sending invite template to seller {user_id}: {e}")
             # Fallback message tanpa format
             simple_invite = f"🔗 LINK UNDANGAN PEMBELI:\n{invite_link}\n\nBagikan link ini ke pembeli untuk bergabung!"
-            await context.bot.send_message(
+            await dispatcher.send_message(
                 chat_id=user_id,
                 text=simple_invite
             )
@@ -445,16 +432,14 @@ async def rekber_new_buyer_callback(update: Update, context: ContextTypes.DEFAUL
 #============= NEW REKBER BUYER ==============
 async def rekber_new_buyer(update, context, title, amount, admin_fee):
     user_id = update.effective_user.id
-    username = "@" + update.effective_user.username if update.effective_user.username else update.effective_user.first_name
+    username = display_name(update.effective_user)
 
     deal_id = generate_deal_id()   # 🔥 ID unik
     total = amount + admin_fee
 
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO deals (id, title, amount, admin_fee, admin_fee_payer, buyer_id, seller_id, status) VALUES (?,?,?,?,?,?,?,?)",
+    def _create_deal(conn):
+        row = conn.execute(
+            "INSERT INTO deals (id, title, amount, admin_fee, admin_fee_payer, buyer_id, seller_id, status, expires_at) VALUES (?,?,?,?,?,?,?,?,?) RETURNING *",
             (
                 deal_id,
                 title,
@@ -463,12 +448,16 @@ async def rekber_new_buyer(update, context, title, amount, admin_fee):
                 context.user_data.get("admin_fee_payer"),
                 user_id,
                 None,  # seller_id is NULL initially for buyer-created transactions
-                "PENDING_JOIN"
+                "PENDING_JOIN",
+                # Batal otomatis jika pihak kedua tidak bergabung (deal_state.DEADLINES)
+                initial_deadline("PENDING_JOIN", datetime.now())
             )
-        )
+        ).fetchone()
+        # Penjual yang membuka link join langsung dilayani dari cache
+        deal_cache.created(deal_id, row)
 
-        conn.commit()
-        conn.close()
+    try:
+        await db.transaction(_create_deal)
 
         log_action(deal_id, user_id, "BUYER", "CREATE", f"Pembeli {username} buat transaksi {title} Rp {amount:,}")
         
@@ -546,7 +535,7 @@ async def rekber_new_buyer(update, context, title, amount, admin_fee):
             f"Transaksi aman dengan jaminan rekber bot! ✅"
         )
 
-        await context.bot.send_message(
+        await dispatcher.send_message(
             chat_id=user_id,
             text=invite_template
         )
@@ -554,7 +543,7 @@ async def rekber_new_buyer(update, context, title, amount, admin_fee):
         logger.error(f"Error sending invite template to buyer {user_id}: {e}")
         # Fallback message tanpa format
         simple_invite = f"🔗 LINK UNDANGAN PENJUAL:\n{invite_link}\n\nBagikan link ini ke penjual untuk bergabung!"
-        await context.bot.send_message(
+        await dispatcher.send_message(
             chat_id=user_id,
             text=simple_invite
         )
@@ -573,11 +562,7 @@ async def rekber_join(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # Get transaction details
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT id, title, amount, buyer_id, seller_id, status FROM deals WHERE id = ?", (deal_id,))
-            row = cur.fetchone()
-            conn.close()
+            row = await deal_cache.get(deal_id)
         except Exception as e:
             logger.error(f"Database error in rekber_join: {e}")
             await update.message.reply_text(
@@ -604,18 +589,9 @@ async def rekber_join(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # ⛔ SECURITY: Cek apakah user sudah pernah join transaksi ini sebagai joined_by
         # Mencegah double-joining vulnerability
-        try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT joined_by FROM deals WHERE id = ? AND joined_by = ?", (deal_id, user_id))
-            already_joined = cur.fetchone()
-            conn.close()
-            
-            if already_joined:
-                await update.message.reply_text("❌ Anda sudah pernah mencoba bergabung dalam transaksi ini. Setiap user hanya bisa join sekali.")
-                return
-        except Exception as e:
-            logger.error(f"Error checking joined_by: {e}")
+        if row['joined_by'] == user_id:
+            await update.message.reply_text("❌ Anda sudah pernah mencoba bergabung dalam transaksi ini. Setiap user hanya bisa join sekali.")
+            return
 
         # Check if transaction is still open for joining
         if status != "PENDING_JOIN":
@@ -701,221 +677,45 @@ async def rekber_join(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text("❌ Terjadi kesalahan dalam memproses permintaan join.")
 
-async def rekber_join_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """User konfirmasi bergabung ke transaksi"""
-    query = update.callback_query
-    await query.answer()
-
-    # Extract deal_id and role from callback data
-    if not query.data or not query.data.startswith("rekber_join_confirm|"):
-        await query.edit_message_text("❌ Data tidak valid untuk konfirmasi bergabung.")
-        return ConversationHandler.END
-
-    parts = query.data.split("|")
-    if len(parts) < 3:
-        await query.edit_message_text("❌ Format data tidak lengkap.")
-        return ConversationHandler.END
 
-    deal_id = parts[1]
-    role = parts[2]
-    user_id = query.from_user.id
-    username = query.from_user.username or query.from_user.first_name
-
-    logger.debug(f"Processing join confirmation - Deal: {deal_id}, Role: {role}, User: {user_id}")
-
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
+def _join_deal(conn, deal_id: str, role: str, user_id: int):
+    """Daftarkan user ke deal dalam satu transaksi (dijalankan di thread database)"""
+    column = {"BUYER": "buyer_id", "SELLER": "seller_id"}.get(role)
+    if column is not None:
+        # Validasi di WHERE; RETURNING memberi baris setelah update tanpa SELECT ulang
+        updated = conn.execute(
+            f"UPDATE deals SET {column} = ?, joined_by = ? "
+            f"WHERE id = ? AND status = 'PENDING_JOIN' AND {column} IS NULL "
+            f"AND ? NOT IN (IFNULL(buyer_id, 0), IFNULL(seller_id, 0)) RETURNING *",
+            (user_id, user_id, deal_id, user_id)
+        ).fetchone()
+        if updated is not None:
+            deal_cache.invalidate(deal_id, updated)
+            if updated['buyer_id'] and updated['seller_id']:
+                apply_transition(conn, deal_id, "JOIN", user_id, role, "Kedua pihak sudah bergabung")
+            return updated, None
+
+    # Tidak bisa bergabung: cari alasannya
+    row = conn.execute(
         "SELECT id, title, amount, admin_fee, admin_fee_payer, buyer_id, seller_id, status "
         "FROM deals WHERE id = ?",
         (deal_id,)
-    )
-    row = cur.fetchone()
+    ).fetchone()
 
     if not row:
-        await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-        conn.close()
-        return ConversationHandler.END
-
-    title = row['title']
-    amount = int(row['amount'])  # Convert to integer
-    admin_fee = int(row['admin_fee'])  # Convert to integer
-    admin_fee_payer = row['admin_fee_payer']
-    buyer_id = row['buyer_id']
-    seller_id = row['seller_id']
-    status = row['status']
+        return None, "❌ Transaksi tidak ditemukan."
 
     # Validate that transaction can still accept joins
-    if status not in ["PENDING_JOIN"]:
-        await query.edit_message_text("❌ Transaksi ini tidak bisa diikuti lagi.")
-        conn.close()
-        return ConversationHandler.END
+    if row['status'] not in ["PENDING_JOIN"]:
+        return row, "❌ Transaksi ini tidak bisa diikuti lagi."
 
     # Validate user is not already in this transaction
-    if user_id == buyer_id or user_id == seller_id:
-        await query.edit_message_text("❌ Anda sudah terdaftar dalam transaksi ini.")
-        conn.close()
-        return ConversationHandler.END
-
-    # Update database with the new participant
-    updated_buyer_id = buyer_id
-    updated_seller_id = seller_id
-
-    if role == "BUYER":
-        cur.execute("UPDATE deals SET buyer_id = ?, joined_by = ? WHERE id = ?", (user_id, user_id, deal_id))
-        updated_buyer_id = user_id
-        logger.debug(f"Updated buyer_id to {user_id} for deal {deal_id}")
-    elif role == "SELLER":
-        cur.execute("UPDATE deals SET seller_id = ?, joined_by = ? WHERE id = ?", (user_id, user_id, deal_id))
-        updated_seller_id = user_id
-        logger.debug(f"Updated seller_id to {user_id} for deal {deal_id}")
-    else:
-        await query.edit_message_text("❌ Peran tidak valid.")
-        conn.close()
-        return ConversationHandler.END
-
-    conn.commit()
-
-    # Re-fetch to ensure correct IDs are used
-    cur.execute("SELECT buyer_id, seller_id FROM deals WHERE id = ?", (deal_id,))
-    verification_row = cur.fetchone()
-    if verification_row:
-        updated_buyer_id = verification_row['buyer_id']
-        updated_seller_id = verification_row['seller_id']
-    else:
-        logger.error(f"Failed to re-fetch deal details after update for {deal_id}")
-        conn.close()
-        return ConversationHandler.END
-
-    # Check if both roles are now filled and update status
-    if updated_buyer_id and updated_seller_id:
-        cur.execute("UPDATE deals SET status = ? WHERE id = ?", ("PENDING_FUNDING", deal_id))
-        conn.commit()
-
-        logger.debug(f"Transaction {deal_id} complete - Buyer: {updated_buyer_id}, Seller: {updated_seller_id}, Status: PENDING_FUNDING")
-
-        buyer_total = amount + admin_fee if admin_fee_payer == "BUYER" else amount
-        seller_receive = amount if admin_fee_payer == "BUYER" else amount - admin_fee
-
-        role_indo = "Penjual" if role == "SELLER" else "Pembeli"
-        await query.edit_message_text(
-            f"✅ **BERHASIL BERGABUNG!**\n\n"
-            f"Anda telah bergabung sebagai **{role_indo}** untuk transaksi `{deal_id}`\n\n"
-            f"📦 **Produk:** {title}\n"
-            f"💰 **Nilai:** {format_rupiah(amount)}\n\n"
-            f"Transaksi sekarang **LENGKAP** dan siap dimulai!",
-            parse_mode="Markdown"
-        )
-
-        # Send detailed instructions to buyer
-        buyer_confirmation = (
-            f"🎉 **TRANSAKSI SIAP DIMULAI!**\n\n"
-            f"📋 **ID:** `{deal_id}`\n"
-            f"📦 **Barang/Jasa:** {title}\n"
-            f"💰 **Harga:** {format_rupiah(amount)}\n"
-            f"💸 **Biaya Admin:** {format_rupiah(admin_fee)} *(ditanggung {'Anda' if admin_fee_payer == 'BUYER' else 'penjual'})*\n"
-            f"📊 **Total Anda Transfer:** **{format_rupiah(buyer_total)}**\n\n"
-            f"👥 **Kedua pihak sudah bergabung!**\n\n"
-            f"📌 **LANGKAH SELANJUTNYA:**\n"
-            f"1️⃣ Transfer dana ke rekening admin\n"
-            f"2️⃣ Konfirmasi pembayaran\n"
-            f"3️⃣ Tunggu penjual kirim barang\n"
-            f"4️⃣ Konfirmasi penerimaan\n"
-            f"5️⃣ Dana dilepas ke penjual\n\n"
-            f"⏰ **Batas waktu transfer:** 24 jam"
-        )
-
-        keyboard_buyer = [
-            [InlineKeyboardButton("💰 Lanjut ke Pembayaran", callback_data=f"start_payment|{deal_id}")],
-            [InlineKeyboardButton("📋 Lihat Status", callback_data=f"rekber_status|{deal_id}"),
-             InlineKeyboardButton("❌ Batalkan", callback_data=f"rekber_funding_cancel|{deal_id}")]
-        ]
-
-        # Send instructions to seller
-        seller_confirmation = (
-            f"🎉 **TRANSAKSI SIAP DIMULAI!**\n\n"
-            f"📋 **ID:** `{deal_id}`\n"
-            f"📦 **Barang/Jasa:** {title}\n"
-            f"💰 **Harga:** {format_rupiah(amount)}\n"
-            f"💸 **Biaya Admin:** {format_rupiah(admin_fee)} *(ditanggung {'pembeli' if admin_fee_payer == 'BUYER' else 'Anda'})*\n"
-            f"📊 **Anda Terima:** **{format_rupiah(seller_receive)}**\n\n"
-            f"👥 **Kedua pihak sudah bergabung!**\n\n"
-            f"📌 **LANGKAH SELANJUTNYA:**\n"
-            f"1️⃣ Tunggu pembeli transfer dana\n"
-            f"2️⃣ Admin verifikasi pembayaran\n"
-            f"3️⃣ Anda kirim barang/jasa\n"
-            f"4️⃣ Pembeli konfirmasi penerimaan\n"
-            f"5️⃣ Dana dilepas ke Anda\n\n"
-            f"📱 **Siap-siap kirim barang setelah dana terverifikasi!**"
-        )
-
-        keyboard_seller = [
-            [InlineKeyboardButton("📋 Lihat Status", callback_data=f"rekber_status|{deal_id}")]
-        ]
-
-        # Send messages to both parties
-        try:
-            await context.bot.send_message(
-                chat_id=updated_buyer_id,
-                text=buyer_confirmation,
-                parse_mode="Markdown",
-                reply_markup=InlineKeyboardMarkup(keyboard_buyer)
-            )
-            logger.debug(f"Successfully sent payment instructions to buyer {updated_buyer_id}")
-        except Exception as e:
-            logger.error(f"Failed to send message to buyer {updated_buyer_id}: {e}")
-
-        try:
-            await context.bot.send_message(
-                chat_id=updated_seller_id,
-                text=seller_confirmation,
-                parse_mode="Markdown",
-                reply_markup=InlineKeyboardMarkup(keyboard_seller)
-            )
-            logger.debug(f"Successfully sent instructions to seller {updated_seller_id}")
-        except Exception as e:
-            logger.error(f"Failed to send message to seller {updated_seller_id}: {e}")
-
-        # Notify admin
-        admin_notif = (
-            f"📢 <b>Transaksi Rekber Baru !</b>\n\n"
-            f"🏷️ ID: <code>{deal_id}</code>\n"
-            f"📝 Judul: {title}\n"
-            f"💰 Nominal: Rp {amount:,}\n"
-            f"💸 Biaya Admin: Rp {admin_fee:,} (ditanggung {admin_fee_payer})\n"
-            f"💵 Total Transfer Pembeli: Rp {buyer_total:,}\n\n"
-            f"👤 Pembeli ID: {updated_buyer_id}\n"
-            f"👨 Penjual ID: {updated_seller_id}\n\n"
-            f"📦 Status: <b>PENDING_FUNDING</b>\n"
-            f"⏳ Menunggu pembeli melakukan pembayaran..."
-        )
-
-        try:
-            await context.bot.send_message(
-                chat_id=ADMIN_ID,
-                text=admin_notif,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            logger.error(f"Gagal kirim notif admin: {e}")
-
-        # Log the successful completion
-        log_action(deal_id, user_id, role, "JOIN_COMPLETE", f"{role_indo} {username} bergabung - transaksi lengkap dan siap funding")
-
-    else:
-        # Only one party has joined so far
-        role_indo = "Penjual" if role == "SELLER" else "Pembeli"
-        await query.edit_message_text(
-            f"✅ **BERHASIL BERGABUNG!**\n\n"
-            f"Anda berhasil bergabung sebagai **{role_indo}** untuk transaksi `{deal_id}`\n\n"
-            f"⏳ Menunggu {'penjual' if role == 'BUYER' else 'pembeli'} untuk bergabung...\n\n"
-            f"📱 Bagikan link undangan untuk mempercepat proses!"
-        )
-        log_action(deal_id, user_id, role, "JOIN", f"{role_indo} {username} bergabung - menunggu pihak lain")
-
-    conn.close()
-    return ConversationHandler.END
+    if user_id == row['buyer_id'] or user_id == row['seller_id']:
+        return row, "❌ Anda sudah terdaftar dalam transaksi ini."
 
+    if column is None:
+        return row, "❌ Peran tidak valid."
+    return row, "❌ Posisi ini sudah terisi."
 
 
 ## JOIN CONFIRM
@@ -941,75 +741,22 @@ async def rekber_join_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     logger.debug(f"Processing join confirmation - Deal: {deal_id}, Role: {role}, User: {user_id}")
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, title, amount, admin_fee, admin_fee_payer, buyer_id, seller_id, status "
-        "FROM deals WHERE id = ?",
-        (deal_id,)
-    )
-    row = cur.fetchone()
-
-    if not row:
-        await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-        conn.close()
+    # Validasi + update peserta + status dijalankan atomik di thread database
+    row, error = await db.transaction(_join_deal, deal_id, role, user_id)
+    if error:
+        await query.edit_message_text(error)
         return ConversationHandler.END
 
     title = row['title']
     amount = int(row['amount'])  # Convert to integer
     admin_fee = int(row['admin_fee'])  # Convert to integer
     admin_fee_payer = row['admin_fee_payer']
-    buyer_id = row['buyer_id']
-    seller_id = row['seller_id']
-    status = row['status']
-
-    # Validate that transaction can still accept joins
-    if status not in ["PENDING_JOIN"]:
-        await query.edit_message_text("❌ Transaksi ini tidak bisa diikuti lagi.")
-        conn.close()
-        return ConversationHandler.END
-
-    # Validate user is not already in this transaction
-    if user_id == buyer_id or user_id == seller_id:
-        await query.edit_message_text("❌ Anda sudah terdaftar dalam transaksi ini.")
-        conn.close()
-        return ConversationHandler.END
-
-    # Update database with the new participant
-    updated_buyer_id = buyer_id
-    updated_seller_id = seller_id
-
-    if role == "BUYER":
-        cur.execute("UPDATE deals SET buyer_id = ?, joined_by = ? WHERE id = ?", (user_id, user_id, deal_id))
-        updated_buyer_id = user_id
-        logger.debug(f"Updated buyer_id to {user_id} for deal {deal_id}")
-    elif role == "SELLER":
-        cur.execute("UPDATE deals SET seller_id = ?, joined_by = ? WHERE id = ?", (user_id, user_id, deal_id))
-        updated_seller_id = user_id
-        logger.debug(f"Updated seller_id to {user_id} for deal {deal_id}")
-    else:
-        await query.edit_message_text("❌ Peran tidak valid.")
-        conn.close()
-        return ConversationHandler.END
-
-    conn.commit()
-
-    # Re-fetch to ensure correct IDs are used
-    cur.execute("SELECT buyer_id, seller_id FROM deals WHERE id = ?", (deal_id,))
-    verification_row = cur.fetchone()
-    if verification_row:
-        updated_buyer_id = verification_row['buyer_id']
-        updated_seller_id = verification_row['seller_id']
-    else:
-        logger.error(f"Failed to re-fetch deal details after update for {deal_id}")
-        conn.close()
-        return ConversationHandler.END
+    updated_buyer_id = row['buyer_id']
+    updated_seller_id = row['seller_id']
+    logger.debug(f"Updated {role.lower()}_id to {user_id} for deal {deal_id}")
 
     # Check if both roles are now filled and update status
     if updated_buyer_id and updated_seller_id:
-        cur.execute("UPDATE deals SET status = ? WHERE id = ?", ("PENDING_FUNDING", deal_id))
-        conn.commit()
-
         logger.debug(f"Transaction {deal_id} complete - Buyer: {updated_buyer_id}, Seller: {updated_seller_id}, Status: PENDING_FUNDING")
 
         buyer_total = amount + admin_fee if admin_fee_payer == "BUYER" else amount
@@ -1073,7 +820,7 @@ async def rekber_join_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE
 
         # Send messages to both parties
         try:
-            await context.bot.send_message(
+            await dispatcher.send_message(
                 chat_id=updated_buyer_id,
                 text=buyer_confirmation,
                 parse_mode="Markdown",
@@ -1084,7 +831,7 @@ async def rekber_join_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE
             logger.error(f"Failed to send message to buyer {updated_buyer_id}: {e}")
 
         try:
-            await context.bot.send_message(
+            await dispatcher.send_message(
                 chat_id=updated_seller_id,
                 text=seller_confirmation,
                 parse_mode="Markdown",
@@ -1109,7 +856,7 @@ async def rekber_join_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
 
         try:
-            await context.bot.send_message(
+            await dispatcher.send_message(
                 chat_id=ADMIN_ID,
                 text=admin_notif,
                 parse_mode="HTML"
@@ -1131,7 +878,6 @@ async def rekber_join_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         log_action(deal_id, user_id, role, "JOIN", f"{role_indo} {username} bergabung - menunggu pihak lain")
 
-    conn.close()
     return ConversationHandler.END
 
 
@@ -1146,11 +892,7 @@ async def start_payment_handler(update: Update, context: ContextTypes.DEFAULT_TY
 
     # Fetch complete transaction data
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT title, amount, buyer_id, status FROM deals WHERE id = ?", (deal_id,))
-        row = cur.fetchone()
-        conn.close()
+        row = await deal_cache.get(deal_id)
     except Exception as e:
         logger.error(f"Database error in start_payment_handler: {e}")
         await query.edit_message_text(
@@ -1184,14 +926,7 @@ async def start_payment_handler(update: Update, context: ContextTypes.DEFAULT_TY
 
 # --- STEP 3: BUYER FUNDING ---
 async def rekber_funding_menu(context: ContextTypes.DEFAULT_TYPE, user_id: int, deal_id: str, title: str, amount: int):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT buyer_id, seller_id, admin_fee, admin_fee_payer FROM deals WHERE id = ?",
-        (deal_id,)
-    )
-    row = cur.fetchone()
-    conn.close()
+    row = await deal_cache.get(deal_id)
 
     if not row:
         return
@@ -1270,7 +1005,7 @@ async def rekber_funding_menu(context: ContextTypes.DEFAULT_TYPE, user_id: int,
         [InlineKeyboardButton("❌ Batalkan Transaksi", callback_data=f"rekber_funding_cancel|{deal_id}")]
     ]
 
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=user_id,
         text=payment_instruction,
         parse_mode="Markdown",
@@ -1294,7 +1029,7 @@ async def rekber_funding_menu(context: ContextTypes.DEFAULT_TYPE, user_id: int,
 
         keyboard_seller = [[InlineKeyboardButton("✅ Sudah Transfer Biaya Admin", callback_data=f"seller_fee_confirm|{deal_id}")]]
 
-        await context.bot.send_message(
+        await dispatcher.send_message(
             chat_id=seller_id,
             text=seller_payment_instruction,
             parse_mode="Markdown",
@@ -1310,44 +1045,27 @@ async def rekber_fund_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE
     deal_id = query.data.split("|")[1]
     user_id = query.from_user.id
 
-    conn = get_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT buyer_id, seller_id, status, title, amount, admin_fee, admin_fee_payer FROM deals WHERE id=?", (deal_id,))
-        row = cur.fetchone()
-
+        # Update status transaksi ke WAITING_PAYMENT_PROOF (hanya pembeli, hanya dari PENDING_FUNDING)
+        row = await transition(
+            deal_id, "FUND_CONFIRM", user_id, "BUYER", "Pembeli konfirmasi transfer",
+            guard=BUYER, guard_params=(user_id,), returning="id"
+        )
         if not row:
-            await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-            return
-
-        buyer_id = row['buyer_id']
-        seller_id = row['seller_id']
-        status = row['status']
-        title = row['title']
-        amount = int(row['amount'])  # Convert to integer
-        admin_fee = int(row['admin_fee'])  # Convert to integer
-        admin_fee_payer = row['admin_fee_payer']
-
-        if user_id != buyer_id:
-            await query.edit_message_text("❌ Hanya pembeli yang bisa melakukan pendanaan.")
-            return
-
-        if status != "PENDING_FUNDING":
-            await query.edit_message_text("⚠️ Transaksi tidak dalam tahap pendanaan.")
-            return
-
-        # Update status transaksi ke WAITING_PAYMENT_PROOF
-        cur.execute("UPDATE deals SET status='WAITING_PAYMENT_PROOF' WHERE id=?", (deal_id,))
-        conn.commit()
+            current = await deal_cache.get(deal_id)
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error in rekber_fund_confirm: {e}")
         await query.edit_message_text("❌ Terjadi kesalahan saat konfirmasi pembayaran.")
         return
-    finally:
-        cur.close()
-        from db_sqlite import return_connection
-        return_connection(conn)
+
+    if not row:
+        if not current:
+            await query.edit_message_text("❌ Transaksi tidak ditemukan.")
+        elif user_id != current['buyer_id']:
+            await query.edit_message_text("❌ Hanya pembeli yang bisa melakukan pendanaan.")
+        else:
+            await query.edit_message_text("⚠️ Transaksi tidak dalam tahap pendanaan.")
+        return
 
     # Minta user upload bukti pembayaran
     proof_message = (
@@ -1374,21 +1092,16 @@ async def rekber_fee_paid(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
     deal_id = query.data.split("|")[1]
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT seller_id, buyer_id, title, admin_fee FROM deals WHERE id = ?", (deal_id,))
-    row = cur.fetchone()
+    row = await deal_cache.get(deal_id)
 
     if not row:
         await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-        conn.close()
         return
 
     seller_id = row['seller_id']
     buyer_id = row['buyer_id'] 
     title = row['title']
     admin_fee = row['admin_fee']
-    conn.close()
 
     # Debug log untuk troubleshooting
     logger.debug(f"Fee payment confirmation - Deal: {deal_id}, Seller in DB: {seller_id}, Current User: {user_id}")
@@ -1411,7 +1124,7 @@ async def rekber_fee_paid(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"👨 Penjual sudah menekan tombol <b>Sudah Bayar</b>.\n\n"
         f"Silakan verifikasi."
     )
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=config.ADMIN_ID,
         text=notif_text,
         parse_mode="HTML",
@@ -1425,30 +1138,25 @@ async def rekber_fee_verify(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     deal_id = query.data.split("|")[1]
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT seller_id, buyer_id, title FROM deals WHERE id = ?", (deal_id,))
-    row = cur.fetchone()
+    row = await deal_cache.get(deal_id)
 
     if not row:
         await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-        conn.close()
         return
 
     seller_id = row['seller_id']
     buyer_id = row['buyer_id']
     title = row['title']
-    conn.close()
 
     # Notif ke Penjual
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=seller_id,
         text=f"✅ Fee admin untuk transaksi <b>{title}</b> sudah diverifikasi.",
         parse_mode="HTML"
     )
 
     # Notif ke Pembeli
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=buyer_id,
         text=(
             f"📢 Fee admin untuk transaksi <b>{title}</b> sudah diterima.\n\n"
@@ -1459,103 +1167,6 @@ async def rekber_fee_verify(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await query.edit_message_text("✅ Fee admin berhasil diverifikasi. Transaksi lanjut ke tahap pendanaan.")
 
-async def rekber_fund_verify(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    deal_id = query.data.split("|")[1]
-
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT seller_id, buyer_id, title FROM deals WHERE id = ?", (deal_id,))
-    row = cur.fetchone()
-    conn.close()
-
-    if not row:
-        await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-        return
-
-    buyer_id, seller_id, title = row
-
-    # Update status transaksi
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE deals SET status = ? WHERE id = ?", ("FUNDED", deal_id))
-    conn.commit()
-    conn.close()
-
-    # --- Dana yang dilepas ke penjual ---
-    released_amount = amount
-
-    # Notif ke Penjual
-    await context.bot.send_message(
-        chat_id=seller_id,
-        text=f"📦 Pembayaran untuk transaksi <b>{title}</b> sudah diverifikasi.\n\nSilakan kirim barang/jasa ke pembeli.",
-        parse_mode="HTML"
-    )
-
-    # Notif ke Pembeli
-    await context.bot.send_message(
-        chat_id=buyer_id,
-        text=f"✅ Pembayaran kamu untuk transaksi <b>{title}</b> sudah diverifikasi.\n\nMenunggu barang/jasa dari penjual.",
-        parse_mode="HTML"
-    )
-
-    await query.edit_message_text("✅ Pembayaran pembeli berhasil diverifikasi. Transaksi lanjut ke tahap pengiriman.")
-
-    # Logging (opsional)
-    try:
-        log_action(deal_id, buyer_id, "BUYER", "FUND_VERIFY", "Admin verifikasi pembayaran pembeli")
-    except Exception:
-        pass
-
-
-
-
-async def rekber_admin_verify(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Admin handler untuk verifikasi pembayaran"""
-    query = update.callback_query
-    await query.answer()
-    deal_id = query.data.split("|")[1]
-
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT buyer_id, seller_id, title, amount, admin_fee, admin_fee_payer FROM deals WHERE id = ?", (deal_id,))
-    row = cur.fetchone()
-
-    if not row:
-        await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-        conn.close()
-        return
-
-    buyer_id = row['buyer_id']
-    seller_id = row['seller_id']
-    title = row['title']
-    amount = int(row['amount'])  # Convert to integer
-    admin_fee = int(row['admin_fee'])
-    admin_fee_payer = row['admin_fee_payer']
-
-    # Update status ke FUNDED (dana sudah terverifikasi)
-    cur.execute("UPDATE deals SET status = ? WHERE id = ?", ("FUNDED", deal_id))
-    conn.commit()
-    conn.close()
-
-    # Notifikasi ke kedua belah pihak
-    await context.bot.send_message(
-        chat_id=buyer_id,
-        text=f"✅ Pembayaran untuk transaksi <b>{title}</b> sudah diverifikasi. Menunggu pengiriman barang/jasa.",
-        parse_mode="HTML"
-    )
-
-    keyboard_seller = [[InlineKeyboardButton("📦 Tandai Sudah Dikirim", callback_data=f"rekber_mark_shipped|{deal_id}")]]
-    await context.bot.send_message(
-        chat_id=seller_id,
-        text=f"✅ Pembayaran untuk transaksi <b>{title}</b> sudah diverifikasi. Silakan kirim barang/jasa ke pembeli.",
-        parse_mode="HTML",
-        reply_markup=keyboard_seller
-    )
-
-    await query.edit_message_text("✅ Pembayaran berhasil diverifikasi.")
-
 # === REKBER STATUS WITH CANCEL BUTTON ===
 async def rekber_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handler untuk melihat status transaksi dengan tombol batalkan jika diperlukan"""
@@ -1565,14 +1176,7 @@ async def rekber_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     deal_id = query.data.split("|")[1]
     user_id = query.from_user.id
     
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT buyer_id, seller_id, status, title, amount, admin_fee, admin_fee_payer FROM deals WHERE id = ?",
-        (deal_id,)
-    )
-    row = cur.fetchone()
-    conn.close()
+    row = await deal_cache.get(deal_id)
     
     if not row:
         await query.edit_message_text("❌ Transaksi tidak ditemukan.")
@@ -1659,40 +1263,25 @@ async def rekber_mark_shipped(update: Update, context: ContextTypes.DEFAULT_TYPE
     deal_id = query.data.split("|")[1]
     user_id = query.from_user.id
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT buyer_id, seller_id, status FROM deals WHERE id=?", (deal_id,))
-    row = cur.fetchone()
+    # update status jadi AWAITING_CONFIRM (hanya penjual, hanya dari FUNDED)
+    row = await transition(
+        deal_id, "MARK_SHIPPED", user_id, "SELLER", "Penjual menandai barang/jasa dikirim",
+        guard=SELLER, guard_params=(user_id,), returning="buyer_id"
+    )
     if not row:
-        await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-        conn.close()
+        current = await deal_cache.get(deal_id)
+        logger.debug(f"Mark shipped ditolak - Deal: {deal_id}, Current User: {user_id}, Data: {dict(current) if current else None}")
+        if not current:
+            await query.edit_message_text("❌ Transaksi tidak ditemukan.")
+        elif current['seller_id'] is None:
+            await query.edit_message_text("❌ Penjual belum terdaftar dalam transaksi ini.")
+        elif user_id != current['seller_id']:
+            await query.edit_message_text("❌ Hanya penjual yang bisa tandai pengiriman.")
+        else:
+            await query.edit_message_text("⚠️ Transaksi belum siap dikirim.")
         return
 
     buyer_id = row['buyer_id']
-    seller_id_db = row['seller_id']
-    status = row['status']
-
-    logger.debug(f"Mark shipped - Deal: {deal_id}, Seller in DB: {seller_id_db}, Current User: {user_id}, Status: {status}")
-
-    if seller_id_db is None:
-        await query.edit_message_text("❌ Penjual belum terdaftar dalam transaksi ini.")
-        conn.close()
-        return
-
-    if user_id != seller_id_db:
-        await query.edit_message_text("❌ Hanya penjual yang bisa tandai pengiriman.")
-        conn.close()
-        return
-
-    if status != "FUNDED":
-        await query.edit_message_text("⚠️ Transaksi belum siap dikirim.")
-        conn.close()
-        return
-
-    # update status jadi AWAITING_CONFIRM
-    cur.execute("UPDATE deals SET status='AWAITING_CONFIRM' WHERE id=?", (deal_id,))
-    conn.commit()
-    conn.close()
 
     await query.edit_message_text("📦 Kamu sudah menandai barang/jasa dikirim. Menunggu konfirmasi buyer.")
 
@@ -1701,7 +1290,7 @@ async def rekber_mark_shipped(update: Update, context: ContextTypes.DEFAULT_TYPE
         [InlineKeyboardButton("✅ Barang Diterima", callback_data=f"rekber_release|{deal_id}")],
         [InlineKeyboardButton("⚠️ Ajukan Sengketa", callback_data=f"rekber_dispute|{deal_id}")]
     ]
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=buyer_id,
         text=f"📦 Penjual telah menandai barang/jasa sudah dikirim untuk Rekber {deal_id}.\n\n"
              f"Jika sudah diterima & sesuai, klik *Barang Diterima* untuk rilis dana.\n"
@@ -1715,31 +1304,36 @@ async def rekber_release(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     deal_id = query.data.split("|")[1]
+    user_id = query.from_user.id
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT buyer_id, seller_id, title, amount, admin_fee, admin_fee_payer FROM deals WHERE id = ?",
-        (deal_id,)
+    # Update status transaksi ke RELEASED (hanya pembeli, hanya setelah barang dikirim);
+    # notifikasi ke kedua pihak ditulis ke outbox di transaksi yang sama
+    row = await transition(
+        deal_id, "RELEASE", user_id, "BUYER", "Pembeli konfirmasi barang diterima, dana dilepas",
+        guard=BUYER, guard_params=(user_id,),
+        returning="buyer_id, seller_id, title, amount, admin_fee, admin_fee_payer",
+        notify=lambda row: _release_notifications(deal_id, row)
     )
-    row = cur.fetchone()
     if not row:
-        conn.close()
-        await query.edit_message_text("❌ Transaksi tidak ditemukan.")
+        current = await deal_cache.get(deal_id)
+        if not current:
+            await query.edit_message_text("❌ Transaksi tidak ditemukan.")
+        elif user_id != current['buyer_id']:
+            await query.edit_message_text("❌ Hanya pembeli yang bisa mengonfirmasi penerimaan barang.")
+        else:
+            await query.edit_message_text("⚠️ Dana transaksi ini sudah dilepas atau belum siap dilepas.")
         return
 
-    buyer_id = row['buyer_id']
-    seller_id = row['seller_id']
+    await query.edit_message_text("✅ Dana berhasil dilepas ke penjual. Transaksi selesai.")
+
+
+def _release_notifications(deal_id: str, row):
+    """Notifikasi dana dilepas ke penjual & pembeli (ditulis ke outbox)"""
     title = row['title']
     amount = int(row['amount'])  # Convert to integer
     admin_fee = int(row['admin_fee'])  # Convert to integer
     admin_fee_payer = row['admin_fee_payer']
 
-    # Update status transaksi
-    cur.execute("UPDATE deals SET status = ? WHERE id = ?", ("RELEASED", deal_id))
-    conn.commit()
-    conn.close()
-
     # --- Dana yang dilepas ke penjual ---
     released_amount = amount
 
@@ -1759,12 +1353,6 @@ async def rekber_release(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Silakan isi data pencairan (rekening/e-wallet) untuk menerima dana.\n\n"
         f"Terima kasih telah menggunakan layanan Rekber."
     )
-    await context.bot.send_message(
-        chat_id=seller_id,
-        text=text_seller,
-        parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(keyboard_seller)
-    )
 
     # Notif ke Pembeli
     text_buyer = (
@@ -1774,72 +1362,56 @@ async def rekber_release(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"💵 Dana sudah dilepas ke Penjual: Rp {released_amount:,}\n\n"
         f"Terima kasih telah menggunakan layanan Rekber."
     )
-    await context.bot.send_message(
-        chat_id=buyer_id,
-        text=text_buyer,
-        parse_mode="HTML"
-    )
+    return [
+        Notification(row['seller_id'], text_seller,
+                     {"parse_mode": "HTML", "reply_markup": InlineKeyboardMarkup(keyboard_seller)}),
+        Notification(row['buyer_id'], text_buyer, {"parse_mode": "HTML"}),
+    ]
 
-    await query.edit_message_text("✅ Dana berhasil dilepas ke penjual. Transaksi selesai.")
 
-    # Logging
-    try:
-        log_action(deal_id, seller_id, "SELLER", "RELEASE", f"Release dana Rp {released_amount:,}")
-    except Exception:
-        pass
+# --- STEP 5B: BUYER DISPUTE ---
+def _open_dispute(conn, deal_id: str, user_id: int):
+    """Buka sengketa secara atomik; mengembalikan (deal sebelum berubah, error)"""
+    row = conn.execute("SELECT buyer_id, seller_id, status FROM deals WHERE id = ?", (deal_id,)).fetchone()
+    if not row:
+        return None, "❌ Transaksi tidak ditemukan."
+
+    # ✅ SECURITY FIX: Allow both buyer and seller to open dispute
+    if user_id != row['buyer_id'] and user_id != row['seller_id']:
+        return None, "❌ Anda tidak terdaftar dalam transaksi ini."
 
+    role = "BUYER" if user_id == row['buyer_id'] else "SELLER"
+    opener_name = "Pembeli" if role == "BUYER" else "Penjual"
+    # Allow dispute in multiple states for better protection (lihat deal_state.TRANSITIONS)
+    if not apply_transition(conn, deal_id, "OPEN_DISPUTE", user_id, role, f"Dispute dibuka oleh {opener_name}",
+                            guard=PARTY, guard_params=(user_id,)):
+        return None, "⚠️ Sengketa hanya bisa dibuka setelah pembayaran terverifikasi."
+
+    # Record dispute in database for audit trail
+    conn.execute(
+        "INSERT INTO disputes (deal_id, raised_by, reason, status) VALUES (?, ?, ?, ?)",
+        (deal_id, user_id, f"Dispute dibuka oleh {opener_name}", "OPEN")
+    )
+    return row, None
 
-# --- STEP 5B: BUYER DISPUTE ---
 async def rekber_dispute(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     deal_id = query.data.split("|")[1]
     user_id = query.from_user.id
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT buyer_id, seller_id, status FROM deals WHERE id=?", (deal_id,))
-    row = cur.fetchone()
-    if not row:
-        await query.edit_message_text("❌ Transaksi tidak ditemukan.")
+    # Status → DISPUTED dan catatan disputes dalam satu transaksi
+    row, error = await db.transaction(_open_dispute, deal_id, user_id)
+    if error:
+        await query.edit_message_text(error)
         return
 
-    buyer_id, seller_id, status = row
-    
-    # ✅ SECURITY FIX: Allow both buyer and seller to open dispute
-    if user_id != buyer_id and user_id != seller_id:
-        await query.edit_message_text("❌ Anda tidak terdaftar dalam transaksi ini.")
-        return
-    
-    # Determine who is opening the dispute
+    buyer_id, seller_id, status = row['buyer_id'], row['seller_id'], row['status']
     dispute_opener = "BUYER" if user_id == buyer_id else "SELLER"
     opener_name = "Pembeli" if dispute_opener == "BUYER" else "Penjual"
 
-    # Allow dispute in multiple states for better protection
-    if status not in ["AWAITING_CONFIRM", "FUNDED", "SHIPPED"]:
-        await query.edit_message_text("⚠️ Sengketa hanya bisa dibuka setelah pembayaran terverifikasi.")
-        return
-
-    # update status → DISPUTED
-    cur.execute("UPDATE deals SET status='DISPUTED' WHERE id=?", (deal_id,))
-    conn.commit()
-    conn.close()
-
     await query.edit_message_text(f"⚠️ {opener_name} telah membuka sengketa untuk Rekber {deal_id}.")
 
-    # Record dispute in database for audit trail
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO disputes (deal_id, raised_by, reason, status) VALUES (?, ?, ?, ?)",
-            (deal_id, user_id, f"Dispute dibuka oleh {opener_name}", "OPEN")
-        )
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        logger.error(f"Error recording dispute: {e}")
-
     # Send detailed notification to admin
     admin_message = (
         f"🚨 <b>SENGKETA DIBUKA</b>\n\n"
@@ -1860,7 +1432,7 @@ async def rekber_dispute(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ]
     
     # Send to admin
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=config.ADMIN_ID,
         text=admin_message,
         parse_mode="HTML",
@@ -1879,7 +1451,7 @@ async def rekber_dispute(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Anda akan mendapat notifikasi setelah admin memutuskan."
     )
     
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=other_party_id,
         text=other_party_message,
         parse_mode="HTML"
@@ -1889,15 +1461,10 @@ async def rekber_dispute(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def rekber_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, title, amount, admin_fee, admin_fee_payer, status "
-        "FROM deals WHERE buyer_id = ? OR seller_id = ? ORDER BY id DESC LIMIT 10",
-        (user_id, user_id)
+    rows = await db.fetchall(
+        user_deals_query("id, title, amount, admin_fee, admin_fee_payer, status"),
+        (user_id, user_id, user_id)
     )
-    rows = cur.fetchall()
-    conn.close()
 
     if not rows:
         await update.message.reply_text("📭 Belum ada riwayat transaksi.")
@@ -1931,20 +1498,14 @@ async def rekber_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def rekber_active(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, title, amount, admin_fee, admin_fee_payer, status
-        FROM deals
-        WHERE (buyer_id = ? OR seller_id = ?)
-          AND status NOT IN ('RELEASED', 'COMPLETED', 'CANCELED')
-        ORDER BY id DESC
-        """,
-        (user_id, user_id)
+    rows = await db.fetchall(
+        user_deals_query(
+            "id, title, amount, admin_fee, admin_fee_payer, status",
+            "status NOT IN ('RELEASED', 'COMPLETED', 'CANCELED')",
+            limit=None
+        ),
+        (user_id, user_id, user_id)
     )
-    rows = cur.fetchall()
-    conn.close()
 
     if not rows:
         await update.message.reply_text("📭 Tidak ada transaksi aktif saat ini.")
@@ -1977,20 +1538,13 @@ async def rekber_active(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def rekber_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, title, amount, admin_fee, admin_fee_payer, status
-        FROM deals
-        WHERE (buyer_id = ? OR seller_id = ?)
-          AND status IN ('RELEASED', 'COMPLETED')
-        ORDER BY id DESC LIMIT 10
-        """,
-        (user_id, user_id)
+    rows = await db.fetchall(
+        user_deals_query(
+            "id, title, amount, admin_fee, admin_fee_payer, status",
+            "status IN ('RELEASED', 'COMPLETED')"
+        ),
+        (user_id, user_id, user_id)
     )
-    rows = cur.fetchall()
-    conn.close()
 
     if not rows:
         await update.message.reply_text("📭 Belum ada transaksi yang selesai.")
@@ -2020,84 +1574,77 @@ async def rekber_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 #============== REKBER STATS ====================
+STATS_USAGE = (
+    "⚠️ Format salah. Contoh:\n"
+    "/rekber_stats 2025-08\n"
+    "/rekber_stats 2025-08-01..2025-08-15\n"
+    "/rekber_stats 7d"
+)
+# Status selesai; sisanya dihitung aktif
+STATS_FINISHED = ("COMPLETED", "RELEASED", "REFUNDED", "CANCELLED")
+
+
+def parse_stats_range(text: str):
+    """Rentang /rekber_stats -> (start, end, label); end eksklusif, tanggal UTC seperti created_at.
+
+    Menerima YYYY-MM, YYYY-MM-DD, YYYY-MM-DD..YYYY-MM-DD atau Nd (N hari
+    terakhir termasuk hari ini). ValueError jika format tidak dikenal.
+    """
+    text = text.strip()
+    if text[:-1].isdigit() and text[-1:].lower() == "d":
+        days = int(text[:-1])
+        if days < 1:
+            raise ValueError(text)
+        today = datetime.now(timezone.utc).date()
+        return today - timedelta(days=days - 1), today + timedelta(days=1), f"{days} hari terakhir"
+    if ".." in text:
+        first, last = (datetime.strptime(part, "%Y-%m-%d").date() for part in text.split("..", 1))
+        if last < first:
+            raise ValueError(text)
+        return first, last + timedelta(days=1), f"{first.isoformat()} s/d {last.isoformat()}"
+    try:
+        day = datetime.strptime(text, "%Y-%m-%d").date()
+        return day, day + timedelta(days=1), day.isoformat()
+    except ValueError:
+        month = datetime.strptime(text, "%Y-%m").date()
+        next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return month, next_month, month.strftime("%B %Y")
+
+
 async def rekber_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
     # Hanya admin yang boleh akses
-    if user_id not in config.ADMIN_ID:
+    if not check_admin_permission(user_id, "view_stats"):
         await update.message.reply_text("❌ Kamu tidak punya akses ke perintah ini.")
         return
 
     # Default: semua data
-    month_filter = None
-    start_date = None
-    end_date = None
-
+    start_date = end_date = None
+    period = "Semua Periode"
     if context.args:
         try:
-            month_filter = datetime.strptime(context.args[0], "%Y-%m")
-            start_date = month_filter.replace(day=1)
-            # Hitung akhir bulan
-            if start_date.month == 12:
-                end_date = start_date.replace(year=start_date.year + 1, month=1, day=1)
-            else:
-                end_date = start_date.replace(month=start_date.month + 1, day=1)
-        except ValueError:
-            await update.message.reply_text("⚠️ Format salah. Gunakan contoh: `/rekber_stats 2025-08`")
+            start_date, end_date, period = parse_stats_range(" ".join(context.args))
+        except (ValueError, OverflowError):
+            await update.message.reply_text(STATS_USAGE)
             return
 
-    conn = get_connection()
-    cur = conn.cursor()
-
-    # Query filter (opsional by bulan)
-    filter_sql = ""
-    params = []
-    if month_filter:
-        filter_sql = "WHERE created_at >= ? AND created_at < ?"
-        params = [start_date, end_date]
-
-    # Total transaksi
-    cur.execute(f"SELECT COUNT(*) AS total, COALESCE(SUM(amount),0) AS total_amount FROM deals {filter_sql}", params)
-    total_row = cur.fetchone()
-
-    # Aktif
-    cur.execute(f"""
-        SELECT COUNT(*) AS aktif FROM deals
-        {filter_sql + (' AND' if filter_sql else 'WHERE')}
-        status IN ('PENDING_JOIN','PENDING_FUNDING','FUNDED','AWAITING_CONFIRM','DISPUTED')
-    """, params)
-    aktif_row = cur.fetchone()
-
-    # Selesai
-    cur.execute(f"""
-        SELECT COUNT(*) AS selesai FROM deals
-        {filter_sql + (' AND' if filter_sql else 'WHERE')}
-        status IN ('RELEASED','REFUNDED','CANCELLED')
-    """, params)
-    selesai_row = cur.fetchone()
-
-    # Dispute
-    cur.execute(f"""
-        SELECT COUNT(*) AS dispute FROM deals
-        {filter_sql + (' AND' if filter_sql else 'WHERE')}
-        status='DISPUTED'
-    """, params)
-    dispute_row = cur.fetchone()
-
-    conn.close()
-
-    # Judul
-    if month_filter:
-        period = month_filter.strftime("%B %Y")
-    else:
-        period = "Semua Periode"
+    # Jumlah dari deal_daily_rollup/deal_monthly_rollup, bukan scan tabel deals
+    totals = await db.run(deal_rollup_totals, start_date, end_date)
+    empty = {'count': 0, 'volume': 0, 'fees': 0}
+    total = sum(row['count'] for row in totals.values())
+    total_amount = sum(row['volume'] for row in totals.values())
+    total_fees = sum(row['fees'] for row in totals.values())
+    selesai = sum(totals.get(status, empty)['count'] for status in STATS_FINISHED)
+    dispute = totals.get("DISPUTED", empty)['count']
 
     text = (
         f"📊 Statistik Rekber ({period})\n\n"
-        f"🔹 Total Transaksi: {total_row['total']} (Rp{total_row['total_amount']})\n"
-        f"🟢 Aktif: {aktif_row['aktif']}\n"
-        f"✅ Selesai: {selesai_row['selesai']}\n"
-        f"⚠️ Sengketa: {dispute_row['dispute']}\n"
+        f"🔹 Total Transaksi: {total} (Rp{total_amount})\n"
+        f"🟢 Aktif: {total - selesai}\n"
+        f"✅ Selesai: {selesai}\n"
+        f"⚠️ Sengketa: {dispute}\n"
+        f"💰 Fee Admin: Rp{total_fees}\n"
     )
 
     await update.message.reply_text(text)
@@ -2112,27 +1659,20 @@ async def rekber_funding_cancel(update: Update, context: ContextTypes.DEFAULT_TY
     user_id = query.from_user.id
     username = query.from_user.username or query.from_user.first_name
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT buyer_id, seller_id, status FROM deals WHERE id=?", (deal_id,))
-    row = cur.fetchone()
-
+    # update DB → batal (hanya peserta, hanya sebelum dana masuk)
+    row = await transition(
+        deal_id, "CANCEL", user_id, "BUYER", f"Pembeli @{username} batalkan transaksi",
+        guard=PARTY, guard_params=(user_id,), returning="seller_id"
+    )
     if not row:
-        await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-        return
-
-    buyer_id, seller_id, status = row
-
-    if status not in ["PENDING_FUNDING", "PENDING_JOIN"]:
-        await query.edit_message_text("⚠️ Transaksi ini tidak bisa dibatalkan lagi.")
+        exists = await deal_cache.get(deal_id)
+        if not exists:
+            await query.edit_message_text("❌ Transaksi tidak ditemukan.")
+        else:
+            await query.edit_message_text("⚠️ Transaksi ini tidak bisa dibatalkan lagi.")
         return
 
-    # update DB → batal
-    cur.execute("UPDATE deals SET status='CANCELLED' WHERE id=?", (deal_id,))
-    conn.commit()
-    conn.close()
-
-    log_action(deal_id, user_id, "BUYER", "CANCEL", f"Pembeli @{username} batalkan transaksi")
+    seller_id = row['seller_id']
 
     # edit pesan di chat buyer
     await query.edit_message_text(
@@ -2142,7 +1682,7 @@ async def rekber_funding_cancel(update: Update, context: ContextTypes.DEFAULT_TY
 
     # notif seller
     if seller_id:
-        await context.bot.send_message(
+        await dispatcher.send_message(
             seller_id,
             f"⚠️ Transaksi {deal_id} dibatalkan oleh pembeli @{username}."
         )
@@ -2162,19 +1702,10 @@ async def rekber_user_history(update: Update, context: ContextTypes.DEFAULT_TYPE
         user_id = update.effective_user.id
         is_callback = False
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, title, amount, admin_fee, admin_fee_payer, status, created_at
-        FROM deals
-        WHERE buyer_id = ? OR seller_id = ?
-        ORDER BY created_at DESC LIMIT 10
-        """,
-        (user_id, user_id)
+    rows = await db.fetchall(
+        user_deals_query("id, title, amount, admin_fee, admin_fee_payer, status, created_at"),
+        (user_id, user_id, user_id)
     )
-    rows = cur.fetchall()
-    conn.close()
 
     # Status mapping untuk tampilan yang lebih friendly
     status_map = {
@@ -2354,20 +1885,15 @@ async def payout_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     deal_id = query.data.split("|")[1]
     user_id = query.from_user.id
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT seller_id, status, title FROM deals WHERE id=?", (deal_id,))
-    row = cur.fetchone()
+    row = await deal_cache.get(deal_id)
 
     if not row:
         await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-        conn.close()
         return ConversationHandler.END
 
     seller_id_db = row['seller_id']
     status = row['status']
     title = row['title']
-    conn.close()
 
     # Debug logging
     logger.debug(f"Payout start - Deal: {deal_id}, Seller in DB: {seller_id_db}, Current User: {user_id}, Status: {status}")
@@ -2382,8 +1908,7 @@ async def payout_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
     # Check if payout info already exists
-    from db_sqlite import get_payout_info
-    existing_payout = get_payout_info(deal_id)
+    existing_payout = await db.call(get_payout_info, deal_id)
 
     if existing_payout:
         # Show existing payout info with option to update
@@ -2535,8 +2060,8 @@ async def payout_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     seller_id = update.effective_user.id
 
     if method == "BANK":
-        save_payout_info(
-            deal_id, seller_id, "BANK",
+        await db.call(
+            save_payout_info, deal_id, seller_id, "BANK",
             bank_name=context.user_data.get("bank_name"),
             account_number=context.user_data.get("account_number"),
             account_name=context.user_data.get("account_name"),
@@ -2548,8 +2073,8 @@ async def payout_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"👤 *Nama:* {context.user_data.get('account_name')}"
         )
     else:
-        save_payout_info(
-            deal_id, seller_id, "EWALLET",
+        await db.call(
+            save_payout_info, deal_id, seller_id, "EWALLET",
             ewallet_provider=context.user_data.get("ewallet_provider"),
             ewallet_number=context.user_data.get("ewallet_number"),
             note=note
@@ -2560,18 +2085,11 @@ async def payout_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
     # Update status ke AWAITING_PAYOUT setelah penjual isi rekening
-    conn = get_connection()
-    cur = conn.cursor()
-
-    # Check current status first
-    cur.execute("SELECT status FROM deals WHERE id=?", (deal_id,))
-    current_status = cur.fetchone()
-
-    if current_status and current_status['status'] in ['FUNDED', 'AWAITING_CONFIRM', 'RELEASED']:
-        cur.execute("UPDATE deals SET status='AWAITING_PAYOUT' WHERE id=?", (deal_id,))
-        conn.commit()
-
-    conn.close()
+    # (tidak berubah jika status deal sudah lewat tahap tersebut)
+    await transition(
+        deal_id, "SUBMIT_PAYOUT", seller_id, "SELLER", f"Penjual mengisi data pencairan ({method})",
+        guard=SELLER, guard_params=(seller_id,), returning="id"
+    )
 
     # Konfirmasi ke seller
     await update.message.reply_text(
@@ -2584,7 +2102,7 @@ async def payout_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [
         [InlineKeyboardButton("✅ Konfirmasi & Selesaikan Transaksi", callback_data=f"admin_confirm_payout|{deal_id}")]
     ]
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=config.ADMIN_ID,
         text=f"🔔 Penjual mengisi *rekening pencairan* untuk `{deal_id}`:\n\n{summary}",
         parse_mode="Markdown",
@@ -2614,17 +2132,13 @@ async def receive_group_link(update: Update, context: ContextTypes.DEFAULT_TYPE)
     deal_id = context.user_data.get('deal_id')
 
     # Ambil buyer_id & seller_id dari database
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT buyer_id, seller_id FROM deals WHERE id=?", (deal_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = await deal_cache.get(deal_id) if deal_id else None
 
     if not row:
         await update.message.reply_text("❌ Data transaksi tidak ditemukan.")
         return ConversationHandler.END
 
-    buyer_id, seller_id = row
+    buyer_id, seller_id = row['buyer_id'], row['seller_id']
 
     # Kirim pesan ke Buyer dan Seller
     message = (
@@ -2632,8 +2146,8 @@ async def receive_group_link(update: Update, context: ContextTypes.DEFAULT_TYPE)
         f"🔗 Silakan join grup mediasi untuk menyelesaikan masalah: {group_link}"
     )
 
-    await context.bot.send_message(chat_id=buyer_id, text=message)
-    await context.bot.send_message(chat_id=seller_id, text=message)
+    await dispatcher.send_message(chat_id=buyer_id, text=message)
+    await dispatcher.send_message(chat_id=seller_id, text=message)
 
 
     await update.message.reply_text("✅ Link grup sudah dikirim kepada Pembeli dan Penjual.")
@@ -2677,11 +2191,7 @@ async def rekber_cancel_request(update: Update, context: ContextTypes.DEFAULT_TY
     deal_id = query.data.split("|")[1]
     user_id = query.from_user.id
     
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT buyer_id, seller_id, status, title FROM deals WHERE id = ?", (deal_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = await deal_cache.get(deal_id)
     
     if not row:
         await query.edit_message_text("❌ Transaksi tidak ditemukan.")
@@ -2729,7 +2239,7 @@ async def rekber_cancel_request(update: Update, context: ContextTypes.DEFAULT_TY
         f"Apakah Anda setuju?"
     )
     
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=approver_id,
         text=cancel_message,
         parse_mode="Markdown",
@@ -2746,26 +2256,20 @@ async def rekber_cancel_approve(update: Update, context: ContextTypes.DEFAULT_TY
     deal_id = query.data.split("|")[1]
     user_id = query.from_user.id
     
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT buyer_id, seller_id, status, title FROM deals WHERE id = ?", (deal_id,))
-    row = cur.fetchone()
+    # Update status transaksi (hanya peserta, dan hanya sekali walau tombol ditekan berulang)
+    row = await transition(
+        deal_id, "CANCEL_APPROVED", user_id, "BOTH", "Pembatalan transaksi disetujui",
+        guard=PARTY, guard_params=(user_id,), returning="buyer_id, seller_id, title"
+    )
     
     if not row:
-        await query.edit_message_text("❌ Transaksi tidak ditemukan.")
-        conn.close()
+        await query.edit_message_text("❌ Transaksi tidak ditemukan atau sudah tidak bisa dibatalkan.")
         return
     
     buyer_id = row['buyer_id']
     seller_id = row['seller_id']
-    status = row['status']
     title = row['title']
     
-    # Update status transaksi
-    cur.execute("UPDATE deals SET status = 'CANCELLED' WHERE id = ?", (deal_id,))
-    conn.commit()
-    conn.close()
-    
     await query.edit_message_text("✅ Transaksi berhasil dibatalkan atas persetujuan kedua belah pihak.")
     
     # Notifikasi ke kedua pihak
@@ -2777,8 +2281,8 @@ async def rekber_cancel_approve(update: Update, context: ContextTypes.DEFAULT_TY
         f"Pembeli akan mendapat refund dari admin."
     )
     
-    await context.bot.send_message(chat_id=buyer_id, text=cancel_notification, parse_mode="Markdown")
-    await context.bot.send_message(chat_id=seller_id, text=cancel_notification, parse_mode="Markdown")
+    await dispatcher.send_message(chat_id=buyer_id, text=cancel_notification, parse_mode="Markdown")
+    await dispatcher.send_message(chat_id=seller_id, text=cancel_notification, parse_mode="Markdown")
     
     # Notifikasi admin untuk proses refund
     admin_notification = (
@@ -2789,13 +2293,11 @@ async def rekber_cancel_approve(update: Update, context: ContextTypes.DEFAULT_TY
         f"Silakan proses refund ke pembeli."
     )
     
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=config.ADMIN_ID,
         text=admin_notification,
         parse_mode="HTML"
     )
-    
-    log_action(deal_id, user_id, "BOTH", "CANCEL_APPROVED", "Pembatalan transaksi disetujui")
 
 async def rekber_cancel_reject(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handler untuk menolak pembatalan transaksi"""
@@ -2805,11 +2307,7 @@ async def rekber_cancel_reject(update: Update, context: ContextTypes.DEFAULT_TYP
     deal_id = query.data.split("|")[1]
     user_id = query.from_user.id
     
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT buyer_id, seller_id, title FROM deals WHERE id = ?", (deal_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = await deal_cache.get(deal_id)
     
     if not row:
         await query.edit_message_text("❌ Transaksi tidak ditemukan.")
@@ -2832,7 +2330,7 @@ async def rekber_cancel_reject(update: Update, context: ContextTypes.DEFAULT_TYP
         f"Transaksi akan dilanjutkan sesuai prosedur."
     )
     
-    await context.bot.send_message(
+    await dispatcher.send_message(
         chat_id=other_party_id,
         text=reject_notification,
         parse_mode="Markdown"
@@ -2852,18 +2350,19 @@ async def handle_payment_proof(update: Update, context: ContextTypes.DEFAULT_TYP
     if not deal_id:
         return  # User tidak sedang dalam proses upload bukti
     
-    # Validasi user adalah buyer dari transaksi ini
-    conn = get_connection()
-    if not conn:
-        await update.message.reply_text("❌ Terjadi kesalahan koneksi database.")
-        return
-    
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT buyer_id, title, amount, admin_fee, admin_fee_payer, status FROM deals WHERE id=?", (deal_id,))
-        row = cur.fetchone()
+        # Ambil file photo dengan resolusi tertinggi
+        photo = update.message.photo[-1]
+        file_id = photo.file_id
+        
+        # Simpan bukti pembayaran; hanya jika user adalah buyer dan deal menunggu bukti
+        row = await transition(
+            deal_id, "SUBMIT_PROOF", user_id, "BUYER", "Pembeli upload bukti pembayaran",
+            guard=BUYER, guard_params=(user_id,), fields={"payment_proof_file_id": file_id},
+            returning="title, amount, admin_fee, admin_fee_payer"
+        )
         
-        if not row or row['buyer_id'] != user_id or row['status'] != 'WAITING_PAYMENT_PROOF':
+        if not row:
             await update.message.reply_text("❌ Bukti pembayaran tidak valid untuk transaksi ini.")
             return
         
@@ -2872,17 +2371,6 @@ async def handle_payment_proof(update: Update, context: ContextTypes.DEFAULT_TYP
         admin_fee = int(row['admin_fee'])
         admin_fee_payer = row['admin_fee_payer']
         
-        # Ambil file photo dengan resolusi tertinggi
-        photo = update.message.photo[-1]
-        file_id = photo.file_id
-        
-        # Simpan bukti pembayaran ke database
-        cur.execute(
-            "UPDATE deals SET payment_proof_file_id=?, status='WAITING_VERIFICATION' WHERE id=?", 
-            (file_id, deal_id)
-        )
-        conn.commit()
-        
         # Clear context
         context.user_data.pop('awaiting_payment_proof', None)
         
@@ -2912,7 +2400,7 @@ async def handle_payment_proof(update: Update, context: ContextTypes.DEFAULT_TYP
         
         # Kirim foto bukti ke admin
         try:
-            await context.bot.send_photo(
+            await dispatcher.send_photo(
                 chat_id=config.ADMIN_ID,
                 photo=file_id,
                 caption=admin_message,
@@ -2925,12 +2413,8 @@ async def handle_payment_proof(update: Update, context: ContextTypes.DEFAULT_TYP
             await update.message.reply_text("⚠️ Bukti pembayaran diterima, namun gagal mengirim ke admin. Silakan hubungi @Nexoitsme")
         
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error saving payment proof: {e}")
         await update.message.reply_text("❌ Terjadi kesalahan saat menyimpan bukti pembayaran.")
-    finally:
-        cur.close()
-        return_connection(conn)
 
 # ========== PAYMENT VERIFICATION HANDLERS ==========
 async def verify_payment_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -2940,30 +2424,32 @@ async def verify_payment_handler(update: Update, context: ContextTypes.DEFAULT_T
     
     deal_id = query.data.split("|")[1]
     
-    conn = get_connection()
-    if not conn:
-        await query.edit_message_caption("❌ Terjadi kesalahan koneksi database.")
-        return
-    
-    cur = conn.cursor()
     try:
-        # Update status transaksi ke FUNDED
-        cur.execute("UPDATE deals SET status='FUNDED' WHERE id=?", (deal_id,))
-        
-        # Get transaction details
-        cur.execute("SELECT buyer_id, seller_id, title FROM deals WHERE id=?", (deal_id,))
-        row = cur.fetchone()
+        # Update status transaksi ke FUNDED sekaligus ambil detail transaksi;
+        # notifikasi ke pembeli & penjual ditulis ke outbox di transaksi yang sama
+        keyboard_seller = [[InlineKeyboardButton("📦 Tandai Sudah Dikirim", callback_data=f"rekber_mark_shipped|{deal_id}")]]
+        row = await transition(
+            deal_id, "VERIFY_PAYMENT", query.from_user.id, "ADMIN", "Admin verifikasi pembayaran",
+            returning="buyer_id, seller_id, title", notify=lambda row: [
+                Notification(
+                    row['buyer_id'],
+                    f"✅ Pembayaran untuk transaksi <b>{row['title']}</b> ({deal_id}) sudah diverifikasi.\n\nMenunggu penjual mengirim barang/jasa.",
+                    {"parse_mode": "HTML"}
+                ),
+                Notification(
+                    row['seller_id'],
+                    f"✅ Pembayaran untuk transaksi <b>{row['title']}</b> ({deal_id}) sudah diverifikasi.\n\nSilakan kirim barang/jasa ke pembeli.",
+                    {"parse_mode": "HTML", "reply_markup": InlineKeyboardMarkup(keyboard_seller)}
+                ),
+            ]
+        )
         
         if not row:
-            await query.edit_message_caption("❌ Transaksi tidak ditemukan.")
+            await query.edit_message_caption("❌ Transaksi tidak ditemukan atau sudah diproses.")
             return
         
-        buyer_id = row['buyer_id']
-        seller_id = row['seller_id']
         title = row['title']
         
-        conn.commit()
-        
         # Update admin message
         await query.edit_message_caption(
             f"✅ **PEMBAYARAN DIVERIFIKASI**\n\n"
@@ -2973,31 +2459,9 @@ async def verify_payment_handler(update: Update, context: ContextTypes.DEFAULT_T
             parse_mode="Markdown"
         )
         
-        # Notifikasi ke buyer
-        await context.bot.send_message(
-            chat_id=buyer_id,
-            text=f"✅ Pembayaran untuk transaksi <b>{title}</b> ({deal_id}) sudah diverifikasi.\n\nMenunggu penjual mengirim barang/jasa.",
-            parse_mode="HTML"
-        )
-        
-        # Notifikasi ke seller dengan tombol mark shipped
-        keyboard_seller = [[InlineKeyboardButton("📦 Tandai Sudah Dikirim", callback_data=f"rekber_mark_shipped|{deal_id}")]]
-        await context.bot.send_message(
-            chat_id=seller_id,
-            text=f"✅ Pembayaran untuk transaksi <b>{title}</b> ({deal_id}) sudah diverifikasi.\n\nSilakan kirim barang/jasa ke pembeli.",
-            parse_mode="HTML",
-            reply_markup=InlineKeyboardMarkup(keyboard_seller)
-        )
-        
-        log_action(deal_id, query.from_user.id, "ADMIN", "VERIFY_PAYMENT", "Admin verifikasi pembayaran")
-        
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error verifying payment: {e}")
         await query.edit_message_caption("❌ Terjadi kesalahan saat memverifikasi pembayaran.")
-    finally:
-        cur.close()
-        return_connection(conn)
 
 async def reject_payment_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handler untuk admin menolak pembayaran"""
@@ -3006,29 +2470,20 @@ async def reject_payment_handler(update: Update, context: ContextTypes.DEFAULT_T
     
     deal_id = query.data.split("|")[1]
     
-    conn = get_connection()
-    if not conn:
-        await query.edit_message_caption("❌ Terjadi kesalahan koneksi database.")
-        return
-    
-    cur = conn.cursor()
     try:
-        # Update status transaksi kembali ke PENDING_FUNDING
-        cur.execute("UPDATE deals SET status='PENDING_FUNDING', payment_proof_file_id=NULL WHERE id=?", (deal_id,))
-        
-        # Get transaction details
-        cur.execute("SELECT buyer_id, title FROM deals WHERE id=?", (deal_id,))
-        row = cur.fetchone()
+        # Update status transaksi kembali ke PENDING_FUNDING sekaligus ambil detail transaksi
+        row = await transition(
+            deal_id, "REJECT_PAYMENT", query.from_user.id, "ADMIN", "Admin tolak bukti pembayaran",
+            fields={"payment_proof_file_id": None}, returning="buyer_id, title"
+        )
         
         if not row:
-            await query.edit_message_caption("❌ Transaksi tidak ditemukan.")
+            await query.edit_message_caption("❌ Transaksi tidak ditemukan atau sudah diproses.")
             return
         
         buyer_id = row['buyer_id']
         title = row['title']
         
-        conn.commit()
-        
         # Update admin message
         await query.edit_message_caption(
             f"❌ **PEMBAYARAN DITOLAK**\n\n"
@@ -3040,19 +2495,13 @@ async def reject_payment_handler(update: Update, context: ContextTypes.DEFAULT_T
         
         # Notifikasi ke buyer
         keyboard_buyer = [[InlineKeyboardButton("💰 Coba Transfer Lagi", callback_data=f"start_payment|{deal_id}")]]
-        await context.bot.send_message(
+        await dispatcher.send_message(
             chat_id=buyer_id,
             text=f"❌ Bukti pembayaran untuk transaksi <b>{title}</b> ({deal_id}) ditolak admin.\n\nSilakan periksa kembali nominal dan metode pembayaran, lalu coba transfer ulang.",
             parse_mode="HTML",
             reply_markup=InlineKeyboardMarkup(keyboard_buyer)
         )
         
-        log_action(deal_id, query.from_user.id, "ADMIN", "REJECT_PAYMENT", "Admin tolak bukti pembayaran")
-        
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error rejecting payment: {e}")
         await query.edit_message_caption("❌ Terjadi kesalahan saat menolak pembayaran.")
-    finally:
-        cur.close()
-        return_connection(conn)
\ No newline at end of file
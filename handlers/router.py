@@ -0,0 +1,130 @@
+"""Router tombol inline (callback_data) untuk Rekber Bot.
+
+callback_data berformat `aksi|arg1|arg2...` (mis. `rekber_release|RB-...`,
+`rate|RB-...|5`). Router memecahnya sekali menjadi (aksi, args) lalu
+memanggil handler aksi tersebut lewat satu lookup dict, menggantikan
+puluhan CallbackQueryHandler regex yang dicoba satu per satu.
+
+Tombol yang menjadi entry point/state ConversationHandler (buat transaksi,
+pencairan, mediasi, testimoni, komentar rating) tetap didaftarkan di
+ConversationHandler masing-masing di main.py.
+"""
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseHandler, ContextTypes
+
+from handlers.start import rekber_create_role, rekber_panduan, show_panduan_page, rekber_main_menu
+from handlers.admin_dashboard import admin_pending_actions, admin_user_stats, admin_analytics, admin_outbox, admin_outbox_retry
+from handlers.ux_helpers import help_create_role, help_what_is_rekber, join_cancel, change_fee_payer_handler
+from handlers.rekber import (
+    rekber_join, rekber_join_confirm, rekber_status, rekber_mark_shipped, rekber_release, rekber_dispute,
+    rekber_fee_paid, rekber_fee_verify, rekber_fund_confirm, start_payment_handler, rekber_funding_cancel,
+    rekber_cancel_request, rekber_cancel_approve, rekber_cancel_reject, rekber_user_history
+)
+from handlers.admin import (
+    rekber_admin_verify, rekber_admin_reject, rekber_admin_release, rekber_admin_refund,
+    admin_release_final, admin_release_execute, admin_confirm_payout,
+    verify_payment_with_proof, reject_payment_with_proof
+)
+from handlers.rating import handle_rating, skip_comment
+
+Callback = Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable]
+
+
+def parse_callback_data(data: str) -> Tuple[str, List[str]]:
+    """`aksi|a|b` -> ("aksi", ["a", "b"])"""
+    action, *args = data.split("|")
+    return action, args
+
+
+class CallbackRouter(BaseHandler):
+    """Satu handler untuk semua tombol di `routes` (aksi -> coroutine handler)"""
+
+    def __init__(self, routes: Dict[str, Callback]):
+        super().__init__(self.dispatch)
+        self.routes = dict(routes)
+
+    def resolve(self, data) -> Optional[Tuple[Callback, List[str]]]:
+        if not isinstance(data, str):
+            return None
+        action, args = parse_callback_data(data)
+        callback = self.routes.get(action)
+        return (callback, args) if callback is not None else None
+
+    def check_update(self, update: object):
+        if isinstance(update, Update) and update.callback_query is not None:
+            return self.resolve(update.callback_query.data)
+        return None
+
+    async def handle_update(self, update, application, check_result, context):
+        callback, _ = check_result
+        return await callback(update, context)
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Panggil handler untuk update ini (tanpa lewat Application)"""
+        resolved = self.resolve(update.callback_query.data)
+        if resolved is not None:
+            return await resolved[0](update, context)
+
+
+async def _panduan_page(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int):
+    return await show_panduan_page(update.callback_query, page)
+
+
+ROUTES: Dict[str, Callback] = {
+    # === Transaksi ===
+    "rekber_create_role": rekber_create_role,
+    "rekber_join": rekber_join,
+    "rekber_join_confirm": rekber_join_confirm,
+    "rekber_status": rekber_status,
+    "rekber_mark_shipped": rekber_mark_shipped,
+    "rekber_release": rekber_release,
+    "rekber_dispute": rekber_dispute,
+    "seller_fee_confirm": rekber_fee_paid,
+    "fee_verify": rekber_fee_verify,
+    "rekber_fund_confirm": rekber_fund_confirm,
+    "start_payment": start_payment_handler,
+    "rekber_funding_cancel": rekber_funding_cancel,
+    "rekber_cancel_request": rekber_cancel_request,
+    "rekber_cancel_approve": rekber_cancel_approve,
+    "rekber_cancel_reject": rekber_cancel_reject,
+
+    # === Admin ===
+    "rekber_admin_verify": rekber_admin_verify,
+    "rekber_admin_reject": rekber_admin_reject,
+    "rekber_admin_release": rekber_admin_release,
+    "rekber_admin_refund": rekber_admin_refund,
+    "admin_release_final": admin_release_final,
+    "admin_release_execute": admin_release_execute,
+    "admin_confirm_payout": admin_confirm_payout,
+    "verify_payment": verify_payment_with_proof,
+    "reject_payment": reject_payment_with_proof,
+
+    # === Rating ===
+    "rate": handle_rating,
+    "skip_comment": skip_comment,
+
+    # === Navigasi ===
+    "rekber_panduan": rekber_panduan,
+    **{f"rekber_panduan_page_{page}": partial(_panduan_page, page=page) for page in range(1, 5)},
+    "rekber_main_menu": rekber_main_menu,
+    "rekber_user_history": rekber_user_history,
+    "rekber_history_menu": rekber_user_history,
+
+    # === Dashboard admin ===
+    "admin_pending_actions": admin_pending_actions,
+    "admin_user_stats": admin_user_stats,
+    "admin_analytics": admin_analytics,
+    "admin_outbox_retry": admin_outbox_retry,
+    "admin_outbox": admin_outbox,
+
+    # === UX helper ===
+    "help_create_role": help_create_role,
+    "help_what_is_rekber": help_what_is_rekber,
+    "join_cancel": join_cancel,
+    "change_fee_payer": change_fee_payer_handler,
+}
+
+callback_router = CallbackRouter(ROUTES)
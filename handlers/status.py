@@ -1,7 +1,7 @@
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from db_sqlite import get_connection
+from db_sqlite import db
 from utils import format_rupiah
 import logging
 
@@ -15,16 +15,11 @@ async def rekber_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     deal_id = query.data.split("|")[1]
     user_id = query.from_user.id
     
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
+    row = await db.fetchone("""
         SELECT id, title, amount, admin_fee, admin_fee_payer, buyer_id, seller_id, status, created_at
         FROM deals WHERE id = ?
     """, (deal_id,))
     
-    row = cur.fetchone()
-    conn.close()
-    
     if not row:
         await query.edit_message_text("❌ Transaksi tidak ditemukan.")
         return
@@ -93,7 +88,7 @@ async def rekber_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if status in ["FUNDED", "AWAITING_CONFIRM"] and user_role == "SELLER":
         from db_sqlite import get_payout_info
-        payout = get_payout_info(deal_id)
+        payout = await db.call(get_payout_info, deal_id)
         if not payout:
             keyboard.append([InlineKeyboardButton("💳 Isi Data Pencairan", callback_data=f"payout_start|{deal_id}")])
     
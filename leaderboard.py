@@ -0,0 +1,121 @@
+"""Leaderboard user (top-K) untuk statistik admin.
+
+    entries = await leaderboard.top("deals")   # atau "volume", "rating"
+
+- Angka per user (deal selesai dan nominal sebagai pembeli/penjual, rating)
+  dijaga trigger di tabel users (migrasi 0012 dan 0013); setiap deal
+  dihitung untuk kedua pihak.
+- Daftar teratas disimpan di memori dan dibangun ulang hanya jika ada deal
+  selesai atau rating baru sejak pembangunan terakhir (`invalidate`), atau
+  paling lama LEADERBOARD_TTL detik (penulis di luar proses ini, mis.
+  maintenance.py). Pembangunan ulang membaca LEADERBOARD_SIZE baris dari
+  ujung index per daftar, jadi biayanya tidak bergantung pada jumlah deal.
+"""
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+from typing import Dict, List, NamedTuple, Optional
+
+from db_sqlite import db
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10"))
+LEADERBOARD_TTL = float(os.getenv("LEADERBOARD_TTL", "300"))
+# Rating baru masuk peringkat setelah minimal sekian penilaian
+LEADERBOARD_MIN_RATINGS = int(os.getenv("LEADERBOARD_MIN_RATINGS", "3"))
+
+
+class LeaderboardEntry(NamedTuple):
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    buyer_deals: int
+    buyer_volume: int
+    seller_deals: int
+    seller_volume: int
+    average_rating: Optional[float]
+    rating_count: int
+
+    @property
+    def deals(self) -> int:
+        return self.buyer_deals + self.seller_deals
+
+    @property
+    def volume(self) -> int:
+        return self.buyer_volume + self.seller_volume
+
+
+_COLUMNS = ", ".join(LeaderboardEntry._fields)
+
+# ORDER BY harus sama persis dengan index migrasi 0013
+RANKINGS = {
+    "deals": "WHERE successful_deals > 0 ORDER BY successful_deals DESC",
+    "volume": "WHERE buyer_volume + seller_volume > 0 ORDER BY buyer_volume + seller_volume DESC",
+    "rating": "WHERE average_rating IS NOT NULL AND rating_count >= :min_ratings "
+              "ORDER BY average_rating DESC, rating_count DESC",
+}
+
+
+def _load(conn: sqlite3.Connection, size: int, min_ratings: int) -> Dict[str, List[LeaderboardEntry]]:
+    return {
+        kind: [LeaderboardEntry(*row) for row in conn.execute(
+            f"SELECT {_COLUMNS} FROM users {ranking} LIMIT :size", {"size": size, "min_ratings": min_ratings}
+        )]
+        for kind, ranking in RANKINGS.items()
+    }
+
+
+class Leaderboard:
+    """Top-K per peringkat di memori, dibangun ulang secara lazy dari index users"""
+
+    def __init__(self, database=db, size: int = LEADERBOARD_SIZE, ttl: float = LEADERBOARD_TTL,
+                 min_ratings: int = LEADERBOARD_MIN_RATINGS):
+        self.db = database
+        self.size = size
+        self.ttl = ttl
+        self.min_ratings = min_ratings
+        self.rebuilds = 0
+        self.reads = 0
+        self._entries: Dict[str, List[LeaderboardEntry]] = {}
+        self._built_at = 0.0
+        self._dirty = True
+        # Ditandai di transaksi writer yang belum commit
+        self._uncommitted = False
+        self._lock = asyncio.Lock()
+        database.writer.on_commit(self._committed)
+
+    def invalidate(self):
+        """Tandai daftar basi; boleh dipanggil di transaksi writer maupun setelah commit"""
+        self._dirty = True
+        self._uncommitted = True
+
+    def _committed(self, conn: sqlite3.Connection):
+        # Pembangunan ulang sebelum commit masih membaca data lama
+        if self._uncommitted:
+            self._uncommitted = False
+            self._dirty = True
+
+    async def top(self, kind: str) -> List[LeaderboardEntry]:
+        """Daftar teratas untuk `kind` ("deals", "volume" atau "rating")"""
+        if kind not in RANKINGS:
+            raise ValueError(f"Peringkat tidak dikenal: {kind}")
+        self.reads += 1
+        if self._dirty or time.monotonic() - self._built_at > self.ttl:
+            async with self._lock:
+                # Tap bersamaan menunggu satu pembangunan ulang
+                if self._dirty or time.monotonic() - self._built_at > self.ttl:
+                    self._dirty = False
+                    try:
+                        self._entries = await self.db.run(_load, self.size, self.min_ratings)
+                    except Exception:
+                        self._dirty = True
+                        raise
+                    self._built_at = time.monotonic()
+                    self.rebuilds += 1
+        return self._entries[kind]
+
+
+leaderboard = Leaderboard()
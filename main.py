@@ -1,38 +1,37 @@
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ConversationHandler, MessageHandler, filters
+from telegram import Update
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ConversationHandler, MessageHandler, TypeHandler, filters
 import config
 import signal
 import sys
 import asyncio
+from importlib.util import find_spec
 from db_sqlite import init_db
-from handlers.start import start, rekber_create_role, rekber_panduan, show_panduan_page, rekber_main_menu
-from handlers.admin_dashboard import admin_dashboard, admin_pending_actions, admin_user_stats
+from rate_limiter import limiter
+from scheduler import scheduler
+from dispatcher import dispatcher
+from outbox import outbox
+from profile_cache import observe_update
+from activity import activity_tracker
+from webhook import WEBHOOK_URL, ALLOWED_UPDATES, run_webhook
+from update_locks import OrderedApplication, UPDATE_MAX_PENDING
+from persistence import SQLitePersistence, CONVERSATION_TIMEOUT
+from handlers.start import start
+from handlers.admin_dashboard import admin_dashboard, admin_outbox
 from handlers.notifications import init_notifications
-from handlers.ux_helpers import (
-    help_create_role, help_what_is_rekber, join_cancel, 
-    change_fee_payer_handler
-)
+from handlers.router import callback_router
 from handlers.rekber import (
     rekber_create_role_buyer,
     rekber_create_role_seller,
     rekber_create_title,
     rekber_create_amount,
     rekber_pick_fee_payer,
-    rekber_fund_confirm,
     rekber_confirm_create, 
     rekber_cancel_create,
-    rekber_join,
-    rekber_join_confirm, 
-    rekber_fund_verify, 
-    rekber_funding_cancel, 
-    rekber_mark_shipped, 
-    rekber_release, 
-    rekber_dispute,
     rekber_history,
     rekber_active,
     rekber_done,
     rekber_stats,
     rekber_user_history,
-    rekber_status,
     ASK_AMOUNT,
     ASK_TITLE,
     ASK_CONFIRMATION,
@@ -56,21 +55,10 @@ from handlers.rekber import (
     handle_mediasi,
     ASK_GROUP_LINK,
     receive_group_link,
-    rekber_fee_paid,
-    rekber_fee_verify,
-    start_payment_handler,
-    rekber_cancel_request,
-    rekber_cancel_approve,
-    rekber_cancel_reject,
     handle_payment_proof
 )
 
-from handlers.admin import (
-    rekber_admin_verify, rekber_admin_reject, rekber_admin_release, 
-    rekber_admin_refund, admin_release_final, admin_release_execute, 
-    admin_confirm_payout, verify_payment_with_proof, reject_payment_with_proof
-)
-from handlers.rating import handle_rating, ask_for_comment, receive_comment, skip_comment, cancel_rating, WAITING_COMMENT, send_testimoni_menu, receive_testimoni, cancel_testimoni, WAITING_TESTIMONI
+from handlers.rating import ask_for_comment, receive_comment, cancel_rating, WAITING_COMMENT, send_testimoni_menu, receive_testimoni, cancel_testimoni, WAITING_TESTIMONI
 
 
 
@@ -89,12 +77,23 @@ def main():
     # Try to initialize database, but continue if it fails
     try:
         init_db()
+        # Pulihkan & simpan berkala bucket rate limit (jika RATE_LIMIT_SNAPSHOT_SECONDS > 0)
+        limiter.start_snapshots()
     except Exception as e:
         print(f"⚠️ Database initialization failed: {e}")
         print("📱 Bot will start without database - some features may be limited")
 
     # Build app with retry settings untuk handling conflicts
-    app = Application.builder().token(str(config.BOT_TOKEN)).connect_timeout(30).read_timeout(30).build()
+    # Update diproses paralel; update untuk deal/user yang sama tetap berurutan (update_locks.py)
+    app = (
+        Application.builder().token(str(config.BOT_TOKEN)).connect_timeout(30).read_timeout(30)
+        .concurrent_updates(UPDATE_MAX_PENDING).application_class(OrderedApplication)
+        # State percakapan & user_data bertahan saat restart (persistence.py)
+        .persistence(SQLitePersistence())
+        .build()
+    )
+    # Timeout percakapan menganggur butuh JobQueue (python-telegram-bot[job-queue])
+    conversation_timeout = CONVERSATION_TIMEOUT if find_spec("apscheduler") else None
     # simpan admin id 
     app.bot_data["admin"] = config.ADMIN_ID
 
@@ -102,6 +101,9 @@ def main():
     notification_manager = init_notifications(app.bot)
     app.bot_data["notification_manager"] = notification_manager
 
+    # Isi cache profil dari setiap update (group -1: jalan sebelum handler lain)
+    app.add_handler(TypeHandler(Update, observe_update), group=-1)
+
     # === Rekber Conversation ===
     conv_handler = ConversationHandler(
         entry_points=[
@@ -118,6 +120,9 @@ def main():
             ],
         },
         fallbacks=[],   # cukup pakai tombol, ga perlu /cancel
+        name="rekber_create",
+        persistent=True,
+        conversation_timeout=conversation_timeout,
     )
     app.add_handler(conv_handler)
 
@@ -130,6 +135,9 @@ def main():
             ]
         },
         fallbacks=[CommandHandler("cancel", cancel_testimoni)],
+        name="testimoni",
+        persistent=True,
+        conversation_timeout=conversation_timeout,
     )
     app.add_handler(conv_handler_testimoni)
 
@@ -152,7 +160,10 @@ def main():
             CommandHandler("cancel", payout_cancel),
             CallbackQueryHandler(payout_cancel, pattern="^payout_cancel$")
         ],
-        per_message=False
+        per_message=False,
+        name="payout",
+        persistent=True,
+        conversation_timeout=conversation_timeout,
     )
     app.add_handler(payout_conv)
 
@@ -163,44 +174,20 @@ def main():
             ASK_GROUP_LINK: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_group_link)]
         },
         fallbacks=[],
+        name="mediasi",
+        persistent=True,
+        conversation_timeout=conversation_timeout,
     )
     app.add_handler(mediasi_conv_handler)
 
-    # === Tambahkan handler untuk eksekusi release ===
-    app.add_handler(CallbackQueryHandler(admin_release_execute, pattern="^admin_release_execute\\|"))
-
     # command
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("admin", admin_dashboard))
     app.add_handler(CommandHandler("dashboard", admin_dashboard))
+    app.add_handler(CommandHandler("admin_outbox", admin_outbox))
 
-    # === Main Callback Handlers ===
-    app.add_handler(CallbackQueryHandler(rekber_create_role, pattern="^rekber_create_role$"))
-    app.add_handler(CallbackQueryHandler(rekber_join, pattern="^rekber_join\\|"))
-    app.add_handler(CallbackQueryHandler(rekber_join_confirm, pattern="^rekber_join_confirm\\|"))
-    app.add_handler(CallbackQueryHandler(rekber_status, pattern="^rekber_status\\|"))
-    app.add_handler(CallbackQueryHandler(rekber_mark_shipped, pattern="^rekber_mark_shipped\\|"))
-    app.add_handler(CallbackQueryHandler(rekber_release, pattern="^rekber_release\\|"))
-    app.add_handler(CallbackQueryHandler(rekber_dispute, pattern="^rekber_dispute\\|"))
-    app.add_handler(CallbackQueryHandler(rekber_fee_paid, pattern="^seller_fee_confirm"))
-    app.add_handler(CallbackQueryHandler(rekber_fee_verify, pattern="^fee_verify"))
-    app.add_handler(CallbackQueryHandler(rekber_fund_confirm, pattern="^rekber_fund_confirm\\|"))
-    app.add_handler(CallbackQueryHandler(start_payment_handler, pattern="^start_payment\\|"))
-    app.add_handler(CallbackQueryHandler(rekber_funding_cancel, pattern="^rekber_funding_cancel\\|"))
-    app.add_handler(CallbackQueryHandler(rekber_cancel_request, pattern="^rekber_cancel_request"))
-    app.add_handler(CallbackQueryHandler(rekber_cancel_approve, pattern="^rekber_cancel_approve"))
-    app.add_handler(CallbackQueryHandler(rekber_cancel_reject, pattern="^rekber_cancel_reject"))
-
-    # === Admin Handlers ===
-    app.add_handler(CallbackQueryHandler(rekber_admin_verify, pattern="^rekber_admin_verify\\|"))
-    app.add_handler(CallbackQueryHandler(rekber_admin_reject, pattern="^rekber_admin_reject\\|"))
-    app.add_handler(CallbackQueryHandler(rekber_admin_release, pattern="^rekber_admin_release\\|"))
-    app.add_handler(CallbackQueryHandler(rekber_admin_refund, pattern="^rekber_admin_refund\\|"))
-    app.add_handler(CallbackQueryHandler(admin_release_final, pattern="^admin_release_final\\|"))
-    app.add_handler(CallbackQueryHandler(admin_release_execute, pattern="^admin_release_execute\\|"))
-    app.add_handler(CallbackQueryHandler(admin_confirm_payout, pattern="^admin_confirm_payout\\|"))
-    app.add_handler(CallbackQueryHandler(verify_payment_with_proof, pattern="^verify_payment\\|"))
-    app.add_handler(CallbackQueryHandler(reject_payment_with_proof, pattern="^reject_payment\\|"))
+    # === Tombol inline (di luar conversation): satu router, lihat handlers/router.py ===
+    app.add_handler(callback_router)
 
     # Rating conversation handler - dipindah ke atas agar prioritas
     rating_conv_handler = ConversationHandler(
@@ -209,15 +196,13 @@ def main():
             WAITING_COMMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_comment)]
         },
         fallbacks=[CommandHandler("cancel", cancel_rating)],
-        per_message=False
+        per_message=False,
+        name="rating_comment",
+        persistent=True,
+        conversation_timeout=conversation_timeout,
     )
     app.add_handler(rating_conv_handler)
 
-    # Rating handlers - setelah conversation handler
-    # === Rating Handlers ===
-    app.add_handler(CallbackQueryHandler(handle_rating, pattern="^rate"))
-    app.add_handler(CallbackQueryHandler(skip_comment, pattern="^skip_comment"))
-
     # === Command Handlers ===
     app.add_handler(CommandHandler("rekber_history", rekber_history))
     app.add_handler(CommandHandler("rekber_active", rekber_active))
@@ -228,37 +213,33 @@ def main():
     # === Photo Handler ===
     app.add_handler(MessageHandler(filters.PHOTO, handle_payment_proof))
 
-    # === Navigation Handlers ===
-    app.add_handler(CallbackQueryHandler(rekber_panduan, pattern="^rekber_panduan$"))
-    app.add_handler(CallbackQueryHandler(lambda u, c: show_panduan_page(u.callback_query, 1), pattern="^rekber_panduan_page_1$"))
-    app.add_handler(CallbackQueryHandler(lambda u, c: show_panduan_page(u.callback_query, 2), pattern="^rekber_panduan_page_2$"))
-    app.add_handler(CallbackQueryHandler(lambda u, c: show_panduan_page(u.callback_query, 3), pattern="^rekber_panduan_page_3$"))
-    app.add_handler(CallbackQueryHandler(lambda u, c: show_panduan_page(u.callback_query, 4), pattern="^rekber_panduan_page_4$"))
-    app.add_handler(CallbackQueryHandler(lambda u, c: rekber_main_menu(u, c), pattern="^rekber_main_menu$"))
-    app.add_handler(CallbackQueryHandler(rekber_user_history, pattern="^rekber_user_history$"))
-    app.add_handler(CallbackQueryHandler(rekber_user_history, pattern="^rekber_history_menu$"))
-
-    # === Dashboard and Menu Handlers ===
-    app.add_handler(CallbackQueryHandler(admin_pending_actions, pattern="^admin_pending_actions"))
-    app.add_handler(CallbackQueryHandler(admin_user_stats, pattern="^admin_user_stats"))
-
-    # === UX Helper Handlers ===
-    app.add_handler(CallbackQueryHandler(help_create_role, pattern="^help_create_role"))
-    app.add_handler(CallbackQueryHandler(help_what_is_rekber, pattern="^help_what_is_rekber"))
-    app.add_handler(CallbackQueryHandler(join_cancel, pattern="^join_cancel"))
-    app.add_handler(CallbackQueryHandler(change_fee_payer_handler, pattern="^change_fee_payer"))
-
     # Start background tasks setelah polling dimulai
     async def post_init(application):
         import asyncio
+        dispatcher.start(application.bot)
         asyncio.create_task(notification_manager.start_background_tasks())
+        notification_manager.register_jobs(scheduler)
+        asyncio.create_task(scheduler.run())
+        asyncio.create_task(outbox.run())
+        asyncio.create_task(activity_tracker.run())
+
+    # Aktivitas user yang belum ditulis ikut disimpan saat bot berhenti
+    async def post_shutdown(application):
+        activity_tracker.stop()
+        await activity_tracker.flush()
 
     app.post_init = post_init
+    app.post_shutdown = post_shutdown
 
     try:
-        print("Starting bot...")
-        # Add retry mechanism untuk conflict handling
-        app.run_polling(drop_pending_updates=True, close_loop=False)
+        if WEBHOOK_URL:
+            # Mode webhook: update tertunda saat restart tidak dibuang
+            print("Starting bot (webhook)...")
+            run_webhook(app)
+        else:
+            print("Starting bot...")
+            # Add retry mechanism untuk conflict handling
+            app.run_polling(drop_pending_updates=True, allowed_updates=ALLOWED_UPDATES, close_loop=False)
     except Exception as e:
         print(f"Bot stopped with error: {e}")
         if "terminated by other getUpdates request" in str(e):
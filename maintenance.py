@@ -0,0 +1,93 @@
+"""Perintah perawatan database Rekber Bot.
+
+Pemakaian:
+    python maintenance.py reconcile-counters [--dry-run]
+    python maintenance.py reconcile-reputation [--dry-run]
+    python maintenance.py rebuild-rollup [--dry-run]
+
+reconcile-counters: hitung ulang deal_counters (counter dashboard admin)
+dari tabel deals/disputes, tampilkan selisihnya, lalu perbaiki. Dengan
+--dry-run hanya melaporkan. Exit code 1 jika ditemukan selisih.
+
+reconcile-reputation: sama, untuk agregat reputasi dan leaderboard di tabel
+users (total_deals, successful_deals, cancelled_deals, rating_sum,
+rating_count, average_rating, buyer_/seller_deals, buyer_/seller_volume)
+yang dihitung ulang dari riwayat deals dan ratings.
+
+rebuild-rollup: sama, untuk deal_daily_rollup dan deal_monthly_rollup
+(statistik /rekber_stats) yang dibangun ulang dari tabel deals.
+"""
+import sys
+import logging
+
+from db_sqlite import init_db, reconcile_deal_counters, reconcile_user_reputation, rebuild_deal_rollup, REPUTATION_COLUMNS
+
+logging.basicConfig(level=logging.INFO)
+
+
+def reconcile_counters(dry_run: bool = False) -> bool:
+    drift = reconcile_deal_counters(fix=not dry_run)
+    for item in drift:
+        print(
+            f"{item['scope']}:{item['key'] or '-'}  "
+            f"count {item['actual_count']} -> {item['expected_count']}  "
+            f"amount {item['actual_amount']} -> {item['expected_amount']}"
+        )
+    if not drift:
+        print("Counter sesuai ✅")
+    elif dry_run:
+        print(f"{len(drift)} counter selisih (dry run, tidak diperbaiki)")
+    else:
+        print(f"{len(drift)} counter selisih, sudah dibangun ulang ✅")
+    return not drift
+
+
+def reconcile_reputation(dry_run: bool = False) -> bool:
+    drift = reconcile_user_reputation(fix=not dry_run)
+    for item in drift[:50]:
+        actual = item['actual'] or ("tidak ada",) * len(REPUTATION_COLUMNS)
+        changes = [f"{column} {old} -> {new}"
+                   for column, old, new in zip(REPUTATION_COLUMNS, actual, item['expected']) if old != new]
+        print(f"user {item['user_id']}  " + ("  ".join(changes) or "average_rating"))
+    if len(drift) > 50:
+        print(f"... dan {len(drift) - 50} user lainnya")
+    if not drift:
+        print("Reputasi sesuai ✅")
+    elif dry_run:
+        print(f"{len(drift)} user selisih (dry run, tidak diperbaiki)")
+    else:
+        print(f"{len(drift)} user selisih, sudah dibangun ulang ✅")
+    return not drift
+
+
+def rebuild_rollup(dry_run: bool = False) -> bool:
+    drift = rebuild_deal_rollup(fix=not dry_run)
+    for item in drift[:50]:
+        print(
+            f"{item['table']}:{item['key'] or '-'}:{item['status'] or '-'}  "
+            f"count/volume/fees {'/'.join(map(str, item['actual']))} -> {'/'.join(map(str, item['expected']))}"
+        )
+    if len(drift) > 50:
+        print(f"... dan {len(drift) - 50} baris lainnya")
+    if not drift:
+        print("Rollup sesuai ✅")
+    elif dry_run:
+        print(f"{len(drift)} baris rollup selisih (dry run, tidak diperbaiki)")
+    else:
+        print(f"{len(drift)} baris rollup selisih, sudah dibangun ulang ✅")
+    return not drift
+
+
+COMMANDS = {
+    "reconcile-counters": reconcile_counters,
+    "reconcile-reputation": reconcile_reputation,
+    "rebuild-rollup": rebuild_rollup,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(__doc__)
+        sys.exit(1)
+    init_db()
+    sys.exit(0 if COMMANDS[sys.argv[1]](dry_run="--dry-run" in sys.argv[2:]) else 1)
@@ -1,43 +1,114 @@
+"""CLI migrasi schema database Rekber Bot.
+
+Pemakaian:
+    python migrate.py status        # versi schema dan migrasi yang tertunda
+    python migrate.py up            # terapkan migrasi tertunda ke DB_PATH
+    python migrate.py test [db]     # uji semua migrasi pada salinan database
+
+`test` tidak pernah menyentuh database asli: database disalin ke direktori
+sementara lewat backup API SQLite, lalu dicek integritas, jumlah baris per
+tabel, dan bahwa run kedua tidak menjalankan apa pun. Juga diuji pada
+database kosong. Exit code 1 jika ada yang gagal.
+"""
+import os
+import sys
 import sqlite3
+import logging
+import tempfile
+
+import migrations
+
+logging.basicConfig(level=logging.INFO)
+
+DB_PATH = os.getenv("DB_PATH", "rekber.db")
+
+
+def status(path: str = DB_PATH):
+    conn = migrations.connect(path)
+    try:
+        print(f"Database: {path}")
+        print(f"Versi schema: {migrations.current_version(conn)} (terbaru: {migrations.latest_version()})")
+        for version, name, _ in migrations.pending_migrations(conn):
+            print(f"  tertunda: {version:04d}_{name}")
+    finally:
+        conn.close()
+
+
+def up(path: str = DB_PATH):
+    applied = migrations.migrate(path)
+    print(f"Diterapkan: {', '.join(applied)}" if applied else "Schema sudah terbaru")
+
+
+def _row_counts(path: str):
+    conn = sqlite3.connect(path)
+    try:
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )]
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables}
+    finally:
+        conn.close()
+
+
+def _check(path: str, label: str) -> bool:
+    before = _row_counts(path)
+    applied = migrations.migrate(path)
+    print(f"[{label}] diterapkan: {', '.join(applied) or '-'}")
+
+    ok = True
+    conn = sqlite3.connect(path)
+    try:
+        integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if integrity != "ok":
+            print(f"[{label}] integrity_check gagal: {integrity}")
+            ok = False
+        version = migrations.current_version(conn)
+        if version != migrations.latest_version():
+            print(f"[{label}] versi schema {version}, seharusnya {migrations.latest_version()}")
+            ok = False
+    finally:
+        conn.close()
+
+    after = _row_counts(path)
+    for table, count in before.items():
+        if after.get(table) != count:
+            print(f"[{label}] jumlah baris {table} berubah: {count} -> {after.get(table)}")
+            ok = False
+
+    again = migrations.migrate(path)
+    if again:
+        print(f"[{label}] run kedua masih menerapkan: {', '.join(again)}")
+        ok = False
+    return ok
+
+
+def test(source: str = DB_PATH) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = True
+        if os.path.exists(source):
+            copy = os.path.join(tmp, "copy.db")
+            src, dst = sqlite3.connect(source), sqlite3.connect(copy)
+            try:
+                src.backup(dst)
+            finally:
+                src.close()
+                dst.close()
+            ok = _check(copy, source) and ok
+        else:
+            print(f"{source} tidak ditemukan, hanya menguji database kosong")
+        ok = _check(os.path.join(tmp, "empty.db"), "database kosong") and ok
+    print("Semua migrasi OK ✅" if ok else "Migrasi GAGAL ❌")
+    return ok
+
 
-conn = sqlite3.connect("rekber.db")
-cur = conn.cursor()
-
-# Tambah kolom admin_fee
-try:
-    cur.execute("ALTER TABLE deals ADD COLUMN admin_fee INTEGER DEFAULT 0")
-    print("Kolom admin_fee ditambahkan")
-except sqlite3.OperationalError:
-    print("Kolom admin_fee sudah ada")
-
-# Tambah kolom total
-try:
-    cur.execute("ALTER TABLE deals ADD COLUMN total INTEGER DEFAULT 0")
-    print("Kolom total ditambahkan")
-except sqlite3.OperationalError:
-    print("Kolom total sudah ada")
-
-# Tambah kolom admin_fee_payer
-try:
-    cur.execute("ALTER TABLE deals ADD COLUMN admin_fee_payer TEXT")
-    print("Kolom admin_fee_payer ditambahkan")
-except sqlite3.OperationalError:
-    print("Kolom admin_fee_payer sudah ada")
-
-# Tambah kolom joined_by
-try:
-    cur.execute("ALTER TABLE deals ADD COLUMN joined_by INTEGER")
-    print("Kolom joined_by ditambahkan")
-except sqlite3.OperationalError:
-    print("Kolom joined_by sudah ada")
-
-# Tambah kolom payment_proof_file_id untuk menyimpan file_id bukti pembayaran
-try:
-    cur.execute("ALTER TABLE deals ADD COLUMN payment_proof_file_id TEXT")
-    print("Kolom payment_proof_file_id ditambahkan")
-except sqlite3.OperationalError:
-    print("Kolom payment_proof_file_id sudah ada")
-
-conn.commit()
-conn.close()
-print("Migrasi selesai ✅")
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "status":
+        status()
+    elif command == "up":
+        up()
+    elif command == "test":
+        sys.exit(0 if test(*sys.argv[2:3]) else 1)
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,157 @@
+"""Schema awal: semua tabel yang sebelumnya dibuat oleh init_db()"""
+
+TABLES = [
+    # Tabel deals (transaksi rekber)
+    """
+    CREATE TABLE IF NOT EXISTS deals (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        buyer_id INTEGER,
+        seller_id INTEGER,
+        status TEXT DEFAULT 'CREATED',
+        fund_status TEXT DEFAULT 'UNPAID',
+        admin_fee INTEGER DEFAULT 0,
+        admin_fee_payer TEXT DEFAULT 'BUYER',
+        payment_proof TEXT,
+        payment_proof_file_id TEXT,
+        joined_by INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at TIMESTAMP
+    )
+    """,
+    # Tabel logs (riwayat aktivitas)
+    """
+    CREATE TABLE IF NOT EXISTS logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        deal_id TEXT NOT NULL,
+        actor_id INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        action TEXT NOT NULL,
+        detail TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (deal_id) REFERENCES deals(id) ON DELETE CASCADE
+    )
+    """,
+    # Tabel disputes (sengketa)
+    """
+    CREATE TABLE IF NOT EXISTS disputes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        deal_id TEXT NOT NULL,
+        raised_by INTEGER NOT NULL,
+        reason TEXT,
+        evidence TEXT,
+        status TEXT DEFAULT 'OPEN',
+        resolved_by INTEGER,
+        resolution TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        resolved_at TIMESTAMP,
+        FOREIGN KEY (deal_id) REFERENCES deals(id) ON DELETE CASCADE
+    )
+    """,
+    # Tabel shipments (pengiriman)
+    """
+    CREATE TABLE IF NOT EXISTS shipments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        deal_id TEXT NOT NULL,
+        seller_id INTEGER NOT NULL,
+        tracking_no TEXT,
+        courier TEXT,
+        proof TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (deal_id) REFERENCES deals(id) ON DELETE CASCADE
+    )
+    """,
+    # Tabel ratings (penilaian)
+    """
+    CREATE TABLE IF NOT EXISTS ratings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        deal_id TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        rating INTEGER CHECK (rating >= 1 AND rating <= 5),
+        comment TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (deal_id) REFERENCES deals(id) ON DELETE CASCADE,
+        UNIQUE(deal_id, user_id)
+    )
+    """,
+    # Tabel payouts (pencairan dana)
+    """
+    CREATE TABLE IF NOT EXISTS payouts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        deal_id TEXT UNIQUE NOT NULL,
+        seller_id INTEGER NOT NULL,
+        method TEXT NOT NULL CHECK (method IN ('BANK', 'EWALLET')),
+        bank_name TEXT,
+        account_number TEXT,
+        account_name TEXT,
+        ewallet_provider TEXT,
+        ewallet_number TEXT,
+        note TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (deal_id) REFERENCES deals(id) ON DELETE CASCADE
+    )
+    """,
+    # Tabel users untuk statistik dan riwayat pengguna
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        total_deals INTEGER DEFAULT 0,
+        successful_deals INTEGER DEFAULT 0,
+        average_rating REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Tabel untuk rate limiting dan security
+    """
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        user_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        count INTEGER DEFAULT 1,
+        reset_time TIMESTAMP DEFAULT (datetime('now', '+1 hour')),
+        PRIMARY KEY (user_id, action)
+    )
+    """,
+    # Snapshot token bucket dari rate_limiter (opsional)
+    """
+    CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+        user_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        tokens REAL NOT NULL,
+        capacity REAL NOT NULL,
+        rate REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (user_id, action)
+    )
+    """,
+    # Log event keamanan (sebelumnya dibuat oleh security.log_security_event)
+    """
+    CREATE TABLE IF NOT EXISTS security_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_type TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        details TEXT,
+        ip_address TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_deals_buyer_id ON deals(buyer_id)",
+    "CREATE INDEX IF NOT EXISTS idx_deals_seller_id ON deals(seller_id)",
+    "CREATE INDEX IF NOT EXISTS idx_deals_status ON deals(status)",
+    "CREATE INDEX IF NOT EXISTS idx_deals_created_at ON deals(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_deal_id ON logs(deal_id)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_created_at ON logs(created_at)",
+]
+
+
+def upgrade(conn):
+    for sql in TABLES + INDEXES:
+        conn.execute(sql)
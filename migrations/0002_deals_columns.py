@@ -0,0 +1,23 @@
+"""Kolom deals yang dulu ditambahkan manual lewat migrate.py.
+
+Database lama dibuat sebelum kolom-kolom ini ada di CREATE TABLE, jadi
+masing-masing hanya ditambahkan jika belum ada.
+"""
+from migrations import add_column
+
+COLUMNS = [
+    ("fund_status", "TEXT DEFAULT 'UNPAID'"),
+    ("admin_fee", "INTEGER DEFAULT 0"),
+    ("admin_fee_payer", "TEXT DEFAULT 'BUYER'"),
+    ("total", "INTEGER DEFAULT 0"),
+    ("payment_proof", "TEXT"),
+    ("payment_proof_file_id", "TEXT"),
+    ("joined_by", "INTEGER"),
+    ("updated_at", "TIMESTAMP"),
+    ("expires_at", "TIMESTAMP"),
+]
+
+
+def upgrade(conn):
+    for column, declaration in COLUMNS:
+        add_column(conn, "deals", column, declaration)
@@ -0,0 +1,35 @@
+"""Constraint deals: minimal salah satu dari buyer_id/seller_id terisi.
+
+Pengganti migrate_buyer_id.py (versi PostgreSQL). SQLite tidak bisa
+menambah CHECK lewat ALTER TABLE, jadi tabel deals ditulis ulang secara
+online dengan rebuild_table (salin per potongan, bot tetap jalan).
+"""
+from migrations import rebuild_table
+
+TRANSACTIONAL = False
+
+DEALS_TABLE = """
+CREATE TABLE {table} (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    buyer_id INTEGER,
+    seller_id INTEGER,
+    status TEXT DEFAULT 'CREATED',
+    fund_status TEXT DEFAULT 'UNPAID',
+    admin_fee INTEGER DEFAULT 0,
+    admin_fee_payer TEXT DEFAULT 'BUYER',
+    total INTEGER DEFAULT 0,
+    payment_proof TEXT,
+    payment_proof_file_id TEXT,
+    joined_by INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP,
+    CONSTRAINT deals_participants_check CHECK (buyer_id IS NOT NULL OR seller_id IS NOT NULL)
+)
+"""
+
+
+def upgrade(conn):
+    rebuild_table(conn, "deals", DEALS_TABLE)
@@ -0,0 +1,27 @@
+"""Index komposit untuk daftar transaksi per user dan antrean admin.
+
+`(buyer_id, created_at)` dan `(seller_id, created_at)` membuat daftar
+riwayat (lihat db_sqlite.user_deals_query) menjadi merge dua index yang
+sudah terurut, tanpa sort. Index satu kolom lama adalah prefix dari index
+komposit ini sehingga dihapus setelah index baru selesai dibangun.
+"""
+from migrations import create_index
+
+TRANSACTIONAL = False
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_deals_buyer_created ON deals(buyer_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_deals_seller_created ON deals(seller_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_deals_status_created ON deals(status, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_disputes_status_created ON disputes(status, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_shipments_deal_id ON shipments(deal_id)",
+]
+
+REPLACED = ["idx_deals_buyer_id", "idx_deals_seller_id", "idx_deals_status"]
+
+
+def upgrade(conn):
+    for sql in INDEXES:
+        create_index(conn, sql)
+    for name in REPLACED:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
@@ -0,0 +1,98 @@
+"""Counter dashboard admin yang dijaga trigger (tabel deal_counters).
+
+Setiap perubahan deals/disputes memperbarui counter dalam transaksi yang
+sama, sehingga get_admin_dashboard_stats cukup membaca beberapa baris.
+
+    scope='status'  key=status   count=jumlah deal, amount=total nominal
+    scope='day'     key=tanggal  count=deal yang dibuat pada tanggal itu
+    scope='dispute' key=status   count=jumlah dispute
+"""
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS deal_counters (
+        scope TEXT NOT NULL,
+        key TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        amount INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, key)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS deal_counters_deal_ins AFTER INSERT ON deals BEGIN
+        INSERT INTO deal_counters (scope, key, count, amount)
+        VALUES ('status', IFNULL(NEW.status, ''), 1, IFNULL(NEW.amount, 0))
+        ON CONFLICT (scope, key) DO UPDATE SET count = count + 1, amount = amount + excluded.amount;
+        INSERT INTO deal_counters (scope, key, count) VALUES ('day', IFNULL(DATE(NEW.created_at), ''), 1)
+        ON CONFLICT (scope, key) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS deal_counters_deal_del AFTER DELETE ON deals BEGIN
+        UPDATE deal_counters SET count = count - 1, amount = amount - IFNULL(OLD.amount, 0)
+        WHERE scope = 'status' AND key = IFNULL(OLD.status, '');
+        UPDATE deal_counters SET count = count - 1
+        WHERE scope = 'day' AND key = IFNULL(DATE(OLD.created_at), '');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS deal_counters_deal_upd AFTER UPDATE OF status, amount ON deals
+    WHEN OLD.status IS NOT NEW.status OR OLD.amount IS NOT NEW.amount BEGIN
+        UPDATE deal_counters SET count = count - 1, amount = amount - IFNULL(OLD.amount, 0)
+        WHERE scope = 'status' AND key = IFNULL(OLD.status, '');
+        INSERT INTO deal_counters (scope, key, count, amount)
+        VALUES ('status', IFNULL(NEW.status, ''), 1, IFNULL(NEW.amount, 0))
+        ON CONFLICT (scope, key) DO UPDATE SET count = count + 1, amount = amount + excluded.amount;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS deal_counters_deal_day AFTER UPDATE OF created_at ON deals
+    WHEN DATE(OLD.created_at) IS NOT DATE(NEW.created_at) BEGIN
+        UPDATE deal_counters SET count = count - 1
+        WHERE scope = 'day' AND key = IFNULL(DATE(OLD.created_at), '');
+        INSERT INTO deal_counters (scope, key, count) VALUES ('day', IFNULL(DATE(NEW.created_at), ''), 1)
+        ON CONFLICT (scope, key) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS deal_counters_dispute_ins AFTER INSERT ON disputes BEGIN
+        INSERT INTO deal_counters (scope, key, count) VALUES ('dispute', IFNULL(NEW.status, ''), 1)
+        ON CONFLICT (scope, key) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS deal_counters_dispute_del AFTER DELETE ON disputes BEGIN
+        UPDATE deal_counters SET count = count - 1
+        WHERE scope = 'dispute' AND key = IFNULL(OLD.status, '');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS deal_counters_dispute_upd AFTER UPDATE OF status ON disputes
+    WHEN OLD.status IS NOT NEW.status BEGIN
+        UPDATE deal_counters SET count = count - 1
+        WHERE scope = 'dispute' AND key = IFNULL(OLD.status, '');
+        INSERT INTO deal_counters (scope, key, count) VALUES ('dispute', IFNULL(NEW.status, ''), 1)
+        ON CONFLICT (scope, key) DO UPDATE SET count = count + 1;
+    END
+    """,
+    # active_users di dashboard: hitung range index, bukan scan tabel users
+    "CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users(last_activity)",
+]
+
+# Isi awal dari data yang sudah ada; sama dengan db_sqlite.DEAL_COUNTERS_SQL
+BACKFILL = """
+INSERT INTO deal_counters (scope, key, count, amount)
+SELECT 'status', IFNULL(status, ''), COUNT(*), IFNULL(SUM(amount), 0) FROM deals GROUP BY 2
+UNION ALL
+SELECT 'day', IFNULL(DATE(created_at), ''), COUNT(*), 0 FROM deals GROUP BY 2
+UNION ALL
+SELECT 'dispute', IFNULL(status, ''), COUNT(*), 0 FROM disputes GROUP BY 2
+"""
+
+
+def upgrade(conn):
+    # Satu transaksi: trigger dan isi awal konsisten terhadap penulis lain
+    for sql in STATEMENTS:
+        conn.execute(sql)
+    conn.execute("DELETE FROM deal_counters")
+    conn.execute(BACKFILL)
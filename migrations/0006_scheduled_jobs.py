@@ -0,0 +1,41 @@
+"""Tabel scheduled_jobs untuk scheduler persisten (lihat scheduler.py).
+
+Job disimpan dengan waktu jatuh tempo `due_at` (epoch detik) sehingga tetap
+ada setelah restart. `key` unik untuk deduplikasi. Job yang terikat ke
+status deal (`deal_status`) otomatis dihapus trigger begitu status deal
+berubah, di transaksi yang sama dengan perubahan status tersebut.
+"""
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS scheduled_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        key TEXT UNIQUE,
+        due_at REAL NOT NULL,
+        deal_id TEXT,
+        deal_status TEXT,
+        payload TEXT,
+        created_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_scheduled_jobs_due ON scheduled_jobs(due_at)",
+    "CREATE INDEX IF NOT EXISTS idx_scheduled_jobs_deal ON scheduled_jobs(deal_id) WHERE deal_id IS NOT NULL",
+    """
+    CREATE TRIGGER IF NOT EXISTS scheduled_jobs_deal_status AFTER UPDATE OF status ON deals
+    WHEN OLD.status IS NOT NEW.status BEGIN
+        DELETE FROM scheduled_jobs
+        WHERE deal_id = NEW.id AND deal_status IS NOT NULL AND deal_status IS NOT NEW.status;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS scheduled_jobs_deal_del AFTER DELETE ON deals BEGIN
+        DELETE FROM scheduled_jobs WHERE deal_id = OLD.id;
+    END
+    """,
+]
+
+
+def upgrade(conn):
+    for sql in STATEMENTS:
+        conn.execute(sql)
@@ -0,0 +1,27 @@
+"""Isi dan index kolom deals.expires_at.
+
+Mulai versi ini deal_state mengisi `expires_at` di setiap transisi (lihat
+deal_state.DEADLINES). Deal lama yang sedang menunggu batas waktu diisi
+dengan aturan yang sama seperti sweeper lama: 24 jam sejak dibuat untuk
+CREATED, 72 jam sejak pengiriman untuk SHIPPED. Index parsial
+(status, expires_at) hanya memuat deal yang punya deadline, jadi tetap
+kecil, dan deadline terdekat per status cukup satu seek.
+"""
+from migrations import backfill, create_index
+
+TRANSACTIONAL = False
+
+EXPIRES_AT = """
+expires_at = CASE status
+    WHEN 'CREATED' THEN datetime(created_at, '+24 hours')
+    WHEN 'SHIPPED' THEN datetime(COALESCE(
+        (SELECT MAX(s.created_at) FROM shipments s WHERE s.deal_id = deals.id), updated_at, created_at
+    ), '+72 hours')
+END
+"""
+
+
+def upgrade(conn):
+    backfill(conn, "deals", EXPIRES_AT, "status IN ('CREATED', 'SHIPPED') AND expires_at IS NULL")
+    create_index(conn, "CREATE INDEX IF NOT EXISTS idx_deals_status_expires ON deals(status, expires_at) "
+                       "WHERE expires_at IS NOT NULL")
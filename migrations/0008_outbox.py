@@ -0,0 +1,30 @@
+"""Tabel outbox untuk notifikasi yang dikirim setelah perubahan status (lihat outbox.py).
+
+Baris ditulis di transaksi yang sama dengan perubahan status deal dan
+dihapus setelah terkirim. `next_attempt_at` (epoch detik) mengatur retry
+dan lease; baris yang gagal permanen diberi `dead_at` (dead letter).
+"""
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        deal_id TEXT,
+        priority INTEGER NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        created_at REAL NOT NULL,
+        last_error TEXT,
+        dead_at REAL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox(next_attempt_at) WHERE dead_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS idx_outbox_dead ON outbox(dead_at) WHERE dead_at IS NOT NULL",
+]
+
+
+def upgrade(conn):
+    for sql in STATEMENTS:
+        conn.execute(sql)
@@ -0,0 +1,12 @@
+"""Kolom cache profil user (lihat profile_cache.py).
+
+`profile_updated_at` (epoch detik) adalah waktu terakhir username/nama
+dikonfirmasi dari update Telegram atau get_chat; `reachable` 1/0 menandai
+apakah bot bisa mengirim pesan ke user (NULL = belum diketahui).
+"""
+from migrations import add_column
+
+
+def upgrade(conn):
+    add_column(conn, "users", "profile_updated_at", "REAL")
+    add_column(conn, "users", "reachable", "INTEGER")
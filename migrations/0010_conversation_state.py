@@ -0,0 +1,33 @@
+"""Tabel persistence ConversationHandler dan context.user_data (lihat persistence.py).
+
+`conversation_state` menyimpan state setiap percakapan yang sedang berjalan
+(kunci percakapan disimpan sebagai JSON), `user_state` isi user_data per
+user sebagai JSON ringkas. `updated_at` (epoch detik) dipakai untuk
+membuang percakapan/user_data yang menganggur.
+"""
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS conversation_state (
+        name TEXT NOT NULL,
+        key TEXT NOT NULL,
+        state TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (name, key)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_conversation_state_updated ON conversation_state(updated_at)",
+    """
+    CREATE TABLE IF NOT EXISTS user_state (
+        user_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_user_state_updated ON user_state(updated_at)",
+]
+
+
+def upgrade(conn):
+    for sql in STATEMENTS:
+        conn.execute(sql)
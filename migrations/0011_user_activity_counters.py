@@ -0,0 +1,50 @@
+"""Counter user aktif per hari di deal_counters (lihat activity.py).
+
+Setiap user dihitung di tepat satu baris: hari aktivitas terakhirnya.
+
+    scope='active_day'  key=tanggal  count=user yang terakhir aktif pada tanggal itu
+
+Jumlah user aktif 30 hari terakhir = SUM(count) untuk 30 tanggal terakhir,
+dibaca dari paling banyak 31 baris, bukan range scan tabel users.
+
+Jangan menulis users dengan INSERT OR REPLACE: baris yang dihapus REPLACE
+tidak menjalankan trigger DELETE, sehingga counter ikut bergeser.
+"""
+
+STATEMENTS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS user_activity_ins AFTER INSERT ON users BEGIN
+        INSERT INTO deal_counters (scope, key, count) VALUES ('active_day', IFNULL(DATE(NEW.last_activity), ''), 1)
+        ON CONFLICT (scope, key) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_activity_del AFTER DELETE ON users BEGIN
+        UPDATE deal_counters SET count = count - 1
+        WHERE scope = 'active_day' AND key = IFNULL(DATE(OLD.last_activity), '');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_activity_upd AFTER UPDATE OF last_activity ON users
+    WHEN DATE(OLD.last_activity) IS NOT DATE(NEW.last_activity) BEGIN
+        UPDATE deal_counters SET count = count - 1
+        WHERE scope = 'active_day' AND key = IFNULL(DATE(OLD.last_activity), '');
+        INSERT INTO deal_counters (scope, key, count) VALUES ('active_day', IFNULL(DATE(NEW.last_activity), ''), 1)
+        ON CONFLICT (scope, key) DO UPDATE SET count = count + 1;
+    END
+    """,
+]
+
+# Isi awal; sama dengan bagian 'active_day' di db_sqlite.DEAL_COUNTERS_SQL
+BACKFILL = """
+INSERT INTO deal_counters (scope, key, count)
+SELECT 'active_day', IFNULL(DATE(last_activity), ''), COUNT(*) FROM users GROUP BY 2
+"""
+
+
+def upgrade(conn):
+    # Satu transaksi: trigger dan isi awal konsisten terhadap penulis lain
+    for sql in STATEMENTS:
+        conn.execute(sql)
+    conn.execute("DELETE FROM deal_counters WHERE scope = 'active_day'")
+    conn.execute(BACKFILL)
@@ -0,0 +1,160 @@
+"""Agregat reputasi per user di tabel users, dijaga trigger.
+
+    total_deals       deal selesai (COMPLETED, CANCELLED, REFUNDED) sebagai pembeli/penjual
+    successful_deals  deal COMPLETED
+    cancelled_deals   deal CANCELLED atau REFUNDED
+    rating_sum        jumlah rating dari pihak lain pada deal user ini
+    rating_count      banyaknya rating tersebut
+    average_rating    rating_sum / rating_count (NULL jika belum ada rating)
+
+Deal dihitung saat mencapai status akhir, rating saat dimasukkan
+(handle_rating), sehingga db_sqlite.get_user_stats cukup satu lookup
+primary key. Trigger membuatkan baris users untuk pihak yang belum punya
+(last_activity NULL, belum pernah terlihat); isi awal hanya mengisi baris
+yang sudah ada, pihak deal lama tanpa baris users dibuatkan oleh
+`python maintenance.py reconcile-reputation`.
+
+Yang tidak dijaga trigger: rating pada deal yang kemudian dihapus atau
+berganti pembeli/penjual. Keduanya tidak terjadi di alur bot; perbaiki
+dengan `python maintenance.py reconcile-reputation`.
+"""
+from migrations import add_column
+
+TERMINAL = "('COMPLETED', 'CANCELLED', 'REFUNDED')"
+CANCELLED = "('CANCELLED', 'REFUNDED')"
+PARTIES = ("buyer_id", "seller_id")
+
+
+def _add_deal(row: str) -> str:
+    # Tambah deal `row` (NEW/OLD) ke kedua pihak jika statusnya status akhir.
+    # Satu upsert per pihak: lebih murah daripada satu upsert dari UNION
+    return "".join(f"""
+        INSERT INTO users (user_id, total_deals, successful_deals, cancelled_deals, last_activity)
+        SELECT {row}.{party}, 1, {row}.status = 'COMPLETED', {row}.status IN {CANCELLED}, NULL
+        WHERE {row}.{party} IS NOT NULL AND {row}.status IN {TERMINAL}
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_deals = total_deals + 1,
+            successful_deals = successful_deals + excluded.successful_deals,
+            cancelled_deals = cancelled_deals + excluded.cancelled_deals;""" for party in PARTIES)
+
+
+def _remove_deal(row: str) -> str:
+    return f"""
+        UPDATE users SET
+            total_deals = total_deals - 1,
+            successful_deals = successful_deals - ({row}.status = 'COMPLETED'),
+            cancelled_deals = cancelled_deals - ({row}.status IN {CANCELLED})
+        WHERE {row}.status IN {TERMINAL} AND user_id IN ({row}.buyer_id, {row}.seller_id);"""
+
+
+def _rated(row: str, party: str) -> str:
+    # Pihak `party` dari deal rating `row`, kecuali si pemberi rating sendiri
+    return (f"FROM deals WHERE id = {row}.deal_id AND {party} IS NOT NULL AND {party} != {row}.user_id "
+            f"AND {row}.rating IS NOT NULL")
+
+
+def _add_rating(row: str) -> str:
+    return "".join(f"""
+        INSERT INTO users (user_id, rating_sum, rating_count, average_rating, last_activity)
+        SELECT {party}, {row}.rating, 1, {row}.rating * 1.0, NULL {_rated(row, party)}
+        ON CONFLICT (user_id) DO UPDATE SET
+            rating_sum = rating_sum + excluded.rating_sum,
+            rating_count = rating_count + 1,
+            average_rating = (rating_sum + excluded.rating_sum) * 1.0 / (rating_count + 1);""" for party in PARTIES)
+
+
+def _remove_rating(row: str) -> str:
+    return f"""
+        UPDATE users SET
+            rating_sum = rating_sum - {row}.rating,
+            rating_count = rating_count - 1,
+            average_rating = CASE WHEN rating_count > 1
+                THEN (rating_sum - {row}.rating) * 1.0 / (rating_count - 1) END
+        WHERE user_id IN (SELECT buyer_id {_rated(row, "buyer_id")} UNION ALL SELECT seller_id {_rated(row, "seller_id")});"""
+
+
+STATEMENTS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS user_reputation_deal_ins AFTER INSERT ON deals
+    WHEN NEW.status IN {TERMINAL} BEGIN{_add_deal("NEW")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS user_reputation_deal_del AFTER DELETE ON deals
+    WHEN OLD.status IN {TERMINAL} BEGIN{_remove_deal("OLD")}
+    END
+    """,
+    # Jalur umum (deal baru selesai) punya trigger sendiri supaya tidak ikut
+    # menjalankan statement pengurangan
+    f"""
+    CREATE TRIGGER IF NOT EXISTS user_reputation_deal_done AFTER UPDATE OF status ON deals
+    WHEN IFNULL(OLD.status, '') NOT IN {TERMINAL} AND NEW.status IN {TERMINAL} BEGIN{_add_deal("NEW")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS user_reputation_deal_upd AFTER UPDATE OF status, buyer_id, seller_id ON deals
+    WHEN OLD.status IN {TERMINAL}
+        AND (OLD.status IS NOT NEW.status OR OLD.buyer_id IS NOT NEW.buyer_id OR OLD.seller_id IS NOT NEW.seller_id)
+    BEGIN{_remove_deal("OLD")}{_add_deal("NEW")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS user_reputation_rating_ins AFTER INSERT ON ratings BEGIN{_add_rating("NEW")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS user_reputation_rating_del AFTER DELETE ON ratings BEGIN{_remove_rating("OLD")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS user_reputation_rating_upd AFTER UPDATE OF rating, deal_id, user_id ON ratings
+    WHEN OLD.rating IS NOT NEW.rating OR OLD.deal_id IS NOT NEW.deal_id OR OLD.user_id IS NOT NEW.user_id
+    BEGIN{_remove_rating("OLD")}{_add_rating("NEW")}
+    END
+    """,
+]
+
+# Isi awal; sama dengan bagian reputasi di db_sqlite.USER_REPUTATION_SQL
+REPUTATION = f"""
+SELECT user_id, SUM(deals) AS total_deals, SUM(completed) AS successful_deals,
+       SUM(cancelled) AS cancelled_deals, SUM(rating) AS rating_sum, SUM(rated) AS rating_count
+FROM (
+    SELECT party AS user_id, 1 AS deals, status = 'COMPLETED' AS completed,
+           status IN {CANCELLED} AS cancelled, 0 AS rating, 0 AS rated
+    FROM (SELECT buyer_id AS party, status FROM deals UNION ALL SELECT seller_id, status FROM deals)
+    WHERE party IS NOT NULL AND status IN {TERMINAL}
+    UNION ALL
+    SELECT party, 0, 0, 0, r.rating, 1
+    FROM ratings r JOIN (
+        SELECT id, buyer_id AS party FROM deals UNION ALL SELECT id, seller_id FROM deals
+    ) d ON d.id = r.deal_id
+    WHERE party IS NOT NULL AND party != r.user_id AND r.rating IS NOT NULL
+)
+GROUP BY user_id
+"""
+
+BACKFILL = [
+    """
+    UPDATE users SET total_deals = 0, successful_deals = 0, cancelled_deals = 0,
+        rating_sum = 0, rating_count = 0, average_rating = NULL
+    """,
+    f"""
+    INSERT INTO users (user_id, total_deals, successful_deals, cancelled_deals,
+                       rating_sum, rating_count, average_rating, last_activity)
+    SELECT *, CASE WHEN rating_count THEN rating_sum * 1.0 / rating_count END, NULL FROM ({REPUTATION})
+    WHERE user_id IN (SELECT user_id FROM users)
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_deals = excluded.total_deals, successful_deals = excluded.successful_deals,
+        cancelled_deals = excluded.cancelled_deals, rating_sum = excluded.rating_sum,
+        rating_count = excluded.rating_count, average_rating = excluded.average_rating
+    """,
+]
+
+
+def upgrade(conn):
+    add_column(conn, "users", "cancelled_deals", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "users", "rating_sum", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "users", "rating_count", "INTEGER NOT NULL DEFAULT 0")
+    # Satu transaksi: trigger dan isi awal konsisten terhadap penulis lain
+    for sql in STATEMENTS + BACKFILL:
+        conn.execute(sql)
@@ -0,0 +1,115 @@
+"""Data leaderboard admin (lihat leaderboard.py).
+
+Kolom users untuk deal COMPLETED per peran, dijaga trigger:
+
+    buyer_deals, buyer_volume    deal selesai sebagai pembeli dan total nominalnya
+    seller_deals, seller_volume  deal selesai sebagai penjual dan total nominalnya
+
+Index untuk top-K: successful_deals (0012), buyer_volume + seller_volume,
+dan average_rating, sehingga daftar teratas dibaca dari ujung index tanpa
+GROUP BY atas deals.
+
+Counter user baru per hari di deal_counters, untuk "user baru 7 hari":
+
+    scope='user_day'  key=tanggal  count=user yang dibuat pada tanggal itu
+"""
+from migrations import add_column
+
+
+def _add_deal(row: str) -> str:
+    return "".join(f"""
+        INSERT INTO users (user_id, {side}_deals, {side}_volume, last_activity)
+        SELECT {row}.{side}_id, 1, {row}.amount, NULL WHERE {row}.{side}_id IS NOT NULL AND {row}.status = 'COMPLETED'
+        ON CONFLICT (user_id) DO UPDATE SET
+            {side}_deals = {side}_deals + 1, {side}_volume = {side}_volume + excluded.{side}_volume;"""
+                   for side in ("buyer", "seller"))
+
+
+def _remove_deal(row: str) -> str:
+    return "".join(f"""
+        UPDATE users SET {side}_deals = {side}_deals - 1, {side}_volume = {side}_volume - {row}.amount
+        WHERE user_id = {row}.{side}_id;""" for side in ("buyer", "seller"))
+
+
+STATEMENTS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS leaderboard_deal_ins AFTER INSERT ON deals
+    WHEN NEW.status = 'COMPLETED' BEGIN{_add_deal("NEW")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS leaderboard_deal_del AFTER DELETE ON deals
+    WHEN OLD.status = 'COMPLETED' BEGIN{_remove_deal("OLD")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS leaderboard_deal_done AFTER UPDATE OF status ON deals
+    WHEN OLD.status IS NOT 'COMPLETED' AND NEW.status = 'COMPLETED' BEGIN{_add_deal("NEW")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS leaderboard_deal_upd AFTER UPDATE OF status, amount, buyer_id, seller_id ON deals
+    WHEN OLD.status = 'COMPLETED' AND (OLD.status IS NOT NEW.status OR OLD.amount IS NOT NEW.amount
+        OR OLD.buyer_id IS NOT NEW.buyer_id OR OLD.seller_id IS NOT NEW.seller_id)
+    BEGIN{_remove_deal("OLD")}{_add_deal("NEW")}
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_day_ins AFTER INSERT ON users BEGIN
+        INSERT INTO deal_counters (scope, key, count) VALUES ('user_day', IFNULL(DATE(NEW.created_at), ''), 1)
+        ON CONFLICT (scope, key) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_day_del AFTER DELETE ON users BEGIN
+        UPDATE deal_counters SET count = count - 1
+        WHERE scope = 'user_day' AND key = IFNULL(DATE(OLD.created_at), '');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_day_upd AFTER UPDATE OF created_at ON users
+    WHEN DATE(OLD.created_at) IS NOT DATE(NEW.created_at) BEGIN
+        UPDATE deal_counters SET count = count - 1
+        WHERE scope = 'user_day' AND key = IFNULL(DATE(OLD.created_at), '');
+        INSERT INTO deal_counters (scope, key, count) VALUES ('user_day', IFNULL(DATE(NEW.created_at), ''), 1)
+        ON CONFLICT (scope, key) DO UPDATE SET count = count + 1;
+    END
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_users_top_deals ON users(successful_deals)",
+    "CREATE INDEX IF NOT EXISTS idx_users_top_volume ON users((buyer_volume + seller_volume))",
+    "CREATE INDEX IF NOT EXISTS idx_users_top_rating ON users(average_rating, rating_count)",
+]
+
+# Isi awal; sama dengan bagian leaderboard di db_sqlite.USER_REPUTATION_SQL dan
+# bagian 'user_day' di db_sqlite.DEAL_COUNTERS_SQL
+BACKFILL = [
+    """
+    UPDATE users SET buyer_deals = 0, buyer_volume = 0, seller_deals = 0, seller_volume = 0
+    """,
+    """
+    INSERT INTO users (user_id, buyer_deals, buyer_volume, seller_deals, seller_volume, last_activity)
+    SELECT user_id, SUM(bought), SUM(bought * amount), SUM(sold), SUM(sold * amount), NULL FROM (
+        SELECT buyer_id AS user_id, 1 AS bought, 0 AS sold, amount FROM deals WHERE status = 'COMPLETED'
+        UNION ALL
+        SELECT seller_id, 0, 1, amount FROM deals WHERE status = 'COMPLETED'
+    )
+    WHERE user_id IN (SELECT user_id FROM users)
+    GROUP BY user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        buyer_deals = excluded.buyer_deals, buyer_volume = excluded.buyer_volume,
+        seller_deals = excluded.seller_deals, seller_volume = excluded.seller_volume
+    """,
+    "DELETE FROM deal_counters WHERE scope = 'user_day'",
+    """
+    INSERT INTO deal_counters (scope, key, count)
+    SELECT 'user_day', IFNULL(DATE(created_at), ''), COUNT(*) FROM users GROUP BY 2
+    """,
+]
+
+
+def upgrade(conn):
+    for column in ("buyer_deals", "buyer_volume", "seller_deals", "seller_volume"):
+        add_column(conn, "users", column, "INTEGER NOT NULL DEFAULT 0")
+    # Satu transaksi: trigger dan isi awal konsisten terhadap penulis lain
+    for sql in STATEMENTS + BACKFILL:
+        conn.execute(sql)
@@ -0,0 +1,91 @@
+"""Rollup deal per hari dan per bulan untuk /rekber_stats.
+
+    deal_daily_rollup    day='YYYY-MM-DD'  status  count, volume, fees
+    deal_monthly_rollup  month='YYYY-MM'   status  count, volume, fees
+
+Tanggal dari DATE(created_at) deal, volume = SUM(amount), fees =
+SUM(admin_fee). Trigger di tabel deals memindahkan deal antar baris saat
+status (atau amount, admin_fee, created_at) berubah, dalam transaksi yang
+sama dengan transisinya. Statistik rentang tanggal berapa pun cukup
+menjumlahkan baris bulan penuh ditambah baris hari di kedua ujungnya (lihat
+db_sqlite.deal_rollup_totals). Bangun ulang dari tabel deals:
+`python maintenance.py rebuild-rollup`.
+"""
+
+TABLES = ("deal_daily_rollup", "deal_monthly_rollup")
+
+
+def _targets(row: str):
+    return (
+        ("deal_daily_rollup", "day", f"IFNULL(DATE({row}.created_at), '')"),
+        ("deal_monthly_rollup", "month", f"IFNULL(STRFTIME('%Y-%m', {row}.created_at), '')"),
+    )
+
+
+def _add(row: str) -> str:
+    return "".join(f"""
+        INSERT INTO {table} ({key}, status, count, volume, fees)
+        VALUES ({expr}, IFNULL({row}.status, ''), 1, {row}.amount, IFNULL({row}.admin_fee, 0))
+        ON CONFLICT ({key}, status) DO UPDATE SET
+            count = count + 1, volume = volume + excluded.volume, fees = fees + excluded.fees;"""
+                   for table, key, expr in _targets(row))
+
+
+def _remove(row: str) -> str:
+    return "".join(f"""
+        UPDATE {table} SET count = count - 1, volume = volume - {row}.amount, fees = fees - IFNULL({row}.admin_fee, 0)
+        WHERE {key} = {expr} AND status = IFNULL({row}.status, '');"""
+                   for table, key, expr in _targets(row))
+
+
+STATEMENTS = [
+    *(f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        {key} TEXT NOT NULL,
+        status TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        volume INTEGER NOT NULL DEFAULT 0,
+        fees INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY ({key}, status)
+    ) WITHOUT ROWID
+    """ for table, key in zip(TABLES, ("day", "month"))),
+    f"""
+    CREATE TRIGGER IF NOT EXISTS deal_rollup_ins AFTER INSERT ON deals BEGIN{_add("NEW")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS deal_rollup_del AFTER DELETE ON deals BEGIN{_remove("OLD")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS deal_rollup_upd AFTER UPDATE OF status, amount, admin_fee, created_at ON deals
+    WHEN OLD.status IS NOT NEW.status OR OLD.amount IS NOT NEW.amount
+        OR OLD.admin_fee IS NOT NEW.admin_fee OR OLD.created_at IS NOT NEW.created_at
+    BEGIN{_remove("OLD")}{_add("NEW")}
+    END
+    """,
+]
+
+# Isi awal; sama dengan db_sqlite.DEAL_ROLLUP_SQL
+BACKFILL = [
+    """
+    INSERT INTO deal_daily_rollup (day, status, count, volume, fees)
+    SELECT IFNULL(DATE(created_at), ''), IFNULL(status, ''), COUNT(*), SUM(amount), SUM(IFNULL(admin_fee, 0))
+    FROM deals GROUP BY 1, 2
+    """,
+    """
+    INSERT INTO deal_monthly_rollup (month, status, count, volume, fees)
+    SELECT SUBSTR(day, 1, 7), status, SUM(count), SUM(volume), SUM(fees)
+    FROM deal_daily_rollup GROUP BY 1, 2
+    """,
+]
+
+
+def upgrade(conn):
+    # Satu transaksi: trigger dan isi awal konsisten terhadap penulis lain
+    for sql in STATEMENTS:
+        conn.execute(sql)
+    for table in TABLES:
+        conn.execute(f"DELETE FROM {table}")
+    for sql in BACKFILL:
+        conn.execute(sql)
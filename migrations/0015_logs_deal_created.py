@@ -0,0 +1,14 @@
+"""Index logs per deal terurut waktu untuk analitik siklus deal.
+
+analytics.py membaca seluruh logs terurut `(deal_id, created_at)`. Dengan
+index komposit ini urutan itu langsung dari index, tanpa sort atas jutaan
+baris. Index `deal_id` lama adalah prefix-nya sehingga dihapus.
+"""
+from migrations import create_index
+
+TRANSACTIONAL = False
+
+
+def upgrade(conn):
+    create_index(conn, "CREATE INDEX IF NOT EXISTS idx_logs_deal_created ON logs(deal_id, created_at)")
+    conn.execute("DROP INDEX IF EXISTS idx_logs_deal_id")
@@ -0,0 +1,27 @@
+"""Isi expires_at untuk status alur utama yang sekarang punya batas waktu.
+
+deal_state.DEADLINES kini memakai status yang benar-benar dilalui deal:
+PENDING_JOIN dan PENDING_FUNDING dibatalkan 24 jam setelah status dimulai,
+AWAITING_CONFIRM dilepas 72 jam setelah barang dikirim. Deal yang sudah
+berada di status tersebut sebelum versi ini diisi dengan aturan yang sama;
+waktu masuk status diambil dari updated_at (created_at untuk PENDING_JOIN).
+Index (status, expires_at) dari migrasi 0007 tetap dipakai.
+"""
+from migrations import backfill
+
+TRANSACTIONAL = False
+
+EXPIRES_AT = """
+expires_at = CASE status
+    WHEN 'PENDING_JOIN' THEN datetime(created_at, '+24 hours')
+    WHEN 'PENDING_FUNDING' THEN datetime(COALESCE(updated_at, created_at), '+24 hours')
+    WHEN 'AWAITING_CONFIRM' THEN datetime(COALESCE(
+        (SELECT MAX(s.created_at) FROM shipments s WHERE s.deal_id = deals.id), updated_at, created_at
+    ), '+72 hours')
+END
+"""
+
+
+def upgrade(conn):
+    backfill(conn, "deals", EXPIRES_AT,
+             "status IN ('PENDING_JOIN', 'PENDING_FUNDING', 'AWAITING_CONFIRM') AND expires_at IS NULL")
@@ -0,0 +1,249 @@
+"""Runner migrasi schema berversi untuk database SQLite Rekber Bot.
+
+Setiap migrasi adalah modul `NNNN_nama.py` di paket ini dengan fungsi
+`upgrade(conn)`. Versi yang sudah diterapkan dicatat di tabel
+`schema_version`, sehingga startup cukup membaca satu baris jika schema
+sudah terbaru.
+
+Secara default migrasi dijalankan dalam satu transaksi. Migrasi yang berat
+(rewrite tabel, backfill, build index) men-set `TRANSACTIONAL = False` dan
+memakai helper di bawah yang commit per potongan, sehingga bot tetap bisa
+membaca dan menulis selama migrasi berjalan. Helper tersebut idempotent:
+migrasi yang terputus aman untuk dijalankan ulang.
+"""
+import os
+import re
+import sqlite3
+import logging
+import importlib
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+CHUNK_SIZE = int(os.getenv("MIGRATION_CHUNK_SIZE", "2000"))
+
+
+def available_migrations() -> List[Tuple[int, str, object]]:
+    """Daftar (versi, nama, modul) urut berdasarkan versi"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = re.match(r"^(\d{4})_(\w+)\.py$", filename)
+        if match:
+            module = importlib.import_module(f"{__name__}.{filename[:-3]}")
+            migrations.append((int(match.group(1)), match.group(2), module))
+    return migrations
+
+
+def latest_version() -> int:
+    migrations = available_migrations()
+    return migrations[-1][0] if migrations else 0
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Koneksi autocommit (transaksi dikendalikan manual oleh runner/helper)"""
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0  # tabel schema_version belum ada
+    return row[0] or 0
+
+
+def pending_migrations(conn: sqlite3.Connection):
+    version = current_version(conn)
+    return [m for m in available_migrations() if m[0] > version]
+
+
+def migrate(path: str) -> List[str]:
+    """Terapkan semua migrasi tertunda, kembalikan nama migrasi yang diterapkan"""
+    conn = connect(path)
+    try:
+        pending = pending_migrations(conn)
+        if not pending:
+            return []
+
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        applied = []
+        for version, name, module in pending:
+            logger.info(f"Menerapkan migrasi {version:04d}_{name}")
+            if getattr(module, "TRANSACTIONAL", True):
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    module.upgrade(conn)
+                    conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            else:
+                module.upgrade(conn)
+                conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            applied.append(f"{version:04d}_{name}")
+        return applied
+    finally:
+        conn.close()
+
+
+# --- Helper untuk migrasi ---
+
+def column_names(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row['name'] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def add_column(conn: sqlite3.Connection, table: str, column: str, declaration: str):
+    """ALTER TABLE ADD COLUMN hanya jika kolom belum ada"""
+    if column not in column_names(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def create_index(conn: sqlite3.Connection, sql: str):
+    """Build satu index dalam transaksinya sendiri.
+
+    Pembaca tetap dilayani (WAL); penulis hanya menunggu selama index ini
+    dibangun, bukan selama seluruh migrasi.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(sql)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def backfill(conn: sqlite3.Connection, table: str, set_clause: str, where: str = "1", chunk: int = CHUNK_SIZE) -> int:
+    """UPDATE besar dipecah per rentang rowid, commit per potongan"""
+    max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+    updated = 0
+    for start in range(0, max_rowid, chunk):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                f"UPDATE {table} SET {set_clause} WHERE rowid > ? AND rowid <= ? AND ({where})",
+                (start, start + chunk)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        updated += cur.rowcount
+    return updated
+
+
+def rebuild_table(conn: sqlite3.Connection, table: str, create_sql: str, chunk: int = CHUNK_SIZE) -> int:
+    """Rewrite tabel secara online (pola shadow table + trigger).
+
+    1. Buat `<table>__new` dari `create_sql` (nama tabel ditulis `{table}`).
+    2. Trigger di tabel lama meneruskan INSERT/UPDATE/DELETE ke tabel baru.
+    3. Salin baris per potongan rowid, commit per potongan.
+    4. Transaksi singkat terakhir: tukar tabel, pasang ulang index & trigger.
+    """
+    shadow = f"{table}__new"
+    # Sisa percobaan sebelumnya yang terputus: mulai ulang dari awal
+    _drop_shadow(conn, shadow)
+
+    old_objects = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') "
+        "AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+
+    conn.execute(create_sql.format(table=shadow))
+    columns = [c for c in column_names(conn, shadow) if c in column_names(conn, table)]
+    cols = ", ".join(columns)
+    new_cols = ", ".join(f"NEW.{c}" for c in columns)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {shadow}_ins AFTER INSERT ON {table} BEGIN
+        INSERT OR REPLACE INTO {shadow} (rowid, {cols}) VALUES (NEW.rowid, {new_cols});
+    END""")
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {shadow}_upd AFTER UPDATE ON {table} BEGIN
+        DELETE FROM {shadow} WHERE rowid = OLD.rowid;
+        INSERT OR REPLACE INTO {shadow} (rowid, {cols}) VALUES (NEW.rowid, {new_cols});
+    END""")
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {shadow}_del AFTER DELETE ON {table} BEGIN
+        DELETE FROM {shadow} WHERE rowid = OLD.rowid;
+    END""")
+
+    try:
+        copied = _copy_and_swap(conn, table, shadow, cols, old_objects, chunk)
+    except Exception:
+        # Jangan tinggalkan trigger penerus di tabel yang masih dipakai bot
+        _drop_shadow(conn, shadow)
+        raise
+    return copied
+
+
+def _drop_shadow(conn: sqlite3.Connection, shadow: str):
+    for suffix in ("ins", "upd", "del"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {shadow}_{suffix}")
+    conn.execute(f"DROP TABLE IF EXISTS {shadow}")
+
+
+def _copy_and_swap(conn: sqlite3.Connection, table: str, shadow: str, cols: str, old_objects, chunk: int) -> int:
+    copied = 0
+    last = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            upper = conn.execute(
+                f"SELECT MAX(rowid) FROM (SELECT rowid FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+                (last, chunk)
+            ).fetchone()[0]
+            if upper is None:
+                conn.execute("COMMIT")
+                break
+            # OR IGNORE: baris yang sudah diteruskan trigger lebih baru dari salinan ini
+            cur = conn.execute(
+                f"INSERT OR IGNORE INTO {shadow} (rowid, {cols}) "
+                f"SELECT rowid, {cols} FROM {table} WHERE rowid > ? AND rowid <= ?",
+                (last, upper)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        copied += cur.rowcount
+        last = upper
+
+    # legacy_alter_table: RENAME tidak memvalidasi ulang trigger tabel lain yang
+    # menyebut tabel ini (sesaat setelah DROP tabel tersebut memang belum ada)
+    conn.execute("PRAGMA legacy_alter_table=ON")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # OR IGNORE juga melewati baris yang melanggar constraint baru
+        old_count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        new_count = conn.execute(f"SELECT COUNT(*) FROM {shadow}").fetchone()[0]
+        if old_count != new_count:
+            raise RuntimeError(
+                f"Rebuild {table} dibatalkan: {old_count - new_count} baris tidak bisa disalin "
+                f"(melanggar constraint baru?)"
+            )
+        for suffix in ("ins", "upd", "del"):
+            conn.execute(f"DROP TRIGGER {shadow}_{suffix}")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {shadow} RENAME TO {table}")
+        for obj in old_objects:
+            conn.execute(obj['sql'])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.execute("PRAGMA legacy_alter_table=OFF")
+    return copied
@@ -63,13 +63,11 @@ def check_stuck_transactions():
 async def alert_admin(message: str):
     """Kirim alert ke admin"""
     # Import di sini untuk menghindari circular import
-    from telegram import Bot
-    
-    bot = Bot(token=config.BOT_TOKEN)
+    from dispatcher import dispatcher
     
     for admin_id in config.ADMIN_IDS:
         try:
-            await bot.send_message(admin_id, f"🔔 SECURITY ALERT\n\n{message}")
+            await dispatcher.send_message(admin_id, f"🔔 SECURITY ALERT\n\n{message}")
         except Exception as e:
             print(f"Failed to send alert to admin {admin_id}: {e}")
 
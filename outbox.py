@@ -0,0 +1,234 @@
+"""Outbox transaksional untuk notifikasi setelah perubahan status deal.
+
+Notifikasi ditulis ke tabel outbox di transaksi yang sama dengan perubahan
+status (parameter `notify` di deal_state.apply_transition/transition),
+sehingga tidak hilang jika bot mati atau Telegram gagal setelah commit:
+
+    row = await transition(deal_id, "RELEASE", user_id, "BUYER", notify=lambda row: [
+        Notification(row['seller_id'], "Dana dilepas", {"parse_mode": "HTML"}),
+    ])
+
+`OutboxRelay` mengirim isi outbox lewat dispatcher:
+
+- baris jatuh tempo di-lease (next_attempt_at digeser OUTBOX_LEASE detik)
+  sebelum dikirim, lalu dihapus begitu terkirim;
+- gagal sementara (jaringan, timeout): dicoba lagi dengan backoff
+  eksponensial OUTBOX_RETRY_BASE * 2^percobaan (maks OUTBOX_RETRY_MAX) + jitter;
+- gagal permanen (BadRequest/Forbidden, mis. bot diblokir) atau sudah
+  OUTBOX_MAX_ATTEMPTS kali gagal: menjadi dead letter (`dead_at` terisi),
+  terlihat di /admin_outbox dan bisa dikirim ulang admin.
+
+Pengiriman at-least-once: jika bot mati setelah Telegram menerima pesan tapi
+sebelum barisnya dihapus, pesan dikirim ulang setelah lease habis.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import sqlite3
+from collections import deque
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, ChatMigrated, Forbidden
+
+from db_sqlite import db
+from dispatcher import dispatcher, INTERACTIVE
+from profile_cache import profile_cache
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "2"))
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "600"))
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "120"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "100"))
+# Sampel latensi (commit -> terkirim) untuk stats()
+LATENCY_SAMPLES = 1000
+
+PERMANENT_ERRORS = (BadRequest, Forbidden, ChatMigrated)
+OUTBOX_COLUMNS = "id, chat_id, payload, deal_id, priority, attempts, created_at"
+
+
+class Notification(NamedTuple):
+    """Satu pesan untuk outbox; `options` adalah argumen send_message lainnya"""
+    chat_id: int
+    text: str
+    options: Dict[str, Any] = {}
+
+
+def enqueue(conn: sqlite3.Connection, chat_id: int, text: str, deal_id: str = None,
+            priority: int = INTERACTIVE, **options) -> int:
+    """Tulis notifikasi di transaksi `conn` (tidak commit). Mengembalikan id outbox"""
+    markup = options.get("reply_markup")
+    if isinstance(markup, InlineKeyboardMarkup):
+        options["reply_markup"] = markup.to_dict()
+    now = time.time()
+    return conn.execute(
+        "INSERT INTO outbox (chat_id, payload, deal_id, priority, next_attempt_at, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (chat_id, json.dumps(dict(options, text=text)), deal_id, priority, now, now)
+    ).lastrowid
+
+
+def _lease(conn: sqlite3.Connection, now: float, lease: float, limit: int) -> List[sqlite3.Row]:
+    return conn.execute(
+        f"UPDATE outbox SET next_attempt_at = ? WHERE id IN ("
+        f"SELECT id FROM outbox WHERE dead_at IS NULL AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?"
+        f") RETURNING {OUTBOX_COLUMNS}",
+        (now + lease, now, limit)
+    ).fetchall()
+
+
+def _settle(conn: sqlite3.Connection, delivered: List[tuple], retries: List[tuple], dead: List[tuple]):
+    conn.executemany("DELETE FROM outbox WHERE id = ?", delivered)
+    conn.executemany(
+        "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?", retries
+    )
+    conn.executemany("UPDATE outbox SET attempts = attempts + 1, dead_at = ?, last_error = ? WHERE id = ?", dead)
+
+
+def dead_letters(conn: sqlite3.Connection, limit: int = 10) -> List[sqlite3.Row]:
+    """Dead letter terbaru"""
+    return conn.execute(
+        "SELECT id, chat_id, deal_id, attempts, last_error, dead_at FROM outbox "
+        "WHERE dead_at IS NOT NULL ORDER BY dead_at DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+
+
+def requeue(conn: sqlite3.Connection, outbox_id: int = None) -> int:
+    """Kembalikan dead letter (satu, atau semua jika `outbox_id` None) ke antrean"""
+    sql = "UPDATE outbox SET dead_at = NULL, attempts = 0, next_attempt_at = ? WHERE dead_at IS NOT NULL"
+    params = [time.time()]
+    if outbox_id is not None:
+        sql += " AND id = ?"
+        params.append(outbox_id)
+    return conn.execute(sql, params).rowcount
+
+
+def counts(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """Jumlah pesan tertunda/dead letter dan umur pesan tertunda tertua (detik)"""
+    pending, dead, oldest = conn.execute(
+        "SELECT (SELECT COUNT(*) FROM outbox WHERE dead_at IS NULL), "
+        "(SELECT COUNT(*) FROM outbox WHERE dead_at IS NOT NULL), "
+        "(SELECT MIN(created_at) FROM outbox WHERE dead_at IS NULL)"
+    ).fetchone()
+    return {"pending": pending, "dead": dead, "oldest_pending": time.time() - oldest if oldest else 0.0}
+
+
+class OutboxRelay:
+    """Mengirim isi tabel outbox dengan retry, backoff eksponensial, dan dead letter"""
+
+    def __init__(self, database=db, sender=dispatcher, profiles=profile_cache, max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 retry_base: float = OUTBOX_RETRY_BASE, retry_max: float = OUTBOX_RETRY_MAX,
+                 lease: float = OUTBOX_LEASE, poll: float = OUTBOX_POLL_SECONDS, batch: int = OUTBOX_BATCH):
+        self.db = database
+        self.sender = sender
+        self.profiles = profiles
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease = lease
+        self.poll = poll
+        self.batch = batch
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+        self._latency = deque(maxlen=LATENCY_SAMPLES)
+        self._delivered_at = deque()
+        self._running = False
+        self._wake: Optional[asyncio.Event] = None
+
+    def wake(self):
+        """Kirim segera (panggil setelah transaksi yang menulis outbox commit)"""
+        if self._wake is not None:
+            self._wake.set()
+
+    def stop(self):
+        self._running = False
+        self.wake()
+
+    def backoff(self, attempts: int) -> float:
+        """Jeda sebelum percobaan berikutnya setelah `attempts` kali gagal sebelumnya"""
+        return min(self.retry_max, self.retry_base * 2 ** attempts) * random.uniform(0.8, 1.2)
+
+    async def _deliver(self, row: sqlite3.Row) -> Optional[Exception]:
+        payload = json.loads(row['payload'])
+        if payload.get("reply_markup") is not None:
+            payload["reply_markup"] = InlineKeyboardMarkup.de_json(payload["reply_markup"], None)
+        try:
+            await self.sender.send_message(row['chat_id'], priority=row['priority'], **payload)
+        except Exception as e:
+            return e
+        return None
+
+    async def relay_once(self) -> int:
+        """Kirim satu batch pesan jatuh tempo; mengembalikan jumlah baris yang diproses"""
+        rows = await self.db.transaction(_lease, time.time(), self.lease, self.batch)
+        if not rows:
+            return 0
+        errors = await asyncio.gather(*(self._deliver(row) for row in rows))
+
+        now = time.time()
+        delivered, retries, dead = [], [], []
+        for row, error in zip(rows, errors):
+            if error is None:
+                delivered.append((row['id'],))
+                self._latency.append(now - row['created_at'])
+                self._delivered_at.append(now)
+            elif isinstance(error, PERMANENT_ERRORS) or row['attempts'] + 1 >= self.max_attempts:
+                if isinstance(error, Forbidden):
+                    self.profiles.mark_unreachable(row['chat_id'])
+                dead.append((now, str(error)[:500], row['id']))
+                logger.warning(f"Outbox {row['id']} (deal {row['deal_id']}) gagal permanen: {error}")
+            else:
+                retries.append((now + self.backoff(row['attempts']), str(error)[:500], row['id']))
+        await self.db.transaction(_settle, delivered, retries, dead)
+        self.delivered += len(delivered)
+        self.retried += len(retries)
+        self.dead += len(dead)
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        """Metrik relay sejak start: terkirim/retry/dead letter, throughput 60 detik terakhir, latensi"""
+        now = time.time()
+        while self._delivered_at and now - self._delivered_at[0] > 60:
+            self._delivered_at.popleft()
+        ordered = sorted(self._latency)
+        return {
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "dead": self.dead,
+            "per_minute": len(self._delivered_at),
+            "latency_p50": ordered[len(ordered) // 2] if ordered else 0.0,
+            "latency_p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] if ordered else 0.0,
+        }
+
+    async def run(self):
+        """Loop utama; jalankan sebagai background task"""
+        self._wake = asyncio.Event()
+        self._running = True
+        while self._running:
+            try:
+                self._wake.clear()
+                if await self.relay_once() >= self.batch:
+                    continue
+                # Tidur sampai retry terdekat; pesan baru membangunkan lewat wake()
+                row = await self.db.fetchone("SELECT MIN(next_attempt_at) FROM outbox WHERE dead_at IS NULL")
+                timeout = self.poll
+                if row[0] is not None:
+                    timeout = min(timeout, max(row[0] - time.time(), 0))
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except Exception as e:
+                logger.error(f"Error in outbox relay: {e}")
+                await asyncio.sleep(5)
+
+
+outbox = OutboxRelay()
@@ -0,0 +1,203 @@
+"""Persistence PTB di SQLite untuk ConversationHandler dan context.user_data.
+
+State percakapan (buat transaksi, pencairan, mediasi, rating, testimoni)
+dan user_data disimpan di tabel `conversation_state` / `user_state`
+(migrasi 0010), sehingga form yang setengah jalan tidak hilang saat restart.
+
+- Perubahan dikumpulkan per interval PERSISTENCE_FLUSH_SECONDS (PTB hanya
+  menandai user/percakapan yang berubah) lalu ditulis lewat writer dalam
+  transaksi berisi PERSISTENCE_FLUSH_BATCH baris; user yang berubah
+  berkali-kali dalam satu interval hanya ditulis sekali.
+- user_data dimuat per user saat update pertamanya masuk (refresh_user_data),
+  bukan semuanya saat start.
+- user_data yang menganggur lebih dari CONVERSATION_TIMEOUT detik dilepas
+  dari memori (dimuat lagi saat user kembali), percakapan yang menganggur
+  selama itu tidak dipulihkan saat start dan dihapus dari tabel.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from db_sqlite import db
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_FLUSH_SECONDS = float(os.getenv("PERSISTENCE_FLUSH_SECONDS", "5"))
+CONVERSATION_TIMEOUT = float(os.getenv("CONVERSATION_TIMEOUT", "3600"))
+# Baris per transaksi saat flush, supaya writer tidak tertahan lama oleh flush besar
+PERSISTENCE_FLUSH_BATCH = int(os.getenv("PERSISTENCE_FLUSH_BATCH", "5000"))
+# Baris menganggur dihapus paling sering sekali per interval ini
+PRUNE_INTERVAL = 600
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _write_state(conn: sqlite3.Connection, users: Dict[int, Optional[str]],
+                 conversations: Dict[Tuple[str, str], Optional[str]], now: float):
+    # user_data / state kosong (None) berarti hapus baris
+    conn.executemany(
+        "INSERT INTO user_state (user_id, data, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+        [(user_id, data, now) for user_id, data in users.items() if data is not None]
+    )
+    conn.executemany("DELETE FROM user_state WHERE user_id = ?",
+                     [(user_id,) for user_id, data in users.items() if data is None])
+    conn.executemany(
+        "INSERT INTO conversation_state (name, key, state, updated_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (name, key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+        [(name, key, state, now) for (name, key), state in conversations.items() if state is not None]
+    )
+    conn.executemany("DELETE FROM conversation_state WHERE name = ? AND key = ?",
+                     [key for key, state in conversations.items() if state is None])
+
+
+def _prune(conn: sqlite3.Connection, before: float) -> int:
+    return conn.execute("DELETE FROM conversation_state WHERE updated_at < ?", (before,)).rowcount
+
+
+def _load_user(conn: sqlite3.Connection, user_id: int) -> Optional[str]:
+    row = conn.execute("SELECT data FROM user_state WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+def _load_conversations(conn: sqlite3.Connection, name: str, since: float):
+    return conn.execute(
+        "SELECT key, state FROM conversation_state WHERE name = ? AND updated_at >= ?", (name, since)
+    ).fetchall()
+
+
+class SQLitePersistence(BasePersistence):
+    """Persistence conversation + user_data dengan write coalescing dan lazy loading per user"""
+
+    def __init__(self, database=db, update_interval: float = PERSISTENCE_FLUSH_SECONDS,
+                 idle_timeout: float = CONVERSATION_TIMEOUT):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db = database
+        self.idle_timeout = idle_timeout
+        self.flushes = 0
+        self.rows_written = 0
+        self.evicted = 0
+        self._users: Dict[int, Optional[str]] = {}
+        self._conversations: Dict[Tuple[str, str], Optional[str]] = {}
+        # user_data yang sudah dimuat: user_id -> (dict milik Application, terakhir dipakai)
+        self._loaded: Dict[int, Tuple[dict, float]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._prune_at = 0.0
+
+    # === user_data ===
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        # Dimuat per user lewat refresh_user_data
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        loaded = self._loaded.get(user_id)
+        if loaded is None and not user_data:
+            data = await self.db.run(_load_user, user_id)
+            if data is not None:
+                user_data.update(json.loads(data))
+        self._loaded[user_id] = (user_data, time.time())
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._users[user_id] = _dumps(data) if data else None
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._users[user_id] = None
+        self._loaded.pop(user_id, None)
+        self._schedule_flush()
+
+    # === ConversationHandler ===
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        rows = await self.db.run(_load_conversations, name, time.time() - self.idle_timeout)
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        self._conversations[(name, _dumps(list(key)))] = None if new_state is None else _dumps(new_state)
+        self._schedule_flush()
+
+    # === Tidak dipakai bot ini (store_data False) ===
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        pass
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    # === Penulisan ===
+    def _schedule_flush(self):
+        # PTB memanggil update_* untuk semua yang berubah sekaligus; tulis sekali setelahnya
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self):
+        # Perubahan yang masuk selama menulis ikut ditulis di putaran berikutnya
+        while self._users or self._conversations:
+            users, self._users = self._users, {}
+            conversations, self._conversations = self._conversations, {}
+            user_items, conversation_items = list(users.items()), list(conversations.items())
+            try:
+                for i in range(0, max(len(user_items), len(conversation_items)), PERSISTENCE_FLUSH_BATCH):
+                    await self.db.transaction(
+                        _write_state, dict(user_items[i:i + PERSISTENCE_FLUSH_BATCH]),
+                        dict(conversation_items[i:i + PERSISTENCE_FLUSH_BATCH]), time.time()
+                    )
+            except Exception as e:
+                logger.error(f"Error flushing persistence: {e}")
+                # Kembalikan supaya ditulis di flush berikutnya (perubahan baru tetap menang)
+                self._users = {**users, **self._users}
+                self._conversations = {**conversations, **self._conversations}
+                return
+            self.flushes += 1
+            self.rows_written += len(users) + len(conversations)
+        now = time.time()
+        self._evict_idle(now)
+        if now >= self._prune_at:
+            self._prune_at = now + PRUNE_INTERVAL
+            pruned = await self.db.transaction(_prune, now - self.idle_timeout)
+            if pruned:
+                logger.info(f"{pruned} percakapan menganggur dihapus dari persistence")
+
+    def _evict_idle(self, now: float):
+        for user_id, (user_data, used_at) in list(self._loaded.items()):
+            if now - used_at > self.idle_timeout and user_id not in self._users:
+                # Sudah tersimpan; dimuat lagi oleh refresh_user_data saat user kembali
+                user_data.clear()
+                del self._loaded[user_id]
+                self.evicted += 1
+
+    async def flush(self) -> None:
+        """Dipanggil PTB saat shutdown"""
+        if self._flush_task is not None:
+            await asyncio.shield(self._flush_task)
+        await self._flush()
@@ -0,0 +1,180 @@
+"""Cache profil user (username, nama, keterjangkauan) untuk Rekber Bot.
+
+Menggantikan `bot.get_chat` di jalur panas:
+
+    name = await profile_cache.display_name(seller_id, context.bot)
+    if await profile_cache.is_reachable(buyer_id, context.bot): ...
+
+- Diisi pasif dari setiap update yang masuk (`observe_update`, dipasang
+  sebagai TypeHandler group -1 di main.py) dan disimpan di tabel users
+  lewat activity_tracker (kolom yang berubah saja, ditulis berkala), yang
+  sekaligus mencatat last_activity.
+- Profil yang lebih tua dari PROFILE_TTL detik di-refresh lewat get_chat;
+  permintaan bersamaan untuk user yang sama hanya memicu satu get_chat
+  (single-flight). Jika Telegram gagal, data lama tetap dipakai.
+- Bot yang diblokir / chat yang tidak ada dicatat sebagai tidak terjangkau
+  (reachable = 0) sampai user berinteraksi lagi dengan bot.
+"""
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+from telegram.error import BadRequest, Forbidden
+
+from db_sqlite import db
+from activity import activity_tracker, activity_timestamp
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TTL = float(os.getenv("PROFILE_TTL", "86400"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "50000"))
+
+PROFILE_COLUMNS = "user_id, username, first_name, last_name, reachable, profile_updated_at"
+
+
+class Profile(NamedTuple):
+    id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    reachable: Optional[bool]
+    updated_at: float
+
+
+def display_name(user, user_id: int = None) -> str:
+    """"@username", nama depan, atau "User <id>" dari telegram.User/Chat atau Profile"""
+    if user is not None and user.username:
+        return "@" + user.username
+    if user is not None and user.first_name:
+        return user.first_name
+    return f"User {user_id if user is None else user.id}"
+
+
+def _changed_columns(profile: Profile, previous: Optional[Profile]) -> Dict[str, object]:
+    # Kolom users yang berbeda dari profil sebelumnya (semua jika belum dikenal)
+    columns = {"profile_updated_at": profile.updated_at}
+    for index, column in ((1, "username"), (2, "first_name"), (3, "last_name"), (4, "reachable")):
+        if previous is None or profile[index] != previous[index]:
+            value = profile[index]
+            columns[column] = int(value) if column == "reachable" and value is not None else value
+    return columns
+
+
+def _load(conn: sqlite3.Connection, user_id: int) -> Optional[Profile]:
+    row = conn.execute(f"SELECT {PROFILE_COLUMNS} FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if row is None or row['profile_updated_at'] is None:
+        return None
+    return Profile(row['user_id'], row['username'] or None, row['first_name'] or None, row['last_name'] or None,
+                   None if row['reachable'] is None else bool(row['reachable']), row['profile_updated_at'])
+
+
+class ProfileCache:
+    """LRU profil di memori di atas tabel users, dengan refresh TTL dan single-flight get_chat"""
+
+    def __init__(self, database=db, ttl: float = PROFILE_TTL, max_entries: int = PROFILE_CACHE_SIZE,
+                 tracker=activity_tracker):
+        self.db = database
+        self.tracker = tracker
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.lookups = 0
+        self._profiles: "OrderedDict[int, Profile]" = OrderedDict()
+        self._inflight: Dict[int, asyncio.Future] = {}
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def _remember(self, profile: Profile):
+        self._profiles[profile.id] = profile
+        self._profiles.move_to_end(profile.id)
+        while len(self._profiles) > self.max_entries:
+            self._profiles.popitem(last=False)
+
+    def _save(self, profile: Profile, previous: Optional[Profile] = None, touch: bool = False):
+        self._remember(profile)
+        columns = _changed_columns(profile, previous)
+        if touch:
+            columns["last_activity"] = activity_timestamp(profile.updated_at)
+        self.tracker.record(profile.id, **columns)
+
+    def observe(self, user, private_chat: bool = False):
+        """Catat profil dari update masuk; chat pribadi dengan bot berarti user bisa dihubungi"""
+        if user is None or user.is_bot:
+            return
+        now = time.time()
+        cached = self._profiles.get(user.id)
+        reachable = True if private_chat else (cached.reachable if cached else None)
+        profile = Profile(user.id, user.username, user.first_name, user.last_name, reachable, now)
+        # Hanya dicatat di memori; tracker menulis sekali per user per interval flush
+        self._save(profile, cached, touch=True)
+
+    def mark_unreachable(self, user_id: int):
+        """Dipanggil saat Telegram menolak kirim (mis. bot diblokir)"""
+        cached = self._profiles.get(user_id)
+        if cached is not None and cached.reachable is False:
+            return
+        now = time.time()
+        if cached is not None:
+            self._save(cached._replace(reachable=False, updated_at=now), cached)
+            return
+        # Nama belum diketahui: jangan timpa yang tersimpan
+        self._remember(Profile(user_id, None, None, None, False, now))
+        self.tracker.record(user_id, reachable=0, profile_updated_at=now)
+
+    async def get(self, user_id: int, bot=None) -> Optional[Profile]:
+        """Profil user; di-refresh lewat get_chat (jika `bot` diberikan) saat lebih tua dari TTL"""
+        self.lookups += 1
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            profile = await self.db.run(_load, user_id)
+            if profile is not None:
+                self._remember(profile)
+        if profile is not None and time.time() - profile.updated_at < self.ttl:
+            self.hits += 1
+            self._profiles.move_to_end(user_id)
+            return profile
+        if bot is None:
+            return profile
+
+        future = self._inflight.get(user_id)
+        if future is None:
+            future = self._inflight[user_id] = asyncio.ensure_future(self._fetch(user_id, bot, profile))
+            future.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await asyncio.shield(future)
+
+    async def _fetch(self, user_id: int, bot, stale: Optional[Profile]) -> Optional[Profile]:
+        try:
+            chat = await bot.get_chat(user_id)
+        except (Forbidden, BadRequest) as e:
+            logger.info(f"Chat {user_id} tidak terjangkau: {e}")
+            profile = Profile(user_id, *(stale[1:4] if stale else (None, None, None)), False, time.time())
+        except Exception as e:
+            # Gangguan jaringan: pakai data lama, coba refresh lagi di lookup berikutnya
+            logger.warning(f"get_chat {user_id} gagal: {e}")
+            return stale
+        else:
+            profile = Profile(user_id, chat.username, chat.first_name, chat.last_name, True, time.time())
+        self._save(profile, stale)
+        return profile
+
+    async def display_name(self, user_id: int, bot=None) -> str:
+        return display_name(await self.get(user_id, bot), user_id)
+
+    async def is_reachable(self, user_id: int, bot=None) -> bool:
+        """False hanya jika Telegram sudah menolak chat ini; belum diketahui dianggap terjangkau"""
+        profile = await self.get(user_id, bot)
+        return profile is None or profile.reachable is not False
+
+
+profile_cache = ProfileCache()
+
+
+async def observe_update(update, context):
+    """TypeHandler: isi cache dari setiap update yang masuk"""
+    chat = update.effective_chat
+    profile_cache.observe(update.effective_user, private_chat=chat is not None and chat.type == "private")
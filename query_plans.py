@@ -0,0 +1,115 @@
+"""Cek regresi query plan untuk semua query di handlers/.
+
+Pemakaian:
+    python query_plans.py            # hanya tampilkan query yang bermasalah
+    python query_plans.py -v         # tampilkan plan semua query
+
+Query diambil langsung dari source handlers/ (argumen string pertama pada
+pemanggilan seperti `db.fetchall("SELECT ...")` atau `cur.execute(...)`,
+termasuk `user_deals_query(...)`), lalu dijalankan `EXPLAIN QUERY PLAN` pada
+database sementara dengan schema hasil migrasi. Gagal (exit code 1) jika ada
+query yang melakukan full scan tabel, memakai temp B-tree untuk sort/group,
+atau tidak valid di SQLite.
+"""
+import os
+import re
+import ast
+import sys
+import glob
+import sqlite3
+import tempfile
+
+import migrations
+from db_sqlite import user_deals_query
+
+HANDLERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "handlers")
+
+SQL_START = re.compile(r"^\s*(SELECT|WITH|UPDATE|DELETE|INSERT)\b", re.IGNORECASE)
+# SCAN atas subquery/co-routine bukan scan tabel
+FULL_SCAN = re.compile(r"^SCAN (?!\(subquery|CONSTANT ROW)")
+
+# (file, fungsi) yang memang membaca seluruh tabel, beserta alasannya
+ALLOWED = {}
+
+QUERY_BUILDERS = {"user_deals_query": user_deals_query}
+
+
+def _builder_sql(node: ast.Call):
+    name = node.func.id if isinstance(node.func, ast.Name) else getattr(node.func, "attr", None)
+    builder = QUERY_BUILDERS.get(name)
+    if builder is None:
+        return None
+    try:
+        args = [ast.literal_eval(arg) for arg in node.args]
+        kwargs = {kw.arg: ast.literal_eval(kw.value) for kw in node.keywords}
+    except ValueError:
+        return None
+    return builder(*args, **kwargs)
+
+
+def collect_queries(directory: str = HANDLERS_DIR):
+    """Daftar (file, baris, fungsi, sql) dari semua modul handler"""
+    queries = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        tree = ast.parse(open(path, encoding="utf-8").read())
+        for func in ast.walk(tree):
+            if not isinstance(func, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            for node in ast.walk(func):
+                if not (isinstance(node, ast.Call) and node.args):
+                    continue
+                first = node.args[0]
+                sql = None
+                if isinstance(first, ast.Constant) and isinstance(first.value, str):
+                    sql = first.value
+                elif isinstance(first, ast.Call):
+                    sql = _builder_sql(first)
+                if sql and SQL_START.match(sql):
+                    queries.append((os.path.basename(path), node.lineno, func.name, sql))
+    # Fungsi bersarang ikut terbaca dua kali lewat fungsi induknya
+    return sorted(set(queries))
+
+
+def explain(conn: sqlite3.Connection, sql: str):
+    params = [None] * sql.count("?")
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def problems(plan):
+    return [step for step in plan if FULL_SCAN.match(step) or "TEMP B-TREE" in step]
+
+
+def check(verbose: bool = False) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "plan.db")
+        migrations.migrate(path)
+        conn = sqlite3.connect(path)
+        failures = 0
+        try:
+            for filename, lineno, function, sql in collect_queries():
+                where = f"{filename}:{lineno} {function}"
+                try:
+                    plan = explain(conn, sql)
+                    bad = problems(plan)
+                except sqlite3.Error as e:
+                    plan, bad = [], [f"tidak valid di SQLite: {e}"]
+
+                allowed = ALLOWED.get((filename, function))
+                if bad and not allowed:
+                    failures += 1
+                    print(f"❌ {where}\n   {' '.join(sql.split())[:160]}")
+                    for step in bad:
+                        print(f"   -> {step}")
+                elif verbose:
+                    note = f" (diizinkan: {allowed})" if bad else ""
+                    print(f"✅ {where}{note}")
+                    for step in plan:
+                        print(f"   {step}")
+        finally:
+            conn.close()
+    print("Semua query plan OK ✅" if not failures else f"{failures} query bermasalah ❌")
+    return not failures
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check(verbose="-v" in sys.argv[1:]) else 1)
@@ -0,0 +1,223 @@
+"""Rate limiter token bucket per (user, aksi) untuk Rekber Bot.
+
+Semua pengecekan berjalan di memori (tanpa query database). Policy bisa
+diatur per aksi lewat `RATE_LIMIT_POLICIES`, contoh:
+
+    RATE_LIMIT_POLICIES="default=1/30,rekber_create=5/3600"
+
+artinya kapasitas 1 token yang terisi penuh dalam 30 detik untuk aksi
+default, dan 5 token per jam untuk `rekber_create`.
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_MAX_ENTRIES = int(os.getenv("RATE_LIMIT_MAX_ENTRIES", "100000"))
+# 0 = snapshot ke SQLite dimatikan
+RATE_LIMIT_SNAPSHOT_SECONDS = float(os.getenv("RATE_LIMIT_SNAPSHOT_SECONDS", "0"))
+
+
+class RatePolicy(NamedTuple):
+    """`capacity` token, terisi penuh kembali dalam `per_seconds` detik"""
+    capacity: float
+    per_seconds: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.per_seconds
+
+
+DEFAULT_POLICIES: Dict[str, RatePolicy] = {
+    "default": RatePolicy(capacity=1, per_seconds=30),
+}
+
+
+def parse_policies(spec: str) -> Dict[str, RatePolicy]:
+    """Parse format `aksi=kapasitas/detik,...`"""
+    policies = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            action, limit = item.split("=", 1)
+            capacity, seconds = limit.split("/", 1)
+            policies[action.strip()] = RatePolicy(float(capacity), float(seconds))
+        except ValueError:
+            logger.warning(f"Policy rate limit tidak valid diabaikan: {item}")
+    return policies
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, policy: RatePolicy, now: float, tokens: Optional[float] = None):
+        self.capacity = policy.capacity
+        self.rate = policy.rate
+        self.tokens = policy.capacity if tokens is None else tokens
+        self.updated = now
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def consume(self, now: float, cost: float = 1.0) -> bool:
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+    def retry_after(self, now: float, cost: float = 1.0) -> float:
+        """Detik sampai `cost` token tersedia"""
+        self._refill(now)
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """Token bucket per (user_id, aksi) dengan memori terbatas.
+
+    Bucket disimpan dalam urutan LRU. Bucket yang idle lebih lama dari waktu
+    isi penuhnya dibuang (setara dengan bucket baru), dan jumlah bucket
+    dibatasi `max_entries`.
+    """
+
+    def __init__(self, policies: Optional[Dict[str, RatePolicy]] = None,
+                 max_entries: int = RATE_LIMIT_MAX_ENTRIES):
+        self.policies = dict(DEFAULT_POLICIES)
+        self.policies.update(policies or {})
+        self.max_entries = max_entries
+        self._buckets: "OrderedDict[tuple, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._snapshot_thread = None
+
+    def policy_for(self, action: str) -> RatePolicy:
+        return self.policies.get(action, self.policies["default"])
+
+    def set_policy(self, action: str, policy: RatePolicy):
+        """Ganti policy aksi; bucket lama dibuang agar policy baru langsung berlaku"""
+        with self._lock:
+            self.policies[action] = policy
+            for key in [key for key in self._buckets if key[1] == action]:
+                del self._buckets[key]
+
+    def _bucket(self, user_id: int, action: str, now: float, policy: Optional[RatePolicy]) -> TokenBucket:
+        key = (user_id, action)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(policy or self.policy_for(action), now)
+            self._evict(now)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self, now: float):
+        while len(self._buckets) > self.max_entries:
+            self._buckets.popitem(last=False)
+        # Bucket terlama yang sudah terisi penuh tidak membawa informasi
+        while self._buckets:
+            bucket = next(iter(self._buckets.values()))
+            if now - bucket.updated < bucket.capacity / bucket.rate:
+                break
+            self._buckets.popitem(last=False)
+
+    def check(self, user_id: int, action: str = "default", cost: float = 1.0,
+              policy: Optional[RatePolicy] = None) -> bool:
+        """Ambil `cost` token; False jika user harus menunggu.
+
+        `policy` dipakai sebagai fallback untuk aksi yang tidak punya policy
+        sendiri di `self.policies`.
+        """
+        if action in self.policies:
+            policy = None
+        now = time.monotonic()
+        with self._lock:
+            return self._bucket(user_id, action, now, policy).consume(now, cost)
+
+    def retry_after(self, user_id: int, action: str = "default", cost: float = 1.0) -> float:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get((user_id, action))
+            return bucket.retry_after(now, cost) if bucket else 0.0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    # --- Snapshot ke SQLite ---
+
+    def snapshot(self):
+        """Simpan bucket yang belum penuh ke tabel rate_limit_buckets"""
+        from db_sqlite import writer
+
+        now, wall = time.monotonic(), time.time()
+        with self._lock:
+            rows = [
+                (user_id, action, bucket.tokens, bucket.capacity, bucket.rate, wall - (now - bucket.updated))
+                for (user_id, action), bucket in self._buckets.items()
+                if not bucket.is_full(now)
+            ]
+
+        def _save(conn):
+            conn.execute("DELETE FROM rate_limit_buckets")
+            conn.executemany(
+                "INSERT INTO rate_limit_buckets (user_id, action, tokens, capacity, rate, updated_at) "
+                "VALUES (?,?,?,?,?,?)",
+                rows
+            )
+        writer.run(_save)
+        return len(rows)
+
+    def restore(self):
+        """Muat bucket dari snapshot terakhir (dipanggil saat startup)"""
+        from db_sqlite import get_connection
+
+        conn = get_connection()
+        if not conn:
+            return 0
+        try:
+            rows = conn.execute(
+                "SELECT user_id, action, tokens, capacity, rate, updated_at FROM rate_limit_buckets"
+            ).fetchall()
+        finally:
+            conn.close()
+
+        now, wall = time.monotonic(), time.time()
+        with self._lock:
+            for row in rows:
+                updated = now - max(0.0, wall - row['updated_at'])
+                policy = RatePolicy(row['capacity'], row['capacity'] / row['rate'])
+                self._buckets[(row['user_id'], row['action'])] = TokenBucket(policy, updated, tokens=row['tokens'])
+            self._evict(now)
+        return len(rows)
+
+    def start_snapshots(self, interval: float = RATE_LIMIT_SNAPSHOT_SECONDS):
+        """Restore snapshot lalu simpan ulang setiap `interval` detik dan saat shutdown"""
+        if interval <= 0 or self._snapshot_thread is not None:
+            return
+        try:
+            logger.info(f"Rate limiter: {self.restore()} bucket dipulihkan dari snapshot")
+        except Exception as e:
+            logger.error(f"Gagal memulihkan snapshot rate limiter: {e}")
+
+        def _loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.snapshot()
+                except Exception as e:
+                    logger.error(f"Gagal menyimpan snapshot rate limiter: {e}")
+
+        self._snapshot_thread = threading.Thread(target=_loop, name="rate-limit-snapshot", daemon=True)
+        self._snapshot_thread.start()
+        atexit.register(self.snapshot)
+
+
+limiter = RateLimiter(parse_policies(os.getenv("RATE_LIMIT_POLICIES", "")))
@@ -0,0 +1,215 @@
+"""Scheduler job persisten untuk Rekber Bot (tabel scheduled_jobs).
+
+Menggantikan reminder berbasis `asyncio.sleep` yang hilang saat restart.
+Job disimpan di SQLite dengan waktu jatuh tempo `due_at` (epoch detik);
+hanya job yang jatuh tempo dalam `SCHEDULER_HORIZON` detik ke depan yang
+dimuat ke heap di memori, maksimal `SCHEDULER_MAX_LOADED` job. Memori per
+proses tetap konstan berapa pun jumlah job yang terjadwal.
+
+    add_job(conn, "payment_reminder", time.time() + 7200,
+            key=f"payment_reminder:{deal_id}:7200", deal_id=deal_id,
+            deal_status="PENDING_FUNDING", payload={"hours": 2})
+
+- `key` unik: menjadwalkan key yang sama dua kali tidak membuat job kedua.
+- Job dengan `deal_status` dihapus trigger (migrasi 0006) begitu status deal
+  berubah, di transaksi yang sama dengan perubahan status.
+- Saat jatuh tempo, job di-klaim dengan DELETE ... RETURNING lalu handler
+  untuk `kind`-nya dipanggil, paling banyak sekali.
+- Job yang terlewat saat bot mati dijalankan begitu bot hidup kembali
+  (urut `due_at`), kecuali terlambat lebih dari `SCHEDULER_MAX_LATENESS`.
+"""
+import os
+import json
+import time
+import heapq
+import asyncio
+import logging
+import sqlite3
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from db_sqlite import db
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_HORIZON = float(os.getenv("SCHEDULER_HORIZON", "60"))
+SCHEDULER_MAX_LOADED = int(os.getenv("SCHEDULER_MAX_LOADED", "10000"))
+# 0 = job yang terlambat berapa lama pun tetap dijalankan
+SCHEDULER_MAX_LATENESS = float(os.getenv("SCHEDULER_MAX_LATENESS", "21600"))
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "20"))
+# Jumlah job yang di-klaim per transaksi
+CLAIM_BATCH = 200
+
+JOB_COLUMNS = "id, kind, key, due_at, deal_id, deal_status, payload"
+
+
+def add_job(conn: sqlite3.Connection, kind: str, due_at: float, key: str = None, deal_id: str = None,
+            deal_status: str = None, payload: Any = None) -> Optional[int]:
+    """Simpan job di transaksi `conn`. Mengembalikan id, atau None jika `key` sudah terjadwal"""
+    row = conn.execute(
+        "INSERT INTO scheduled_jobs (kind, key, due_at, deal_id, deal_status, payload, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO NOTHING RETURNING id",
+        (kind, key, due_at, deal_id, deal_status,
+         json.dumps(payload) if payload is not None else None, time.time())
+    ).fetchone()
+    return row[0] if row else None
+
+
+def cancel_jobs(conn: sqlite3.Connection, key: str = None, deal_id: str = None) -> int:
+    """Hapus job berdasarkan key atau semua job milik satu deal"""
+    if key is not None:
+        return conn.execute("DELETE FROM scheduled_jobs WHERE key = ?", (key,)).rowcount
+    return conn.execute("DELETE FROM scheduled_jobs WHERE deal_id = ?", (deal_id,)).rowcount
+
+
+def _claim(conn: sqlite3.Connection, job_ids: List[int]) -> List[sqlite3.Row]:
+    # Job yang sudah dibatalkan tidak ikut terhapus, jadi tidak dijalankan
+    return conn.execute(
+        f"DELETE FROM scheduled_jobs WHERE id IN ({', '.join('?' * len(job_ids))}) RETURNING {JOB_COLUMNS}",
+        job_ids
+    ).fetchall()
+
+
+class Scheduler:
+    """Menjalankan job scheduled_jobs tepat waktu dengan heap berukuran terbatas.
+
+    Heap berisi (due_at, id) untuk job terdekat saja; detail job baru dibaca
+    saat di-klaim. Heap diisi ulang dari index `due_at` setiap setengah
+    horizon, atau lebih cepat saat masih ada antrean job terlambat.
+    """
+
+    def __init__(self, database=db, horizon: float = SCHEDULER_HORIZON, max_loaded: int = SCHEDULER_MAX_LOADED,
+                 max_lateness: float = SCHEDULER_MAX_LATENESS, concurrency: int = SCHEDULER_CONCURRENCY):
+        self.db = database
+        self.horizon = horizon
+        self.max_loaded = max_loaded
+        self.max_lateness = max_lateness
+        self.concurrency = concurrency
+        self.handlers: Dict[str, Callable[[dict], Awaitable[Any]]] = {}
+        self.fired = 0
+        self.skipped = 0
+        self._heap = []
+        self._loaded = set()
+        self._backlog = False
+        self._refill_at = 0.0
+        self._running = False
+        self._wake: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def register(self, kind: str, handler: Callable[[dict], Awaitable[Any]]):
+        """Daftarkan coroutine handler(job) untuk jenis job `kind`"""
+        self.handlers[kind] = handler
+
+    def __len__(self):
+        return len(self._heap)
+
+    async def schedule(self, kind: str, due_at: float, **kwargs) -> Optional[int]:
+        """Simpan job lalu langsung muat ke heap jika jatuh tempo dalam horizon"""
+        job_id = await self.db.transaction(lambda conn: add_job(conn, kind, due_at, **kwargs))
+        if job_id is not None:
+            self._push(job_id, due_at)
+        return job_id
+
+    async def cancel(self, key: str = None, deal_id: str = None) -> int:
+        return await self.db.transaction(cancel_jobs, key, deal_id)
+
+    def wake(self):
+        """Paksa isi ulang heap (mis. setelah add_job dengan jeda pendek di transaksi lain)"""
+        self._refill_at = 0.0
+        if self._wake is not None:
+            self._wake.set()
+
+    def stop(self):
+        self._running = False
+        if self._wake is not None:
+            self._wake.set()
+
+    def _push(self, job_id: int, due_at: float):
+        # Di luar horizon atau heap penuh: diambil oleh refill berikutnya
+        if job_id in self._loaded or due_at > time.time() + self.horizon or len(self._heap) >= self.max_loaded:
+            return
+        heapq.heappush(self._heap, (due_at, job_id))
+        self._loaded.add(job_id)
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _refill(self):
+        now = time.time()
+        rows = await self.db.fetchall(
+            "SELECT id, due_at FROM scheduled_jobs WHERE due_at <= ? ORDER BY due_at LIMIT ?",
+            (now + self.horizon, self.max_loaded)
+        )
+        for job_id, due_at in rows:
+            if len(self._heap) >= self.max_loaded:
+                break
+            if job_id not in self._loaded:
+                heapq.heappush(self._heap, (due_at, job_id))
+                self._loaded.add(job_id)
+        self._backlog = len(rows) >= self.max_loaded
+        self._refill_at = now + self.horizon / 2
+
+    async def _fire(self, job_ids: List[int]):
+        rows = await self.db.transaction(_claim, job_ids)
+        now = time.time()
+        stale = 0
+        for row in rows:
+            if self.max_lateness and now - row['due_at'] > self.max_lateness:
+                stale += 1
+                continue
+            handler = self.handlers.get(row['kind'])
+            if handler is None:
+                self.skipped += 1
+                logger.warning(f"Tidak ada handler untuk job {row['kind']} ({row['key']})")
+                continue
+            job = dict(row)
+            job['payload'] = json.loads(job['payload']) if job['payload'] else None
+            # Batasi job yang berjalan bersamaan (backpressure saat catch-up)
+            await self._slots.acquire()
+            asyncio.create_task(self._run_job(handler, job))
+        if stale:
+            self.skipped += stale
+            logger.warning(f"{stale} job dilewati karena terlambat lebih dari {self.max_lateness:.0f} detik")
+
+    async def _run_job(self, handler, job: dict):
+        try:
+            await handler(job)
+            self.fired += 1
+        except Exception as e:
+            logger.error(f"Error in scheduled job {job['kind']} ({job['key']}): {e}")
+        finally:
+            self._slots.release()
+
+    async def run(self):
+        """Loop utama; jalankan sebagai background task"""
+        self._wake = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._running = True
+        while self._running:
+            try:
+                now = time.time()
+                if now >= self._refill_at or (self._backlog and len(self._heap) < self.max_loaded // 2):
+                    await self._refill()
+                    now = time.time()
+
+                due = []
+                while self._heap and self._heap[0][0] <= now and len(due) < CLAIM_BATCH:
+                    _, job_id = heapq.heappop(self._heap)
+                    self._loaded.discard(job_id)
+                    due.append(job_id)
+                if due:
+                    await self._fire(due)
+                    continue
+
+                timeout = self._refill_at - now
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - now)
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+            except Exception as e:
+                logger.error(f"Error in scheduler loop: {e}")
+                await asyncio.sleep(5)
+
+
+scheduler = Scheduler()
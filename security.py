@@ -2,33 +2,37 @@
 import hashlib
 import secrets
 import time
+import logging
 from functools import wraps
 from telegram import Update
 from telegram.ext import ContextTypes
 import config
 
-# Rate limiting storage
-user_last_action = {}
-RATE_LIMIT_SECONDS = 30
+from rate_limiter import limiter
 
-def rate_limit(func):
-    """Decorator untuk rate limiting"""
-    @wraps(func)
-    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
-        user_id = update.effective_user.id
-        current_time = time.time()
-        
-        if user_id in user_last_action:
-            if current_time - user_last_action[user_id] < RATE_LIMIT_SECONDS:
+logger = logging.getLogger(__name__)
+
+def rate_limit(func=None, *, action: str = None):
+    """Decorator untuk rate limiting (token bucket per user + aksi).
+
+    Bisa dipakai sebagai `@rate_limit` (aksi = nama handler) atau
+    `@rate_limit(action="rekber_create")`.
+    """
+    def decorator(func):
+        name = action or func.__name__
+
+        @wraps(func)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+            user_id = update.effective_user.id
+            if not limiter.check(user_id, name):
                 if update.message:
                     await update.message.reply_text("⚠️ Mohon tunggu sebelum melakukan aksi berikutnya.")
                 elif update.callback_query:
                     await update.callback_query.answer("⚠️ Mohon tunggu sebelum melakukan aksi berikutnya.", show_alert=True)
                 return
-        
-        user_last_action[user_id] = current_time
-        return await func(update, context, *args, **kwargs)
-    return wrapper
+            return await func(update, context, *args, **kwargs)
+        return wrapper
+    return decorator(func) if func else decorator
 
 def validate_amount(amount_str: str) -> tuple[bool, int]:
     """Validasi amount dengan keamanan ekstra"""
@@ -109,36 +113,27 @@ def generate_secure_deal_id() -> str:
     random_part = secrets.token_hex(4).upper()
     return f"RB-{timestamp}-{random_part}"
 
+def _security_log_done(future):
+    error = future.exception()
+    if error:
+        logger.error(f"Gagal mencatat security event: {error}")
+
 def log_security_event(event_type: str, user_id: int, details: str):
-    """Log security events untuk monitoring"""
-    from db_sqlite import get_connection
-    conn = get_connection()
-    cur = conn.cursor()
-    
+    """Log security events untuk monitoring.
+
+    Fire-and-forget lewat single writer (seperti log_action tanpa sync):
+    dipanggil dari handler async, jadi tidak menunggu group commit.
+    """
+    from db_sqlite import writer
+
     try:
-        # Buat tabel security_logs jika belum ada (PostgreSQL syntax)
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS security_logs (
-            id SERIAL PRIMARY KEY,
-            event_type TEXT NOT NULL,
-            user_id BIGINT NOT NULL,
-            details TEXT,
-            ip_address TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
-        
-        cur.execute(
-            "INSERT INTO security_logs (event_type, user_id, details) VALUES (%s, %s, %s)",
+        # Tabel security_logs dibuat oleh migrasi 0001_initial
+        writer.submit(lambda conn: conn.execute(
+            "INSERT INTO security_logs (event_type, user_id, details) VALUES (?, ?, ?)",
             (event_type, user_id, details)
-        )
-        conn.commit()
+        )).add_done_callback(_security_log_done)
     except Exception as e:
-        conn.rollback()
-        # Log ke console jika database gagal
-        print(f"Failed to log security event: {e}")
-    finally:
-        conn.close()
+        logger.error(f"Gagal mencatat security event: {e}")
 
 def check_admin_permission(user_id: int, action: str) -> bool:
     """Cek permission admin untuk aksi tertentu"""
@@ -0,0 +1,32 @@
+"""Konfigurasi pytest: modul bot diimpor dari root repo, tanpa token Telegram asli."""
+import os
+import sys
+import atexit
+import shutil
+import logging
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# config.py butuh BOT_TOKEN; tidak ada test yang menghubungi Telegram
+os.environ.setdefault("BOT_TOKEN", "123:FAKE")
+logging.disable(logging.WARNING)
+
+# Instance global (db_sqlite.db, deal_cache, ...) memakai database sementara, bukan rekber.db.
+# rmtree didaftarkan sebelum db_sqlite diimpor agar berjalan setelah db.shutdown (atexit LIFO).
+_tmp = tempfile.mkdtemp(prefix="rekber-test-")
+atexit.register(shutil.rmtree, _tmp, True)
+os.environ["DB_PATH"] = os.path.join(_tmp, "rekber.db")
+
+import migrations  # noqa: E402
+
+migrations.migrate(os.environ["DB_PATH"])
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # benchmark, migrate, dan query_plans membaca path relatif ke root repo
+    monkeypatch.chdir(ROOT)
@@ -0,0 +1,11 @@
+"""Counter user aktif."""
+from benchmark import bench_activity
+
+
+def test_activity_counters_match_scan():
+    updates = 5000
+    result = bench_activity(updates, 5000)
+    assert result["created_reset"] == 0
+    assert result["scan"] == result["counter"]
+    assert result["expected"] == result["actual"]
+    assert result["rows_written"] < updates
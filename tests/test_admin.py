@@ -0,0 +1,65 @@
+"""Handler admin yang membaca deal lewat deal_cache."""
+import os
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+import handlers.admin as admin
+from utils import format_rupiah
+
+
+class _FakeQuery:
+    def __init__(self, data: str):
+        self.data = data
+        self.message = SimpleNamespace(text="")
+        self.edits = []
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, **kwargs):
+        self.edits.append((text, kwargs))
+
+
+class _FakeDispatcher:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+def _release_final(deal_id: str) -> _FakeQuery:
+    query = _FakeQuery(f"admin_release_final|{deal_id}")
+    update = SimpleNamespace(callback_query=query)
+    asyncio.run(admin.admin_release_final(update, SimpleNamespace()))
+    return query
+
+
+def test_admin_release_final(monkeypatch):
+    fake = _FakeDispatcher()
+    monkeypatch.setattr(admin, "dispatcher", fake)
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    conn.execute("INSERT INTO deals (id, title, amount, buyer_id, seller_id, status) "
+                 "VALUES ('RB-ADMIN1', 'Akun game', 150000, 11, 22, 'AWAITING_CONFIRM')")
+    conn.commit()
+
+    # Belum ada data pencairan: penjual diminta mengisi, admin dapat tombol Cek Lagi
+    query = _release_final("RB-ADMIN1")
+    assert [chat_id for chat_id, _ in fake.sent] == [22]
+    text, kwargs = query.edits[-1]
+    assert "Belum ada data pencairan" in text
+    assert kwargs["reply_markup"].inline_keyboard[0][0].callback_data == "admin_release_final|RB-ADMIN1"
+
+    # Cek Lagi setelah penjual mengisi: preview pencairan dari baris deal
+    conn.execute("INSERT INTO payouts (deal_id, seller_id, method, bank_name, account_number, account_name) "
+                 "VALUES ('RB-ADMIN1', 22, 'BANK', 'BCA', '123', 'Penjual')")
+    conn.commit()
+    conn.close()
+    query = _release_final("RB-ADMIN1")
+    text, kwargs = query.edits[-1]
+    assert "Akun game" in text and format_rupiah(150000) in text and "BCA" in text
+    assert kwargs["reply_markup"].inline_keyboard[0][0].callback_data == "admin_release_execute|RB-ADMIN1"
+
+    query = _release_final("RB-MISSING")
+    assert query.edits[-1][0] == "❌ Transaksi tidak ditemukan."
@@ -0,0 +1,10 @@
+"""Analitik lama status deal."""
+from benchmark import bench_analytics
+
+
+def test_analytics_sketch_accuracy():
+    result = bench_analytics(50_000, 3)
+    assert result["same"]
+    assert result["counted"] == result["expected_count"]
+    assert result["worst"] <= result["accuracy"] * 1.001
+    assert result["peak"] <= 50e6
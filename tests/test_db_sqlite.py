@@ -0,0 +1,13 @@
+"""AsyncDatabase dan WriteQueue."""
+from benchmark import bench_loop_lag, bench_group_commit
+
+
+def test_async_database_keeps_event_loop_responsive():
+    result = bench_loop_lag(300)
+    assert result["async_lag"] < 0.1
+    assert result["async_lag"] < result["sync_lag"]
+
+
+def test_group_commit_not_slower_than_commit_per_write():
+    result = bench_group_commit(500, 64)
+    assert result["grouped"] <= result["normal"]
@@ -0,0 +1,15 @@
+"""Cache baris deal di alur join dan pendanaan."""
+from benchmark import bench_deals, _LEGACY_QUERIES
+
+
+def test_deal_cache_cuts_queries_without_stale_reads():
+    deals = 50
+    result = bench_deals(deals)
+    before, after = result["tanpa cache"]["per_update"], result["dengan cache"]["per_update"]
+    for flow in after:
+        assert after[flow] < _LEGACY_QUERIES[flow]
+        assert after[flow] < before[flow]
+    assert result["dengan cache"]["stale"] == 0
+    assert result["race_stale"] == 0
+    assert result["tanpa cache"]["done"] == deals
+    assert result["dengan cache"]["done"] == deals
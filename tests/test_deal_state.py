@@ -0,0 +1,32 @@
+"""Transisi status deal: compare-and-set, auto-cancel, dan deadline."""
+from benchmark import bench_state_race, bench_sweep, bench_deadline
+
+
+def test_concurrent_transition_applies_once():
+    result = bench_state_race(100, 8)
+    assert result["writer_wins"] == 1
+    assert result["cas_wins"] == 1
+    assert result["logs"] == {"VERIFY_PAYMENT": 1, "MARK_SHIPPED": 1}
+
+
+def test_sweep_cancels_expired_deals():
+    deals = 2000
+    result = bench_sweep(deals, 0)
+    assert result["swept"] == deals
+    assert result["cancelled"] == deals
+    assert result["logged"] == deals
+    assert result["untouched"] == result["fresh"]
+    # Deal PENDING_FUNDING punya dua pihak, PENDING_JOIN hanya satu
+    assert result["sent"] == deals + deals // 2
+
+
+def test_deadline_sweeper_wakes_on_time():
+    near, far = 100, 1000
+    result = bench_deadline(near, far)
+    near_late = result["near_late"]
+    assert len(near_late) == near
+    assert len(result["moved_late"]) == result["moved"]
+    assert result["untouched"] == far
+    assert result["idle_sweeps"] == 0
+    assert near_late[int(len(near_late) * 0.99)] < 1.0
+    assert result["moved_late"][-1] < 1.0
@@ -0,0 +1,14 @@
+"""Antrian kirim pesan per prioritas."""
+from benchmark import bench_dispatch
+
+
+def test_dispatcher_respects_limits_and_order():
+    result = bench_dispatch(90, 1)
+    stats = result["stats"]
+    interactive = result["latency"]["interactive"]
+    assert not result["rejected"]
+    assert not stats["errors"]
+    assert result["ordered"]
+    assert stats["coalesced"]
+    assert stats["queue_full"]
+    assert interactive[int(len(interactive) * 0.99)] < 1.5
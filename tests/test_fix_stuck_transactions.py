@@ -0,0 +1,20 @@
+"""Script perbaikan transaksi stuck lewat deal_state."""
+import os
+import sqlite3
+
+from fix_stuck_transactions import fix_stuck_transaction
+
+
+def test_fix_goes_through_transition():
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    conn.execute("INSERT INTO deals (id, title, amount, buyer_id, seller_id, status, expires_at) "
+                 "VALUES ('RB-STUCK1', 'Stuck', 1000, 11, 22, 'WAITING_VERIFICATION', '2000-01-01')")
+    conn.commit()
+
+    fix_stuck_transaction("RB-STUCK1")
+    # Dijalankan ulang: status sudah bukan WAITING_VERIFICATION, tidak ada transisi kedua
+    fix_stuck_transaction("RB-STUCK1")
+
+    assert conn.execute("SELECT status, expires_at FROM deals WHERE id = 'RB-STUCK1'").fetchone() == ("FUNDED", None)
+    assert conn.execute("SELECT action FROM logs WHERE deal_id = 'RB-STUCK1'").fetchall() == [("STATUS_FIX",)]
+    conn.close()
@@ -0,0 +1,11 @@
+"""Leaderboard dari tabel agregat."""
+from benchmark import bench_leaderboard
+
+
+def test_leaderboard_matches_full_aggregation():
+    result = bench_leaderboard(5000, 500)
+    sizes = result["sizes"]
+    assert result["expected"] == result["actual"]
+    assert result["leader"] == result["newcomer"]
+    assert not any(size["cached_rebuilds"] for size in sizes.values())
+    assert sizes[max(sizes)]["rebuild"] / sizes[min(sizes)]["rebuild"] <= 3
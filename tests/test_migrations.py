@@ -0,0 +1,30 @@
+"""Migrasi, query plan, dan agregat yang dijaga trigger migrasi."""
+import os
+
+import migrate
+import query_plans
+from benchmark import bench_reputation, bench_rollup
+
+
+def test_migrations_apply_cleanly():
+    # rekber.db disalin lewat backup, yang asli tidak disentuh (DB_PATH menunjuk database test)
+    assert migrate.test(os.path.abspath("rekber.db"))
+
+
+def test_query_plans_use_indexes():
+    assert query_plans.check()
+
+
+def test_reputation_triggers_match_aggregation():
+    result = bench_reputation(3000, 300)
+    assert not result["drift"]
+    assert result["mismatched"] == 0
+    assert result["broken"]
+    assert result["after_fix"] == 0
+
+
+def test_rollup_matches_deal_scan():
+    result = bench_rollup(20_000)
+    assert not result["drift"]
+    assert all(same for _, _, same, _ in result["ranges"].values())
+    assert result["applied"] == result["expected_applied"]
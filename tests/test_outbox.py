@@ -0,0 +1,11 @@
+"""Outbox notifikasi."""
+from benchmark import bench_outbox
+
+
+def test_outbox_delivers_every_notification_once():
+    result = bench_outbox(200, 30)
+    assert not result["lost"]
+    assert not result["duplicates"]
+    assert result["pending"] == 0
+    # Hanya pesan ke user yang memblokir bot yang berakhir di dead letter
+    assert result["dead"] == result["blocked"]
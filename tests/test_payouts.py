@@ -0,0 +1,21 @@
+"""Data pencairan penjual."""
+import os
+import sqlite3
+
+from db_sqlite import save_payout_info, get_payout_info
+
+
+def test_save_payout_info_updates_in_place():
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    conn.execute("INSERT INTO deals (id, title, amount, buyer_id, seller_id, status) "
+                 "VALUES ('RB-PAYOUT1', 'Payout', 1000, 11, 22, 'FUNDED')")
+    conn.commit()
+    conn.close()
+
+    save_payout_info("RB-PAYOUT1", 22, "BANK", bank_name="BCA", account_number="123", account_name="Penjual")
+    first = get_payout_info("RB-PAYOUT1")
+    save_payout_info("RB-PAYOUT1", 22, "EWALLET", ewallet_provider="DANA", ewallet_number="0812")
+    second = get_payout_info("RB-PAYOUT1")
+
+    assert (second["id"], second["created_at"]) == (first["id"], first["created_at"])
+    assert (second["method"], second["bank_name"], second["ewallet_provider"]) == ("EWALLET", None, "DANA")
@@ -0,0 +1,12 @@
+"""Persistence SQLite untuk user_data dan percakapan."""
+from benchmark import bench_persistence
+
+
+def test_persistence_round_trip():
+    users = 200
+    result = bench_persistence(users)
+    assert result["partial_rows"] == users // 10
+    assert result["restored"] == result["sampled"]
+    assert result["conversations"] == users
+    assert result["evicted"] == users
+    assert result["e2e"]
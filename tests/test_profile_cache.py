@@ -0,0 +1,10 @@
+"""Cache profil user."""
+from benchmark import bench_profile
+
+
+def test_profile_cache_single_flight_and_restart():
+    result = bench_profile(200, 2000)
+    assert result["single_flight"] == 1
+    assert result["refreshed"] == 1
+    assert not any(result["reachable"])
+    assert result["restart_calls"] == 0
@@ -0,0 +1,37 @@
+"""/rekber_stats dari tabel rollup."""
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import config
+from db_sqlite import writer
+from handlers.rekber import rekber_stats
+
+
+def _stats(user_id: int, args=()) -> list:
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=user_id),
+                             message=SimpleNamespace(reply_text=reply_text))
+    asyncio.run(rekber_stats(update, SimpleNamespace(args=list(args))))
+    return replies
+
+
+def test_rekber_stats_does_not_wait_for_writer(monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_IDS", [777])
+    release = threading.Event()
+    # Cek admin mencatat security event; handler tidak boleh menunggu writer yang sibuk
+    busy = writer.submit(lambda conn: release.wait(5))
+    try:
+        start = time.monotonic()
+        replies = _stats(777, ["2025-01"])
+        assert time.monotonic() - start < 0.5
+    finally:
+        release.set()
+    busy.result()
+    assert replies[0].startswith("📊 Statistik Rekber (") and "Total Transaksi: 0" in replies[0]
+    assert _stats(778) == ["❌ Kamu tidak punya akses ke perintah ini."]
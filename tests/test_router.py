@@ -0,0 +1,7 @@
+"""Router callback_query."""
+from benchmark import bench_router
+
+
+def test_router_matches_legacy_handler_chain():
+    result = bench_router(2000)
+    assert not result["mismatches"]
@@ -0,0 +1,17 @@
+"""Scheduler job persisten."""
+from benchmark import bench_scheduler
+
+
+def test_scheduler_runs_due_jobs_once():
+    near = 100
+    result = bench_scheduler(10_000, near)
+    lateness = result["lateness"]
+    assert result["counts"].get("overdue", 0) == result["overdue"]
+    assert result["skipped"] == result["stale"]
+    # Job dekat ditambah satu job "dup" yang disimpan sekali
+    assert len(lateness) == near + 1
+    assert lateness[int(len(lateness) * 0.99)] < 1.0
+    assert result["peak"] <= result["max_loaded"]
+    assert result["dedup"][1] is None
+    # Job milik deal yang sudah pindah status dihapus trigger, tidak dijalankan
+    assert not result["counts"].get("cancelled")
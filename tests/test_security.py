@@ -0,0 +1,37 @@
+"""Log security event tanpa menunggu writer."""
+import os
+import time
+import sqlite3
+import threading
+
+import config
+import security
+from db_sqlite import writer
+
+
+def _security_logs(user_id: int) -> int:
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    try:
+        return conn.execute("SELECT COUNT(*) FROM security_logs WHERE user_id = ?", (user_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_admin_permission_does_not_wait_for_commit(monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_IDS", [7001])
+    release = threading.Event()
+    # Writer sibuk: batch berikutnya belum bisa di-commit
+    busy = writer.submit(lambda conn: release.wait(5))
+    try:
+        start = time.monotonic()
+        assert security.check_admin_permission(7001, "view_stats")
+        assert not security.check_admin_permission(7002, "view_stats")
+        assert time.monotonic() - start < 0.5
+        assert _security_logs(7001) == 0
+    finally:
+        release.set()
+    busy.result()
+    deadline = time.monotonic() + 5
+    while _security_logs(7001) == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert _security_logs(7001) == 1
@@ -0,0 +1,13 @@
+"""Pemrosesan update paralel dengan lock per deal/user."""
+from benchmark import bench_updates
+
+
+def test_ordered_updates_complete_every_deal():
+    deals = 20
+    ordered = [row for row in bench_updates(deals, 2) if row[0] == "berurutan per deal"]
+    for _, _, _, failed, done, _, locks_left in ordered:
+        assert not failed
+        assert done == deals
+        assert not locks_left
+    # Konkurensi menaikkan throughput (batas benchmark penuh: 8x)
+    assert ordered[-1][2] > ordered[0][2] * 2
@@ -0,0 +1,18 @@
+"""Server webhook."""
+import json
+
+from benchmark import bench_webhook
+from webhook import ALLOWED_UPDATES
+
+
+def test_webhook_handles_updates_and_rejects_bad_requests():
+    updates = 200
+    result = bench_webhook(updates, 5)
+    registered = result["registered"]
+    assert len(result["handled"]) == updates
+    assert all(status == 200 for status in result["statuses"])
+    assert 0 not in result["handled"]
+    assert list(result["checks"].values()) == [403, 403, 400, 404]
+    assert result["health"]["updates"] == updates
+    assert registered[0]["secret_token"] == "rahasia"
+    assert json.loads(registered[0]["allowed_updates"]) == ALLOWED_UPDATES
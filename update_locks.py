@@ -0,0 +1,117 @@
+"""Pemrosesan update paralel dengan urutan per deal dan per user.
+
+Application di main.py dibangun dengan `OrderedApplication`: update diproses
+bersamaan (maks UPDATE_CONCURRENCY handler berjalan), tetapi update yang
+menyentuh kunci yang sama berjalan berurutan sesuai urutan masuk:
+
+- `user:<id>`: semua update dari user yang sama (menjaga alur
+  ConversationHandler dan klik beruntun);
+- `deal:<id>`: update dengan id deal di callback_data (`rekber_release|RB-...`)
+  atau deep link `/start rekber_RB-...`, mis. tombol admin dan pembeli
+  pada deal yang sama.
+
+Update yang tidak berbagi kunci berjalan paralel. Lock dibuat saat
+dibutuhkan dan dibuang begitu tidak ada lagi yang memegang/menunggu, jadi
+tabel lock hanya berisi kunci update yang sedang berjalan.
+"""
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+# Update yang boleh menunggu lock/slot sekaligus (concurrent_updates PTB)
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "1024"))
+
+DEAL_ID_PREFIX = "RB-"
+
+
+class _Entry:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class KeyedLocks:
+    """asyncio.Lock per kunci; entri dihapus saat tidak ada pemegang/penunggu"""
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self.peak = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @asynccontextmanager
+    async def hold(self, *keys: str):
+        """Pegang semua `keys` (urut, tanpa duplikat, supaya tidak deadlock)"""
+        keys = sorted(set(keys))
+        entries = []
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            entry.users += 1
+            entries.append((key, entry))
+        self.peak = max(self.peak, len(self._entries))
+        acquired = 0
+        try:
+            for _, entry in entries:
+                await entry.lock.acquire()
+                acquired += 1
+            yield
+        finally:
+            for key, entry in reversed(entries):
+                if acquired:
+                    entry.lock.release()
+                    acquired -= 1
+                entry.users -= 1
+                if entry.users == 0:
+                    del self._entries[key]
+                    self.evicted += 1
+
+
+def update_keys(update: object) -> List[str]:
+    """Kunci urutan untuk satu update: user pengirim dan deal yang disebut"""
+    if not isinstance(update, Update):
+        return []
+    keys = []
+    if update.effective_user is not None:
+        keys.append(f"user:{update.effective_user.id}")
+    if update.callback_query is not None and update.callback_query.data:
+        text = update.callback_query.data
+    elif update.message is not None and update.message.text and update.message.text.startswith("/start "):
+        text = update.message.text.split(" ", 1)[1].replace("rekber_", "", 1)
+    else:
+        return keys
+    keys += [f"deal:{part}" for part in text.split("|") if part.startswith(DEAL_ID_PREFIX)]
+    return keys
+
+
+class OrderedApplication(Application):
+    """Application yang memproses update paralel dengan urutan per kunci (lihat modul).
+
+    Dibangun lewat `ApplicationBuilder().concurrent_updates(UPDATE_MAX_PENDING)
+    .application_class(OrderedApplication)`. Lock diambil sebelum slot
+    UPDATE_CONCURRENCY, sehingga update yang menunggu giliran deal/user-nya
+    tidak memakan slot handler.
+    """
+
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY, locks: KeyedLocks = None, **kwargs):
+        super().__init__(**kwargs)
+        self.update_locks = locks or KeyedLocks()
+        self.update_slots = asyncio.Semaphore(concurrency)
+
+    async def process_update(self, update: object) -> None:
+        async with self.update_locks.hold(*update_keys(update)):
+            async with self.update_slots:
+                await super().process_update(update)
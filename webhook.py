@@ -0,0 +1,192 @@
+"""Mode webhook untuk Rekber Bot (alternatif run_polling).
+
+Aktif jika WEBHOOK_URL diisi (URL publik HTTPS yang diteruskan ke
+WEBHOOK_LISTEN:WEBHOOK_PORT, mis. lewat reverse proxy):
+
+    WEBHOOK_URL=https://rekber.example.com python main.py
+
+- Server HTTP/1.1 kecil di atas asyncio (tanpa dependensi tambahan) menerima
+  POST Telegram di WEBHOOK_PATH dan memasukkan Update ke
+  `application.update_queue`, sama seperti polling.
+- Header X-Telegram-Bot-Api-Secret-Token wajib cocok dengan WEBHOOK_SECRET
+  (acak per proses jika tidak diisi; set_webhook dipanggil setiap start).
+- Telegram hanya mengirim jenis update yang ditangani bot (ALLOWED_UPDATES)
+  dan update yang tertunda saat bot mati tidak dibuang.
+- GET /health mengembalikan status dan jumlah update untuk health check.
+"""
+import os
+import hmac
+import json
+import time
+import signal
+import asyncio
+import logging
+import secrets
+from typing import Any, Dict, Optional
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "") or secrets.token_urlsafe(32)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Update Telegram jauh di bawah batas ini; body lebih besar ditolak 413
+WEBHOOK_MAX_BODY = int(os.getenv("WEBHOOK_MAX_BODY", "1048576"))
+HEALTH_PATH = "/health"
+
+# Jenis update yang punya handler di main.py (command/pesan/foto dan tombol inline)
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class WebhookServer:
+    """Server webhook di atas asyncio.start_server (HTTP/1.1 keep-alive)"""
+
+    def __init__(self, application, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET,
+                 listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT):
+        self.application = application
+        self.path = path
+        self.secret = secret
+        self.listen = listen
+        self.port = port
+        self.received = 0
+        self.rejected = 0
+        self.started_at = time.time()
+        self.last_update_at: Optional[float] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.listen, self.port)
+        # Port 0 = port acak (benchmark)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.started_at = time.time()
+        logger.info(f"Webhook mendengarkan di {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "status": "ok" if self.application.running else "stopping",
+            "mode": "webhook",
+            "uptime": round(now - self.started_at, 1),
+            "updates": self.received,
+            "rejected": self.rejected,
+            "queue": self.application.update_queue.qsize(),
+            "last_update_age": round(now - self.last_update_at, 1) if self.last_update_at else None,
+        }
+
+    async def _route(self, method: str, path: str, headers: Dict[str, str], body: bytes):
+        if path == HEALTH_PATH:
+            if method != "GET":
+                return 405, None
+            stats = self.stats()
+            return (200 if stats["status"] == "ok" else 503), stats
+        if path != self.path:
+            return 404, None
+        if method != "POST":
+            return 405, None
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, "").encode(), self.secret.encode()):
+            self.rejected += 1
+            logger.warning("Webhook ditolak: secret token tidak cocok")
+            return 403, None
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Webhook: update tidak valid: {e}")
+            return 400, None
+        if update is None:
+            return 400, None
+        await self.application.update_queue.put(update)
+        self.received += 1
+        self.last_update_at = time.time()
+        return 200, None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    break
+                method, target, version = parts
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                if length > WEBHOOK_MAX_BODY:
+                    status, result = 413, None
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    status, result = await self._route(method, target.split("?", 1)[0], headers, body)
+                    keep_alive = (headers.get("connection", "").lower() != "close"
+                                  and version == "HTTP/1.1")
+
+                payload = json.dumps(result if result is not None else {"ok": status == 200}).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except Exception as e:
+            logger.error(f"Error in webhook connection: {e}")
+        finally:
+            writer.close()
+
+
+async def serve(application, url: str = WEBHOOK_URL, server: WebhookServer = None,
+                stop: asyncio.Event = None):
+    """Jalankan application dalam mode webhook sampai `stop` di-set (default: SIGINT/SIGTERM)"""
+    server = server or WebhookServer(application)
+    if stop is None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+    # Urutan sama dengan run_polling: initialize -> post_init -> terima update -> start
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await server.start()
+        await application.bot.set_webhook(
+            url.rstrip("/") + server.path, secret_token=server.secret, allowed_updates=ALLOWED_UPDATES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS, drop_pending_updates=False
+        )
+        logger.info(f"Webhook terdaftar: {url.rstrip('/')}{server.path}")
+        await application.start()
+        await stop.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+def run_webhook(application):
+    """Pengganti app.run_polling untuk mode webhook"""
+    asyncio.run(serve(application))